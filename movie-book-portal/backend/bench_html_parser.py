@@ -0,0 +1,153 @@
+"""
+Benchmark of the scraper extraction functions on recorded HTML, per parser.
+
+    python bench_html_parser.py --record     # fetch one live page per case into bench_html/
+    python bench_html_parser.py [-n 20]      # replay recorded pages on every available backend
+
+Replay runs the real extraction functions (browse/search/details of every
+provider) with the network replaced by the recorded page, checks that all
+parser backends extract the same result and prints the time per call.
+
+The committed pages cover the list loops that use the backend interface
+(genre and search pages of flibusta, coollib and royallib). They are
+trimmed copies of the providers' markup, quirks included: unclosed <p> and
+<tr>, markup inside links, &nbsp; separators, windows-1251 on royallib.
+The other cases go through parse_html(), which stays on html.parser.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+import requests
+
+from services import html_parser, scrape_cache
+from services.http_client import http_client
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BASE_DIR, "bench_html")
+
+def _cases():
+    from routers import discovery
+    from routers import audiobooks_source
+    from services import kinorush_service
+
+    flibusta = discovery.PROVIDERS["flibusta"]
+    coollib = discovery.PROVIDERS["coollib"]
+    royallib = discovery.PROVIDERS["royallib"]
+    return {
+        "flibusta_genre": lambda: discovery.browse_library_genre("Фантастика", flibusta),
+        "flibusta_search": lambda: discovery.search_flibusta("Стругацкие", flibusta),
+        "flibusta_book": lambda: discovery.scrape_book_details("75538", flibusta),
+        "coollib_genre": lambda: discovery.browse_library_genre("Фантастика", coollib),
+        "coollib_search": lambda: discovery.search_coollib("Стругацкие", coollib),
+        "royallib_genre": lambda: discovery.browse_library_genre("Фантастика", royallib),
+        "royallib_search": lambda: discovery.search_royallib("Стругацкие", royallib),
+        "audioboo_genre": lambda: audiobooks_source.browse_audioboo("Фантастика"),
+        "kinorush_genre": lambda: kinorush_service.search_movies_by_genre("boevik"),
+    }
+
+def _fixture_path(name):
+    return os.path.join(FIXTURES_DIR, f"{name}.html")
+
+def _recorded_response(content):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    response.encoding = "utf-8"
+    response.url = "http://recorded/"
+    return response
+
+@contextlib.contextmanager
+def _network(fake_get):
+    """Routes both the scrape cache and the shared client through fake_get"""
+    original_cached_get, original_get = scrape_cache.cached_get, http_client.get
+    scrape_cache.cached_get = lambda url, *a, **kw: fake_get(url, original_cached_get, *a, **kw)
+    http_client.get = lambda url, *a, **kw: fake_get(url, original_get, *a, **kw)
+    try:
+        yield
+    finally:
+        scrape_cache.cached_get, http_client.get = original_cached_get, original_get
+
+def record(cases):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name, run in cases.items():
+        pages = []
+
+        def capture(url, original, *args, **kwargs):
+            response = original(url, *args, **kwargs)
+            if response.status_code == 200:
+                pages.append(response.content)
+            return response
+
+        with _network(capture), contextlib.redirect_stdout(io.StringIO()):
+            run()
+        if pages:
+            with open(_fixture_path(name), "wb") as f:
+                f.write(pages[-1])
+            print(f"{name}: recorded {len(pages[-1])} bytes")
+        else:
+            print(f"{name}: nothing recorded")
+
+def _timed(run, iterations):
+    random.seed(0)  # browse_* shuffle their results
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            random.seed(0)
+            run()
+        elapsed = (time.perf_counter() - started) / iterations
+    return repr(result), elapsed * 1000
+
+def replay(cases, iterations):
+    parsers = html_parser.available_backends()
+    if len(parsers) == 1:
+        print("lxml is not installed: only html.parser is measured\n")
+
+    print(f"{'case':<18}{'bytes':>9}" + "".join(f"{p + ' ms':>16}" for p in parsers) + f"{'speedup':>10}  same")
+    for name, run in cases.items():
+        path = _fixture_path(name)
+        if not os.path.exists(path):
+            print(f"{name:<18}  (not recorded, run with --record)")
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+
+        timings, results = [], []
+        with _network(lambda url, original, *a, **kw: _recorded_response(content)):
+            for parser in parsers:
+                html_parser.use(parser)
+                result, ms = _timed(run, iterations)
+                results.append(result)
+                timings.append(ms)
+        html_parser.use(html_parser.DEFAULT_BACKEND)
+
+        speedup = f"{timings[0] / timings[-1]:.1f}x" if len(timings) > 1 and timings[-1] else "-"
+        same = "yes" if all(r == results[0] for r in results) else "NO"
+        print(f"{name:<18}{len(content):>9}" + "".join(f"{t:>16.2f}" for t in timings) + f"{speedup:>10}  {same}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="Fetch live pages into bench_html/")
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument("cases", nargs="*", help="Subset of cases to run")
+    args = parser.parse_args()
+
+    cases = _cases()
+    if args.cases:
+        unknown = set(args.cases) - set(cases)
+        if unknown:
+            sys.exit(f"Unknown cases: {', '.join(sorted(unknown))}")
+        cases = {k: v for k, v in cases.items() if k in args.cases}
+
+    if args.record:
+        record(cases)
+    else:
+        replay(cases, args.iterations)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of catalog serialization: how GET /api/books turned its rows into
+JSON before (no response model: jsonable_encoder over the ORM objects, then
+json.dumps) against the response models of models.py.
+
+    python bench_json_serialization.py [--rows 10000] [-n 10]
+
+The rows are real ORM instances loaded from an in-memory SQLite database
+with the schema of database_books.py, so attribute access costs what it
+costs in the app:
+    before       - jsonable_encoder + JSONResponse (json.dumps)
+    orjson       - jsonable_encoder + FastJSONResponse (the default for
+                   endpoints without a response model)
+    after        - List[BookResponse] dumped by pydantic-core, what FastAPI
+                   and conditional_json() do for endpoints with one
+"""
+import argparse
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database_books import BaseBooks, Book
+from models import BookResponse
+from responses import ORJSON_AVAILABLE, FastJSONResponse
+
+def load_rows(count: int):
+    engine = create_engine("sqlite://")
+    BaseBooks.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all(Book(title=f"Мастер и Маргарита, том {i}", author="Михаил Булгаков", year=1966 + i % 50,
+                    genre="Роман", rating=4.5, description="Описание книги " * 8,
+                    file_path=f"uploads/books/{i}.epub", thumbnail_path=f"uploads/books/{i}_thumb.jpg",
+                    total_pages=320, series="Собрание сочинений" if i % 3 else None, series_index=i % 10)
+               for i in range(count))
+    db.commit()
+    return db.query(Book).all()
+
+def timed(function, n: int):
+    function()  # Warm-up
+    started = time.perf_counter()
+    for _ in range(n):
+        body = function()
+    return (time.perf_counter() - started) / n * 1000, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("-n", type=int, default=10, help="Repetitions per variant")
+    args = parser.parse_args()
+
+    rows = load_rows(args.rows)
+    adapter = TypeAdapter(List[BookResponse])
+    variants = {
+        "before (jsonable_encoder + json)": lambda: JSONResponse(jsonable_encoder(rows)).body,
+        f"jsonable_encoder + {'orjson' if ORJSON_AVAILABLE else 'json (orjson missing)'}":
+            lambda: FastJSONResponse(jsonable_encoder(rows)).body,
+        "after (response model, pydantic-core)":
+            lambda: adapter.dump_json(adapter.validate_python(rows, from_attributes=True)),
+    }
+    print(f"{args.rows} rows, {args.n} runs each")
+    baseline = None
+    for name, function in variants.items():
+        ms, size = timed(function, args.n)
+        baseline = baseline or ms
+        print(f"{name:45}{ms:>9.1f} ms{size / 1024:>9.0f} KB{baseline / ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmark of the access-control middleware: the former @app.middleware("http")
+implementation (BaseHTTPMiddleware) against the pure ASGI SecurityMiddleware.
+
+    python bench_security_middleware.py [-n 5000] [--stream-mb 512]
+
+Both run in-process on the same tiny app, driven directly through ASGI (no
+sockets), so only the middleware differs:
+    per request  - small JSON responses for a local client, an external app
+                   client (x-forwarded-for + app user agent) and a blocked one
+    streaming    - one StreamingResponse of --stream-mb in 64 KB chunks, the
+                   way video files go out
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import ipaddress
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from middleware.security import SecurityMiddleware, classify
+
+CHUNK = 64 * 1024
+
+async def legacy_security_middleware(request: Request, call_next):
+    """The middleware as it was in main.py (abridged blocked page)"""
+    x_forwarded = request.headers.get("x-forwarded-for")
+    x_real_ip = request.headers.get("x-real-ip")
+    if x_forwarded:
+        real_ip = x_forwarded.split(",")[0].strip()
+    elif x_real_ip:
+        real_ip = x_real_ip.strip()
+    else:
+        real_ip = request.client.host if request.client else "127.0.0.1"
+    is_local = False
+    if real_ip in ("127.0.0.1", "localhost", "::1"):
+        is_local = True
+    else:
+        try:
+            ip_obj = ipaddress.ip_address(real_ip)
+            is_local = ip_obj.is_private or ip_obj.is_loopback
+        except ValueError:
+            pass
+    user_agent = request.headers.get("user-agent", "").lower()
+    is_app = ("xwv2-app-identifier" in user_agent
+              or request.headers.get("X-App-Identifier") == "true" or request.headers.get("X-User-Id") is not None
+              or "xwv2-app-identifier" in request.cookies.get("app_id", "").lower()
+              or "dalvik" in user_agent)
+    if not is_local:
+        print(f"External access attempt: IP={real_ip}, App={is_app}, UA={user_agent}")
+    if not is_local and not is_app:
+        if request.url.path.startswith("/api"):
+            return JSONResponse(status_code=403, content={"detail": "Access Denied."})
+        return HTMLResponse(status_code=403, content=f"<p>Ваш IP: {real_ip}</p>")
+    response = await call_next(request)
+    if is_app:
+        response.set_cookie(key="app_id", value="xWV2-App-Identifier", max_age=31536000,
+                            httponly=True, samesite="lax", path="/")
+    if request.url.path.startswith("/assets/"):
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    elif request.url.path == "/" or request.url.path == "/index.html":
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def make_app(stream_bytes: int, legacy: bool) -> Starlette:
+    async def small(request):
+        return JSONResponse({"id": 1, "title": "Сталкер", "year": 1979})
+
+    async def stream(request):
+        async def body():
+            chunk = b"\0" * CHUNK
+            for _ in range(stream_bytes // CHUNK):
+                yield chunk
+        return StreamingResponse(body(), media_type="video/mp4")
+
+    if legacy:
+        middleware = [Middleware(BaseHTTPMiddleware, dispatch=legacy_security_middleware)]
+    else:
+        middleware = [Middleware(SecurityMiddleware)]
+    return Starlette(routes=[Route("/api/small", small), Route("/uploads/video.mp4", stream)], middleware=middleware)
+
+CLIENTS = {
+    "local": ("192.168.1.20", []),
+    "external app": ("8.8.8.8", [(b"x-forwarded-for", b"93.184.216.34"), (b"user-agent", b"Mozilla/5.0 xWV2-App-Identifier")]),
+    "blocked": ("8.8.8.8", [(b"user-agent", b"curl/8.0")]),
+}
+
+async def request(app, path: str, client: str) -> int:
+    ip, headers = CLIENTS[client]
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "root_path": "", "headers": [(b"host", b"portal")] + headers, "client": (ip, 50000),
+             "server": ("portal", 80)}
+    received = 0
+    requested = False
+    done = asyncio.Event()
+
+    async def receive():
+        # The request body once, then nothing until the response is over (like a real client)
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+            if not message.get("more_body"):
+                done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return received
+
+async def bench(n: int, stream_mb: int):
+    stream_bytes = stream_mb * 1024 * 1024
+    results = {}
+    for name, legacy in (("before (BaseHTTPMiddleware)", True), ("after (pure ASGI)", False)):
+        app = make_app(stream_bytes, legacy)
+        classify.cache_clear()
+        row = {}
+        for client in CLIENTS:
+            await request(app, "/api/small", client)  # Warm-up
+            started = time.perf_counter()
+            for _ in range(n):
+                await request(app, "/api/small", client)
+            row[client] = (time.perf_counter() - started) / n * 1e6
+        started = time.perf_counter()
+        received = await request(app, "/uploads/video.mp4", "external app")
+        elapsed = time.perf_counter() - started
+        assert received == stream_bytes // CHUNK * CHUNK
+        row["stream"] = received / elapsed / 1024 ** 2
+        results[name] = row
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5000, help="Requests per client type")
+    parser.add_argument("--stream-mb", type=int, default=512)
+    args = parser.parse_args()
+
+    # The legacy middleware prints on every external request: keep that cost, hide the output
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(bench(args.n, args.stream_mb))
+
+    print(f"{'':30}" + "".join(f"{c:>16}" for c in CLIENTS) + f"{'stream':>14}")
+    for name, row in results.items():
+        print(f"{name:30}" + "".join(f"{row[c]:>13.1f} us" for c in CLIENTS) + f"{row['stream']:>9.0f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,7 @@ class Movie(Base):
     description = Column(String, nullable=True)
     file_path = Column(String, nullable=True)
     thumbnail_path = Column(String, nullable=True)
+    content_sha256 = Column(String, nullable=True)  # Blob of file_path in the media store
 
 class Book(Base):
     __tablename__ = "books"
@@ -78,6 +79,19 @@ def get_db():
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    # Ensure columns exist (for existing databases)
+    with engine.connect() as conn:
+        from sqlalchemy import text
+        columns = [
+            ("content_sha256", "VARCHAR")
+        ]
+        for col_name, col_type in columns:
+            try:
+                conn.execute(text(f"ALTER TABLE movies ADD COLUMN {col_name} {col_type}"))
+                conn.commit()
+                print(f"Migration: Added column {col_name} to movies table.")
+            except Exception as e:
+                pass
 
 def add_sample_data():
     db = SessionLocal()
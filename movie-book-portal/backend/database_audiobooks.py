@@ -29,6 +29,7 @@ class Audiobook(BaseAudiobooks):
     source = Column(String, nullable=True)  # Source: flibusta, audioboo, manual, etc.
     series = Column(String, nullable=True)
     series_index = Column(Integer, nullable=True)
+    content_sha256 = Column(String, nullable=True)  # Blob of file_path in the media store
 
 def get_db_audiobooks():
     db = SessionLocalAudiobooks()
@@ -47,7 +48,8 @@ def create_audiobooks_tables():
             ("duration", "INTEGER DEFAULT 0"),
             ("source", "VARCHAR"),
             ("series", "VARCHAR"),
-            ("series_index", "INTEGER")
+            ("series_index", "INTEGER"),
+            ("content_sha256", "VARCHAR")
         ]
         for col_name, col_type in columns:
             try:
@@ -27,6 +27,7 @@ class Book(BaseBooks):
     total_pages = Column(Integer, default=1)
     series = Column(String, nullable=True)
     series_index = Column(Integer, nullable=True)
+    content_sha256 = Column(String, nullable=True)  # Blob of file_path in the media store
 
 def get_db_books():
     db = SessionLocalBooks()
@@ -44,7 +45,8 @@ def create_books_tables():
         columns = [
             ("series", "VARCHAR"),
             ("series_index", "INTEGER"),
-            ("total_pages", "INTEGER DEFAULT 1")
+            ("total_pages", "INTEGER DEFAULT 1"),
+            ("content_sha256", "VARCHAR")
         ]
         for col_name, col_type in columns:
             try:
@@ -0,0 +1,105 @@
+# database_catalog.py
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_URL_CATALOG = f"sqlite:///{os.path.join(BASE_DIR, 'catalog.db')}"
+
+engine_catalog = create_engine(DATABASE_URL_CATALOG, connect_args={"check_same_thread": False})
+SessionLocalCatalog = sessionmaker(autocommit=False, autoflush=False, bind=engine_catalog)
+
+BaseCatalog = declarative_base()
+
+class CatalogBook(BaseCatalog):
+    """Книга из жанрового списка внешней библиотеки (локальная копия для мгновенного просмотра)"""
+    __tablename__ = "catalog_books"
+    __table_args__ = (UniqueConstraint("provider", "genre", "book_id", name="uq_catalog_book"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String, index=True)   # flibusta / coollib / royallib
+    genre = Column(String, index=True)      # Название жанра из GENRE_MAPPING
+    book_id = Column(String)                # ID на сайте провайдера
+    title = Column(String)
+    author = Column(String, nullable=True)
+    image = Column(String, nullable=True)   # URL обложки
+    source_url = Column(String, nullable=True)
+    page = Column(Integer, default=1)
+    cover_checked_at = Column(DateTime, nullable=True)
+    first_seen = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow, index=True)
+
+class CatalogPage(BaseCatalog):
+    """Когда страница жанра последний раз была скачана"""
+    __tablename__ = "catalog_pages"
+    __table_args__ = (UniqueConstraint("provider", "genre", "page", name="uq_catalog_page"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String, index=True)
+    genre = Column(String, index=True)
+    page = Column(Integer, default=1)
+    book_count = Column(Integer, default=0)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+class OpdsBook(BaseCatalog):
+    """Книга из OPDS-каталога Флибусты (локальное зеркало жанровых лент)"""
+    __tablename__ = "opds_books"
+
+    book_id = Column(String, primary_key=True)  # ID книги на Флибусте (/b/<id>)
+    title = Column(String)
+    authors = Column(String, nullable=True)     # Через запятую
+    series = Column(String, nullable=True)
+    formats = Column(String, nullable=True)     # fb2,epub,mobi
+    cover_url = Column(String, nullable=True)
+    summary = Column(Text, nullable=True)
+    search_text = Column(String, index=True)    # lower(title + authors): SQLite LIKE не сворачивает регистр кириллицы
+    updated = Column(DateTime, index=True)      # <updated> из ленты
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+class OpdsBookGenre(BaseCatalog):
+    __tablename__ = "opds_book_genres"
+    __table_args__ = (UniqueConstraint("book_id", "genre", name="uq_opds_book_genre"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    book_id = Column(String, index=True)
+    genre = Column(String, index=True)          # Название жанра из GENRE_MAPPING
+
+class OpdsGenreFeed(BaseCatalog):
+    """Лента жанра (или подраздела жанра) и состояние инкрементальной синхронизации"""
+    __tablename__ = "opds_genre_feeds"
+
+    id = Column(Integer, primary_key=True, index=True)
+    genre = Column(String, index=True)          # Жанр, за которым мы следим (genre_priorities)
+    feed_url = Column(String, unique=True)
+    high_water = Column(DateTime, nullable=True)  # Самый новый <updated>, уже загруженный
+    backfill_url = Column(String, nullable=True)  # rel=next, с которого продолжить догрузку старых страниц
+    gap_url = Column(String, nullable=True)       # rel=next недочитанных новых записей (не хватило лимита страниц)
+    gap_newest = Column(DateTime, nullable=True)  # Самый новый <updated> над этим пропуском
+    last_sync = Column(DateTime, nullable=True)
+    book_count = Column(Integer, default=0)     # Книг в жанре (по всем его лентам)
+
+def get_db_catalog():
+    db = SessionLocalCatalog()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def create_catalog_tables():
+    BaseCatalog.metadata.create_all(bind=engine_catalog)
+    # Ensure columns exist (for existing databases)
+    with engine_catalog.connect() as conn:
+        from sqlalchemy import text
+        columns = [
+            ("gap_url", "VARCHAR"),
+            ("gap_newest", "DATETIME")
+        ]
+        for col_name, col_type in columns:
+            try:
+                conn.execute(text(f"ALTER TABLE opds_genre_feeds ADD COLUMN {col_name} {col_type}"))
+                conn.commit()
+                print(f"Migration: Added column {col_name} to opds_genre_feeds table.")
+            except Exception as e:
+                pass
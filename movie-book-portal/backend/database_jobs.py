@@ -0,0 +1,87 @@
+# database_jobs.py
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, Boolean, Index
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_URL_JOBS = f"sqlite:///{os.path.join(BASE_DIR, 'jobs.db')}"
+
+engine_jobs = create_engine(DATABASE_URL_JOBS, connect_args={"check_same_thread": False})
+SessionLocalJobs = sessionmaker(autocommit=False, autoflush=False, bind=engine_jobs)
+
+BaseJobs = declarative_base()
+
+class Job(BaseJobs):
+    """Одна задача планировщика (запуск обнаружения, синхронизация и т.п.)"""
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String, index=True)           # discover_books / discover_audiobooks / discover_movies ...
+    status = Column(String, index=True, default="queued")  # queued / running / succeeded / failed / cancelled
+    payload = Column(Text, nullable=True)           # JSON-аргументы задачи
+    trigger = Column(String, default="manual")      # schedule / force / manual / retry
+    schedule_name = Column(String, nullable=True)
+    attempt = Column(Integer, default=1)
+    max_attempts = Column(Integer, default=1)
+    run_after = Column(DateTime, default=datetime.utcnow)  # Не запускать раньше (отложенный повтор)
+    cancel_requested = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration = Column(Float, nullable=True)         # Секунды
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+
+class JobSchedule(BaseJobs):
+    """Триггер, который ставит задачи в очередь: интервал или cron"""
+    __tablename__ = "job_schedules"
+
+    name = Column(String, primary_key=True)         # books / audiobooks / movies ...
+    job_type = Column(String)
+    interval_seconds = Column(Integer, nullable=True)
+    cron = Column(String, nullable=True)            # "0 3 * * *" (минуты часы день месяц день_недели, местное время)
+    enabled = Column(Boolean, default=True)
+    next_run_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+
+class DiscoveryRun(BaseJobs):
+    """Один цикл обнаружения (книги / аудиокниги / фильмы)"""
+    __tablename__ = "discovery_runs"
+    __table_args__ = (Index("ix_discovery_runs_kind_started", "kind", "started_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String)                           # books / audiobooks / movies
+    job_id = Column(Integer, nullable=True)         # Задача планировщика (None для ручного запуска скрипта)
+    genre = Column(String, nullable=True)
+    status = Column(String, default="running")      # running / added / nothing / failed / interrupted
+    pid = Column(Integer, nullable=True)            # Процесс, выполняющий цикл
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    duration = Column(Float, nullable=True)         # Секунды
+    added_title = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+
+class DiscoveryEvent(BaseJobs):
+    """Событие цикла обнаружения: начало, добавление, ошибка, конец, строка лога"""
+    __tablename__ = "discovery_events"
+    __table_args__ = (Index("ix_discovery_events_kind_id", "kind", "id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, index=True)
+    kind = Column(String)
+    event = Column(String)                          # start / info / added / error / end
+    message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+def get_db_jobs():
+    db = SessionLocalJobs()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def create_jobs_tables():
+    BaseJobs.metadata.create_all(bind=engine_jobs)
@@ -0,0 +1,73 @@
+# database_library_scan.py
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, Boolean
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_URL_LIBRARY_SCAN = f"sqlite:///{os.path.join(BASE_DIR, 'library_scan.db')}"
+
+engine_library_scan = create_engine(DATABASE_URL_LIBRARY_SCAN, connect_args={"check_same_thread": False})
+SessionLocalLibraryScan = sessionmaker(autocommit=False, autoflush=False, bind=engine_library_scan)
+
+BaseLibraryScan = declarative_base()
+
+class LibraryFile(BaseLibraryScan):
+    """Состояние сканирования одного видеофайла библиотеки (обрабатывается заново только при изменении)"""
+    __tablename__ = "library_files"
+
+    path = Column(String, primary_key=True)          # Путь относительно BASE_DIR
+    root = Column(String, index=True)               # Сканируемая папка, в которой лежит файл
+    size = Column(Integer)
+    mtime = Column(Integer)
+    state = Column(String, index=True, default="pending")  # pending / done / failed
+    duration = Column(Float, nullable=True)         # Секунды
+    video_codec = Column(String, nullable=True)
+    audio_codec = Column(String, nullable=True)
+    action = Column(String, nullable=True)          # План media_probe: none / faststart / remux / audio / full
+    match = Column(String, nullable=True)           # linked / restored / no_metadata
+    movie_id = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    scan_id = Column(Integer, nullable=True)        # Сканирование, обработавшее файл последним
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class LibraryScan(BaseLibraryScan):
+    """Один проход сканера и его прогресс"""
+    __tablename__ = "library_scans"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, nullable=True)         # Задача планировщика (None для запуска из скрипта)
+    status = Column(String, default="running")      # running / finished / failed / cancelled / interrupted
+    full = Column(Boolean, default=False)           # Обработать все файлы, а не только новые и изменённые
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    files_total = Column(Integer, default=0)
+    files_pending = Column(Integer, default=0)      # Новые, изменённые и оставшиеся от прерванного прохода
+    files_removed = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    restored = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    lookups = Column(Integer, default=0)            # Запросы к kinorush
+    lookups_cached = Column(Integer, default=0)
+    current = Column(String, nullable=True)         # Файл в обработке
+    error = Column(Text, nullable=True)
+
+class MetadataLookup(BaseLibraryScan):
+    """Кэш поиска метаданных фильма по очищенному названию"""
+    __tablename__ = "metadata_lookups"
+
+    query = Column(String, primary_key=True)        # Название в нижнем регистре
+    found = Column(Boolean, default=False)
+    data = Column(Text, nullable=True)              # JSON MovieDetails (без торрентов)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+def get_db_library_scan():
+    db = SessionLocalLibraryScan()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def create_library_scan_tables():
+    BaseLibraryScan.metadata.create_all(bind=engine_library_scan)
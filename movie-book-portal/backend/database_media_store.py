@@ -0,0 +1,50 @@
+# database_media_store.py
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_URL_MEDIA_STORE = f"sqlite:///{os.path.join(BASE_DIR, 'media_store.db')}"
+
+engine_media_store = create_engine(DATABASE_URL_MEDIA_STORE, connect_args={"check_same_thread": False})
+SessionLocalMediaStore = sessionmaker(autocommit=False, autoflush=False, bind=engine_media_store)
+
+BaseMediaStore = declarative_base()
+
+class MediaBlob(BaseMediaStore):
+    __tablename__ = "media_blobs"
+
+    sha256 = Column(String, primary_key=True)  # Хэш содержимого (имя файла в хранилище)
+    size = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MediaLink(BaseMediaStore):
+    __tablename__ = "media_links"
+
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, unique=True, index=True)  # Путь в uploads/ относительно BASE_DIR
+    sha256 = Column(String, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MediaProbe(BaseMediaStore):
+    """Результат ffprobe для версии файла (путь + размер + время изменения)"""
+    __tablename__ = "media_probes"
+
+    path = Column(String, primary_key=True)          # Абсолютный путь
+    size = Column(Integer)
+    mtime = Column(Integer)
+    probe = Column(Text)                              # JSON ffprobe (format + streams)
+    moov_first = Column(Boolean, nullable=True)       # MP4: индекс (moov) перед данными (faststart); None - не MP4
+    probed_at = Column(DateTime, default=datetime.utcnow)
+
+def get_db_media_store():
+    db = SessionLocalMediaStore()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def create_media_store_tables():
+    BaseMediaStore.metadata.create_all(bind=engine_media_store)
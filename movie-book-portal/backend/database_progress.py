@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -24,6 +24,39 @@ class PlaybackProgress(Base):
     user_id = Column(String, index=True, default="global") # Unique Device ID
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class EpisodeWatchState(Base):
+    """Просмотр эпизода пользователем: копия номера сезона/серии, чтобы не ходить в tvshows.db"""
+    __tablename__ = "episode_watch_state"
+    __table_args__ = (
+        UniqueConstraint("user_id", "episode_id", name="uq_episode_watch_user_episode"),
+        Index("ix_episode_watch_user_show", "user_id", "tvshow_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, default="global")
+    tvshow_id = Column(Integer)
+    episode_id = Column(Integer)
+    season_number = Column(Integer)
+    episode_number = Column(Integer)
+    position = Column(Float, default=0.0)  # Секунды
+    duration = Column(Float, nullable=True)
+    watched = Column(Boolean, default=False)  # Досмотрен (остаётся True при повторном просмотре)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ShowWatchState(Base):
+    """Сводка по сериалу для пользователя: последний эпизод и число просмотренных"""
+    __tablename__ = "show_watch_state"
+    __table_args__ = (UniqueConstraint("user_id", "tvshow_id", name="uq_show_watch_user_show"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, default="global")
+    tvshow_id = Column(Integer)
+    last_episode_id = Column(Integer, nullable=True)
+    last_season = Column(Integer, nullable=True)
+    last_episode = Column(Integer, nullable=True)
+    watched_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 def get_db_progress():
     db = SessionLocal()
     try:
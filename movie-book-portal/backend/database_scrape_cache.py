@@ -0,0 +1,41 @@
+# database_scrape_cache.py
+from sqlalchemy import create_engine, Column, Integer, String, Float, LargeBinary
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_URL_SCRAPE_CACHE = f"sqlite:///{os.path.join(BASE_DIR, 'scrape_cache.db')}"
+
+engine_scrape_cache = create_engine(DATABASE_URL_SCRAPE_CACHE, connect_args={"check_same_thread": False})
+SessionLocalScrapeCache = sessionmaker(autocommit=False, autoflush=False, bind=engine_scrape_cache)
+
+BaseScrapeCache = declarative_base()
+
+class ScrapeCacheEntry(BaseScrapeCache):
+    __tablename__ = "scrape_cache"
+
+    url = Column(String, primary_key=True)  # Нормализованный URL
+    policy = Column(String, index=True)     # browse / search / details / ...
+    status_code = Column(Integer, default=200)
+    content_type = Column(String, nullable=True)
+    encoding = Column(String, nullable=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    content = Column(LargeBinary)
+    size = Column(Integer, default=0)
+    fetched_at = Column(Float)             # Unix time of the last successful (re)validation
+    expires_at = Column(Float)             # Fresh until
+    stale_until = Column(Float)            # May be served stale (and revalidated) until
+    last_access = Column(Float, index=True)
+    hits = Column(Integer, default=0)
+
+def get_db_scrape_cache():
+    db = SessionLocalScrapeCache()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def create_scrape_cache_tables():
+    BaseScrapeCache.metadata.create_all(bind=engine_scrape_cache)
@@ -41,6 +41,7 @@ class Episode(BaseTvshows):
     title = Column(String, nullable=True)  # Название эпизода (опционально)
     file_path = Column(String, nullable=True)  # Путь к файлу эпизода
     description = Column(String, nullable=True)  # Описание эпизода
+    duration = Column(Float, nullable=True)  # Длительность в секундах (ffprobe при импорте)
 
     tvshow = relationship("Tvshow", back_populates="episodes")
 
@@ -55,6 +56,15 @@ def get_db_tvshows():
 
 def create_tvshows_tables():
     BaseTvshows.metadata.create_all(bind=engine_tvshows)
+    # Ensure columns exist (for existing databases)
+    with engine_tvshows.connect() as conn:
+        from sqlalchemy import text
+        try:
+            conn.execute(text("ALTER TABLE episodes ADD COLUMN duration FLOAT"))
+            conn.commit()
+            print("Migration: Added column duration to episodes table.")
+        except Exception:
+            pass
 
 
 def add_sample_tvshows_data():
@@ -2,16 +2,18 @@ import os
 import json
 import time
 import random
-import requests
 from datetime import datetime
-import urllib3
+from urllib.parse import urlparse
+from services import media_store, discovery_events, provider_health
+from services.http_client import http_client, backoff_delay, host_of, CircuitOpenError
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SETTINGS_FILE = os.path.join(BASE_DIR, "auto_discovery_settings.json")
 
-def log(message, log_file):
+def log(message, log_file, event="info"):
+    """Writes a line to the human-readable log and to the open discovery run"""
+    discovery_events.note(message, event)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     msg = f"[{timestamp}] {message}"
     print(msg)
@@ -44,54 +46,47 @@ def get_weighted_genre(genre_priorities, genre_mapping):
     return random.choices(genres, weights=weights, k=1)[0]
 
 def download_file(url, target_path, log_func, referer=None, retries=3):
-    """Download a file with retries and robustness"""
+    """
+    Download a file with retries and robustness (shared HTTP client handles transport retries).
+    Gives up at once while the host's circuit is open instead of sleeping through retries.
+    """
+    host = host_of(url)
     for attempt in range(retries):
+        if not provider_health.is_available(host):
+            log_func(f"Skipping download from {host}: host is failing, circuit open")
+            return False
         try:
             if attempt > 0:
-                time.sleep(random.uniform(2, 5))
+                time.sleep(backoff_delay(attempt))
             
             log_func(f"Downloading (Attempt {attempt+1}/{retries}) from {url}")
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Connection': 'keep-alive',
-            }
+            headers = {'Accept': '*/*'}
             if referer:
                 headers['Referer'] = referer
             else:
-                from urllib.parse import urlparse
                 parsed = urlparse(url)
                 headers['Referer'] = f"{parsed.scheme}://{parsed.netloc}/"
             
-            session = requests.Session()
-            session.trust_env = False
-            
-            verify_ssl = False
-            
-            response = session.get(url, stream=True, timeout=30, headers=headers, verify=verify_ssl, allow_redirects=True)
-            
-            if response.status_code == 403:
-                log_func(f"403 Forbidden on {url}. Site might be blocking automated downloads.")
-                if referer and attempt == 0:
-                    log_func("Retrying without referer...")
+            with http_client.get(url, stream=True, timeout=30, headers=headers, allow_redirects=True) as response:
+                if response.status_code == 403:
+                    log_func(f"403 Forbidden on {url}. Site might be blocking automated downloads.")
+                    if referer and attempt == 0:
+                        log_func("Retrying without referer...")
+                        referer = None
                     continue
-                if attempt == retries - 1: return False
-                continue
 
-            response.raise_for_status()
-            
-            with open(target_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=16384):
-                    if chunk:
-                        f.write(chunk)
+                response.raise_for_status()
+
+                # Hashed into the media store while streaming; identical files are hardlinked, not duplicated
+                stored = media_store.store_stream(response.iter_content(chunk_size=16384), target_path)
+            if stored.deduplicated:
+                log_func(f"Content already in library storage, linked {target_path} (sha256 {stored.sha256[:12]})")
             log_func(f"Successfully downloaded to {target_path}")
             return True
+        except CircuitOpenError as e:
+            log_func(f"Download from {url} skipped: {e}")
+            return False
         except Exception as e:
             log_func(f"Attempt {attempt+1} failed for {url}: {e}")
-            if "SSL" in str(e) or "EOF" in str(e):
-                 log_func("SSL error detected, will retry with different settings.")
-            if attempt == retries - 1:
-                return False
     return False
@@ -0,0 +1,275 @@
+"""
+Local stand-in for the qBittorrent Web API, for trying the torrent pipeline
+without a real client or real swarms.
+
+    python fake_qbittorrent.py [--port 8081] [--duration 20]   # serve
+    python fake_qbittorrent.py --selftest                      # download_torrent() against it
+
+Implements the endpoints the app uses (auth/login, app/version,
+torrents/add, sync/maindata with rid cursors, torrents/info, torrents/files,
+torrents/pause/stop, torrents/delete). An added torrent "downloads" in
+--duration seconds and then writes small placeholder files into its save
+path. Torrents whose name contains "stall" never receive data, names with
+"error" switch to the error state. .torrent files can be served from
+/files/<name>.torrent (generated on the fly), so the whole download path
+can be exercised.
+"""
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+VIDEO_SIZE = 4 * 1024 ** 3
+
+def bencode(value) -> bytes:
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(v) for v in value) + b"e"
+    if isinstance(value, dict):
+        items = sorted((k.encode() if isinstance(k, str) else k, v) for k, v in value.items())
+        return b"d" + b"".join(bencode(k) + bencode(v) for k, v in items) + b"e"
+    raise TypeError(type(value))
+
+def bdecode(data: bytes, i: int = 0):
+    """(value, index after it)"""
+    c = data[i:i + 1]
+    if c == b"i":
+        end = data.index(b"e", i)
+        return int(data[i + 1:end]), end + 1
+    if c == b"l":
+        items, i = [], i + 1
+        while data[i:i + 1] != b"e":
+            value, i = bdecode(data, i)
+            items.append(value)
+        return items, i + 1
+    if c == b"d":
+        items, i = {}, i + 1
+        while data[i:i + 1] != b"e":
+            key, i = bdecode(data, i)
+            items[key], i = bdecode(data, i)
+        return items, i + 1
+    colon = data.index(b":", i)
+    end = colon + 1 + int(data[i:colon])
+    return data[colon + 1:end], end
+
+def make_torrent(name: str):
+    """(.torrent bytes, info dict) of a two-file torrent: a film and its subtitles"""
+    info = {
+        "name": name,
+        "piece length": 4 * 1024 * 1024,
+        "pieces": hashlib.sha1(name.encode()).digest(),
+        "files": [
+            {"length": VIDEO_SIZE, "path": [f"{name}.mkv"]},
+            {"length": 80_000, "path": [f"{name}.srt"]},
+        ],
+    }
+    return bencode({"announce": "http://tracker.invalid/announce", "info": info}), info
+
+class FakeQbittorrent:
+    def __init__(self, duration: float):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.torrents = {}
+        self.rid = 0
+        self.snapshots = {}     # rid -> {hash: fields} as sent with that rid
+        self.sync_requests = 0
+
+    def add(self, data: bytes, save_path: str) -> bool:
+        from services.torrent_monitor import info_hash
+        torrent_hash = info_hash(data)
+        name = bdecode(data)[0][b"info"][b"name"].decode()
+        with self.lock:
+            if torrent_hash in self.torrents:
+                return False
+            self.torrents[torrent_hash] = {"name": name, "save_path": save_path, "added": time.monotonic(), "written": False}
+        return True
+
+    def fields(self, torrent_hash: str, t: dict) -> dict:
+        elapsed = time.monotonic() - t["added"]
+        if "stall" in t["name"]:
+            progress, dlspeed, state = 0.0, 0, "stalledDL"
+        elif "error" in t["name"] and elapsed > 1:
+            progress, dlspeed, state = 0.0, 0, "error"
+        else:
+            progress = min(1.0, round(elapsed / self.duration, 2))
+            dlspeed = 0 if progress >= 1 else int(VIDEO_SIZE / self.duration)
+            state = "uploading" if progress >= 1 else "downloading"
+        if progress >= 1 and not t["written"]:
+            os.makedirs(t["save_path"], exist_ok=True)
+            for ext in (".mkv", ".srt"):
+                with open(os.path.join(t["save_path"], t["name"] + ext), "wb") as f:
+                    f.write(b"\0" * 1024)
+            t["written"] = True
+        return {"hash": torrent_hash, "name": t["name"], "save_path": t["save_path"], "progress": progress,
+                "dlspeed": dlspeed, "upspeed": 0, "num_seeds": 0 if "stall" in t["name"] else 12, "state": state,
+                "size": VIDEO_SIZE}
+
+    def maindata(self, rid: int) -> dict:
+        with self.lock:
+            self.sync_requests += 1
+            current = {h: self.fields(h, t) for h, t in self.torrents.items()}
+            self.rid += 1
+            self.snapshots[self.rid] = current
+            for old in [r for r in self.snapshots if r < self.rid - 100]:
+                del self.snapshots[old]
+            previous = self.snapshots.get(rid)
+            if previous is None:
+                return {"rid": self.rid, "full_update": True, "torrents": current, "server_state": {}}
+            changed = {}
+            for h, fields in current.items():
+                diff = {k: v for k, v in fields.items() if previous.get(h, {}).get(k) != v}
+                if diff:
+                    changed[h] = diff
+            removed = [h for h in previous if h not in current]
+            response = {"rid": self.rid, "torrents": changed}
+            if removed:
+                response["torrents_removed"] = removed
+            return response
+
+def make_handler(fake: FakeQbittorrent):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, body, status=200, content_type="text/plain"):
+            if not isinstance(body, (bytes, str)):
+                body, content_type = json.dumps(body), "application/json"
+            data = body.encode() if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            if self.path.startswith("/api/v2/auth/login"):
+                self.send_header("Set-Cookie", "SID=fake; path=/")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _form(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+            content_type = self.headers.get("Content-Type", "")
+            fields, files = {}, []
+            if content_type.startswith("multipart/"):
+                message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                    b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + raw)
+                for part in message.iter_parts():
+                    if part.get_filename():
+                        files.append(part.get_payload(decode=True))
+                    else:
+                        fields[part.get_param("name", header="content-disposition")] = part.get_content().strip()
+            else:
+                fields = {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+            return fields, files
+
+        def do_GET(self):
+            self._route()
+
+        def do_POST(self):
+            self._route()
+
+        def _route(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            path = url.path
+            if path.startswith("/files/") and path.endswith(".torrent"):
+                data, _ = make_torrent(os.path.basename(path)[:-len(".torrent")])
+                return self._send(data, content_type="application/x-bittorrent")
+            if path == "/api/v2/auth/login":
+                return self._send("Ok.")
+            if path == "/api/v2/app/version":
+                return self._send("v4.6.5")
+            if path == "/api/v2/app/webapiVersion":
+                return self._send("2.9.3")
+            if path == "/api/v2/sync/maindata":
+                return self._send(fake.maindata(int(query.get("rid", 0))))
+            if path == "/api/v2/torrents/add":
+                fields, files = self._form()
+                save_path = fields.get("savepath") or os.getcwd()
+                added = [fake.add(data, save_path) for data in files]
+                return self._send("Ok." if added and all(added) else "Fails.")
+            if path == "/api/v2/torrents/info":
+                with fake.lock:
+                    return self._send([fake.fields(h, t) for h, t in fake.torrents.items()])
+            if path == "/api/v2/torrents/files":
+                torrent_hash = query.get("hash") or self._form()[0].get("hash")
+                t = fake.torrents.get(torrent_hash)
+                if not t:
+                    return self._send("Not Found", 404)
+                return self._send([{"name": t["name"] + ".mkv", "size": VIDEO_SIZE},
+                                   {"name": t["name"] + ".srt", "size": 80_000}])
+            if path in ("/api/v2/torrents/pause", "/api/v2/torrents/stop"):
+                self._form()
+                return self._send("")
+            if path == "/api/v2/torrents/delete":
+                hashes = self._form()[0].get("hashes", "")
+                with fake.lock:
+                    for h in hashes.split("|"):
+                        fake.torrents.pop(h, None)
+                return self._send("")
+            self._send("Not Found", 404)
+    return Handler
+
+def serve(port: int, duration: float):
+    fake = FakeQbittorrent(duration)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return fake, server
+
+def selftest(port: int):
+    """Five simultaneous downloads (3 good, 1 stalled, 1 failing) through download_torrent()"""
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from services.torrent_downloader import download_torrent
+
+    fake, server = serve(port, duration=6)
+    base = f"http://127.0.0.1:{port}"
+    names = ["film_a", "film_b", "film_c", "film_stall", "film_error"]
+    tmp = tempfile.mkdtemp(prefix="fake_qbt_")
+    started = time.monotonic()
+
+    def one(name):
+        return name, download_torrent(
+            f"{base}/files/{name}.torrent", os.path.join(tmp, name), timeout=60, stall_timeout=4,
+            qbt_host="127.0.0.1", qbt_port=port,
+        )
+
+    with ThreadPoolExecutor(len(names)) as pool:
+        results = dict(pool.map(one, names))
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    ok = True
+    for name, (video, torrent_hash) in results.items():
+        expected = not ("stall" in name or "error" in name)
+        passed = bool(video) == expected
+        ok &= passed
+        print(f"{'PASS' if passed else 'FAIL'} {name}: {video} {torrent_hash}")
+    print(f"{len(names)} torrents, {fake.sync_requests} sync/maindata requests, {elapsed:.1f} s")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds one torrent takes to complete")
+    parser.add_argument("--selftest", action="store_true")
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(selftest(args.port))
+    fake, server = serve(args.port, args.duration)
+    print(f"Fake qBittorrent on http://127.0.0.1:{args.port} (user/password: anything)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -12,29 +12,39 @@
 import os
 import sys
 import json
+import shutil
 import subprocess
 from pathlib import Path
 from typing import Optional, Dict
 from datetime import datetime
 
 # Импортируем наш конвертер
+from services import media_probe, media_store
 from services.video_converter import convert_to_mp4, get_video_info, log_message
 
 # Путь к папке с фильмами
 MOVIES_DIR = os.path.join(os.path.dirname(__file__), 'uploads', 'movies')
 LOG_FILE = os.path.join(os.path.dirname(__file__), 'logs', 'fix_movies.log')
 
+ISSUE_TEXT = {
+    'faststart': 'Индекс в конце файла, нужен faststart',
+    'remux': 'Нужна перепаковка контейнера',
+    'audio': 'Нужно перекодировать аудио в стерео AAC',
+    'full': 'Нужно перекодировать видео в H.264',
+}
+
 def ensure_log_dir():
     """Создать папку для логов если её нет"""
     os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
 
 def check_video_compatibility(video_path: str) -> Dict[str, any]:
     """
-    Проверить совместимость видео с браузером
+    Проверить совместимость видео с браузером (по плану media_probe)
     
     Returns:
         dict: {
             'compatible': bool,
+            'action': str - самый дешёвый способ исправления (none / faststart / remux / audio / full),
             'issues': list of str,
             'audio_channels': int,
             'video_codec': str,
@@ -42,66 +52,37 @@ def check_video_compatibility(video_path: str) -> Dict[str, any]:
         }
     """
     result = {
-        'compatible': True,
+        'compatible': False,
+        'action': None,
         'issues': [],
         'audio_channels': None,
         'video_codec': None,
         'audio_codec': None
     }
     
-    # Получаем информацию о видео
+    # Получаем информацию о видео (ffprobe один раз на версию файла, результат в кэше)
     info = get_video_info(video_path)
     
     if not info:
-        result['compatible'] = False
         result['issues'].append('Не удалось получить информацию о видео')
         return result
     
-    # Проверяем потоки
-    streams = info.get('streams', [])
-    
-    video_stream = None
-    audio_stream = None
-    
-    for stream in streams:
-        codec_type = stream.get('codec_type', '')
-        
-        if codec_type == 'video' and not video_stream:
-            video_stream = stream
-        elif codec_type == 'audio' and not audio_stream:
-            audio_stream = stream
+    plan = media_probe.plan(info)
+    result.update({
+        'compatible': plan.action == 'none',
+        'action': plan.action,
+        'audio_channels': plan.audio_channels,
+        'video_codec': plan.video_codec,
+        'audio_codec': plan.audio_codec,
+    })
     
-    # Проверка видео кодека
-    if video_stream:
-        video_codec = video_stream.get('codec_name', '')
-        result['video_codec'] = video_codec
-        
-        if video_codec not in ['h264', 'avc']:
-            result['compatible'] = False
-            result['issues'].append(f'Видео кодек {video_codec} не поддерживается, нужен H.264')
-    else:
+    if plan.video_index is None:
         result['compatible'] = False
         result['issues'].append('Видео поток не найден')
-    
-    # Проверка аудио кодека и каналов
-    if audio_stream:
-        audio_codec = audio_stream.get('codec_name', '')
-        result['audio_codec'] = audio_codec
-        
-        channels = audio_stream.get('channels', 0)
-        result['audio_channels'] = channels
-        
-        if audio_codec not in ['aac']:
-            result['compatible'] = False
-            result['issues'].append(f'Аудио кодек {audio_codec} не поддерживается, нужен AAC')
-        
-        # ГЛАВНАЯ ПРОВЕРКА: количество каналов
-        if channels != 2:
-            result['compatible'] = False
-            result['issues'].append(f'Аудио имеет {channels} каналов, нужно 2 (стерео) для браузера')
-    else:
+    if plan.audio_index is None:
         result['compatible'] = False
         result['issues'].append('Аудио поток не найден')
+    result['issues'] += [ISSUE_TEXT.get(plan.action, plan.action) + f" ({reason})" for reason in plan.reasons]
     
     return result
 
@@ -149,14 +130,15 @@ def fix_video(video_path: str, backup: bool = True) -> bool:
                 # Если backup уже существует, удаляем старый
                 os.remove(backup_path)
             
-            os.rename(video_path, backup_path)
+            # Жёсткая ссылка: оригинал остаётся под именем копии, пока путь заменяется
+            try:
+                os.link(video_path, backup_path)
+            except OSError:
+                shutil.copy2(video_path, backup_path)
             log_message(f"✅ Резервная копия создана", LOG_FILE)
-        else:
-            # Удаляем оригинал
-            os.remove(video_path)
         
-        # Переименовываем временный файл в оригинальное имя
-        os.rename(temp_path, video_path)
+        # Исправленный файл занимает место оригинала (атомарно, без записи в общий inode)
+        media_store.replace(temp_path, video_path)
         
         log_message(f"✅ Файл успешно исправлен: {os.path.basename(video_path)}", LOG_FILE)
         log_message(f"   Аудио каналов: {check_result['audio_channels']}", LOG_FILE)
@@ -167,13 +149,14 @@ def fix_video(video_path: str, backup: bool = True) -> bool:
         log_message(f"❌ Ошибка при исправлении файла: {e}", LOG_FILE)
         return False
 
-def scan_and_fix_movies(auto_fix: bool = False, backup: bool = False):
+def scan_and_fix_movies(auto_fix: bool = False, backup: bool = False, dry_run: bool = False):
     """
     Сканировать папку с фильмами и исправить проблемные
     
     Args:
         auto_fix: Автоматически исправлять без подтверждения
         backup: Создавать резервные копии
+        dry_run: Только отчёт - что понадобится каждому файлу, без исправления
     """
     ensure_log_dir()
     
@@ -221,7 +204,7 @@ def scan_and_fix_movies(auto_fix: bool = False, backup: bool = False):
             print(f"   ✅ OK - Каналов: {check_result['audio_channels']}")
             compatible += 1
         else:
-            log_message(f"⚠️  НЕСОВМЕСТИМ!", LOG_FILE)
+            log_message(f"⚠️  НЕСОВМЕСТИМ! Исправление: {check_result['action']}", LOG_FILE)
             for issue in check_result['issues']:
                 log_message(f"   - {issue}", LOG_FILE)
                 print(f"   ⚠️  {issue}")
@@ -230,6 +213,7 @@ def scan_and_fix_movies(auto_fix: bool = False, backup: bool = False):
             incompatible_files.append({
                 'path': video_path,
                 'filename': filename,
+                'action': check_result['action'],
                 'issues': check_result['issues']
             })
     
@@ -254,13 +238,23 @@ def scan_and_fix_movies(auto_fix: bool = False, backup: bool = False):
         print(f"\n⚠️  СПИСОК НЕСОВМЕСТИМЫХ ФАЙЛОВ:")
         
         for idx, file_info in enumerate(incompatible_files, 1):
-            log_message(f"{idx}. {file_info['filename']}", LOG_FILE)
-            print(f"{idx}. {file_info['filename']}")
+            log_message(f"{idx}. {file_info['filename']} [{file_info['action']}]", LOG_FILE)
+            print(f"{idx}. {file_info['filename']} [{file_info['action']}]")
             for issue in file_info['issues']:
                 log_message(f"   - {issue}", LOG_FILE)
         
+        actions = {}
+        for file_info in incompatible_files:
+            actions[file_info['action']] = actions.get(file_info['action'], 0) + 1
+        log_message(f"По способу исправления: {actions}", LOG_FILE)
+        print(f"\nПо способу исправления: {actions}")
+        
         # Исправление
-        if auto_fix:
+        if dry_run:
+            log_message("ℹ️  Пробный запуск (--dry-run): файлы не изменены", LOG_FILE)
+            print("Пробный запуск: файлы не изменены")
+            return
+        elif auto_fix:
             log_message("\n🔧 АВТОМАТИЧЕСКОЕ ИСПРАВЛЕНИЕ", LOG_FILE)
             print(f"\n🔧 Начинаем автоматическое исправление...\n")
         else:
@@ -304,10 +298,12 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description='Проверка и исправление видеофайлов фильмов')
     parser.add_argument('--auto-fix', action='store_true', help='Автоматически исправлять без подтверждения')
+    parser.add_argument('--dry-run', action='store_true', help='Только отчёт, без исправления')
     
     args = parser.parse_args()
     
     scan_and_fix_movies(
         auto_fix=args.auto_fix,
-        backup=False
+        backup=False,
+        dry_run=args.dry_run
     )
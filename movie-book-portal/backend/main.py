@@ -1,11 +1,10 @@
 # main.py - Entry point for the Media Portal
 import os
-import ipaddress
 import datetime
-from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.datastructures import Default
+from fastapi.responses import FileResponse, HTMLResponse
 
 from database import create_tables
 from database_books import create_books_tables
@@ -15,12 +14,20 @@ from database_gallery import create_gallery_tables
 from database_progress import create_progress_tables
 from database_kaleidoscope import create_kaleidoscope_tables
 from database_videogallery import create_videogallery_tables
+from database_media_store import create_media_store_tables
+from database_scrape_cache import create_scrape_cache_tables
+from database_catalog import create_catalog_tables
+from database_jobs import create_jobs_tables
+from database_library_scan import create_library_scan_tables
 from database import ChatMessage, SessionLocal
 
 from routers import movies, books, audiobooks, admin, gallery, videogallery, tvshows, kaleidoscopes, progress, dashboard, flibusta, audiobooks_source, discovery, system
 from routers import requests_router
+from responses import FastJSONResponse
+from middleware import CompressionMiddleware, PrecompressedStaticFiles, SecurityMiddleware, UploadsStaticFiles
 
-app = FastAPI(title="Медиа-портал: Фильмы и Книги")
+# Default(): ответы с response_model по-прежнему сериализует pydantic-core, остальные - orjson
+app = FastAPI(title="Медиа-портал: Фильмы и Книги", default_response_class=Default(FastJSONResponse))
 
 # CORS
 app.add_middleware(
@@ -31,106 +38,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Middleware для проверки доступа (безопасность портала)
-@app.middleware("http")
-async def security_middleware(request: Request, call_next):
-    # 1. Определение реального IP адреса
-    x_forwarded = request.headers.get("x-forwarded-for")
-    x_real_ip = request.headers.get("x-real-ip")
-    
-    if x_forwarded:
-        real_ip = x_forwarded.split(",")[0].strip()
-    elif x_real_ip:
-        real_ip = x_real_ip.strip()
-    else:
-        real_ip = request.client.host if request.client else "127.0.0.1"
-        
-    # 2. Проверка: является ли подключение локальным (домашняя сеть)
-    is_local = False
-    if real_ip in ("127.0.0.1", "localhost", "::1"):
-        is_local = True
-    else:
-        try:
-            ip_obj = ipaddress.ip_address(real_ip)
-            # is_private покрывает 10.0.0.0/8, 172.16.0.0/12, 192.168.0.0/16
-            is_local = ip_obj.is_private or ip_obj.is_loopback
-        except ValueError:
-            pass
-            
-    # 3. Проверка: является ли подключение из нашего приложения
-    user_agent = request.headers.get("user-agent", "").lower()
-    # Рекомендуется использовать поиск в нижнем регистре для надежности
-    is_app_by_ua = "xwv2-app-identifier" in user_agent
-    # Также проверяем кастомный заголовок или куки (на случай, если WebView обрежет User-Agent в XHR/Fetch)
-    is_app_by_header = request.headers.get("X-App-Identifier") == "true" or request.headers.get("X-User-Id") is not None
-    is_app_by_cookie = "xwv2-app-identifier" in request.cookies.get("app_id", "").lower()
-    
-    # Дополнительно разрешаем стандартный UA Dalvik, который используется native-частью Android-приложения при загрузке
-    is_app_by_dalvik = "dalvik" in user_agent
-    
-    is_app = is_app_by_ua or is_app_by_header or is_app_by_cookie or is_app_by_dalvik
+# Сжатие JSON/HTML (gzip, brotli если установлен), медиа не трогаются
+app.add_middleware(CompressionMiddleware)
 
-    # 4. Правила блокировки
-    # Логируем для отладки, если запрос идет не из локальной сети
-    if not is_local:
-        print(f"External access attempt: IP={real_ip}, App={is_app}, UA={user_agent}")
-
-    # Правило: Если запрос НЕ из локальной сети И это НЕ приложение -> Блокируем ВСЁ.
-    if not is_local and not is_app:
-        # Для API-запросов возвращаем JSON-ошибку
-        if request.url.path.startswith("/api"):
-            return JSONResponse(
-                status_code=403,
-                content={"detail": "Access Denied. Only authorized app connections allowed outside local network."}
-            )
-        # Для загрузок и фронтенда тоже блокируем
-        return HTMLResponse(
-            status_code=403,
-            content=f"""
-        <div style="font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; text-align: center; margin-top: 100px; padding: 20px;">
-            <h1 style="color: #e50914; font-size: 3em;">Вход заблокирован</h1>
-            <p style="font-size: 1.2em; color: #333;">Этот сервер — частная территория.</p>
-            <div style="background: #f8f8f8; border: 1px solid #ddd; padding: 20px; border-radius: 8px; max-width: 500px; margin: 30px auto; text-align: left;">
-                <p>Для доступа необходимо выполнить одно из условий:</p>
-                <ul style="line-height: 1.6;">
-                    <li>Находиться в <b>локальной домашней сети</b>.</li>
-                    <li>Использовать <b>официальное приложение xWV2</b>.</li>
-                </ul>
-            </div>
-            <p style="color: #999; font-size: 0.9em;">Ваш IP: {real_ip}</p>
-            <script>
-                if (window.AndroidApp && window.AndroidApp.hideLoadingScreen) {{
-                    window.AndroidApp.hideLoadingScreen();
-                }}
-            </script>
-        </div>
-        """
-        )
-            
-    # 5. Выполняем запрос
-    response = await call_next(request)
-    
-    # 6. Если запрос прошел успешно и это приложение, устанавливаем куку для медиа (thumbnails и т.д.)
-    if is_app:
-        # Устанавливаем куку на год. Это критично для загрузки изображений в <img> тегах
-        response.set_cookie(
-            key="app_id", 
-            value="xWV2-App-Identifier", 
-            max_age=31536000, 
-            httponly=True, 
-            samesite="lax",
-            path="/"
-        )
-        
-    # 7. Add Cache-Control headers for static assets to improve offline WebView reliability
-    if request.url.path.startswith("/assets/"):
-        # Vite assets are hashed, so cache them for a year
-        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
-    elif request.url.path == "/" or request.url.path == "/index.html":
-        # index.html should revalidate to fetch new HTML, but can be cached for offline fallback
-        response.headers["Cache-Control"] = "no-cache"
-    
-    return response
+# Проверка доступа (только домашняя сеть или приложение), чистый ASGI - тело ответа не оборачивается
+app.add_middleware(SecurityMiddleware)
 
 # Пути
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -150,8 +62,10 @@ os.makedirs(os.path.join(UPLOADS_PATH, "kaleidoscopes_music"), exist_ok=True)
 
 # Mount static files only if dist directory exists (production mode)
 if os.path.exists(FRONTEND_PATH):
-    app.mount("/assets", StaticFiles(directory=os.path.join(FRONTEND_PATH, "assets")), name="assets")
-app.mount("/uploads", StaticFiles(directory=UPLOADS_PATH), name="uploads")
+    # .br/.gz рядом с файлами создаются при сборке (npm run build)
+    app.mount("/assets", PrecompressedStaticFiles(directory=os.path.join(FRONTEND_PATH, "assets")), name="assets")
+# Миниатюры отдаются как неизменяемые (ETag по содержимому), остальное - как обычно
+app.mount("/uploads", UploadsStaticFiles(directory=UPLOADS_PATH), name="uploads")
 
 # Добавляем маршрут для favicon.ico
 @app.get("/favicon.ico", include_in_schema=False)
@@ -171,6 +85,11 @@ create_gallery_tables()
 create_videogallery_tables()
 create_progress_tables()
 create_kaleidoscope_tables()
+create_media_store_tables()
+create_scrape_cache_tables()
+create_catalog_tables()
+create_jobs_tables()
+create_library_scan_tables()
 
 # Подключение роутеров
 app.include_router(movies.router, prefix="/api")
@@ -190,6 +109,16 @@ app.include_router(discovery.router, prefix="/api/discovery")
 app.include_router(system.router, prefix="/api")
 app.include_router(requests_router.router, prefix="/api")
 
+@app.on_event("startup")
+def start_background_workers():
+    # Low-priority crawler that keeps the discovery genre catalog warm
+    from services import catalog_warmer, scheduler, discovery_jobs, library_scan
+    catalog_warmer.start()
+    # Discovery cycles, the OPDS mirror sync and library scans run as persistent scheduler jobs
+    discovery_jobs.register()
+    library_scan.register()
+    scheduler.start()
+
 # --- WebSocket: Онлайн-счётчик ---
 import builtins
 import json
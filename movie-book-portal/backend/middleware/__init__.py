@@ -0,0 +1,4 @@
+"""Pure ASGI middleware of the portal (they never buffer or re-wrap response bodies)"""
+from .compression import CompressionMiddleware, PrecompressedStaticFiles
+from .security import SecurityMiddleware
+from .uploads import UploadsStaticFiles
@@ -0,0 +1,218 @@
+"""
+Response compression: gzip, or brotli when the optional Brotli package is
+installed and the client accepts it.
+
+CompressionMiddleware compresses text-like responses (JSON, HTML, JS, CSS,
+SVG...) as their body messages go out: a single-message response below
+MINIMUM_SIZE is sent as is, larger ones are compressed in one go and
+streamed ones (more_body) chunk by chunk with a flush after each chunk, so
+nothing is buffered. Media (video, audio, images, archives, EPUB/PDF),
+ranges and responses that already carry a Content-Encoding pass through
+untouched. A strong ETag of a compressed response is made weak: the bytes
+differ from the identity representation it was computed for.
+
+PrecompressedStaticFiles serves the .br / .gz sidecars written next to the
+Vite assets at build time (frontend-react/scripts/precompress.mjs) instead
+of the plain file when the client accepts them, so the bundles are not
+compressed again on every request.
+"""
+import stat
+import zlib
+from typing import Optional
+
+import anyio
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4   # On-the-fly: close to gzip -6 in speed, smaller output
+
+# Compressed on the fly; everything else (video/*, audio/*, image/* except SVG,
+# application/zip, epub, pdf...) is already compressed or not worth it
+COMPRESSIBLE_TYPES = {
+    b"application/json", b"application/javascript", b"application/xml", b"application/manifest+json",
+    b"application/rss+xml", b"image/svg+xml",
+}
+SKIP_STATUSES = {204, 206, 304}
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings the client accepts (q=0 excluded) from an Accept-Encoding value"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                pass
+        if coding.strip() and q > 0:
+            accepted.add(coding.strip())
+    return accepted
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    if BROTLI_AVAILABLE and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def is_compressible(content_type: bytes) -> bool:
+    media_type = content_type.split(b";")[0].strip().lower()
+    return media_type.startswith(b"text/") or media_type in COMPRESSIBLE_TYPES
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._br = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compresses data and flushes it, so the client can decode what it got so far"""
+        if self._br is not None:
+            return self._br.process(data) + self._br.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._br is not None:
+            return self._br.process(data) + self._br.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+def weak_etag(value: bytes) -> bytes:
+    """W/"..." form of an ETag (already weak ones are returned as they are)"""
+    return value if value.startswith(b"W/") else b"W/" + value
+
+def _add_vary(headers: list) -> list:
+    for i, (key, value) in enumerate(headers):
+        if key.lower() == b"vary":
+            if b"accept-encoding" not in value.lower() and value.strip() != b"*":
+                headers[i] = (key, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+class CompressionMiddleware:
+    """
+    Content-negotiated gzip / brotli for text responses above minimum_size.
+    WebSocket and lifespan traffic passes through unchanged.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = None
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None          # Held back until the first body message decides
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = b""
+                for key, value in headers:
+                    key = key.lower()
+                    if key == b"content-encoding":
+                        passthrough = True
+                    elif key == b"content-type":
+                        content_type = value
+                if passthrough or message["status"] in SKIP_STATUSES or not is_compressible(content_type):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend: the server sends the file itself, uncompressed
+                passthrough = True
+                if start is not None:
+                    await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if start is None:
+                    await send(message)
+                    return
+                if not more_body and len(body) < self.minimum_size:
+                    # Small response: not worth the CPU and the headers
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = [(k, weak_etag(v) if k.lower() == b"etag" else v)
+                           for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more_body:
+                    body = compressor.finish(body)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                await send({**start, "headers": _add_vary(headers)})
+                if not more_body:
+                    await send({"type": "http.response.body", "body": body})
+                    return
+            if more_body:
+                await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.finish(body)})
+
+        await self.app(scope, receive, send_compressed)
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that answers with file.br / file.gz (built next to file) when
+    the client accepts the encoding; the plain file is served otherwise.
+    """
+
+    SIDECARS = (("br", ".br"), ("gzip", ".gz"))
+
+    async def get_response(self, path: str, scope):
+        accepted = set()
+        for key, value in scope["headers"]:
+            if key == b"range":
+                # Byte ranges refer to the plain file
+                accepted = set()
+                break
+            if key == b"accept-encoding":
+                accepted = accepted_encodings(value.decode("latin-1"))
+        for encoding, suffix in self.SIDECARS:
+            if encoding not in accepted or scope["method"] not in ("GET", "HEAD"):
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            # FileResponse takes the type from "app.js" in "app.js.br"; ETag and size are the sidecar's
+            response = self.file_response(full_path, stat_result, scope)
+            response.headers["content-encoding"] = encoding
+            response.headers["vary"] = "Accept-Encoding"
+            return response
+        response = await super().get_response(path, scope)
+        response.headers.setdefault("vary", "Accept-Encoding")
+        return response
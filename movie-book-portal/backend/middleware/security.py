@@ -0,0 +1,147 @@
+"""
+Access control of the portal: only the home network or the xWV2 app.
+
+A pure ASGI middleware: requests are checked from the raw scope headers and
+allowed responses only get their start message amended (app cookie,
+Cache-Control for the frontend), the body messages are passed through as
+they come. Long video streams are therefore not wrapped in the task and
+queue machinery of BaseHTTPMiddleware.
+
+Whether an address is local and whether a user agent is the app's is
+cached per (IP, user agent) pair in a small LRU; classify() is a pure
+function, blocked requests are logged by the middleware itself.
+"""
+from functools import lru_cache
+import ipaddress
+import logging
+from typing import Tuple
+
+from starlette.requests import cookie_parser
+from starlette.responses import HTMLResponse, JSONResponse
+
+logger = logging.getLogger(__name__)
+
+CLASSIFY_CACHE_SIZE = 1024
+APP_COOKIE = b"app_id=xWV2-App-Identifier; HttpOnly; Max-Age=31536000; Path=/; SameSite=lax"
+
+BLOCKED_HTML = """
+        <div style="font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; text-align: center; margin-top: 100px; padding: 20px;">
+            <h1 style="color: #e50914; font-size: 3em;">Вход заблокирован</h1>
+            <p style="font-size: 1.2em; color: #333;">Этот сервер — частная территория.</p>
+            <div style="background: #f8f8f8; border: 1px solid #ddd; padding: 20px; border-radius: 8px; max-width: 500px; margin: 30px auto; text-align: left;">
+                <p>Для доступа необходимо выполнить одно из условий:</p>
+                <ul style="line-height: 1.6;">
+                    <li>Находиться в <b>локальной домашней сети</b>.</li>
+                    <li>Использовать <b>официальное приложение xWV2</b>.</li>
+                </ul>
+            </div>
+            <p style="color: #999; font-size: 0.9em;">Ваш IP: {ip}</p>
+            <script>
+                if (window.AndroidApp && window.AndroidApp.hideLoadingScreen) {{
+                    window.AndroidApp.hideLoadingScreen();
+                }}
+            </script>
+        </div>
+        """
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def classify(real_ip: str, user_agent: str) -> Tuple[bool, bool]:
+    """
+    (is_local, is_app_by_user_agent) for a client. user_agent is lower-cased.
+    """
+    # Проверка: является ли подключение локальным (домашняя сеть)
+    is_local = False
+    if real_ip in ("127.0.0.1", "localhost", "::1"):
+        is_local = True
+    else:
+        try:
+            ip_obj = ipaddress.ip_address(real_ip)
+            # is_private покрывает 10.0.0.0/8, 172.16.0.0/12, 192.168.0.0/16
+            is_local = ip_obj.is_private or ip_obj.is_loopback
+        except ValueError:
+            pass
+
+    # UA приложения; Dalvik - стандартный UA native-части Android-приложения при загрузке
+    is_app = "xwv2-app-identifier" in user_agent or "dalvik" in user_agent
+    return is_local, is_app
+
+def _real_ip(headers: dict, scope) -> str:
+    x_forwarded = headers.get(b"x-forwarded-for")
+    if x_forwarded:
+        return x_forwarded.decode("latin-1").split(",")[0].strip()
+    x_real_ip = headers.get(b"x-real-ip")
+    if x_real_ip:
+        return x_real_ip.decode("latin-1").strip()
+    client = scope.get("client")
+    return client[0] if client else "127.0.0.1"
+
+def _app_cookie(headers: dict) -> bool:
+    raw = headers.get(b"cookie")
+    if not raw or b"app_id" not in raw:
+        return False
+    # Lenient like Request.cookies: a malformed cookie elsewhere in the header must not hide app_id
+    value = cookie_parser(raw.decode("latin-1")).get("app_id", "")
+    return "xwv2-app-identifier" in value.lower()
+
+def _cache_control(path: str):
+    if path.startswith("/assets/"):
+        # Vite assets are hashed, so cache them for a year
+        return b"public, max-age=31536000, immutable"
+    if path == "/" or path == "/index.html":
+        # index.html should revalidate to fetch new HTML, but can be cached for offline fallback
+        return b"no-cache"
+    return None
+
+class SecurityMiddleware:
+    """
+    Blocks clients that are neither in the local network nor the app, marks
+    app clients with a cookie (needed for <img> loads from the WebView) and
+    sets Cache-Control for the frontend files. WebSocket and lifespan
+    traffic passes through unchanged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        real_ip = _real_ip(headers, scope)
+        user_agent = headers.get(b"user-agent", b"").decode("latin-1").lower()
+        is_local, is_app = classify(real_ip, user_agent)
+        # Кастомный заголовок или кука (на случай, если WebView обрежет User-Agent в XHR/Fetch)
+        is_app = (is_app or headers.get(b"x-app-identifier") == b"true" or b"x-user-id" in headers
+                  or _app_cookie(headers))
+
+        path = scope["path"]
+        if not is_local and not is_app:
+            logger.warning("Blocked external access: IP=%s, path=%s, UA=%s", real_ip, path, user_agent)
+            if path.startswith("/api"):
+                response = JSONResponse(
+                    status_code=403,
+                    content={"detail": "Access Denied. Only authorized app connections allowed outside local network."},
+                )
+            else:
+                response = HTMLResponse(status_code=403, content=BLOCKED_HTML.format(ip=real_ip))
+            return await response(scope, receive, send)
+
+        cache_control = _cache_control(path)
+        if not is_app and cache_control is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                extra = []
+                if is_app:
+                    # Кука на год: критично для загрузки изображений в <img> тегах
+                    extra.append((b"set-cookie", APP_COOKIE))
+                response_headers = message.get("headers", [])
+                if cache_control is not None:
+                    response_headers = [(k, v) for k, v in response_headers if k.lower() != b"cache-control"]
+                    extra.append((b"cache-control", cache_control))
+                message = {**message, "headers": list(response_headers) + extra}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
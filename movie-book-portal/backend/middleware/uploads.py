@@ -0,0 +1,69 @@
+"""
+Static files of /uploads with content ETags for thumbnails.
+
+Thumbnails (<name>_thumb.*, thumb_<id>.*, files in a thumbnails/ folder) get
+a strong ETag computed from their content (cached per path, size and mtime),
+so a revalidation is a 304 whenever the image did not change.
+
+Only versioned names are cached as immutable for a year: catalog covers
+uploaded as {id}_thumb_{uuid8}.* or thumb_{id}_{uuid8}.* get a new name for
+every new cover. Other thumbnail names are reused (gallery <name>_thumb.webp
+is rewritten by filters and re-uploads, video gallery thumbnails/<md5>.jpg
+follows the file path), so they are served with no-cache: the WebView keeps
+them but revalidates before use. Every other file keeps the StaticFiles
+defaults.
+"""
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"}
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REUSED_THUMBNAIL_CACHE_CONTROL = "no-cache"
+VERSIONED_THUMBNAIL = re.compile(r"^(\d+_thumb_[0-9a-f]{8}|thumb_\d+_[0-9a-f]{8})$")
+CATALOG_FOLDERS = {"movies", "books", "tvshows", "audiobooks"}   # Not the galleries: users name those files
+ETAG_CACHE_SIZE = 4096
+
+def is_thumbnail(path: str) -> bool:
+    name = os.path.basename(path).lower()
+    stem, ext = os.path.splitext(name)
+    if ext not in IMAGE_EXTENSIONS:
+        return False
+    return ("_thumb" in stem or stem.startswith("thumb_")
+            or os.path.basename(os.path.dirname(path)).lower() == "thumbnails")
+
+def is_versioned_thumbnail(rel_path: str) -> bool:
+    """A catalog thumbnail (path relative to uploads/) whose name changes whenever its content does"""
+    parts = os.path.normpath(rel_path).lower().split(os.sep)
+    stem = os.path.splitext(parts[-1])[0]
+    return len(parts) > 1 and parts[0] in CATALOG_FOLDERS and bool(VERSIONED_THUMBNAIL.match(stem))
+
+@lru_cache(maxsize=ETAG_CACHE_SIZE)
+def content_etag(path: str, size: int, mtime_ns: int) -> str:
+    """Strong ETag from the file content; size and mtime only key the cache"""
+    digest = hashlib.sha1(usedforsecurity=False)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:24]}"'
+
+class UploadsStaticFiles(StaticFiles):
+    """StaticFiles with content ETags for thumbnails, immutable for versioned ones"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        if not is_thumbnail(str(full_path)):
+            return super().file_response(full_path, stat_result, scope, status_code)
+        rel_path = os.path.relpath(full_path, os.path.realpath(self.directory))
+        headers = {
+            "etag": content_etag(str(full_path), stat_result.st_size, stat_result.st_mtime_ns),
+            "cache-control": THUMBNAIL_CACHE_CONTROL if is_versioned_thumbnail(rel_path) else REUSED_THUMBNAIL_CACHE_CONTROL,
+        }
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
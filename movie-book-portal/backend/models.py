@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from datetime import datetime
 from typing import Optional
 
+from pydantic import BaseModel
+
 class MovieCreate(BaseModel):
     title: str
     year: Optional[int] = None
@@ -41,6 +43,12 @@ class EpisodeCreate(BaseModel):
         "populate_by_name": True,
     }
 
+class TvshowImportRequest(BaseModel):
+    path: str                             # Server-side folder inside TV_IMPORT_ROOTS
+    default_season: Optional[int] = None  # For files whose name and folders do not tell
+    overwrite: bool = False
+    dry_run: bool = False
+
 class BookCreate(BaseModel):
     title: str
     year: Optional[int] = None
@@ -101,3 +109,90 @@ class KaleidoscopeCreate(BaseModel):
         "extra": "ignore",
         "populate_by_name": True,
     }
+
+
+# Ответы API каталога: только публичные поля, сериализация через pydantic-core
+# (FastAPI пишет JSON сразу в байты, без jsonable_encoder по ORM-объектам)
+
+class MovieResponse(BaseModel):
+    id: int
+    title: Optional[str] = None
+    year: Optional[int] = None
+    director: Optional[str] = None
+    genre: Optional[str] = None
+    rating: Optional[float] = None
+    description: Optional[str] = None
+    file_path: Optional[str] = None
+    thumbnail_path: Optional[str] = None
+
+    model_config = {"from_attributes": True}
+
+class BookResponse(BaseModel):
+    id: int
+    title: Optional[str] = None
+    author: Optional[str] = None
+    year: Optional[int] = None
+    genre: Optional[str] = None
+    rating: Optional[float] = None
+    description: Optional[str] = None
+    file_path: Optional[str] = None
+    thumbnail_path: Optional[str] = None
+    total_pages: Optional[int] = None
+    series: Optional[str] = None
+    series_index: Optional[int] = None
+
+    model_config = {"from_attributes": True}
+
+class AudiobookResponse(BaseModel):
+    id: int
+    title: Optional[str] = None
+    author: Optional[str] = None
+    narrator: Optional[str] = None
+    year: Optional[int] = None
+    genre: Optional[str] = None
+    rating: Optional[float] = None
+    description: Optional[str] = None
+    file_path: Optional[str] = None
+    thumbnail_path: Optional[str] = None
+    duration: Optional[int] = None
+    series: Optional[str] = None
+    series_index: Optional[int] = None
+
+    model_config = {"from_attributes": True}
+
+class TvshowResponse(BaseModel):
+    id: int
+    title: Optional[str] = None
+    year: Optional[int] = None
+    director: Optional[str] = None
+    genre: Optional[str] = None
+    rating: Optional[float] = None
+    description: Optional[str] = None
+    file_path: Optional[str] = None
+    thumbnail_path: Optional[str] = None
+    episodes_count: Optional[int] = None
+    season_count: Optional[int] = None
+
+    model_config = {"from_attributes": True}
+
+class EpisodeResponse(BaseModel):
+    id: int
+    tvshow_id: int
+    season_number: int
+    episode_number: int
+    title: Optional[str] = None
+    file_path: Optional[str] = None
+    description: Optional[str] = None
+    duration: Optional[float] = None
+
+    model_config = {"from_attributes": True}
+
+class KaleidoscopeResponse(BaseModel):
+    id: int
+    title: Optional[str] = None
+    description: Optional[str] = None
+    music_path: Optional[str] = None
+    cover_path: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
@@ -15,14 +15,16 @@ from sqlalchemy.orm import Session
 from database import Movie, SessionLocal
 from services.kinorush_service import search_films_page, get_movie_details, filter_by_size
 from services.torrent_downloader import download_torrent, check_qbittorrent_connection
-from services.video_converter import convert_to_mp4, check_ffmpeg_available
+from services.video_converter import check_ffmpeg_available
+from services import library_index, discovery_events, media_ingest
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SETTINGS_FILE = os.path.join(BASE_DIR, "movie_discovery_settings.json")
 LOG_FILE = os.path.join(BASE_DIR, "movie_discovery.log")
 
-def log(message):
-    """Log message to file and console"""
+def log(message, event="info"):
+    """Log message to file and console (and to the open discovery run)"""
+    discovery_events.note(message, event)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     msg = f"[{timestamp}] {message}"
     print(msg)
@@ -53,32 +55,25 @@ def load_settings():
 
 def download_file(url, target_path, referer=None, retries=3):
     """Download a file with retries"""
-    import requests
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    from services.http_client import http_client, backoff_delay
     
     for attempt in range(retries):
         try:
             if attempt > 0:
-                time.sleep(random.uniform(2, 5))
+                time.sleep(backoff_delay(attempt))
             
             log(f"Downloading (Attempt {attempt+1}/{retries}) from {url}")
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-            }
+            headers = {'Accept': '*/*'}
             if referer:
                 headers['Referer'] = referer
             
-            response = requests.get(url, stream=True, timeout=30, headers=headers, verify=False, allow_redirects=True)
-            response.raise_for_status()
-            
-            with open(target_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=16384):
-                    if chunk:
-                        f.write(chunk)
+            with http_client.get(url, stream=True, timeout=30, headers=headers, allow_redirects=True) as response:
+                response.raise_for_status()
+                with open(target_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=16384):
+                        if chunk:
+                            f.write(chunk)
             log(f"Successfully downloaded to {target_path}")
             return True
         except Exception as e:
@@ -88,7 +83,7 @@ def download_file(url, target_path, referer=None, retries=3):
     return False
 
 def process_movie():
-    """Process one movie discovery cycle"""
+    """Process one movie discovery cycle. Returns the added title, or False."""
     settings = load_settings()
     
     if not settings.get("enabled", True):
@@ -97,7 +92,7 @@ def process_movie():
     
     # Check FFmpeg
     if not check_ffmpeg_available():
-        log("ERROR: FFmpeg is not available. Please install FFmpeg.")
+        log("ERROR: FFmpeg is not available. Please install FFmpeg.", "error")
         log("Download from: https://www.gyan.dev/ffmpeg/builds/")
         return False
     
@@ -110,7 +105,7 @@ def process_movie():
     }
     
     if not check_qbittorrent_connection(**qbt_params):
-        log("ERROR: qBittorrent is not running or not accessible.")
+        log("ERROR: qBittorrent is not running or not accessible.", "error")
         log("Please start qBittorrent and enable Web UI (Tools → Options → Web UI)")
         log("Web UI should be accessible at: http://localhost:8080")
         return False
@@ -138,6 +133,11 @@ def process_movie():
         
         for movie_info in movies:
             try:
+                # Screen against the library before fetching the details page
+                if library_index.find_duplicate("movies", movie_info.title, year=movie_info.year):
+                    log(f"Skipping {movie_info.title}: already in the library")
+                    continue
+                
                 # Get full details
                 log(f"Checking: {movie_info.title}")
                 details = get_movie_details(movie_info.url)
@@ -162,11 +162,8 @@ def process_movie():
                     log(f"  ❌ No torrents >= {min_file_size_gb}GB, skipping")
                     continue
                 
-                # Check for duplicates
-                existing = db.query(Movie).filter(
-                    Movie.title == details.title,
-                    Movie.year == details.year
-                ).first()
+                # Check for duplicates (the details page may spell the title differently)
+                existing = library_index.find_duplicate("movies", details.title, year=details.year)
                 
                 if existing:
                     log(f"  ❌ Already exists in database, skipping")
@@ -187,6 +184,7 @@ def process_movie():
                 db.add(new_movie)
                 db.commit()
                 db.refresh(new_movie)
+                library_index.register("movies", new_movie.id, new_movie.title, year=new_movie.year)
                 
                 movie_id = new_movie.id
                 MOVIE_UPLOADS = os.path.join(BASE_DIR, "uploads", "movies")
@@ -229,30 +227,47 @@ def process_movie():
                 if video_file and os.path.exists(video_file):
                     log(f"  ✅ Torrent download complete")
                     
-                    # Convert to MP4
+                    # Probe, convert and register in the shared ingest pipeline
                     output_filename = f"{movie_id}_{details.title[:50].replace(' ', '_').replace('/', '_')}.mp4"
                     output_path = os.path.join(MOVIE_UPLOADS, output_filename)
+                    db.commit()
                     
-                    log(f"  🎬 Converting to MP4...")
-                    
-                    if convert_to_mp4(video_file, output_path, delete_source=False, log_file=LOG_FILE):
-                        new_movie.file_path = os.path.relpath(output_path, BASE_DIR).replace(os.sep, '/')
-                        log(f"  ✅ Conversion successful!")
-                        
+                    def register(path, movie_id=movie_id, torrent_hash=torrent_hash):
+                        reg_db = SessionLocal()
+                        try:
+                            reg_db.query(Movie).filter(Movie.id == movie_id).update(
+                                {"file_path": os.path.relpath(path, BASE_DIR).replace(os.sep, '/')})
+                            reg_db.commit()
+                        finally:
+                            reg_db.close()
                         # Remove torrent from qBittorrent
                         if torrent_hash:
                             from services.torrent_downloader import remove_torrent
                             log(f"  🧹 Cleaning up torrent...")
                             remove_torrent(torrent_hash, log_file=LOG_FILE, **qbt_params)
-                        
+                    
+                    stages_seen = set()
+                    def on_stage(stage, pct):
+                        if stage not in stages_seen:
+                            stages_seen.add(stage)
+                            log(f"  🎬 Ingest stage: {stage}")
+                    
+                    item = media_ingest.submit(media_ingest.IngestItem(
+                        title=details.title, source_path=video_file, output_path=output_path,
+                        register=register, on_stage=on_stage, log_file=LOG_FILE,
+                    ))
+                    # A discovery cycle reports its outcome, so it waits for the pipeline
+                    if item.future.result():
+                        db.refresh(new_movie)
+                        log(f"  ✅ Conversion successful! (plan: {item.plan})")
                         log(f"")
                         log(f"🎉 Successfully added movie: {details.title} ({details.year})")
                         log(f"")
                         
                         db.commit()
-                        return True  # Success!
+                        return details.title  # Success!
                     else:
-                        log(f"  ❌ Failed to convert video")
+                        log(f"  ❌ Failed to convert video: {item.error}")
                 else:
                     log(f"  ❌ Failed to download torrent")
                 
@@ -260,6 +275,7 @@ def process_movie():
                 log(f"Failed to download/convert. Rolling back...")
                 db.delete(new_movie)
                 db.commit()
+                library_index.unregister("movies", new_movie.id)
                 
                 # Cleanup temp files
                 if thumb_success and new_movie.thumbnail_path:
@@ -272,7 +288,7 @@ def process_movie():
                 continue
                 
             except Exception as e:
-                log(f"Error processing movie {movie_info.url}: {e}")
+                log(f"Error processing movie {movie_info.url}: {e}", "error")
                 continue
         
         # If we get here, no suitable movie was found/added
@@ -280,11 +296,12 @@ def process_movie():
         return False
         
     except Exception as e:
-        log(f"Error in movie processing: {e}")
+        log(f"Error in movie processing: {e}", "error")
         if new_movie:
             try:
                 db.delete(new_movie)
                 db.commit()
+                library_index.unregister("movies", new_movie.id)
             except:
                 pass
         return False
@@ -310,76 +327,24 @@ def process_movie():
                     else:
                         log(f"Warning: Could not remove temp directory after 3 attempts: {e}")
 
-def main_loop():
-    """Main discovery loop"""
-    log("="*60)
-    log("Movie Auto-Discovery started")
-    log("="*60)
-    
-    # Track last run times
-    last_run = 0
-    
-    # Load initial settings to log
-    settings = load_settings()
-    log(f"Settings loaded:")
-    log(f"  Interval: {settings.get('interval_minutes', 720)} minutes")
-    
-    while True:
-        try:
-            settings = load_settings()
-            
-            if not settings.get("enabled", True):
-                log("Movie discovery is disabled. Sleeping for 10 minutes...")
-                time.sleep(600)
-                continue
-            
-            current_time = time.time()
-            interval_seconds = settings.get("interval_minutes", 720) * 60
-            
-            # Check for forced run
-            force_run = settings.get("force_run", False)
-            
-            if force_run or (current_time - last_run >= interval_seconds):
-                if force_run:
-                    log("⚠️ Force run triggered!")
-                    # Reset flag
-                    try:
-                        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-                            data = json.load(f)
-                        data["force_run"] = False
-                        with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-                            json.dump(data, f, indent=4, ensure_ascii=False)
-                    except Exception as e:
-                        log(f"Error resetting force_run flag: {e}")
-                
-                log("--- Starting new movie discovery cycle ---")
-                success = process_movie()
-                
-                if success:
-                    log("✅ Movie added successfully!")
-                else:
-                    log("❌ No movie added this cycle.")
-                
-                last_run = time.time()
-                
-                next_run_min = settings.get("interval_minutes", 720)
-                log(f"Cycle completed. Next run in {next_run_min} minutes.")
-                log("")
-            
-            # Sleep for shorter interval to check for force_run
-            time.sleep(60)
-            
-        except KeyboardInterrupt:
-            log("Stopping movie discovery (Ctrl+C pressed)")
-            break
-        except Exception as e:
-            log(f"Error in main loop: {e}")
-            log("Waiting 60 seconds before retry...")
-            time.sleep(60)
+def run_once(job_id=None):
+    """
+    One movie discovery cycle right now, recorded in the discovery run table.
+    Periodic runs are scheduled by the API server (services/discovery_jobs.py),
+    so this script no longer loops. Returns the added title, or None.
+    """
+    log("--- Starting new movie discovery cycle ---")
+    with discovery_events.run("movies", job_id=job_id) as cycle:
+        cycle.added = title = process_movie()
+    if title:
+        log("✅ Movie added successfully!")
+    else:
+        log("❌ No movie added this cycle.")
+    return title
 
 if __name__ == "__main__":
     try:
-        main_loop()
+        run_once()
     except KeyboardInterrupt:
         log("\nMovie discovery stopped by user")
     except Exception as e:
@@ -0,0 +1,30 @@
+"""
+Default JSON response class of the API.
+
+Endpoints with a response model are serialized by pydantic-core straight to
+bytes and never reach this class (see main.py: it is registered as a
+Default(), which keeps FastAPI's fast path). Everything else - the many
+endpoints returning dicts - is rendered with orjson when it is installed,
+with the json module otherwise.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def dumps(content: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson (falls back to json)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
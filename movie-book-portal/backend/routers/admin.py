@@ -11,6 +11,7 @@ from database import Movie, Settings, AccessLog, AppVersion
 from database_books import Book
 from database_tvshows import Tvshow
 from database_gallery import Photo
+from services import media_store
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -162,7 +163,7 @@ async def upload_update(
         os.makedirs(apk_dir, exist_ok=True)
         file_path = os.path.join(apk_dir, file.filename)
         
-        with open(file_path, "wb") as buffer:
+        with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
             
         new_version = AppVersion(
@@ -1,29 +1,35 @@
 import os
 import shutil
+import uuid
+import zipfile
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from database_audiobooks import Audiobook
-from models import AudiobookCreate
+from typing import List
+from models import AudiobookCreate, AudiobookResponse
 from dependencies import get_db_audiobooks_simple
-from utils import get_book_page_content
+from utils import get_book_page_content, StreamingZipExtractor, ZIP_STREAM_CHUNK_SIZE
+from services import library_index, media_store
 
 router = APIRouter(prefix="/audiobooks", tags=["audiobooks"])
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-@router.get("")
+@router.get("", response_model=List[AudiobookResponse])
 def get_audiobooks(genre: str = None, db: Session = Depends(get_db_audiobooks_simple)):
     query = db.query(Audiobook)
     if genre and genre != "Все":
         query = query.filter(Audiobook.genre.ilike(f"%{genre}%"))
     return query.all()
 
-@router.post("")
+@router.post("", response_model=AudiobookResponse)
 def create_audiobook(audiobook: AudiobookCreate, db: Session = Depends(get_db_audiobooks_simple)):
     db_audiobook = Audiobook(**audiobook.dict(), source="manual")
     db.add(db_audiobook)
     db.commit()
     db.refresh(db_audiobook)
+    library_index.register("audiobooks", db_audiobook.id, db_audiobook.title, db_audiobook.author)
     return db_audiobook
 
 @router.get("/{audiobook_id}/tracks")
@@ -65,14 +71,14 @@ def get_audiobook_tracks(audiobook_id: int, db: Session = Depends(get_db_audiobo
 
     return [{"title": os.path.basename(full_path), "url": audiobook.file_path.replace('\\', '/')}]
 
-@router.get("/{audiobook_id}")
+@router.get("/{audiobook_id}", response_model=AudiobookResponse)
 def get_audiobook(audiobook_id: int, db: Session = Depends(get_db_audiobooks_simple)):
     audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     return audiobook
 
-@router.put("/{audiobook_id}")
+@router.put("/{audiobook_id}", response_model=AudiobookResponse)
 def update_audiobook(audiobook_id: int, audiobook: AudiobookCreate, db: Session = Depends(get_db_audiobooks_simple)):
     db_audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
     if not db_audiobook:
@@ -81,6 +87,9 @@ def update_audiobook(audiobook_id: int, audiobook: AudiobookCreate, db: Session
         setattr(db_audiobook, key, value)
     db.commit()
     db.refresh(db_audiobook)
+    # Новое название или автор: отпечаток пересчитывается
+    library_index.unregister("audiobooks", db_audiobook.id)
+    library_index.register("audiobooks", db_audiobook.id, db_audiobook.title, db_audiobook.author)
     return db_audiobook
 
 @router.delete("/{audiobook_id}")
@@ -107,6 +116,7 @@ def delete_audiobook(audiobook_id: int, db: Session = Depends(get_db_audiobooks_
     
     db.delete(audiobook)
     db.commit()
+    library_index.unregister("audiobooks", audiobook_id)
     return {"status": "deleted"}
 
 @router.post("/{audiobook_id}/upload")
@@ -125,48 +135,39 @@ async def upload_audiobook_file(
         os.makedirs(AUDIOBOOKS_UPLOADS, exist_ok=True)
         
         if file.filename.lower().endswith('.zip'):
-             # Unzip logic
-             import uuid
-             temp_zip_name = f"temp_{uuid.uuid4()}.zip"
-             temp_zip_path = os.path.join(AUDIOBOOKS_UPLOADS, temp_zip_name)
-             
-             with open(temp_zip_path, "wb") as buffer:
-                 content = await file.read()
-                 buffer.write(content)
-                 
-             # Create a directory for the audiobook
+             # Stream the archive straight into the book directory (no temp zip, no full read into RAM)
              book_dir_name = f"audiobook_{audiobook_id}_{audiobook.title[:30].replace(' ', '_')}"
              book_dir_path = os.path.join(AUDIOBOOKS_UPLOADS, book_dir_name)
              
-             from utils import unzip_file, find_audio_files, find_thumbnail_in_dir
+             extractor = StreamingZipExtractor(book_dir_path)
+             try:
+                 while chunk := await file.read(ZIP_STREAM_CHUNK_SIZE):
+                     await run_in_threadpool(extractor.feed, chunk)
+                 audio_files = extractor.close()
+             except zipfile.BadZipFile as e:
+                 extractor.abort()
+                 raise HTTPException(status_code=400, detail=f"Failed to unzip file: {e}")
+             except Exception:
+                 # Disk full, client gone...: do not leave a half-extracted book behind
+                 extractor.abort()
+                 raise
+             
+             if not audio_files:
+                 extractor.abort()
+                 raise HTTPException(status_code=400, detail="No audio files found in ZIP")
+             
+             # Use the first audio file relative to BASE_DIR
+             relative_path = os.path.relpath(audio_files[0], BASE_DIR)
+             audiobook.file_path = relative_path
+             
+             # Cover was picked up while extracting
+             if not audiobook.thumbnail_path and extractor.cover_path:
+                 audiobook.thumbnail_path = os.path.relpath(extractor.cover_path, BASE_DIR)
+             
+             db.commit()
              
-             if unzip_file(temp_zip_path, book_dir_path):
-                 # Find first audio file
-                 audio_files = find_audio_files(book_dir_path)
-                 if audio_files:
-                     # Use the first audio file relative to BASE_DIR
-                     first_file = audio_files[0]
-                     relative_path = os.path.relpath(first_file, BASE_DIR)
-                     audiobook.file_path = relative_path
-                     
-                     # Look for thumbnail if not already present or if we want to overwrite
-                     if not audiobook.thumbnail_path:
-                         thumb_path = find_thumbnail_in_dir(book_dir_path)
-                         if thumb_path:
-                             audiobook.thumbnail_path = os.path.relpath(thumb_path, BASE_DIR)
-                     
-                     db.commit()
-                     
-                     # Remove absolute zip file
-                     try:
-                        os.remove(temp_zip_path)
-                     except: pass
-                     
-                     return {"status": "uploaded_and_unzipped", "file_path": relative_path}
-                 else:
-                     raise HTTPException(status_code=400, detail="No audio files found in ZIP")
-             else:
-                 raise HTTPException(status_code=400, detail="Failed to unzip file")
+             tracks = [os.path.relpath(f, BASE_DIR).replace('\\', '/') for f in audio_files]
+             return {"status": "uploaded_and_unzipped", "file_path": relative_path, "tracks": tracks}
                  
         else:
             # Save file normally
@@ -174,9 +175,9 @@ async def upload_audiobook_file(
             safe_filename = f"audiobook_{audiobook_id}_{audiobook.title[:30].replace(' ', '_')}{file_extension}"
             file_path = os.path.join(AUDIOBOOKS_UPLOADS, safe_filename)
             
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
+            with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
+                while chunk := await file.read(ZIP_STREAM_CHUNK_SIZE):
+                    buffer.write(chunk)
             
             # Update database
             relative_path = os.path.relpath(file_path, BASE_DIR)
@@ -185,6 +186,8 @@ async def upload_audiobook_file(
             
             return {"status": "uploaded", "file_path": relative_path}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при загрузке файла: {str(e)}")
 
@@ -204,16 +207,23 @@ async def upload_audiobook_thumbnail(
         os.makedirs(THUMBNAILS_PATH, exist_ok=True)
         
         file_extension = os.path.splitext(file.filename)[1]
-        safe_filename = f"thumb_{audiobook_id}{file_extension}"
+        # Новое имя на каждую загрузку: миниатюры кэшируются клиентом как неизменяемые
+        safe_filename = f"thumb_{audiobook_id}_{uuid.uuid4().hex[:8]}{file_extension}"
         file_path = os.path.join(THUMBNAILS_PATH, safe_filename)
         
         with open(file_path, "wb") as buffer:
             content = await file.read()
             buffer.write(content)
         
+        old_thumb = audiobook.thumbnail_path
         relative_path = os.path.relpath(file_path, BASE_DIR)
         audiobook.thumbnail_path = relative_path
         db.commit()
+        if old_thumb and old_thumb != relative_path:
+            try:
+                media_store.release(os.path.join(BASE_DIR, old_thumb))
+            except OSError:
+                pass
         
         return {"status": "uploaded", "thumbnail_path": relative_path}
     except Exception as e:
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 import requests
 import feedparser
-from bs4 import BeautifulSoup
+from services.html_parser import parse_html
 import os
 import shutil
 from sqlalchemy.orm import Session
@@ -14,53 +15,15 @@ import re
 import base64
 import json
 from urllib.parse import unquote, quote
-import threading
 import time
 import random
 
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-# Global session to maintain cookies
-session = requests.Session()
-session.trust_env = False  # Disable system proxies
-session.verify = False     # Ignore SSL errors (for stability against strict servers/firewalls)
-
-# Limit concurrency to prevent 10054 Connection Reset and SSLErrors
-audioboo_semaphore = threading.Semaphore(2)
-
-# Configure robust retry strategy
-retries = Retry(
-    total=5,
-    backoff_factor=1,
-    status_forcelist=[500, 502, 503, 504, 429],
-    allowed_methods=["GET", "POST", "HEAD", "OPTIONS"],
-    raise_on_status=False
-)
-adapter = HTTPAdapter(max_retries=retries)
-session.mount("http://", adapter)
-session.mount("https://", adapter)
-
-# Configure robust retry strategy
-retries = Retry(
-    total=5,
-    backoff_factor=1,
-    status_forcelist=[500, 502, 503, 504, 429],
-    allowed_methods=["GET", "POST", "HEAD", "OPTIONS"],
-    raise_on_status=False
-)
-adapter = HTTPAdapter(max_retries=retries)
-session.mount("http://", adapter)
-session.mount("https://", adapter)
-
-DEFAULT_HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-    'Connection': 'keep-alive',
-    'Upgrade-Insecure-Requests': '1',
-}
-session.headers.update(DEFAULT_HEADERS)
+from services.http_client import http_client
+from services import library_index, media_store
+
+# Shared process-wide client: keeps audioboo cookies between calls, retries, and limits
+# audioboo.org to 2 parallel requests with a 1-3 s politeness delay (see HOST_POLICIES)
+session = http_client
 
 router = APIRouter(prefix="/audiobooks-source", tags=["audiobooks-source"])
 
@@ -76,7 +39,7 @@ def search_flibusta_audiobooks(q: str = Query(..., min_length=2)):
     search_url = f"{OPDS_URL}/search?searchType=books&searchTerm={requests.utils.quote(q)}"
     
     try:
-        response = requests.get(search_url, timeout=15)
+        response = session.get(search_url, timeout=15)
         response.raise_for_status()
         
         feed = feedparser.parse(response.content)
@@ -104,7 +67,7 @@ def search_flibusta_audiobooks(q: str = Query(..., min_length=2)):
                     "id": entry.id.split('/')[-1] if 'id' in entry else str(uuid.uuid4()),
                     "title": entry.title,
                     "author": entry.author if 'author' in entry else "Неизвестен",
-                    "description": BeautifulSoup(entry.summary, "html.parser").get_text() if 'summary' in entry else "",
+                    "description": parse_html(entry.summary).get_text() if 'summary' in entry else "",
                     "image": links.get('image'),
                     "links": links,
                     "source": "flibusta"
@@ -141,7 +104,7 @@ def search_audioboo(q: str = Query(..., min_length=2), page: int = 1):
         })
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content)
         results = []
         
         # Select items
@@ -318,7 +281,7 @@ def browse_audioboo(genre: str, page: int = 1):
         })
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content)
         results = []
         
         # Similar parsing to search
@@ -360,7 +323,7 @@ def browse_audioboo(genre: str, page: int = 1):
             url = f"https://audioboo.org/{slug}/"
             response = session.get(url, timeout=15, headers={'Referer': 'https://audioboo.org/'})
             response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = parse_html(response.content)
             items = soup.select('.card, article, .short-item, .item')
             for item in items:
                 try:
@@ -413,158 +376,152 @@ def decode_playerjs_file(encoded_str):
 @router.get("/audioboo-fetch")
 def fetch_audioboo_details(url: str = Query(...)):
     """Fetch detailed information from audioboo.org link"""
-    # Throttle requests effectively to prevent connection drops
-    with audioboo_semaphore:
-        # Random delay to mimic human behavior and spread load
-        time.sleep(random.uniform(1.0, 3.0))
-        
-        try:
-            # Visit home first if no cookies (optional, session handles it)
-            if not session.cookies:
-                try: session.get("https://audioboo.org/", timeout=10)
-                except: pass
+    # Throttling (2 parallel requests, 1-3 s spacing) is done by the shared client's host policy
+    try:
+        # Visit home once per process to get cookies
+        session.warm_up("https://audioboo.org/")
 
+        response = session.get(url, timeout=15, headers={
+            'Referer': 'https://audioboo.org/'
+        })
+        
+        # If still 403, try one retry with a small delay
+        if response.status_code == 403:
+            time.sleep(random.uniform(1, 2))
             response = session.get(url, timeout=15, headers={
-                'Referer': 'https://audioboo.org/'
+                'Referer': 'https://audioboo.org/index.php?do=search'
             })
             
-            # If still 403, try one retry with a small delay
-            if response.status_code == 403:
-                time.sleep(random.uniform(1, 2))
-                response = session.get(url, timeout=15, headers={
-                    'Referer': 'https://audioboo.org/index.php?do=search'
-                })
-                
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+        response.raise_for_status()
+        
+        soup = parse_html(response.content)
+        
+        # Extract title
+        title_elem = soup.find('h1')
+        title = title_elem.get_text(strip=True) if title_elem else "Неизвестно"
+        
+        # Extract metadata
+        meta_items = soup.select('.full-meta li')
+        metadata = {}
+        for li in meta_items:
+            text = li.get_text(strip=True)
+            if ':' in text:
+                parts = text.split(':', 1)
+                metadata[parts[0].strip()] = parts[1].strip()
+        
+        # Extract description and fallback metadata
+        desc_elem = soup.select_one('.full-text, .story, #news-id, .page__text')
+        description_text = desc_elem.get_text("\n") if desc_elem else ""
+        description = desc_elem.get_text(strip=True) if desc_elem else ""
+        
+        if not metadata:
+            # Fallback parsing from text block using case-insensitive search and more variants
+            description_lower = description_text.lower()
             
-            # Extract title
-            title_elem = soup.find('h1')
-            title = title_elem.get_text(strip=True) if title_elem else "Неизвестно"
+            author_match = re.search(r'(?:автор|писатель):\s*([^\n<]+)', description_text, re.I)
+            if author_match: metadata['Автор'] = author_match.group(1).strip()
             
-            # Extract metadata
-            meta_items = soup.select('.full-meta li')
-            metadata = {}
-            for li in meta_items:
-                text = li.get_text(strip=True)
-                if ':' in text:
-                    parts = text.split(':', 1)
-                    metadata[parts[0].strip()] = parts[1].strip()
+            narrator_match = re.search(r'(?:исполнитель|чтец|диктор):\s*([^\n<]+)', description_text, re.I)
+            if narrator_match: metadata['Исполнитель'] = narrator_match.group(1).strip()
             
-            # Extract description and fallback metadata
-            desc_elem = soup.select_one('.full-text, .story, #news-id, .page__text')
-            description_text = desc_elem.get_text("\n") if desc_elem else ""
-            description = desc_elem.get_text(strip=True) if desc_elem else ""
+            genre_match = re.search(r'жанр:\s*([^\n<]+)', description_text, re.I)
+            if genre_match: metadata['Жанр'] = genre_match.group(1).strip()
             
-            if not metadata:
-                # Fallback parsing from text block using case-insensitive search and more variants
-                description_lower = description_text.lower()
-                
-                author_match = re.search(r'(?:автор|писатель):\s*([^\n<]+)', description_text, re.I)
-                if author_match: metadata['Автор'] = author_match.group(1).strip()
-                
-                narrator_match = re.search(r'(?:исполнитель|чтец|диктор):\s*([^\n<]+)', description_text, re.I)
-                if narrator_match: metadata['Исполнитель'] = narrator_match.group(1).strip()
-                
-                genre_match = re.search(r'жанр:\s*([^\n<]+)', description_text, re.I)
-                if genre_match: metadata['Жанр'] = genre_match.group(1).strip()
-                
-                year_match = re.search(r'(?:год выпуска|год|дата|выпущено)[^:]*:\s*(\d{4})', description_text, re.I)
-                if year_match: metadata['Год'] = year_match.group(1).strip()
-
-            author = metadata.get('Автор', 'Неизвестен')
-            # narrator might be in metadata as 'Чтец' or 'Исполнитель'
-            narrator = metadata.get('Исполнитель', metadata.get('Чтец', 'Аудиокнига'))
-            
-            # Extract genres
-            genre = metadata.get('Жанр', '')
-            if not genre:
-                genre_elems = soup.select('.full-tag a, .story a[href*="/xfsearch/"], a[href*="/xfsearch/zhanr/"]')
-                genres = [g.get_text(strip=True) for g in genre_elems[:5]]
-                genre = ", ".join(genres) if genres else ""
-            
-            # Extract image
-            img_elem = soup.select_one('.full-img img, .story img, article img, .page__text img')
-            if not img_elem:
-                 # Try data-src as fallback (common for lazy loading)
-                 img_elem = soup.find('img', attrs={'data-src': True})
-        
-            image = img_elem.get('src') or img_elem.get('data-src') if img_elem else None
-            if image and not image.startswith('http'):
-                image = f"https://audioboo.org{image}"
-            
-            # Extract audio links from PlayerJS config
-            download_link = None
+            year_match = re.search(r'(?:год выпуска|год|дата|выпущено)[^:]*:\s*(\d{4})', description_text, re.I)
+            if year_match: metadata['Год'] = year_match.group(1).strip()
+
+        author = metadata.get('Автор', 'Неизвестен')
+        # narrator might be in metadata as 'Чтец' or 'Исполнитель'
+        narrator = metadata.get('Исполнитель', metadata.get('Чтец', 'Аудиокнига'))
+        
+        # Extract genres
+        genre = metadata.get('Жанр', '')
+        if not genre:
+            genre_elems = soup.select('.full-tag a, .story a[href*="/xfsearch/"], a[href*="/xfsearch/zhanr/"]')
+            genres = [g.get_text(strip=True) for g in genre_elems[:5]]
+            genre = ", ".join(genres) if genres else ""
+        
+        # Extract image
+        img_elem = soup.select_one('.full-img img, .story img, article img, .page__text img')
+        if not img_elem:
+             # Try data-src as fallback (common for lazy loading)
+             img_elem = soup.find('img', attrs={'data-src': True})
+    
+        image = img_elem.get('src') or img_elem.get('data-src') if img_elem else None
+        if image and not image.startswith('http'):
+            image = f"https://audioboo.org{image}"
+        
+        # Extract audio links from PlayerJS config
+        download_link = None
+        
+        # Find script with PlayerJS config
+        scripts = soup.find_all('script')
+        for script in scripts:
+            if script.string and ('PlayerJS' in script.string or 'file:' in script.string or 'playlist:' in script.string):
+                # Search for file: "..." or playlist: "..."
+                file_match = re.search(r'file\s*:\s*["\']([^"\']+)["\']', script.string)
+                if file_match:
+                    encoded_file = file_match.group(1)
+                    if encoded_file.startswith('[{'): # JSON playlist
+                        try:
+                            playlist = json.loads(encoded_file)
+                            if playlist and len(playlist) > 0:
+                                # Get first or combine? Usually we want the first to check.
+                                # Or if it's a single file masked as playlist
+                                first_file = playlist[0].get('file')
+                                download_link = decode_playerjs_file(first_file)
+                        except: pass
+                    else:
+                        download_link = decode_playerjs_file(encoded_file)
+                    
+                    if download_link: break
+
+        # Redundant check for direct zip/torrent links
+        if not download_link:
+            # Check for archive.org links or black buttons
+            zip_link = soup.find('a', href=re.compile(r'archive\.org/(download|compress|details)/.+\.zip', re.I))
+            if zip_link:
+                download_link = zip_link.get('href')
+                if '/details/' in download_link:
+                     # Convert details link to direct download link if possible
+                     download_link = download_link.replace('/details/', '/download/')
             
-            # Find script with PlayerJS config
-            scripts = soup.find_all('script')
-            for script in scripts:
-                if script.string and ('PlayerJS' in script.string or 'file:' in script.string or 'playlist:' in script.string):
-                    # Search for file: "..." or playlist: "..."
-                    file_match = re.search(r'file\s*:\s*["\']([^"\']+)["\']', script.string)
-                    if file_match:
-                        encoded_file = file_match.group(1)
-                        if encoded_file.startswith('[{'): # JSON playlist
-                            try:
-                                playlist = json.loads(encoded_file)
-                                if playlist and len(playlist) > 0:
-                                    # Get first or combine? Usually we want the first to check.
-                                    # Or if it's a single file masked as playlist
-                                    first_file = playlist[0].get('file')
-                                    download_link = decode_playerjs_file(first_file)
-                            except: pass
-                        else:
-                            download_link = decode_playerjs_file(encoded_file)
-                        
-                        if download_link: break
-
-            # Redundant check for direct zip/torrent links
             if not download_link:
-                # Check for archive.org links or black buttons
-                zip_link = soup.find('a', href=re.compile(r'archive\.org/(download|compress|details)/.+\.zip', re.I))
-                if zip_link:
-                    download_link = zip_link.get('href')
-                    if '/details/' in download_link:
-                         # Convert details link to direct download link if possible
-                         download_link = download_link.replace('/details/', '/download/')
+                # Check button with engine/go.php or any link containing "облака"
+                btn = soup.find('a', href=re.compile(r'go\.php\?url='))
+                if not btn:
+                     btn = soup.find('a', string=re.compile(r'облака', re.I))
                 
-                if not download_link:
-                    # Check button with engine/go.php or any link containing "облака"
-                    btn = soup.find('a', href=re.compile(r'go\.php\?url='))
-                    if not btn:
-                         btn = soup.find('a', string=re.compile(r'облака', re.I))
+                if btn and btn.get('href'):
+                    href = btn.get('href')
+                    if '/engine/go.php?url=' in href:
+                        download_link = decode_playerjs_file(href)
+                    elif 'archive.org' in href:
+                        download_link = href
                     
-                    if btn and btn.get('href'):
-                        href = btn.get('href')
-                        if '/engine/go.php?url=' in href:
-                            download_link = decode_playerjs_file(href)
-                        elif 'archive.org' in href:
-                            download_link = href
-                        
-                if download_link and download_link.startswith('/'):
-                     download_link = f"https://audioboo.org{download_link}"
-            
-            # Final fallback: search for ANY archive.org link
-            if not download_link:
-                 any_archive_link = soup.find('a', href=re.compile(r'archive\.org/'))
-                 if any_archive_link:
-                      download_link = any_archive_link.get('href')
-            
-            return {
-                "title": title,
-                "author": author,
-                "narrator": narrator,
-                "description": description,
-                "image": image,
-                "genre": genre,
-                "download_link": download_link,
-                "source_url": url,
-                "year": metadata.get('Год')
-            }
-        except Exception as e:
-            print(f"Error fetching audioboo details: {e}")
-            raise HTTPException(status_code=500, detail=f"Ошибка при получении информации: {str(e)}")
+            if download_link and download_link.startswith('/'):
+                 download_link = f"https://audioboo.org{download_link}"
+        
+        # Final fallback: search for ANY archive.org link
+        if not download_link:
+             any_archive_link = soup.find('a', href=re.compile(r'archive\.org/'))
+             if any_archive_link:
+                  download_link = any_archive_link.get('href')
+        
+        return {
+            "title": title,
+            "author": author,
+            "narrator": narrator,
+            "description": description,
+            "image": image,
+            "genre": genre,
+            "download_link": download_link,
+            "source_url": url,
+            "year": metadata.get('Год')
+        }
+    except Exception as e:
+        print(f"Error fetching audioboo details: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении информации: {str(e)}")
 
 
 class AudiobooDownloadRequest(BaseModel):
@@ -600,70 +557,59 @@ def process_audioboo_background(request: AudiobooDownloadRequest):
             except: pass
             
         # 1. Download the audio file
-        response = session.get(download_url, timeout=60, stream=True, headers={
+        with session.get(download_url, timeout=60, stream=True, headers={
             'Referer': 'https://audioboo.org/'
-        })
-        response.raise_for_status()
-        
-        # Determine filename
-        ext = ".mp3"  # Default for audioboo
-        cd = response.headers.get('content-disposition')
-        if cd and 'filename=' in cd:
-            filename = cd.split('filename=')[-1].strip('"')
-        else:
-            filename = f"{title}_{author}{ext}".replace(" ", "_")
-        
-        safe_filename = "".join([c for c in filename if c.isalnum() or c in "._-"]).strip()
-        temp_file_save_path = os.path.join(AUDIOBOOKS_UPLOADS, safe_filename)
-        
-        os.makedirs(AUDIOBOOKS_UPLOADS, exist_ok=True)
-        
-        # Save file with progress
-        with open(temp_file_save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        }) as response:
+            response.raise_for_status()
 
-        # 1.1 Handle ZIP unzipping
-        from utils import unzip_file, find_audio_files, find_thumbnail_in_dir
-        import uuid
-        
-        final_file_path = temp_file_save_path
-        
-        if temp_file_save_path.lower().endswith('.zip') or 'zip' in response.headers.get('content-type', '').lower():
-            # Create a dedicated directory
-            book_dir_name = f"audiobook_dl_{uuid.uuid4()}"
-            book_dir_path = os.path.join(AUDIOBOOKS_UPLOADS, book_dir_name)
-            
-            if unzip_file(temp_file_save_path, book_dir_path):
-                audio_files = find_audio_files(book_dir_path)
-                if audio_files:
-                    final_file_path = audio_files[0]
-                    print(f"DEBUG: Using unzipped file: {final_file_path}")
-                    
-                    # Try to find a better thumbnail if we don't have one or if we just want to check
-                    if not image_url:
-                        found_thumb = find_thumbnail_in_dir(book_dir_path)
-                        if found_thumb:
-                            print(f"DEBUG: Found thumbnail in ZIP: {found_thumb}")
-                            pass
-                            
-                    # Remove the original zip
-                    try: os.remove(temp_file_save_path)
-                    except: pass
-                else:
-                     print("WARNING: No audio files found in ZIP, keeping original file")
+            # Determine filename
+            ext = ".mp3"  # Default for audioboo
+            cd = response.headers.get('content-disposition')
+            if cd and 'filename=' in cd:
+                filename = cd.split('filename=')[-1].strip('"')
             else:
-                 print("WARNING: Failed to unzip, keeping original file")
-        
+                filename = f"{title}_{author}{ext}".replace(" ", "_")
+
+            safe_filename = "".join([c for c in filename if c.isalnum() or c in "._-"]).strip()
+            temp_file_save_path = os.path.join(AUDIOBOOKS_UPLOADS, safe_filename)
+
+            os.makedirs(AUDIOBOOKS_UPLOADS, exist_ok=True)
+
+            # 1.1 ZIP archives are extracted while downloading, without saving the archive first
+            from utils import extract_zip_stream, ZIP_STREAM_CHUNK_SIZE
+            import uuid
+
+            final_file_path = temp_file_save_path
+            found_thumb = None
+
+            if temp_file_save_path.lower().endswith('.zip') or 'zip' in response.headers.get('content-type', '').lower():
+                # Create a dedicated directory
+                book_dir_name = f"audiobook_dl_{uuid.uuid4()}"
+                book_dir_path = os.path.join(AUDIOBOOKS_UPLOADS, book_dir_name)
+
+                extractor = extract_zip_stream(response.iter_content(chunk_size=ZIP_STREAM_CHUNK_SIZE), book_dir_path)
+                if not extractor.audio_files:
+                    extractor.abort()
+                    print(f"WARNING: No audio files found in ZIP for {title}, skipping")
+                    return
+                final_file_path = extractor.audio_files[0]
+                found_thumb = extractor.cover_path
+                print(f"DEBUG: Using unzipped file: {final_file_path}")
+                if found_thumb:
+                    print(f"DEBUG: Found thumbnail in ZIP: {found_thumb}")
+            else:
+                # Save file with progress
+                with media_store.rewriting(temp_file_save_path) as tmp, open(tmp, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
+
         # 2. Download thumbnail if provided
         thumbnail_path = None
         
-        # Check if we found a thumbnail in ZIP (if unzipped)
-        if 'book_dir_path' in locals() and os.path.exists(book_dir_path) and not image_url:
-             found_thumb = find_thumbnail_in_dir(book_dir_path)
-             if found_thumb:
-                 thumbnail_path = os.path.relpath(found_thumb, BASE_DIR)
+        # Use the thumbnail found in the ZIP (if unzipped)
+        if found_thumb and not image_url:
+            thumbnail_path = os.path.relpath(found_thumb, BASE_DIR)
 
         if image_url and not thumbnail_path:
             try:
@@ -687,7 +633,7 @@ def process_audioboo_background(request: AudiobooDownloadRequest):
                 thumb_path = os.path.join(AUDIOBOOKS_UPLOADS, "thumbnails", thumb_filename)
                 os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
                 
-                with open(thumb_path, 'wb') as f:
+                with media_store.rewriting(thumb_path) as tmp, open(tmp, 'wb') as f:
                     f.write(img_response.content)
                 
                 thumbnail_path = os.path.relpath(thumb_path, BASE_DIR)
@@ -713,6 +659,7 @@ def process_audioboo_background(request: AudiobooDownloadRequest):
         db.add(db_audiobook)
         db.commit()
         db.refresh(db_audiobook)
+        library_index.register("audiobooks", db_audiobook.id, db_audiobook.title, db_audiobook.author)
         print(f"Created audiobook in DB: {db_audiobook.id} - {title}")
 
     except Exception as e:
@@ -744,60 +691,57 @@ async def download_flibusta_audiobook(
     """Download an audiobook from Flibusta and add to library"""
     try:
         # 1. Download the audio file
-        response = requests.get(download_url, timeout=60, stream=True)
-        response.raise_for_status()
-        
-        ext = ".mp3"
-        cd = response.headers.get('content-disposition')
-        if cd and 'filename=' in cd:
-            filename = cd.split('filename=')[-1].strip('"')
-        else:
-            filename = f"{title}_{author}{ext}".replace(" ", "_")
-        
-        safe_filename = "".join([c for c in filename if c.isalnum() or c in "._-"]).strip()
-        temp_file_save_path = os.path.join(AUDIOBOOKS_UPLOADS, safe_filename)
-        
-        os.makedirs(AUDIOBOOKS_UPLOADS, exist_ok=True)
-        
-        with open(temp_file_save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        # 1.1 Handle ZIP unzipping logic for Flibusta too
-        from utils import unzip_file, find_audio_files, find_thumbnail_in_dir
-        import uuid
-        
-        final_file_path = temp_file_save_path
-        
-        if temp_file_save_path.lower().endswith('.zip') or 'zip' in response.headers.get('content-type', '').lower():
-             # Create a dedicated directory
-            book_dir_name = f"flibusta_{uuid.uuid4()}"
-            book_dir_path = os.path.join(AUDIOBOOKS_UPLOADS, book_dir_name)
-            
-            if unzip_file(temp_file_save_path, book_dir_path):
-                audio_files = find_audio_files(book_dir_path)
-                if audio_files:
-                    final_file_path = audio_files[0]
-                    
-                    # Remove the original zip
-                    try: os.remove(temp_file_save_path)
-                    except: pass
-                else:
-                    print("WARNING: No audio files found in ZIP")
+        with session.get(download_url, timeout=60, stream=True) as response:
+            response.raise_for_status()
+
+            ext = ".mp3"
+            cd = response.headers.get('content-disposition')
+            if cd and 'filename=' in cd:
+                filename = cd.split('filename=')[-1].strip('"')
+            else:
+                filename = f"{title}_{author}{ext}".replace(" ", "_")
+
+            safe_filename = "".join([c for c in filename if c.isalnum() or c in "._-"]).strip()
+            temp_file_save_path = os.path.join(AUDIOBOOKS_UPLOADS, safe_filename)
+
+            os.makedirs(AUDIOBOOKS_UPLOADS, exist_ok=True)
+
+            # 1.1 ZIP archives are extracted while downloading (Flibusta too)
+            from utils import extract_zip_stream, ZIP_STREAM_CHUNK_SIZE
+            import uuid
+
+            final_file_path = temp_file_save_path
+            found_thumb = None
+
+            if temp_file_save_path.lower().endswith('.zip') or 'zip' in response.headers.get('content-type', '').lower():
+                # Create a dedicated directory
+                book_dir_name = f"flibusta_{uuid.uuid4()}"
+                book_dir_path = os.path.join(AUDIOBOOKS_UPLOADS, book_dir_name)
+
+                extractor = await run_in_threadpool(
+                    extract_zip_stream, response.iter_content(chunk_size=ZIP_STREAM_CHUNK_SIZE), book_dir_path
+                )
+                if not extractor.audio_files:
+                    extractor.abort()
+                    raise HTTPException(status_code=400, detail="В архиве не найдено аудиофайлов")
+                final_file_path = extractor.audio_files[0]
+                found_thumb = extractor.cover_path
+            else:
+                with media_store.rewriting(temp_file_save_path) as tmp, open(tmp, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
 
         # 2. Download thumbnail if provided
         thumbnail_path = None
         
         # Check ZIP for thumbnail first if we unzipped
-        if 'book_dir_path' in locals() and os.path.exists(book_dir_path) and not image_url:
-             found_thumb = find_thumbnail_in_dir(book_dir_path)
-             if found_thumb:
-                 thumbnail_path = os.path.relpath(found_thumb, BASE_DIR)
+        if found_thumb and not image_url:
+            thumbnail_path = os.path.relpath(found_thumb, BASE_DIR)
 
         if image_url and not thumbnail_path:
             try:
-                img_response = requests.get(image_url, timeout=15)
+                img_response = session.get(image_url, timeout=15)
                 img_response.raise_for_status()
                 
                 img_ext = ".jpg"
@@ -805,7 +749,7 @@ async def download_flibusta_audiobook(
                 thumb_path = os.path.join(AUDIOBOOKS_UPLOADS, "thumbnails", thumb_filename)
                 os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
                 
-                with open(thumb_path, 'wb') as f:
+                with media_store.rewriting(thumb_path) as tmp, open(tmp, 'wb') as f:
                     f.write(img_response.content)
                 
                 thumbnail_path = os.path.relpath(thumb_path, BASE_DIR)
@@ -831,6 +775,7 @@ async def download_flibusta_audiobook(
         db.add(db_audiobook)
         db.commit()
         db.refresh(db_audiobook)
+        library_index.register("audiobooks", db_audiobook.id, db_audiobook.title, db_audiobook.author)
         
         return {
             "id": db_audiobook.id,
@@ -840,6 +785,8 @@ async def download_flibusta_audiobook(
             "thumbnail_path": thumbnail_path,
             "status": "downloaded"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error downloading audiobook from Flibusta: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при загрузке аудиокниги: {str(e)}")
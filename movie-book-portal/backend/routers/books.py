@@ -1,33 +1,39 @@
 import os
 import shutil
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from sqlalchemy.orm import Session
 from database_books import Book
-from models import BookCreate
+from typing import List
+from models import BookCreate, BookResponse
 from dependencies import get_db_books_simple
 from dependencies import get_db_books_simple
+from services.http_cache import conditional_json
+from services import library_index, media_store
 from utils import get_book_page_content, get_epub_page_count
 
 router = APIRouter(prefix="/books", tags=["books"])
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-@router.get("")
-def get_books(genre: str = None, db: Session = Depends(get_db_books_simple)):
+@router.get("", response_model=List[BookResponse])
+def get_books(request: Request, genre: str = None, db: Session = Depends(get_db_books_simple)):
     query = db.query(Book)
     if genre and genre != "Все":
         query = query.filter(Book.genre.ilike(f"%{genre}%"))
-    return query.all()
+    # 304 без запроса к БД, пока таблица не менялась
+    return conditional_json(request, query.all, [Book], [db], response_model=List[BookResponse])
 
-@router.post("")
+@router.post("", response_model=BookResponse)
 def create_book(book: BookCreate, db: Session = Depends(get_db_books_simple)):
     db_book = Book(**book.dict(), total_pages=1)
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    library_index.register("books", db_book.id, db_book.title, db_book.author)
     return db_book
 
-@router.get("/search")
+@router.get("/search", response_model=List[BookResponse])
 def search_books(query: str, db: Session = Depends(get_db_books_simple)):
     # SQLite LIKE/ILIKE usually only validates ASCII case-insensitivity.
     # For robust Cyrillic support without extensions, we filter in Python.
@@ -38,14 +44,14 @@ def search_books(query: str, db: Session = Depends(get_db_books_simple)):
     query = query.lower()
     return [book for book in all_books if book.title and query in book.title.lower()]
 
-@router.get("/{book_id}")
+@router.get("/{book_id}", response_model=BookResponse)
 def get_book(book_id: int, db: Session = Depends(get_db_books_simple)):
     book = db.query(Book).filter(Book.id == book_id).first()
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     return book
 
-@router.put("/{book_id}")
+@router.put("/{book_id}", response_model=BookResponse)
 def update_book(book_id: int, book: BookCreate, db: Session = Depends(get_db_books_simple)):
     db_book = db.query(Book).filter(Book.id == book_id).first()
     if not db_book:
@@ -54,6 +60,9 @@ def update_book(book_id: int, book: BookCreate, db: Session = Depends(get_db_boo
         setattr(db_book, key, value)
     db.commit()
     db.refresh(db_book)
+    # Новое название или автор: отпечаток пересчитывается
+    library_index.unregister("books", db_book.id)
+    library_index.register("books", db_book.id, db_book.title, db_book.author)
     return db_book
 
 @router.delete("/{book_id}")
@@ -80,9 +89,10 @@ def delete_book(book_id: int, db: Session = Depends(get_db_books_simple)):
     
     db.delete(book)
     db.commit()
+    library_index.unregister("books", book_id)
     return {"message": "Book deleted successfully"}
 
-@router.post("/{book_id}/upload")
+@router.post("/{book_id}/upload", response_model=BookResponse)
 async def upload_book_file(book_id: int, file: UploadFile = File(...), db: Session = Depends(get_db_books_simple)):
     book = db.query(Book).filter(Book.id == book_id).first()
     if not book:
@@ -95,7 +105,7 @@ async def upload_book_file(book_id: int, file: UploadFile = File(...), db: Sessi
 
     file_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/books/{book_id}_{file.filename}"))
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "wb") as buffer:
+    with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
     relative_path = os.path.relpath(file_path, BASE_DIR)
@@ -107,7 +117,7 @@ async def upload_book_file(book_id: int, file: UploadFile = File(...), db: Sessi
     db.commit()
     return book
 
-@router.post("/{book_id}/upload_thumbnail")
+@router.post("/{book_id}/upload_thumbnail", response_model=BookResponse)
 async def upload_book_thumbnail(book_id: int, file: UploadFile = File(...), db: Session = Depends(get_db_books_simple)):
     book = db.query(Book).filter(Book.id == book_id).first()
     if not book:
@@ -118,14 +128,21 @@ async def upload_book_thumbnail(book_id: int, file: UploadFile = File(...), db:
     if ext not in allowed_ext:
         raise HTTPException(status_code=400, detail="Неподдерживаемый формат изображения")
 
-    thumb_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/books/{book_id}_thumb{ext}"))
+    # Новое имя на каждую загрузку: миниатюры кэшируются клиентом как неизменяемые
+    thumb_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/books/{book_id}_thumb_{uuid.uuid4().hex[:8]}{ext}"))
     os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
     with open(thumb_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
+    old_thumb = book.thumbnail_path
     relative_path = os.path.relpath(thumb_path, BASE_DIR)
     book.thumbnail_path = relative_path.replace(os.sep, '/').replace('\\', '/')
     db.commit()
+    if old_thumb and old_thumb != book.thumbnail_path:
+        try:
+            media_store.release(os.path.join(BASE_DIR, old_thumb))
+        except OSError:
+            pass
     return book
 
 @router.get("/{book_id}/info")
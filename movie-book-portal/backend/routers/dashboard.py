@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Depends, Header, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import random
+from datetime import date
 
 from database import Movie, get_db as get_db_movies
 from database_books import Book
@@ -10,6 +11,7 @@ from database_tvshows import Tvshow, Episode
 from database_gallery import Photo, get_db_gallery
 from database_progress import PlaybackProgress, get_db_progress
 from dependencies import get_db as get_db_main, get_db_books_simple, get_db_tvshows_simple, get_db_audiobooks_simple
+from services.http_cache import conditional_json
 
 import os
 import hashlib
@@ -19,8 +21,19 @@ router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 GALLERY_UPLOADS = os.path.join(BASE_DIR, "uploads", "gallery")
 
+def _gallery_version() -> int:
+    """Latest mtime of the gallery folders: adding, removing or renaming a photo changes its folder's"""
+    latest = 0
+    for root, dirs, files in os.walk(GALLERY_UPLOADS):
+        try:
+            latest = max(latest, os.stat(root).st_mtime_ns)
+        except OSError:
+            pass
+    return latest
+
 @router.get("")
-def get_dashboard_data(
+def get_dashboard(
+    request: Request,
     x_user_id: str = Header("global"),
     db_movies: Session = Depends(get_db_movies),
     db_books: Session = Depends(get_db_books_simple),
@@ -29,6 +42,17 @@ def get_dashboard_data(
     db_gallery: Session = Depends(get_db_gallery),
     db_progress: Session = Depends(get_db_progress)
 ):
+    # Рекомендация случайная: меняется раз в день (или с любым изменением данных)
+    extra = f"{x_user_id}|{date.today()}|{_gallery_version()}"
+    return conditional_json(
+        request,
+        lambda: get_dashboard_data(x_user_id, db_movies, db_books, db_tvshows, db_audiobooks, db_gallery, db_progress),
+        [Movie, Book, Audiobook, Tvshow, Episode, PlaybackProgress],
+        [db_movies, db_books, db_tvshows, db_audiobooks, db_progress],
+        extra,
+    )
+
+def get_dashboard_data(x_user_id, db_movies, db_books, db_tvshows, db_audiobooks, db_gallery, db_progress):
     # 1. Continue Watching (Top 5 recently updated progress)
     continue_watching = []
     recent_progress = db_progress.query(PlaybackProgress).filter(
@@ -1,15 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
 import requests
 import feedparser
-from bs4 import BeautifulSoup
 import os
 import random
 from typing import List, Optional
 from pydantic import BaseModel
 import re
+import zipfile
 from urllib.parse import urlparse, urljoin, quote
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from services.http_client import http_client
+from services import scrape_cache
+from services import html_parser
+from services import provider_health
+from services.http_client import host_of
+from services.html_parser import parse_html, BOOK_LINK_SELECTOR, ROYALLIB_BOOK_SELECTOR, AUTHOR_LINK_SELECTOR, ROYALLIB_AUTHOR_SELECTOR
 
 router = APIRouter(tags=["discovery"])
 
@@ -47,40 +51,37 @@ def get_headers(referer=None):
     return headers
 
 def create_session():
-    """Create a requests session with retries and proxy bypass"""
-    session = requests.Session()
-    # Disable system proxies
-    session.trust_env = False
-    
-    # Configure retries
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["HEAD", "GET", "OPTIONS"]
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
+    """
+    Returns the shared process-wide HTTP client (pooled keep-alive connections,
+    per-host limits, retries, proxy bypass). Pass headers per request: the
+    client is shared, so never update its default headers.
+    """
+    return http_client
 
-def request_flibusta(path: str, timeout: int = 15):
-    """Try to request path from the primary domain"""
+def request_flibusta(path: str, timeout: int = 15, cache: Optional[str] = None, refresh: bool = False):
+    """
+    Try to request path from the primary domain.
+    cache: scrape cache policy (browse / search / details); None fetches live.
+    """
     mirrors = FLIBUSTA_MIRRORS.copy()
     
     # Prioritize environment variable if set
     env_url = os.environ.get("FLIBUSTA_URL")
     if env_url:
         mirrors = [env_url]
+    # Fastest healthy mirror first, mirrors with an open circuit last
+    mirrors = provider_health.order_mirrors(mirrors)
 
     last_error = None
     for mirror in mirrors:
         url = f"{mirror.rstrip('/')}/{path.lstrip('/')}"
         try:
             print(f"Requesting Flibusta: {url}")
-            # Use session with disabled system proxy and safe headers
-            session = create_session()
-            response = session.get(url, headers=get_headers(), timeout=10)
+            # Shared client with disabled system proxy and safe headers
+            if cache:
+                response = scrape_cache.cached_get(url, policy=cache, headers=get_headers(), timeout=10, refresh=refresh)
+            else:
+                response = http_client.get(url, headers=get_headers(), timeout=10)
             if response.status_code == 200:
                 # Add base_url attribute for absolute link resolution
                 response.base_url = mirror
@@ -271,10 +272,16 @@ class Suggestion(BaseModel):
 
 @router.get("/search")
 def search_books(query: str, provider: str = "flibusta", limit: int = 25):
-    """Search for books by title, author, or keyword"""
+    """
+    Search for books by title, author, or keyword.
+    provider=all searches every book provider at once and returns merged, ranked results.
+    """
     if not query or len(query) < 2:
         raise HTTPException(status_code=400, detail="Query too short")
     
+    if provider == "all":
+        return search_all_providers(query, limit)["results"]
+    
     base_url = PROVIDERS.get(provider, PROVIDERS["flibusta"])
     print(f"DEBUG: Searching '{query}' with provider={provider}, base_url={base_url}")
     
@@ -293,7 +300,7 @@ def search_books(query: str, provider: str = "flibusta", limit: int = 25):
 def browse_content(ctype: str, genre: str, provider: str = "flibusta", refresh: bool = False):
     """
     Browse content list based on genre and provider.
-    If refresh=True, it will try to pick a random page.
+    If refresh=True, it will try to pick a random page and bypass the scrape cache.
     """
     
     print(f"DEBUG: browse_content called for {ctype}/{genre}. Refresh={refresh}")
@@ -306,9 +313,24 @@ def browse_content(ctype: str, genre: str, provider: str = "flibusta", refresh:
         print(f"DEBUG: Refresh requested, using random page {page}")
 
     if ctype == "books":
-        base_url = PROVIDERS.get(provider, PROVIDERS["flibusta"])
+        from services import catalog_warmer
+        if provider not in PROVIDERS:
+            provider = "flibusta"
+        # Local catalog filled by the background warmer: answered without a live scrape
+        if not refresh:
+            books = catalog_warmer.browse_from_catalog(provider, genre)
+            if books:
+                print(f"DEBUG: Browse {provider}/{genre} served from local catalog")
+                return books
+        
+        base_url = PROVIDERS[provider]
         print(f"DEBUG: Browsing with provider={provider}, base_url={base_url}, page={page}")
-        return browse_library_genre(genre, base_url, page=page)
+        books = scrape_genre_page(genre, base_url, page=page, refresh=refresh)
+        catalog_warmer.record_page(provider, genre, page, books)
+        # Randomize and limit to 10 as requested
+        if len(books) > 10:
+            books = random.sample(books, 10)
+        return books
     elif ctype == "audiobooks":
         # Use proper browsing with genre mapping and pagination
         from routers.audiobooks_source import browse_audioboo
@@ -317,6 +339,25 @@ def browse_content(ctype: str, genre: str, provider: str = "flibusta", refresh:
     # Placeholder for movies
     return []
 
+@router.get("/opds/status")
+def get_opds_status():
+    """Local Flibusta OPDS mirror: feeds, sync state and book count"""
+    from services import opds_sync
+    return opds_sync.status()
+
+@router.post("/opds/sync")
+def start_opds_sync(background_tasks: BackgroundTasks):
+    """Run an incremental OPDS sync of the followed genres now"""
+    from services import opds_sync
+    background_tasks.add_task(opds_sync.sync_followed_genres)
+    return {"status": "started"}
+
+@router.get("/catalog/status")
+def get_catalog_status():
+    """Progress of the background genre catalog warmer"""
+    from services import catalog_warmer
+    return catalog_warmer.status()
+
 @router.get("/details")
 def get_details(book_id: str, provider: str = "flibusta"):
     """Get full details for a specific book"""
@@ -351,6 +392,14 @@ def suggest_content(ctype: str, genre: str, provider: str = "flibusta"):
     else:
         raise HTTPException(status_code=400, detail="Invalid content type")
 
+def _not_in_library(kind: str, items: List[dict], author_field: str = "author") -> List[dict]:
+    """Drops candidates the local library already has, before any details page is fetched"""
+    from services import library_index
+    fresh = [item for item in items if not library_index.find_duplicate(kind, item.get("title"), item.get(author_field))]
+    if len(fresh) < len(items):
+        print(f"DEBUG: Skipped {len(items) - len(fresh)} candidates already in the library")
+    return fresh
+
 def suggest_audiobook(genre_name: str):
     """Suggest a random audiobook from a genre using search"""
     from routers.audiobooks_source import search_audioboo, fetch_audioboo_details
@@ -361,6 +410,7 @@ def suggest_audiobook(genre_name: str):
             # Try a default genre or just random search if nothing found
             books = search_audioboo("бестселлер")
             
+        books = _not_in_library("audiobooks", books or [])
         if books:
             random_book = random.choice(books[:10])
             # Fetch full details
@@ -423,6 +473,18 @@ def suggest_book(genre_name: str, provider: str = "flibusta"):
     # Get keywords for genre, or use genre name itself
     keywords = genre_keywords.get(genre_name, [genre_name.lower()])
     
+    # Local OPDS mirror: candidates already known to have EPUB and a cover
+    if provider == "flibusta":
+        try:
+            from services import opds_sync
+            for candidate in _not_in_library("books", opds_sync.random_books(genre_name, count=5)):
+                print(f"DEBUG: Checking mirrored candidate: {candidate['title']}")
+                details = scrape_book_details(candidate['id'], PROVIDERS["flibusta"])
+                if details and details.download_url and details.image and (details.pages or 0) >= 10:
+                    return details
+        except Exception as e:
+            print(f"DEBUG: OPDS mirror suggestion failed: {e}")
+    
     # Try each keyword until we get results
     for keyword in keywords:
         try:
@@ -438,6 +500,7 @@ def suggest_book(genre_name: str, provider: str = "flibusta"):
             else:
                 books = search_flibusta(keyword, base_url, limit=30)
             
+            books = _not_in_library("books", books or [])
             if books and len(books) > 0:
                 # Try up to 5 random books from results to find one that meets our new criteria
                 candidates = random.sample(books, min(len(books), 5))
@@ -477,8 +540,8 @@ def get_cover_url(book_id: str):
 def get_book_image_url(book_id: str):
     """Helper to scrape just the image URL from a book page"""
     try:
-        response = request_flibusta(f"b/{book_id}", timeout=5)
-        soup = BeautifulSoup(response.content, 'html.parser')
+        response = request_flibusta(f"b/{book_id}", timeout=5, cache="details")
+        soup = parse_html(response.content)
         base_url = response.base_url
         
         # Image (Cover)
@@ -523,14 +586,13 @@ def scrape_book_details(book_id: str, base_url: str = PROVIDERS["flibusta"]):
         title_tag = None
 
         # Requests with headers including referer
-        session = create_session()
-        session.headers.update(get_headers(referer=base_url))
+        headers = get_headers(referer=base_url)
         
         # RoyalLib doesn't usually block, but headers are good
         if "royallib.com" in base_url:
-            session.headers.update({'Host': 'royallib.com'})
+            headers['Host'] = 'royallib.com'
 
-        response = session.get(url, timeout=15)
+        response = scrape_cache.cached_get(url, policy="details", headers=headers, timeout=15)
         print(f"DEBUG: Response status for {url}: {response.status_code}")
         
         if response.status_code == 403:
@@ -538,7 +600,7 @@ def scrape_book_details(book_id: str, base_url: str = PROVIDERS["flibusta"]):
              # Fallback attempt?
         
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content)
         
         title = "Без названия"
         description = ""
@@ -697,8 +759,22 @@ def scrape_book_details(book_id: str, base_url: str = PROVIDERS["flibusta"]):
         traceback.print_exc()
         return None
 
-def browse_library_genre(genre_name: str, base_url: str, page: int = 1):
-    """Browse library genre page using HTML scraping"""
+# Book list containers, in order of preference
+MAIN_CONTAINER_SELECTORS = [
+    'div#postconn', 'div.oneotzb', 'article', 'div#main', 'div.main', 'div#content',
+    'div.content', 'div#container', 'div.page', 'div#dle-content', 'div.DLE-content', 'main'
+]
+
+def browse_library_genre(genre_name: str, base_url: str, page: int = 1, refresh: bool = False):
+    """Browse library genre page using HTML scraping (10 random books of the page)"""
+    books = scrape_genre_page(genre_name, base_url, page=page, refresh=refresh)
+    # Randomize and limit to 10 as requested
+    if len(books) > 10:
+        books = random.sample(books, 10)
+    return books
+
+def scrape_genre_page(genre_name: str, base_url: str, page: int = 1, refresh: bool = False):
+    """All books listed on one genre page of a library (up to 60)"""
     # Direct lookup in flat GENRE_MAPPING
     genre_slug = GENRE_MAPPING.get(genre_name, "sf")  # Default to sci-fi if not found
     
@@ -731,36 +807,24 @@ def browse_library_genre(genre_name: str, base_url: str, page: int = 1):
         # Coollib is slower, needs longer timeout
         timeout = 30 if "coollib" in base_url else 10
         
-        # Use session to manage headers and disable system proxies
-        session = create_session()
-        session.headers.update(get_headers(referer=base_url))
-        
-        response = session.get(browse_url, timeout=timeout)
+        # Genre pages are cached for hours; refresh=True forces a live fetch
+        response = scrape_cache.cached_get(browse_url, policy="browse", headers=get_headers(referer=base_url), timeout=timeout, refresh=refresh)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Hot path: lxml + compiled CSS selectors when available (see services/html_parser.py)
+        h = html_parser.get_backend()
+        soup = h.document(response.content)
         # Try different container IDs used by various providers
         # Coollib uses div#postconn or article or div.oneotzb, Flibusta uses div#main
-        main = soup.find('div', id='postconn') or \
-               soup.find('div', class_='oneotzb') or \
-               soup.find('article') or \
-               soup.find('div', id='main') or \
-               soup.find('div', class_='main') or \
-               soup.find('div', id='content') or \
-               soup.find('div', class_='content') or \
-               soup.find('div', id='container') or \
-               soup.find('div', class_='page') or \
-               soup.find('div', id='dle-content') or \
-               soup.find('div', class_='DLE-content') or \
-               soup.find('main')
+        main = h.first(soup, MAIN_CONTAINER_SELECTORS)
                
-        if not main: 
+        if main is None: 
             print(f"No main container found on {base_url}, falling back to full page")
             main = soup
         else:
             # Debug: log which container was found
-            container_id = main.get('id', '')
-            container_class = main.get('class', [])
+            container_id = h.attr(main, 'id', '')
+            container_class = h.attr(main, 'class', '')
             print(f"DEBUG: Found container - id='{container_id}', class='{container_class}'")
 
         books = []
@@ -772,11 +836,8 @@ def browse_library_genre(genre_name: str, base_url: str, page: int = 1):
         # Pattern for book links: /book/author/title.html
         if "royallib.com" in base_url:
             # RoyalLib genre pages have tables or simple lists
-            items = main.select('a[href*="/book/"]')
-            
-            for a in items:
-                href = a['href']
-                if not href.endswith('.html'): continue
+            for a in h.select(main, ROYALLIB_BOOK_SELECTOR):
+                href = h.attr(a, 'href')
                 
                 # Extract ID (the full path starting from /book/)
                 book_id = href.split('royallib.com')[-1] if 'royallib.com' in href else href
@@ -784,17 +845,17 @@ def browse_library_genre(genre_name: str, base_url: str, page: int = 1):
                 
                 if book_id in seen_ids: continue
                 
-                title = a.get_text(strip=True)
+                title = h.text(a)
                 if not title or len(title) < 2: continue
 
                 # Author is usually the next link or in the same row
                 author = "Неизвестен"
                 # Heuristic: RoyalLib usually lists author before or after title
                 # Let's try to find author link nearby
-                row = a.find_parent('tr')
-                if row:
-                    author_a = row.select_one('a[href*="/author/"]')
-                    if author_a: author = author_a.get_text(strip=True)
+                row = h.closest(a, ('tr',))
+                if row is not None:
+                    author_a = h.select_one(row, ROYALLIB_AUTHOR_SELECTOR)
+                    if author_a is not None: author = h.text(author_a)
                 
                 books.append({
                     "id": book_id,
@@ -809,28 +870,27 @@ def browse_library_genre(genre_name: str, base_url: str, page: int = 1):
             # Flibusta/CoolLib standard scraping
             print(f"DEBUG: Parsing {base_url}, looking for book links...")
             
-            # Count all links for debugging
-            all_links = main.find_all('a', href=True)
-            print(f"DEBUG: Found {len(all_links)} total links in main container")
+            # Only /b/ links are candidates, filtered by the selector instead of a Python loop
+            candidate_links = h.select(main, BOOK_LINK_SELECTOR)
+            print(f"DEBUG: Found {len(candidate_links)} /b/ links in main container")
             
             # Try to find book links
             book_links_found = 0
-            for a in all_links:
-                href = a['href']
+            for a in candidate_links:
+                href = h.attr(a, 'href')
                 book_id = None
                 
                 # More flexible book ID extraction
                 # Handles both /b/123 (Flibusta) and /b/123-author-title (Coollib)
-                if '/b/' in href:
-                    match = re.search(r'/b/(\d+)', href)
-                    if match: 
-                        book_id = match.group(1)
-                        book_links_found += 1
+                match = re.search(r'/b/(\d+)', href)
+                if match: 
+                    book_id = match.group(1)
+                    book_links_found += 1
                 
                 if not book_id or book_id in seen_ids: 
                     continue
                 
-                title = a.get_text(strip=True)
+                title = h.text(a)
                 if not title or len(title) < 2 or title.startswith('(') or title.isdigit():
                     continue
                 
@@ -840,22 +900,23 @@ def browse_library_genre(genre_name: str, base_url: str, page: int = 1):
                 # For Flibusta: author link comes BEFORE the book title
                 
                 # Check parent element for author (works for both)
-                parent = a.find_parent(['div', 'li', 'tr'])
-                if parent:
+                parent = h.closest(a, ('div', 'li', 'tr'))
+                if parent is not None:
                     # Find all author links in the parent
-                    author_links = parent.find_all('a', href=re.compile(r'/a/|/author/'))
-                    for author_link in author_links:
-                        if author_link != a:  # Not the book link itself
-                            author_text = author_link.get_text(strip=True)
+                    for author_link in h.select(parent, AUTHOR_LINK_SELECTOR):
+                        if author_link is not a:  # Not the book link itself
+                            author_text = h.text(author_link)
                             if author_text and len(author_text) > 2:
                                 author = author_text
                                 break
                 
                 # Fallback: check next sibling link
                 if author == "Неизвестен":
-                    next_a = a.find_next('a', href=True)
-                    if next_a and ('/a/' in next_a['href'] or 'avtor-' in next_a['href'] or '/author/' in next_a['href']):
-                        author = next_a.get_text(strip=True)
+                    next_a = h.next_link(a)
+                    if next_a is not None:
+                        next_href = h.attr(next_a, 'href')
+                        if '/a/' in next_href or 'avtor-' in next_href or '/author/' in next_href:
+                            author = h.text(next_a)
 
                 books.append({
                     "id": book_id,
@@ -871,10 +932,6 @@ def browse_library_genre(genre_name: str, base_url: str, page: int = 1):
             
             print(f"DEBUG: Found {book_links_found} book links, extracted {len(books)} valid books")
         
-        # Randomize and limit to 10 as requested
-        if len(books) > 10:
-            books = random.sample(books, 10)
-        
         if len(books) == 0:
             print(f"WARNING: No books found for genre '{genre_name}' on {base_url}")
             if "coollib" in base_url:
@@ -897,41 +954,53 @@ def try_flibusta_genre(genre_name: str):
     return None
 
 def search_flibusta(query: str, base_url: str, limit: int = 25):
-    """Search Flibusta for books"""
+    """Search Flibusta for books (local OPDS mirror first, live scraping on a miss)"""
+    from services import opds_sync
+    try:
+        local_books = opds_sync.search_local(query, limit)
+    except Exception as e:
+        print(f"OPDS mirror search failed: {e}")
+        local_books = []
+    if len(local_books) >= min(limit, opds_sync.LOCAL_MIN_RESULTS):
+        print(f"Found {len(local_books)} books in local OPDS mirror")
+        return local_books
+    
     try:
         # Flibusta search URL pattern
         search_url = f"{base_url.rstrip('/')}/booksearch?ask={quote(query)}"
         print(f"Searching Flibusta: {search_url}")
         
-        response = request_flibusta(f"booksearch?ask={quote(query)}")
-        soup = BeautifulSoup(response.content, 'html.parser')
+        response = request_flibusta(f"booksearch?ask={quote(query)}", cache="search")
+        h = html_parser.get_backend()
+        soup = h.document(response.content)
         
         books = []
         seen_ids = set()
         
         # Find all book links
-        main = soup.find('div', id='main') or soup
-        for a in main.find_all('a', href=True):
-            href = a['href']
+        main = h.first(soup, ['div#main'])
+        if main is None:
+            main = soup
+        for a in h.select(main, BOOK_LINK_SELECTOR):
+            href = h.attr(a, 'href')
             book_id = None
             
-            if '/b/' in href:
-                match = re.search(r'/b/(\d+)', href)
-                if match:
-                    book_id = match.group(1)
+            match = re.search(r'/b/(\d+)', href)
+            if match:
+                book_id = match.group(1)
             
             if not book_id or book_id in seen_ids:
                 continue
             
-            title = a.get_text(strip=True)
+            title = h.text(a)
             if not title or len(title) < 2 or title.startswith('(') or title.isdigit():
                 continue
             
             # Try to find author
             author = "Неизвестен"
-            next_a = a.find_next('a', href=True)
-            if next_a and '/a/' in next_a['href']:
-                author = next_a.get_text(strip=True)
+            next_a = h.next_link(a)
+            if next_a is not None and '/a/' in h.attr(next_a, 'href'):
+                author = h.text(next_a)
             
             books.append({
                 "id": book_id,
@@ -947,7 +1016,9 @@ def search_flibusta(query: str, base_url: str, limit: int = 25):
                 break
         
         print(f"Found {len(books)} books on Flibusta")
-        return books
+        # A few mirror hits were not enough on their own, but they go first
+        live_ids = {b["id"] for b in books}
+        return ([b for b in local_books if b["id"] not in live_ids] + books)[:limit]
         
     except Exception as e:
         print(f"Flibusta search failed: {e}")
@@ -962,37 +1033,39 @@ def search_coollib(query: str, base_url: str, limit: int = 25):
         search_url = f"{base_url.rstrip('/')}/search?q={quote(query)}"
         print(f"Searching Coollib: {search_url}")
         
-        response = requests.get(search_url, headers=get_headers(referer=base_url), timeout=10)
+        response = scrape_cache.cached_get(search_url, policy="search", headers=get_headers(referer=base_url), timeout=10)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        h = html_parser.get_backend()
+        soup = h.document(response.content)
         
         books = []
         seen_ids = set()
         
         # Coollib uses /b/ links for books
-        main = soup.find('div', id='main') or soup.find('div', class_='content') or soup
+        main = h.first(soup, ['div#main', 'div.content'])
+        if main is None:
+            main = soup
         
-        for a in main.find_all('a', href=True):
-            href = a['href']
+        for a in h.select(main, BOOK_LINK_SELECTOR):
+            href = h.attr(a, 'href')
             book_id = None
             
-            if '/b/' in href:
-                match = re.search(r'/b/(\d+)', href)
-                if match:
-                    book_id = match.group(1)
+            match = re.search(r'/b/(\d+)', href)
+            if match:
+                book_id = match.group(1)
             
             if not book_id or book_id in seen_ids:
                 continue
             
-            title = a.get_text(strip=True)
+            title = h.text(a)
             if not title or len(title) < 2 or title.startswith('(') or title.isdigit():
                 continue
             
             # Try to find author
             author = "Неизвестен"
-            next_a = a.find_next('a', href=True)
-            if next_a and ('/a/' in next_a['href'] or 'author' in next_a['href']):
-                author = next_a.get_text(strip=True)
+            next_a = h.next_link(a)
+            if next_a is not None and ('/a/' in h.attr(next_a, 'href') or 'author' in h.attr(next_a, 'href')):
+                author = h.text(next_a)
             
             books.append({
                 "id": book_id,
@@ -1023,25 +1096,24 @@ def search_royallib(query: str, base_url: str, limit: int = 25):
         search_url = f"{base_url.rstrip('/')}/search/?q={quote(query)}"
         print(f"Searching RoyalLib: {search_url}")
         
-        session = requests.Session()
-        session.headers.update(get_headers(referer=base_url))
-        session.headers.update({'Host': 'royallib.com'})
+        headers = get_headers(referer=base_url)
+        headers['Host'] = 'royallib.com'
         
-        response = session.get(search_url, timeout=10)
+        response = scrape_cache.cached_get(search_url, policy="search", headers=headers, timeout=10)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        h = html_parser.get_backend()
+        soup = h.document(response.content)
         
         books = []
         seen_ids = set()
         
         # RoyalLib uses /book/ links
-        main = soup.find('div', id='content') or soup.find('main') or soup
+        main = h.first(soup, ['div#content', 'main'])
+        if main is None:
+            main = soup
         
-        for a in main.find_all('a', href=True):
-            href = a['href']
-            
-            if '/book/' not in href or not href.endswith('.html'):
-                continue
+        for a in h.select(main, ROYALLIB_BOOK_SELECTOR):
+            href = h.attr(a, 'href')
             
             # Extract book ID (full path)
             book_id = href.split('royallib.com')[-1] if 'royallib.com' in href else href
@@ -1051,17 +1123,19 @@ def search_royallib(query: str, base_url: str, limit: int = 25):
             if book_id in seen_ids:
                 continue
             
-            title = a.get_text(strip=True)
+            title = h.text(a)
             if not title or len(title) < 2:
                 continue
             
             # Try to find author
             author = "Неизвестен"
-            row = a.find_parent('tr') or a.find_parent('div', class_='book-item')
-            if row:
-                author_a = row.find('a', href=re.compile(r'/author/'))
-                if author_a:
-                    author = author_a.get_text(strip=True)
+            row = h.closest(a, ('tr',))
+            if row is None:
+                row = h.closest(a, ('div',), class_='book-item')
+            if row is not None:
+                author_a = h.select_one(row, ROYALLIB_AUTHOR_SELECTOR)
+                if author_a is not None:
+                    author = h.text(author_a)
             
             books.append({
                 "id": book_id,
@@ -1091,6 +1165,22 @@ def search_royallib(query: str, base_url: str, limit: int = 25):
 
 
 
+def search_all_providers(query: str, limit: int = 25):
+    """Meta-search over flibusta, coollib and royallib (see services/meta_search.py)"""
+    from services import meta_search
+    searchers = {
+        "flibusta": lambda q: search_flibusta(q, PROVIDERS["flibusta"], limit),
+        "coollib": lambda q: search_coollib(q, PROVIDERS["coollib"], limit),
+        "royallib": lambda q: search_royallib(q, PROVIDERS["royallib"], limit),
+    }
+    # No point waiting for providers whose circuit is open
+    searchers = {name: search for name, search in searchers.items()
+                 if provider_health.is_available(host_of(PROVIDERS[name]))} or searchers
+    hosts = {name: host_of(PROVIDERS[name]) for name in searchers}
+    outcome = meta_search.meta_search(query, searchers, limit=limit, hosts=hosts)
+    print(f"Meta-search '{query}': {len(outcome['results'])} results in {outcome['elapsed_ms']} ms, {outcome['providers']}")
+    return outcome
+
 def get_russian_classic_by_genre(genre_name: str):
     """Fallback: curated Russian classics by genre"""
     classics = {
@@ -1157,8 +1247,29 @@ def suggest_movie(genre_name: str):
 
 @router.get("/proxy")
 def proxy_content(url: str):
-    """Proxy content from external URL to avoid CORS/IP blocking. Auto-unzips archives if needed."""
+    """
+    Proxy content from external URL to avoid CORS/IP blocking. Auto-unzips archives if needed.
+    Archives are spooled to disk past a few MB, the book is streamed out of them and cached by URL.
+    """
+    from fastapi.responses import FileResponse
+    from services import archive_proxy
+    
+    def disposition(filename):
+        # Encode filename for header
+        encoded_name = quote(filename)
+        return f'attachment; filename="{encoded_name}"; filename*=UTF-8\'\'{encoded_name}'
+    
     try:
+        # Repeat request for an archive we already unpacked: no network at all
+        cached = archive_proxy.get_cached(url)
+        if cached:
+            print(f"DEBUG: Proxy cache hit for {url}")
+            return FileResponse(
+                cached.path,
+                media_type=cached.media_type,
+                headers={'Content-Disposition': disposition(cached.filename)}
+            )
+        
         # Extract domain for Referer
         from urllib.parse import urlparse
         domain = urlparse(url).netloc
@@ -1172,10 +1283,8 @@ def proxy_content(url: str):
             'Referer': referer
         }
         
-        # Verify if we should trust env (usually proxy bypass needed for Flibusta/Coollib)
-        session = create_session()
-        
-        response = session.get(url, headers=headers, stream=True, timeout=60)
+        # Shared client bypasses system proxies (usually needed for Flibusta/Coollib)
+        response = http_client.get(url, headers=headers, stream=True, timeout=60)
         response.raise_for_status()
         
         content_type = response.headers.get('Content-Type', '').lower()
@@ -1188,67 +1297,52 @@ def proxy_content(url: str):
         is_zip = not is_image and ('zip' in content_type or '.zip' in url.lower() or '.zip' in content_disp.lower())
         
         if is_zip:
-            # We need to read the whole content to unzip
-            content = response.content
+            # The central directory is at the end of a zip: spool the body (RAM up to a few MB, then disk)
+            spooled = archive_proxy.spool(response.iter_content(chunk_size=archive_proxy.CHUNK_SIZE))
             try:
-                import zipfile
-                import io
-                with zipfile.ZipFile(io.BytesIO(content)) as z:
-                    # Filter for book files
-                    files = z.namelist()
-                    # Priority: fb2, epub, mobi, txt
-                    target_file = None
-                    for ext in ['.fb2', '.epub', '.mobi', '.txt']:
-                        candidates = [f for f in files if f.lower().endswith(ext)]
-                        if candidates:
-                            target_file = candidates[0]
-                            break
-                    
-                    if target_file:
-                        print(f"DEBUG: Auto-unzipped {target_file} from {url}")
-                        extracted_content = z.read(target_file)
-                        
-                        # Guess semantic content type
-                        new_ctype = "application/octet-stream"
-                        if target_file.endswith('.fb2'): new_ctype = "application/x-fictionbook+xml"
-                        elif target_file.endswith('.epub'): new_ctype = "application/epub+zip"
-                        
-                        # Encode filename for header
-                        encoded_name = quote(target_file)
-                        
-                        from fastapi.responses import Response
-                        return Response(
-                            content=extracted_content,
-                            media_type=new_ctype,
-                            headers={
-                                'Content-Disposition': f'attachment; filename="{encoded_name}"; filename*=UTF-8\'\'{encoded_name}',
-                                'Content-Length': str(len(extracted_content))
-                            }
-                        )
+                archive = zipfile.ZipFile(spooled)
+                member = archive_proxy.find_book_member(archive)
+                if member:
+                    print(f"DEBUG: Auto-unzipping {member.filename} from {url}")
+                    stream = archive_proxy.stream_member(url, spooled, archive, member)
+                    return archive_proxy.CleanupStreamingResponse(
+                        stream,
+                        cleanup=archive_proxy.closer(stream, archive, spooled),
+                        media_type=archive_proxy.media_type_for(member.filename),
+                        headers={
+                            'Content-Disposition': disposition(member.filename),
+                            'Content-Length': str(member.file_size)
+                        }
+                    )
+                archive.close()
             except Exception as zip_err:
                 print(f"DEBUG: Failed to unzip content from {url}: {zip_err}")
-                # Fallback to original content (which is already in 'content' var)
-                pass
+                # Fallback to original content (still in the spool)
             
-            # Fallback for failed unzip OR if we read content but didn't act on it
-            from fastapi.responses import Response
-            return Response(
-                content=content,
+            # Fallback for failed unzip OR an archive without a book inside
+            spooled.seek(0)
+            stream = archive_proxy.stream_file(spooled)
+            return archive_proxy.CleanupStreamingResponse(
+                stream,
+                cleanup=archive_proxy.closer(stream, spooled),
                 media_type=response.headers.get('Content-Type'),
                 headers={
-                    'Content-Disposition': response.headers.get('Content-Disposition', ''),
-                    'Content-Length': str(len(content))
+                    'Content-Disposition': content_disp,
+                    'Content-Length': str(archive_proxy.spooled_size(spooled))
                 }
             )
 
         # If not zip (and stream not consumed), stream it
-        from fastapi.responses import StreamingResponse
-        return StreamingResponse(
+        passthrough_headers = {'Content-Disposition': content_disp}
+        # Length is only exact if requests does not decompress the body on the fly
+        if response.headers.get('Content-Length') and not response.headers.get('Content-Encoding'):
+            passthrough_headers['Content-Length'] = response.headers['Content-Length']
+        # Closing the upstream response also frees its host slot in the shared client
+        return archive_proxy.CleanupStreamingResponse(
             response.iter_content(chunk_size=8192),
+            cleanup=archive_proxy.closer(response),
             media_type=response.headers.get('Content-Type'),
-            headers={
-                'Content-Disposition': response.headers.get('Content-Disposition', ''),
-            }
+            headers=passthrough_headers
         )
     except Exception as e:
         print(f"Proxy failed for {url}: {e}")
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 import requests
 import feedparser
-from bs4 import BeautifulSoup
+from services.http_client import http_client
+from services.html_parser import parse_html
 import os
 import shutil
 from sqlalchemy.orm import Session
 from database_books import Book, get_db_books
 from dependencies import get_db_books_simple
+from services import library_index, media_store
 import uuid
 
 router = APIRouter(prefix="/flibusta", tags=["flibusta"])
@@ -25,7 +27,7 @@ def search_flibusta(q: str = Query(..., min_length=2)):
     search_url = f"{OPDS_URL}/search?searchType=books&searchTerm={requests.utils.quote(q)}"
     
     try:
-        response = requests.get(search_url, timeout=15)
+        response = http_client.get(search_url, timeout=15)
         response.raise_for_status()
         
         feed = feedparser.parse(response.content)
@@ -53,7 +55,7 @@ def search_flibusta(q: str = Query(..., min_length=2)):
                     "id": entry.id.split('/')[-1] if 'id' in entry else str(uuid.uuid4()),
                     "title": entry.title,
                     "author": entry.author if 'author' in entry else "Неизвестен",
-                    "description": BeautifulSoup(entry.summary, "html.parser").get_text() if 'summary' in entry else "",
+                    "description": parse_html(entry.summary).get_text() if 'summary' in entry else "",
                     "image": links.get('image'),
                     "links": links
                 })
@@ -74,32 +76,32 @@ async def download_from_flibusta(
     """Download a book from Flibusta and add to library"""
     try:
         # 1. Download the book file
-        response = requests.get(download_url, timeout=30, stream=True)
-        response.raise_for_status()
-        
-        # Determine filename and extension
-        ext = ".epub" 
-        
-        # Get filename from headers if possible
-        cd = response.headers.get('content-disposition')
-        if cd and 'filename=' in cd:
-            filename = cd.split('filename=')[-1].strip('"')
-        else:
-            filename = f"{title}_{author}{ext}".replace(" ", "_")
-        
-        safe_filename = "".join([c for c in filename if c.isalnum() or c in "._-"]).strip()
-        file_save_path = os.path.join(BOOKS_UPLOADS, safe_filename)
-        
-        os.makedirs(BOOKS_UPLOADS, exist_ok=True)
-        
-        with open(file_save_path, 'wb') as f:
-            shutil.copyfileobj(response.raw, f)
-            
+        with http_client.get(download_url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+
+            # Determine filename and extension
+            ext = ".epub" 
+
+            # Get filename from headers if possible
+            cd = response.headers.get('content-disposition')
+            if cd and 'filename=' in cd:
+                filename = cd.split('filename=')[-1].strip('"')
+            else:
+                filename = f"{title}_{author}{ext}".replace(" ", "_")
+
+            safe_filename = "".join([c for c in filename if c.isalnum() or c in "._-"]).strip()
+            file_save_path = os.path.join(BOOKS_UPLOADS, safe_filename)
+
+            os.makedirs(BOOKS_UPLOADS, exist_ok=True)
+
+            with media_store.rewriting(file_save_path) as tmp, open(tmp, 'wb') as f:
+                shutil.copyfileobj(response.raw, f)
+
         # 2. Download thumbnail
         thumb_rel_path = None
         if image_url:
             try:
-                img_res = requests.get(image_url, timeout=10)
+                img_res = http_client.get(image_url, timeout=10)
                 if img_res.status_code == 200:
                     img_ext = os.path.splitext(image_url)[1] or ".jpg"
                     if "?" in img_ext: img_ext = img_ext.split("?")[0]
@@ -107,7 +109,7 @@ async def download_from_flibusta(
                     thumb_filename = f"thumb_{os.path.splitext(safe_filename)[0]}{img_ext}"
                     thumb_full_path = os.path.join(BOOKS_UPLOADS, thumb_filename)
                     
-                    with open(thumb_full_path, 'wb') as f:
+                    with media_store.rewriting(thumb_full_path) as tmp, open(tmp, 'wb') as f:
                         f.write(img_res.content)
                     
                     thumb_rel_path = f"uploads/books/{thumb_filename}"
@@ -137,6 +139,7 @@ async def download_from_flibusta(
         db.add(db_book)
         db.commit()
         db.refresh(db_book)
+        library_index.register("books", db_book.id, db_book.title, db_book.author)
         
         return {"status": "success", "book_id": db_book.id, "title": db_book.title}
         
@@ -1,11 +1,21 @@
+import io
 import os
 import shutil
 import hashlib
 import re
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import python_multipart
+from python_multipart.multipart import parse_options_header
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
+from fastapi.concurrency import run_in_threadpool
 from PIL import Image, ExifTags
 import datetime
 from utils import apply_image_filter
+from services import media_store
 
 def get_exif_date(path):
     try:
@@ -26,10 +36,52 @@ def get_exif_date(path):
         print(f"Error reading EXIF for {path}: {e}")
     return None
 
+# EXIF dates indexed by path and validated by (mtime, size), so listings don't reopen every photo.
+# Least recently used paths are dropped beyond MAX_EXIF_INDEX (deleted and moved photos never come back)
+MAX_EXIF_INDEX = 50000
+_exif_index = OrderedDict()
+_exif_index_lock = threading.Lock()
+
+def get_indexed_exif_date(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    with _exif_index_lock:
+        cached = _exif_index.get(path)
+        if cached:
+            _exif_index.move_to_end(path)
+    if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+        return cached[2]
+    value = get_exif_date(path)
+    with _exif_index_lock:
+        _exif_index[path] = (st.st_mtime, st.st_size, value)
+        _exif_index.move_to_end(path)
+        while len(_exif_index) > MAX_EXIF_INDEX:
+            _exif_index.popitem(last=False)
+    return value
+
+def make_photo_thumbnail(file_path, quality=85):
+    """Creates the 300x300 <name>_thumb.webp next to the photo and returns its path"""
+    thumb_path = os.path.join(os.path.dirname(file_path), f"{os.path.splitext(os.path.basename(file_path))[0]}_thumb.webp")
+    with Image.open(file_path) as img:
+        img.thumbnail((300, 300), Image.Resampling.LANCZOS)
+        with media_store.rewriting(thumb_path) as tmp:
+            img.save(tmp, "WEBP", quality=quality)
+    return thumb_path
+
 router = APIRouter(prefix="/gallery", tags=["gallery"])
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 GALLERY_UPLOADS = os.path.join(BASE_DIR, "uploads", "gallery")
+ALLOWED_PHOTO_EXT = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+# Batch uploads: thumbnails and EXIF are produced by a small worker pool
+MAX_BATCH_FILES = 5000
+MAX_TRACKED_BATCHES = 20
+_photo_workers = ThreadPoolExecutor(max_workers=max(2, min(4, os.cpu_count() or 2)), thread_name_prefix="gallery-photo")
+_upload_batches = OrderedDict()
+_batches_lock = threading.Lock()
 
 @router.get("")
 def get_gallery_contents(folder: str = ""):
@@ -94,7 +146,7 @@ def get_gallery_contents(folder: str = ""):
                             thumb_filename = thumb_name
                         
                         # Get real filming date from EXIF
-                        exif_date = get_exif_date(item_path)
+                        exif_date = get_indexed_exif_date(item_path)
                         modified_time = exif_date if exif_date else os.path.getmtime(item_path)
 
                         contents.append({
@@ -140,7 +192,7 @@ def search_photos(query: str):
                         relative_thumb_path = os.path.relpath(thumb_path, BASE_DIR).replace('\\', '/')
                         
                         # Get real filming date from EXIF
-                        exif_date = get_exif_date(file_path)
+                        exif_date = get_indexed_exif_date(file_path)
                         modified_time = exif_date if exif_date else os.path.getmtime(file_path)
 
                         results.append({
@@ -177,7 +229,7 @@ def get_photo(photo_id: int):
                         relative_thumb_path = os.path.relpath(thumb_path, BASE_DIR).replace('\\', '/')
                         
                         # Get real filming date from EXIF
-                        exif_date = get_exif_date(file_path)
+                        exif_date = get_indexed_exif_date(file_path)
                         modified_time = exif_date if exif_date else os.path.getmtime(file_path)
 
                         return {
@@ -241,6 +293,7 @@ def delete_folder(path: str):
             raise HTTPException(status_code=400, detail="Указанный путь не является папкой")
         
         shutil.rmtree(requested_path)
+        media_store.collect_garbage()
         
         return {"message": "Папка и её содержимое удалены успешно"}
     except Exception as e:
@@ -255,7 +308,7 @@ def delete_photo(photo_id: int):
                 file_id = int(hashlib.md5(file_path.encode()).hexdigest(), 16) % 10**8
                 
                 if file_id == photo_id:
-                    os.remove(file_path)
+                    media_store.release(file_path)
                     
                     thumb_path = os.path.join(os.path.dirname(file_path), f"{os.path.splitext(file)[0]}_thumb.webp")
                     if os.path.exists(thumb_path):
@@ -288,15 +341,13 @@ async def upload_photo_to_folder(folder: str = Form(""), file: UploadFile = File
         
         file_path = os.path.join(requested_path, file.filename)
         print(f"DEBUG: Saving file to: {file_path}")
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        stored = media_store.store_fileobj(file.file, file_path)
+        if stored.deduplicated:
+            print(f"DEBUG: Same content already stored, linked {file.filename} to blob {stored.sha256[:12]}")
         
         try:
-            with Image.open(file_path) as img:
-                img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                thumb_path = os.path.join(requested_path, f"{os.path.splitext(file.filename)[0]}_thumb.webp")
-                img.save(thumb_path, "WEBP", quality=85)
-                print(f"DEBUG: Thumbnail generated: {thumb_path}")
+            thumb_path = make_photo_thumbnail(file_path)
+            print(f"DEBUG: Thumbnail generated: {thumb_path}")
         except Exception as e:
             print(f"Ошибка при создании миниатюры: {e}")
         
@@ -306,6 +357,227 @@ async def upload_photo_to_folder(folder: str = Form(""), file: UploadFile = File
         print(f"ERROR during upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при загрузке файла: {str(e)}")
 
+def _process_batch_photo(batch, entry, file_path):
+    entry["status"] = "processing"
+    try:
+        thumb_path = make_photo_thumbnail(file_path)
+        entry["thumbnail_path"] = "/" + os.path.relpath(thumb_path, BASE_DIR).replace('\\', '/')
+        exif_date = get_indexed_exif_date(file_path)
+        entry["modified"] = exif_date if exif_date else os.path.getmtime(file_path)
+        entry["status"] = "done"
+    except Exception as e:
+        print(f"Ошибка при обработке {file_path}: {e}")
+        entry["status"] = "error"
+        entry["error"] = str(e)
+    finally:
+        with _batches_lock:
+            batch["processed"] += 1
+            if batch["processed"] + batch["failed"] >= batch["total"] and batch["received"]:
+                batch["status"] = "done"
+                batch["finished_at"] = time.time()
+
+def _resolve_gallery_folder(folder):
+    base_path = os.path.abspath(GALLERY_UPLOADS)
+    requested_path = os.path.abspath(os.path.join(base_path, folder))
+    try:
+        inside = os.path.commonpath([requested_path, base_path]) == base_path
+    except ValueError:
+        inside = False
+    if not inside:
+        raise HTTPException(status_code=400, detail="Недопустимый путь")
+    return requested_path
+
+class _BatchReceiver:
+    """
+    Callbacks of the multipart parser for upload_batch. Each file part is
+    hashed into the media store while it arrives and handed to the photo
+    workers as soon as the part ends, so the request body is never spooled.
+    The "folder" field has to come before the files.
+    """
+
+    MAX_FIELD_SIZE = 64 * 1024
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.requested_path = None
+        self.files = 0
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._field_name = None
+        self._field_data = None
+        self._writer = None
+        self._entry = None
+
+    def _target_dir(self):
+        if self.requested_path is None:
+            self.requested_path = _resolve_gallery_folder(self.batch["folder"])
+            os.makedirs(self.requested_path, exist_ok=True)
+        return self.requested_path
+
+    def _fail(self, entry, error):
+        entry["status"] = "error"
+        entry["error"] = error
+        with _batches_lock:
+            self.batch["failed"] += 1
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._field_name = None
+        self._field_data = None
+        self._writer = None
+        self._entry = None
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._field_name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in options:
+            self._field_data = bytearray()
+            return
+        if self._field_name != "files":
+            return
+        self.files += 1
+        if self.files > MAX_BATCH_FILES:
+            raise HTTPException(status_code=400, detail=f"Слишком много файлов (максимум {MAX_BATCH_FILES})")
+        filename = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+        self._entry = {"name": filename, "status": "receiving", "thumbnail_path": None, "modified": None, "error": None}
+        with _batches_lock:
+            self.batch["files"].append(self._entry)
+            self.batch["total"] += 1
+        if not filename or os.path.splitext(filename)[1].lower() not in ALLOWED_PHOTO_EXT:
+            self._fail(self._entry, "Неподдерживаемый формат изображения")
+            return
+        self._target_dir()
+        self._writer = media_store.StoreWriter()
+
+    def on_part_data(self, data, start, end):
+        if self._field_data is not None:
+            if len(self._field_data) + end - start > self.MAX_FIELD_SIZE:
+                raise HTTPException(status_code=400, detail="Слишком большое поле формы")
+            self._field_data.extend(data[start:end])
+        elif self._writer is not None:
+            self._writer.write(data[start:end])
+
+    def on_part_end(self):
+        if self._field_data is not None:
+            if self._field_name == "folder":
+                if self.requested_path is not None:
+                    raise HTTPException(status_code=400, detail="Поле folder должно идти перед файлами")
+                self.batch["folder"] = self._field_data.decode("utf-8", "replace")
+                self._target_dir()
+            return
+        if self._writer is None:
+            return
+        writer, entry = self._writer, self._entry
+        self._writer = None
+        file_path = os.path.join(self.requested_path, entry["name"])
+        try:
+            writer.commit(file_path)
+        except Exception as e:
+            writer.abort()
+            self._fail(entry, str(e))
+            return
+        entry["status"] = "stored"
+        entry["file_path"] = "/" + os.path.relpath(file_path, BASE_DIR).replace('\\', '/')
+        _photo_workers.submit(_process_batch_photo, self.batch, entry, file_path)
+
+    def abort(self):
+        """The request failed mid-part: drop the half-written file"""
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+            self._fail(self._entry, "Загрузка прервана")
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+@router.post("/upload_batch")
+async def upload_photos_batch(request: Request):
+    """
+    Upload many photos in one multipart request (fields: "folder", then repeated "files").
+    The body is parsed as it streams in: each file is stored when its part ends and its
+    thumbnail, EXIF and indexing run in a worker pool while the next files are still
+    uploading. Per-file progress: GET /gallery/upload_batch/{batch_id}
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Ожидается multipart/form-data")
+
+    batch_id = uuid.uuid4().hex[:12]
+    batch = {
+        "batch_id": batch_id,
+        "folder": "",
+        "status": "uploading",
+        "total": 0,
+        "processed": 0,
+        "failed": 0,
+        "received": False,
+        "started_at": time.time(),
+        "finished_at": None,
+        "files": []
+    }
+    receiver = _BatchReceiver(batch)
+    with _batches_lock:
+        _upload_batches[batch_id] = batch
+        while len(_upload_batches) > MAX_TRACKED_BATCHES:
+            _upload_batches.popitem(last=False)
+
+    try:
+        parser = python_multipart.MultipartParser(boundary, receiver.callbacks())
+        async for chunk in request.stream():
+            # File writes and hashing happen in the callbacks: keep them off the event loop
+            await run_in_threadpool(parser.write, chunk)
+        parser.finalize()
+        if not receiver.files:
+            raise HTTPException(status_code=400, detail="Файлы не переданы")
+    except BaseException:
+        await run_in_threadpool(receiver.abort)
+        with _batches_lock:
+            if not batch["files"]:
+                _upload_batches.pop(batch_id, None)
+        raise
+    finally:
+        with _batches_lock:
+            batch["received"] = True
+            if batch["processed"] + batch["failed"] >= batch["total"]:
+                batch["status"] = "done"
+                batch["finished_at"] = time.time()
+            else:
+                batch["status"] = "processing"
+    return get_upload_batch_status(batch_id)
+
+@router.get("/upload_batch/{batch_id}")
+def get_upload_batch_status(batch_id: str):
+    with _batches_lock:
+        batch = _upload_batches.get(batch_id)
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        result = dict(batch)
+        result["files"] = [dict(f) for f in batch["files"]]
+    result.pop("received", None)
+    return result
+
 @router.post("/move_photo")
 async def move_photo(photo_path: str = Form(...), target_folder: str = Form(None)):
     try:
@@ -453,12 +725,16 @@ async def apply_filter_to_photo(photo_id: int, filter_type: str = None):
         try:
             with Image.open(source_file_path) as img:
                 filtered_img = apply_image_filter(img, filter_type)
-                filtered_img.save(source_file_path, quality=95, optimize=True)
+                # The file may be a hardlink shared with other folders: write new content instead of editing in place
+                buffer = io.BytesIO()
+                filtered_img.save(buffer, format=img.format, quality=95, optimize=True)
+                media_store.store_stream([buffer.getvalue()], source_file_path)
                 
                 thumb_path = os.path.join(os.path.dirname(source_file_path), f"{os.path.splitext(os.path.basename(source_file_path))[0]}_thumb.webp")
                 filtered_thumb = filtered_img.copy()
                 filtered_thumb.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                filtered_thumb.save(thumb_path, "WEBP", quality=85)
+                with media_store.rewriting(thumb_path) as tmp:
+                    filtered_thumb.save(tmp, "WEBP", quality=85)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Ошибка при применении фильтра: {str(e)}")
         
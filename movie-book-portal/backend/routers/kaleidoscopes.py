@@ -1,12 +1,14 @@
 # routers/kaleidoscopes.py
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import List
 import os
 import shutil
 from datetime import datetime
 from database_kaleidoscope import get_db_kaleidoscope, Kaleidoscope, KaleidoscopeItem
-from models import KaleidoscopeCreate
+from models import KaleidoscopeCreate, KaleidoscopeResponse
+from services.http_cache import conditional_json
+from services import media_store
 
 router = APIRouter(prefix="/kaleidoscopes", tags=["kaleidoscopes"])
 
@@ -46,9 +48,10 @@ def create_kaleidoscope(k_data: KaleidoscopeCreate, db: Session = Depends(get_db
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/")
-def list_kaleidoscopes(db: Session = Depends(get_db_kaleidoscope)):
-    return db.query(Kaleidoscope).all()
+@router.get("/", response_model=List[KaleidoscopeResponse])
+def list_kaleidoscopes(request: Request, db: Session = Depends(get_db_kaleidoscope)):
+    return conditional_json(request, db.query(Kaleidoscope).all, [Kaleidoscope], [db],
+                            response_model=List[KaleidoscopeResponse])
 
 @router.get("/{k_id}")
 def get_kaleidoscope(k_id: int, db: Session = Depends(get_db_kaleidoscope)):
@@ -129,7 +132,7 @@ async def upload_music(file: UploadFile = File(...)):
         file_path = os.path.join(KALEIDOSCOPE_MUSIC_PATH, file.filename)
         
         # Avoid overwriting or decide strategy. Here simple overwrite.
-        with open(file_path, "wb") as buffer:
+        with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
             
         relative_path = f"/uploads/kaleidoscopes_music/{file.filename}"
@@ -1,38 +1,44 @@
 import os
 import shutil
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from sqlalchemy.orm import Session
 from database import Movie
-from models import MovieCreate
+from typing import List
+from models import MovieCreate, MovieResponse
 from dependencies import get_db
+from services.http_cache import conditional_json
+from services import library_index, media_store
 
 router = APIRouter(prefix="/movies", tags=["movies"])
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-@router.get("")
-def get_movies(genre: str = None, db: Session = Depends(get_db)):
+@router.get("", response_model=List[MovieResponse])
+def get_movies(request: Request, genre: str = None, db: Session = Depends(get_db)):
     query = db.query(Movie)
     if genre and genre != "Все":
         query = query.filter(Movie.genre.ilike(f"%{genre}%"))
-    return query.all()
+    # 304 без запроса к БД, пока таблица не менялась
+    return conditional_json(request, query.all, [Movie], [db], response_model=List[MovieResponse])
 
-@router.post("")
+@router.post("", response_model=MovieResponse)
 def create_movie(movie: MovieCreate, db: Session = Depends(get_db)):
     db_movie = Movie(**movie.dict())
     db.add(db_movie)
     db.commit()
     db.refresh(db_movie)
+    library_index.register("movies", db_movie.id, db_movie.title, year=db_movie.year)
     return db_movie
 
-@router.get("/{movie_id}")
+@router.get("/{movie_id}", response_model=MovieResponse)
 def get_movie(movie_id: int, db: Session = Depends(get_db)):
     movie = db.query(Movie).filter(Movie.id == movie_id).first()
     if not movie:
         raise HTTPException(status_code=404, detail="Movie not found")
     return movie
 
-@router.put("/{movie_id}")
+@router.put("/{movie_id}", response_model=MovieResponse)
 def update_movie(movie_id: int, movie: MovieCreate, db: Session = Depends(get_db)):
     db_movie = db.query(Movie).filter(Movie.id == movie_id).first()
     if not db_movie:
@@ -41,6 +47,9 @@ def update_movie(movie_id: int, movie: MovieCreate, db: Session = Depends(get_db
         setattr(db_movie, key, value)
     db.commit()
     db.refresh(db_movie)
+    # Новое название или автор: отпечаток пересчитывается
+    library_index.unregister("movies", db_movie.id)
+    library_index.register("movies", db_movie.id, db_movie.title, year=db_movie.year)
     return db_movie
 
 @router.delete("/{movie_id}")
@@ -67,9 +76,10 @@ def delete_movie(movie_id: int, db: Session = Depends(get_db)):
     
     db.delete(movie)
     db.commit()
+    library_index.unregister("movies", movie_id)
     return {"message": "Movie deleted successfully"}
 
-@router.post("/{movie_id}/upload")
+@router.post("/{movie_id}/upload", response_model=MovieResponse)
 async def upload_movie_file(movie_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
     movie = db.query(Movie).filter(Movie.id == movie_id).first()
     if not movie:
@@ -82,7 +92,7 @@ async def upload_movie_file(movie_id: int, file: UploadFile = File(...), db: Ses
 
     file_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/movies/{movie_id}_{file.filename}"))
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "wb") as buffer:
+    with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
     relative_path = os.path.relpath(file_path, BASE_DIR)
@@ -90,7 +100,7 @@ async def upload_movie_file(movie_id: int, file: UploadFile = File(...), db: Ses
     db.commit()
     return movie
 
-@router.post("/{movie_id}/upload_thumbnail")
+@router.post("/{movie_id}/upload_thumbnail", response_model=MovieResponse)
 async def upload_movie_thumbnail(movie_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
     movie = db.query(Movie).filter(Movie.id == movie_id).first()
     if not movie:
@@ -101,16 +111,23 @@ async def upload_movie_thumbnail(movie_id: int, file: UploadFile = File(...), db
     if ext not in allowed_ext:
         raise HTTPException(status_code=400, detail="Неподдерживаемый формат изображения")
 
-    thumb_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/movies/{movie_id}_thumb{ext}"))
+    # Новое имя на каждую загрузку: миниатюры кэшируются клиентом как неизменяемые
+    thumb_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/movies/{movie_id}_thumb_{uuid.uuid4().hex[:8]}{ext}"))
     os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
     with open(thumb_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
+    old_thumb = movie.thumbnail_path
     relative_path = os.path.relpath(thumb_path, BASE_DIR)
     movie.thumbnail_path = relative_path.replace(os.sep, '/').replace('\\', '/')
     db.commit()
+    if old_thumb and old_thumb != movie.thumbnail_path:
+        try:
+            media_store.release(os.path.join(BASE_DIR, old_thumb))
+        except OSError:
+            pass
     return movie
 
-@router.get("/search")
+@router.get("/search", response_model=List[MovieResponse])
 def search_movies(query: str, db: Session = Depends(get_db)):
     return db.query(Movie).filter(Movie.title.ilike(f"%{query}%")).all()
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from database_progress import PlaybackProgress, get_db_progress
+from typing import Optional
+from fastapi.responses import JSONResponse
+from database_progress import PlaybackProgress, EpisodeWatchState, ShowWatchState, get_db_progress
 from pydantic import BaseModel
 from database import Movie
 from database_books import Book
@@ -16,12 +18,14 @@ class ProgressUpdate(BaseModel):
     progress_seconds: float
     scroll_ratio: float = 0.0
     track_index: int = 0
+    duration: Optional[float] = None  # Length of the episode/movie as the player knows it
 
 @router.post("")
 def save_progress(
     data: ProgressUpdate, 
     x_user_id: str = Header("global"),
-    db: Session = Depends(get_db_progress)
+    db: Session = Depends(get_db_progress),
+    db_tvshows: Session = Depends(get_db_tvshows_simple)
 ):
     progress = db.query(PlaybackProgress).filter(
         PlaybackProgress.item_type == data.item_type,
@@ -46,6 +50,16 @@ def save_progress(
     
     db.commit()
     db.refresh(progress)
+
+    if data.item_type == "episode":
+        # Keep the per-show watch state (up next, season completion) in step
+        from services import watch_state
+        try:
+            watch_state.record(db, db_tvshows, x_user_id, data.item_id, data.progress_seconds, data.duration)
+        except Exception as e:
+            db.rollback()
+            print(f"Error updating watch state for episode {data.item_id}: {e}")
+
     return {
         "status": "success", 
         "progress": progress.progress_seconds, 
@@ -119,6 +133,23 @@ def get_latest_progress(
 
     return item_data
 
+@router.get("/tvshow/{tvshow_id}/up-next")
+def get_up_next(
+    tvshow_id: int,
+    x_user_id: str = Header("global"),
+    db: Session = Depends(get_db_progress),
+    db_tvshows: Session = Depends(get_db_tvshows_simple)
+):
+    """Next episode to play (with resume position), per-season completion and prefetch hints"""
+    from services import watch_state
+    if not db_tvshows.query(Tvshow).filter(Tvshow.id == tvshow_id).first():
+        raise HTTPException(status_code=404, detail="Tvshow not found")
+    result = watch_state.up_next(db, db_tvshows, x_user_id, tvshow_id)
+    headers = {}
+    if result["prefetch"]:
+        headers["Link"] = ", ".join(f'<{p["url"]}>; rel=prefetch; as=video' for p in result["prefetch"])
+    return JSONResponse(result, headers=headers)
+
 @router.get("/{item_type}/{item_id}")
 def get_progress(
     item_type: str, 
@@ -149,5 +180,7 @@ def clear_all_progress(
 ):
     """Clear all playback history for the current user/device"""
     db.query(PlaybackProgress).filter(PlaybackProgress.user_id == x_user_id).delete()
+    db.query(EpisodeWatchState).filter(EpisodeWatchState.user_id == x_user_id).delete()
+    db.query(ShowWatchState).filter(ShowWatchState.user_id == x_user_id).delete()
     db.commit()
     return {"status": "success", "message": "All progress cleared"}
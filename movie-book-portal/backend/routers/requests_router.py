@@ -4,12 +4,15 @@ Aggregates search across books (Flibusta), movies (KinoRush), and audiobooks (Au
 """
 import os
 import re
+import json
 import shutil
 import uuid
 import time
+import asyncio
 from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/requests", tags=["requests"])
@@ -32,19 +35,72 @@ async def search_content(query: str, type: str = "all"):
     """
     Search content across sources.
     type: all | books | movies | audiobooks
+    Providers are queried in parallel; a provider that exceeds its timeout is skipped.
     """
+    kinds = _search_kinds(type)
+    outcomes = await asyncio.gather(*(_run_search_provider(kind, query) for kind in kinds))
+
     results = []
+    for outcome in outcomes:
+        results.extend(outcome["results"])
+    return results
+
+
+@router.get("/search/stream")
+async def search_content_stream(query: str, type: str = "all"):
+    """
+    Same as /search, but streams NDJSON: one line per provider as soon as it finishes
+    ({"provider", "status", "elapsed_ms", "results"}), then a final {"done": true} line.
+    """
+    kinds = _search_kinds(type)
 
-    if type in ("all", "books"):
-        results.extend(_search_books(query))
+    async def event_stream():
+        started = time.monotonic()
+        tasks = [asyncio.create_task(_run_search_provider(kind, query)) for kind in kinds]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                outcome = await next_done
+                yield json.dumps(outcome, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield json.dumps({"done": True, "providers": len(kinds), "elapsed_ms": int((time.monotonic() - started) * 1000)}) + "\n"
 
-    if type in ("all", "movies"):
-        results.extend(_search_movies(query))
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    if type in ("all", "audiobooks"):
-        results.extend(_search_audiobooks(query))
 
-    return results
+def _search_kinds(type: str):
+    if type == "all":
+        return list(SEARCH_PROVIDERS.keys())
+    return [type] if type in SEARCH_PROVIDERS else []
+
+
+async def _run_search_provider(kind: str, query: str):
+    """
+    Runs one blocking provider search in a worker thread with its own timeout.
+    On timeout the thread is left to finish on its own; its result is discarded.
+    """
+    search_func, timeout = SEARCH_PROVIDERS[kind]
+    started = time.monotonic()
+    status = "ok"
+    try:
+        results = await asyncio.wait_for(asyncio.to_thread(search_func, query), timeout)
+    except asyncio.TimeoutError:
+        print(f"[Requests] {kind} search timed out after {timeout}s")
+        results, status = [], "timeout"
+    except Exception as e:
+        print(f"[Requests] {kind} search error: {e}")
+        results, status = [], "error"
+    return {
+        "provider": kind,
+        "status": status,
+        "elapsed_ms": int((time.monotonic() - started) * 1000),
+        "results": results
+    }
 
 
 def _search_books(query: str):
@@ -133,6 +189,14 @@ def _search_audiobooks(query: str):
         return []
 
 
+# kind -> (search function, timeout in seconds). Kept below the frontend's 20 s request timeout.
+SEARCH_PROVIDERS = {
+    "books": (_search_books, 15),
+    "movies": (_search_movies, 15),
+    "audiobooks": (_search_audiobooks, 15),
+}
+
+
 # ---- Details endpoint ----
 
 @router.get("/details")
@@ -250,6 +314,12 @@ async def download_content(req: DownloadRequest, background_tasks: BackgroundTas
 def _download_book(download_id: str, req: DownloadRequest):
     """Download a book from Flibusta"""
     try:
+        from services import library_index, media_store
+        existing = library_index.find_duplicate("books", req.title, req.author)
+        if existing:
+            _update_download(download_id, status="error", error="Эта книга уже есть в библиотеке")
+            return
+
         _update_download(download_id, status="downloading", progress=10)
 
         from routers.discovery import create_session, get_headers, PROVIDERS
@@ -270,7 +340,7 @@ def _download_book(download_id: str, req: DownloadRequest):
         # Download file via proxy
         session = create_session()
         headers = get_headers(referer=base_url)
-        resp = session.get(download_url, headers=headers, timeout=60, stream=True)
+        resp = session.get(download_url, headers=headers, timeout=60)
         resp.raise_for_status()
 
         _update_download(download_id, progress=60)
@@ -320,6 +390,7 @@ def _download_book(download_id: str, req: DownloadRequest):
             db.commit()
             db.refresh(new_book)
             book_id = new_book.id
+            library_index.register("books", book_id, new_book.title, new_book.author)
 
             BOOK_UPLOADS = os.path.join(BASE_DIR, "uploads", "books")
             os.makedirs(BOOK_UPLOADS, exist_ok=True)
@@ -328,7 +399,7 @@ def _download_book(download_id: str, req: DownloadRequest):
             filename = f"{book_id}_{safe_title}{ext}"
             filepath = os.path.join(BOOK_UPLOADS, filename)
 
-            with open(filepath, "wb") as f:
+            with media_store.rewriting(filepath) as tmp, open(tmp, "wb") as f:
                 f.write(file_content)
 
             rel_path = os.path.relpath(filepath, BASE_DIR).replace(os.sep, '/')
@@ -348,7 +419,7 @@ def _download_book(download_id: str, req: DownloadRequest):
                         elif 'webp' in ct:
                             img_ext = '.webp'
                         thumb_path = os.path.join(BOOK_UPLOADS, f"{book_id}_thumb{img_ext}")
-                        with open(thumb_path, "wb") as f:
+                        with media_store.rewriting(thumb_path) as tmp, open(tmp, "wb") as f:
                             f.write(img_resp.content)
                         new_book.thumbnail_path = os.path.relpath(thumb_path, BASE_DIR).replace(os.sep, '/')
                 except Exception as img_err:
@@ -368,15 +439,30 @@ def _download_book(download_id: str, req: DownloadRequest):
         _update_download(download_id, status="error", error=str(e))
 
 
+# Ingest pipeline stage -> (download status, base progress); conversion adds up to 25%
+_INGEST_PROGRESS = {
+    "downloaded": ("probing", 70),
+    "probing": ("probing", 70),
+    "planned": ("queued_conversion", 72),
+    "converting": ("converting", 72),
+    "registering": ("registering", 98),
+}
+
 def _download_movie(download_id: str, req: DownloadRequest):
     """Download a movie via torrent"""
     try:
         from services.kinorush_service import get_movie_details, filter_by_size
         from services.torrent_downloader import download_torrent, check_qbittorrent_connection, remove_torrent
-        from services.video_converter import convert_to_mp4, check_ffmpeg_available
+        from services.video_converter import check_ffmpeg_available
+        from services import media_ingest
         from database import Movie, SessionLocal
+        from services import library_index, media_store
         import json
 
+        if library_index.find_duplicate("movies", req.title, year=req.year):
+            _update_download(download_id, status="error", error="Этот фильм уже есть в библиотеке")
+            return
+
         _update_download(download_id, status="checking", progress=5)
 
         # Load qBittorrent settings
@@ -452,6 +538,7 @@ def _download_movie(download_id: str, req: DownloadRequest):
             db.commit()
             db.refresh(movie)
             movie_id = movie.id
+            library_index.register("movies", movie_id, movie.title, year=movie.year)
 
             MOVIE_UPLOADS = os.path.join(BASE_DIR, "uploads", "movies")
             os.makedirs(MOVIE_UPLOADS, exist_ok=True)
@@ -459,13 +546,12 @@ def _download_movie(download_id: str, req: DownloadRequest):
             # Poster
             if req.image_url:
                 try:
-                    import requests as http_requests
-                    img_resp = http_requests.get(req.image_url, timeout=15, verify=False,
-                                                  headers={'User-Agent': 'Mozilla/5.0'})
+                    from services.http_client import http_client
+                    img_resp = http_client.get(req.image_url, timeout=15)
                     if img_resp.ok:
                         img_ext = os.path.splitext(req.image_url.split('?')[0])[1] or ".jpg"
                         thumb_path = os.path.join(MOVIE_UPLOADS, f"{movie_id}_thumb{img_ext}")
-                        with open(thumb_path, "wb") as f:
+                        with media_store.rewriting(thumb_path) as tmp, open(tmp, "wb") as f:
                             f.write(img_resp.content)
                         movie.thumbnail_path = os.path.relpath(thumb_path, BASE_DIR).replace(os.sep, '/')
                         db.commit()
@@ -490,37 +576,57 @@ def _download_movie(download_id: str, req: DownloadRequest):
             else:
                 video_file, torrent_hash = None, None
 
-            if video_file and os.path.exists(video_file):
-                _update_download(download_id, status="converting", progress=70)
-
-                safe_title = re.sub(r'[^\w\s-]', '', req.title)[:50].strip()
-                output_filename = f"{movie_id}_{safe_title}.mp4"
-                output_path = os.path.join(MOVIE_UPLOADS, output_filename)
-
-                if convert_to_mp4(video_file, output_path, delete_source=False):
-                    movie.file_path = os.path.relpath(output_path, BASE_DIR).replace(os.sep, '/')
-                    db.commit()
+            def cleanup(ok):
+                if not ok:
+                    fail_db = SessionLocal()
+                    try:
+                        fail_db.query(Movie).filter(Movie.id == movie_id).delete()
+                        fail_db.commit()
+                        library_index.unregister("movies", movie_id)
+                    finally:
+                        fail_db.close()
+                try:
+                    time.sleep(2)
+                    if os.path.exists(temp_dir):
+                        shutil.rmtree(temp_dir)
+                except Exception:
+                    pass
 
-                    if torrent_hash:
-                        remove_torrent(torrent_hash, **qbt_params)
+            if not (video_file and os.path.exists(video_file)):
+                _update_download(download_id, status="error", error="Ошибка скачивания торрента")
+                cleanup(False)
+                return
 
+            # Probe, convert and register run in the ingest pipeline: this thread is done
+            def register(output_path):
+                reg_db = SessionLocal()
+                try:
+                    reg_db.query(Movie).filter(Movie.id == movie_id).update(
+                        {"file_path": os.path.relpath(output_path, BASE_DIR).replace(os.sep, '/')})
+                    reg_db.commit()
+                finally:
+                    reg_db.close()
+                if torrent_hash:
+                    remove_torrent(torrent_hash, **qbt_params)
+
+            def on_stage(stage, pct):
+                if stage == "failed":
+                    _update_download(download_id, status="error", error="Ошибка конвертации")
+                elif stage == "done":
                     _update_download(download_id, status="completed", progress=100)
                 else:
-                    _update_download(download_id, status="error", error="Ошибка конвертации")
-                    db.delete(movie)
-                    db.commit()
-            else:
-                _update_download(download_id, status="error", error="Ошибка скачивания торрента")
-                db.delete(movie)
-                db.commit()
+                    status, progress = _INGEST_PROGRESS[stage]
+                    _update_download(download_id, status=status, progress=int(progress + pct * 0.25))
 
-            # Cleanup
-            try:
-                time.sleep(2)
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-            except Exception:
-                pass
+            safe_title = re.sub(r'[^\w\s-]', '', req.title)[:50].strip()
+            media_ingest.submit(media_ingest.IngestItem(
+                title=req.title,
+                source_path=video_file,
+                output_path=os.path.join(MOVIE_UPLOADS, f"{movie_id}_{safe_title}.mp4"),
+                register=register,
+                cleanup=cleanup,
+                on_stage=on_stage,
+            ))
 
         except Exception as db_err:
             db.rollback()
@@ -536,6 +642,11 @@ def _download_movie(download_id: str, req: DownloadRequest):
 def _download_audiobook(download_id: str, req: DownloadRequest):
     """Download an audiobook from Audioboo"""
     try:
+        from services import library_index
+        if library_index.find_duplicate("audiobooks", req.title, req.author):
+            _update_download(download_id, status="error", error="Эта аудиокнига уже есть в библиотеке")
+            return
+
         _update_download(download_id, status="fetching_details", progress=10)
 
         from routers.audiobooks_source import fetch_audioboo_details, AudiobooDownloadRequest, process_audioboo_background
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
 from sqlalchemy.orm import Session
 from services.system_monitor import get_system_stats
 from dependencies import get_db
@@ -28,14 +28,15 @@ async def get_stats(show_data_disk: bool = False):
     return get_system_stats(project_root, show_data_disk=show_data_disk)
 
 @router.get("/discovery-status")
-async def get_discovery_status():
-    """Get status of all auto-discovery scripts"""
+def get_discovery_status():
+    """Get status of all auto-discovery cycles (from the run/event tables, not the logs)"""
     import json
     from datetime import datetime
-    
+    from services import discovery_events, scheduler
+
     current_dir = os.path.dirname(os.path.abspath(__file__))
     backend_dir = os.path.dirname(current_dir)
-    
+
     # Helper function to read settings
     def read_settings(filename):
         try:
@@ -46,217 +47,66 @@ async def get_discovery_status():
         except Exception as e:
             print(f"Error reading {filename}: {e}")
         return {}
-    
-    # Helper function to parse log file
-    def parse_log(filename, max_lines=10, filter_category=None):
-        try:
-            log_path = os.path.join(backend_dir, filename)
-            if not os.path.exists(log_path):
-                return {
-                    "last_run": None,
-                    "last_success": None,
-                    "recent_activity": [],
-                    "status": "idle"
-                }
-            
-            with open(log_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # Filter lines by category if provided
-            if filter_category == "books":
-                lines = [line for line in lines if "book" in line.lower() or "книг" in line.lower()]
-            elif filter_category == "audiobooks":
-                lines = [line for line in lines if "audiobook" in line.lower() or "аудиокниг" in line.lower()]
-            elif filter_category == "movies":
-                lines = [line for line in lines if "movie" in line.lower() or "фильм" in line.lower()]
-                
-            # Get last N lines
-            recent_lines = lines[-max_lines:] if len(lines) > max_lines else lines
-            recent_activity = [line.strip() for line in recent_lines if line.strip()]
-            
-            # Find last run timestamp
-            last_run = None
-            last_success = None
-            status = "idle"
-            
-            for line in reversed(lines):
-                # Extract timestamp from log format: [2026-01-22 21:00:00]
-                if '[' in line and ']' in line:
-                    try:
-                        timestamp_str = line[line.find('[')+1:line.find(']')]
-                        if not last_run:
-                            last_run = timestamp_str
-                        
-                        # Check for success indicators
-                        if not last_success:
-                            if 'Successfully added' in line or 'успешно добавлен' in line.lower():
-                                is_success = False
-                                if filter_category == "books" and ("book" in line.lower() or "книг" in line.lower()): is_success = True
-                                elif filter_category == "audiobooks" and ("audiobook" in line.lower() or "аудиокниг" in line.lower()): is_success = True
-                                elif filter_category == "movies" and ("movie" in line.lower() or "фильм" in line.lower()): is_success = True
-                                elif not filter_category: is_success = True
-                                
-                                if is_success:
-                                    if 'book:' in line.lower():
-                                        last_success = line.split('book:')[-1].strip()
-                                    elif 'audiobook:' in line.lower():
-                                        last_success = line.split('audiobook:')[-1].strip()
-                                    elif 'movie:' in line.lower() or 'фильм:' in line.lower():
-                                        last_success = line.split(':')[-1].strip()
-                                    else:
-                                        last_success = "Item downloaded"
-                        
-                        # Check if currently running
-                        if 'Starting' in line and 'cycle' in line:
-                            # Re-verify if this cycle belongs to the category
-                            is_relevant_cycle = False
-                            if filter_category == "books" and "book" in line.lower(): is_relevant_cycle = True
-                            elif filter_category == "audiobooks" and "audiobook" in line.lower(): is_relevant_cycle = True
-                            elif filter_category == "movies" and "movie" in line.lower(): is_relevant_cycle = True
-                            elif not filter_category: is_relevant_cycle = True
-                            
-                            if is_relevant_cycle:
-                                try:
-                                    log_time = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                                    now = datetime.now()
-                                    diff = (now - log_time).total_seconds()
-                                    if diff < 300:  # 5 minutes
-                                        status = "running"
-                                except:
-                                    pass
-                    except:
-                        continue
-            
-            return {
-                "last_run": last_run,
-                "last_success": last_success,
-                "recent_activity": recent_activity,
-                "status": status
-            }
-        except Exception as e:
-            print(f"Error parsing {filename}: {e}")
-            return {
-                "last_run": None,
-                "last_success": None,
-                "recent_activity": [],
-                "status": "error"
-            }
-    
-    # Helper to calculate next run time
-    def calculate_next_run(last_run_str, interval_minutes):
-        if not last_run_str or not interval_minutes:
-            return None
-        try:
-            last_run = datetime.strptime(last_run_str, '%Y-%m-%d %H:%M:%S')
-            from datetime import timedelta
-            next_run = last_run + timedelta(minutes=interval_minutes)
-            return next_run.strftime('%Y-%m-%d %H:%M:%S')
-        except:
-            return None
-    
-    # Read settings
+
+    # Next runs come from the scheduler (stored in UTC)
+    utc_offset = datetime.now() - datetime.utcnow()
+    next_runs = {}
+    for schedule in scheduler.list_schedules():
+        if schedule["enabled"] and schedule["next_run_at"]:
+            next_run = datetime.fromisoformat(schedule["next_run_at"]) + utc_offset
+            next_runs[schedule["name"]] = next_run.strftime('%Y-%m-%d %H:%M:%S')
+
     auto_settings = read_settings('auto_discovery_settings.json')
     movie_settings = read_settings('movie_discovery_settings.json')
-    
-    # Parse logs with fallbacks
-    # We try specific logs first, then fallback to general auto_discovery.log if empty
-    books_log = parse_log('books_discovery.log', filter_category="books")
-    audiobooks_log = parse_log('audiobooks_discovery.log', filter_category="audiobooks")
-    
-    # Check fallback to legacy log if newer logs are empty or missing
-    if not books_log["last_run"]:
-        books_log = parse_log('auto_discovery.log', filter_category="books")
-        
-    if not audiobooks_log["last_run"]:
-        audiobooks_log = parse_log('auto_discovery.log', filter_category="audiobooks")
-        
-    movie_log = parse_log('movie_discovery.log', filter_category="movies")
-    
-    # Build response
-    return {
-        "books": {
-            "enabled": auto_settings.get("enabled", False),
-            "interval_minutes": auto_settings.get("book_interval_minutes", auto_settings.get("interval_minutes", 60)),
-            "last_run": books_log["last_run"],
-            "next_run": calculate_next_run(books_log["last_run"], auto_settings.get("book_interval_minutes", auto_settings.get("interval_minutes", 60))),
-            "last_success": books_log["last_success"],
-            "recent_activity": books_log["recent_activity"],
-            "status": books_log["status"]
-        },
-        "audiobooks": {
-            "enabled": auto_settings.get("enabled", False),
-            "interval_minutes": auto_settings.get("audiobook_interval_minutes", auto_settings.get("interval_minutes", 60)),
-            "last_run": audiobooks_log["last_run"],
-            "next_run": calculate_next_run(audiobooks_log["last_run"], auto_settings.get("audiobook_interval_minutes", auto_settings.get("interval_minutes", 60))),
-            "last_success": audiobooks_log["last_success"],
-            "recent_activity": audiobooks_log["recent_activity"],
-            "status": audiobooks_log["status"]
-        },
-        "movies": {
-            "enabled": movie_settings.get("enabled", False),
-            "interval_minutes": movie_settings.get("interval_minutes", 720),
-            "last_run": movie_log["last_run"],
-            "next_run": calculate_next_run(movie_log["last_run"], movie_settings.get("interval_minutes", 720)),
-            "last_success": movie_log["last_success"],
-            "recent_activity": movie_log["recent_activity"],
-            "status": movie_log["status"]
-        }
+    default_interval = auto_settings.get("interval_minutes", 60)
+    config = {
+        "books": (auto_settings.get("enabled", False), auto_settings.get("book_interval_minutes", default_interval)),
+        "audiobooks": (auto_settings.get("enabled", False), auto_settings.get("audiobook_interval_minutes", default_interval)),
+        "movies": (movie_settings.get("enabled", False), movie_settings.get("interval_minutes", 720)),
     }
 
+    status = {}
+    for kind, (enabled, interval) in config.items():
+        status[kind] = {
+            "enabled": enabled,
+            "interval_minutes": interval,
+            "next_run": next_runs.get(kind),
+            **discovery_events.summary(kind),
+        }
+    return status
+
+@router.get("/discovery-runs")
+def get_discovery_runs(kind: str = None, limit: int = 50):
+    """Recent discovery cycles with duration, outcome and error"""
+    from services import discovery_events
+    return {"runs": discovery_events.list_runs(kind, min(limit, 500))}
+
+@router.get("/discovery-runs/{run_id}/events")
+def get_discovery_run_events(run_id: int):
+    """Step-by-step events of one discovery cycle"""
+    from services import discovery_events
+    return {"events": discovery_events.run_events(run_id)}
+
 @router.post("/discovery-restart/{discovery_type}")
 async def restart_discovery(discovery_type: str):
     """Restart/Force run discovery for specific type"""
-    import json
-    
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    backend_dir = os.path.dirname(current_dir)
-    
-    if discovery_type not in ["books", "audiobooks", "movies"]:
-        from fastapi import HTTPException
+    from services import scheduler
+    from services.discovery_jobs import DISCOVERY_JOBS
+
+    if discovery_type not in DISCOVERY_JOBS:
         raise HTTPException(status_code=400, detail="Invalid discovery type")
-    
+
     try:
-        if discovery_type == "movies":
-            settings_path = os.path.join(backend_dir, "movie_discovery_settings.json")
-            if os.path.exists(settings_path):
-                with open(settings_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Set force flag
-                data["force_run"] = True
-                
-                with open(settings_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=4, ensure_ascii=False)
-                return {"status": "success", "message": "Movie discovery triggered"}
-        
-        else: # books or audiobooks
-            settings_path = os.path.join(backend_dir, "auto_discovery_settings.json")
-            if os.path.exists(settings_path):
-                with open(settings_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Set specific force flag
-                if discovery_type == "books":
-                    data["force_run_books"] = True
-                elif discovery_type == "audiobooks":
-                    data["force_run_audiobooks"] = True
-                
-                with open(settings_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=4, ensure_ascii=False)
-                return {"status": "success", "message": f"{discovery_type.capitalize()} discovery triggered"}
-                
-    except Exception as e:
-        print(f"Error triggering restart: {e}")
-        from fastapi import HTTPException
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    from fastapi import HTTPException
-    raise HTTPException(status_code=404, detail="Settings file not found")
+        job = scheduler.force_run(discovery_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Discovery schedule not found")
+    return {"status": "success", "message": f"{discovery_type.capitalize()} discovery triggered", "job": job}
 
 @router.post("/discovery-settings")
 async def update_discovery_settings(settings: dict):
-    """Update discovery settings (interval)"""
+    """Update discovery settings (interval); the schedules pick the change up at once"""
     import json
+    from services import discovery_jobs
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
     backend_dir = os.path.dirname(current_dir)
@@ -283,6 +133,7 @@ async def update_discovery_settings(settings: dict):
                 
                 with open(settings_path, 'w', encoding='utf-8') as f:
                     json.dump(data, f, indent=4, ensure_ascii=False)
+                discovery_jobs.sync_schedules()
                 return {"status": "success", "message": "Settings updated"}
         
         else: # books or audiobooks
@@ -300,6 +151,7 @@ async def update_discovery_settings(settings: dict):
                 
                 with open(settings_path, 'w', encoding='utf-8') as f:
                     json.dump(data, f, indent=4, ensure_ascii=False)
+                discovery_jobs.sync_schedules()
                 return {"status": "success", "message": "Settings updated"}
                 
     except Exception as e:
@@ -326,3 +178,160 @@ def get_latest_update(db: Session = Depends(get_db)):
     except Exception as e:
         print(f"Error fetching latest update: {e}")
         return {"version_code": 0}
+
+@router.get("/media-store/report")
+def get_media_store_report(top: int = 20):
+    """Deduplication report: how many bytes the content-addressed store saves"""
+    from services import media_store
+    return media_store.dedup_report(top=top)
+
+_media_store_scan = {"status": "idle", "result": None}
+
+@router.post("/media-store/dedupe")
+def dedupe_existing_uploads(background_tasks: BackgroundTasks, folder: str = "uploads"):
+    """Adopt files that were uploaded before the store existed, hardlinking duplicates"""
+    from services import media_store
+    
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    uploads_dir = os.path.join(backend_dir, "uploads")
+    target_dir = os.path.abspath(os.path.join(backend_dir, folder))
+    try:
+        inside = os.path.commonpath([target_dir, uploads_dir]) == uploads_dir
+    except ValueError:  # Другой диск
+        inside = False
+    if not inside or not os.path.isdir(target_dir):
+        raise HTTPException(status_code=400, detail="Invalid folder")
+    if _media_store_scan["status"] == "running":
+        return _media_store_scan
+    
+    def run_scan():
+        try:
+            stats = media_store.ingest_tree(target_dir)
+            stats.update(media_store.collect_garbage())
+            stats["catalog_linked"] = media_store.link_catalog()
+            _media_store_scan.update(status="done", result=stats)
+        except Exception as e:
+            print(f"Media store scan failed: {e}")
+            _media_store_scan.update(status="error", result=str(e))
+    
+    _media_store_scan.update(status="running", result=None)
+    background_tasks.add_task(run_scan)
+    return _media_store_scan
+
+@router.get("/media-store/dedupe")
+def get_dedupe_status():
+    return _media_store_scan
+
+@router.get("/scrape-cache")
+def get_scrape_cache_stats():
+    """Hit rate and size of the discovery scrape cache"""
+    from services import scrape_cache
+    return scrape_cache.stats()
+
+@router.delete("/scrape-cache")
+def clear_scrape_cache(policy: str = None):
+    """Drop cached discovery pages (all, or one policy: browse / search / details)"""
+    from services import scrape_cache
+    return {"removed": scrape_cache.clear(policy)}
+
+@router.get("/provider-health")
+def get_provider_health():
+    """Live health of the scraped hosts: success rate, latency and circuit state"""
+    from services import provider_health
+    return {
+        "hosts": provider_health.snapshot(),
+        "failure_threshold": provider_health.FAILURE_THRESHOLD,
+        "base_cooldown_s": int(provider_health.BASE_COOLDOWN),
+    }
+
+@router.delete("/provider-health")
+def reset_provider_health(host: str = None):
+    """Close the circuit of one host (or of all hosts) and forget its history"""
+    from services import provider_health
+    return {"reset": provider_health.reset(host)}
+
+@router.get("/jobs")
+def list_jobs(status: str = None, job_type: str = None, limit: int = 50):
+    """Recent scheduler jobs, newest first"""
+    from services import scheduler
+    return {"jobs": scheduler.list_jobs(status, job_type, min(limit, 500)), "scheduler": scheduler.status()}
+
+@router.post("/jobs")
+def enqueue_job(body: dict):
+    """Queue a job of a registered type: {"job_type": ..., "payload": {...}}"""
+    from services import scheduler
+    try:
+        return scheduler.enqueue(body.get("job_type"), body.get("payload") or {})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/jobs/schedules")
+def list_job_schedules():
+    """Interval / cron triggers with their next run"""
+    from services import scheduler
+    return {"schedules": scheduler.list_schedules()}
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: int):
+    from services import scheduler
+    job = scheduler.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: int):
+    """Cancel a queued job, or ask a running one to stop"""
+    from services import scheduler
+    job = scheduler.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/torrent-monitor")
+def get_torrent_monitor():
+    """sync/maindata cursor and watched torrents of each qBittorrent instance"""
+    from services import torrent_monitor
+    return {"clients": torrent_monitor.status()}
+
+@router.get("/media-ingest")
+def get_media_ingest():
+    """Movies in the post-download pipeline: stage, progress, conversion plan and per-stage timings"""
+    from services import media_ingest
+    return media_ingest.status()
+
+@router.get("/library-scan")
+def get_library_scan():
+    """Latest library scan (progress while it runs) and the scan state of all movie files"""
+    from services import library_scan
+    return library_scan.status()
+
+@router.post("/library-scan")
+def start_library_scan(full: bool = False):
+    """Queue a library scan; full=true reprocesses unchanged files too"""
+    from services import scheduler
+    try:
+        return scheduler.enqueue("library_scan", {"full": full})
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/library-scan/history")
+def get_library_scan_history(limit: int = 20):
+    from services import library_scan
+    return {"scans": library_scan.list_scans(min(limit, 200))}
+
+@router.get("/library-scan/files")
+def get_library_scan_files(state: str = None, match: str = None, limit: int = 100):
+    """Scanned files, most recently processed first (state: pending / done / failed; match: linked / restored / no_metadata)"""
+    from services import library_scan
+    return {"files": library_scan.list_files(state, match, min(limit, 1000))}
+
+@router.get("/media-compat/report")
+def get_media_compat_report():
+    """
+    Dry run over movies, series and the video gallery: what each file would need
+    (none / faststart / remux / audio / full). Nothing is converted; files probed
+    before come from the probe cache.
+    """
+    from services import media_probe
+    return media_probe.library_report()
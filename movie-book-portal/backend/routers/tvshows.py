@@ -1,24 +1,26 @@
 import os
 import shutil
-from typing import Optional
+from typing import List, Optional
+import uuid
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
 from database_tvshows import Tvshow, Episode
-from models import TvshowCreate, EpisodeCreate
+from models import TvshowCreate, EpisodeCreate, TvshowImportRequest, TvshowResponse, EpisodeResponse
 from dependencies import get_db_tvshows_simple
+from services import media_store
 
 router = APIRouter(tags=["tvshows"])
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-@router.get("/tvshows")
+@router.get("/tvshows", response_model=List[TvshowResponse])
 def get_tvshows(genre: str = None, db: Session = Depends(get_db_tvshows_simple)):
     query = db.query(Tvshow)
     if genre and genre != "Все":
         query = query.filter(Tvshow.genre.ilike(f"%{genre}%"))
     return query.all()
 
-@router.post("/tvshows")
+@router.post("/tvshows", response_model=TvshowResponse)
 def create_tvshow(tvshow: TvshowCreate, db: Session = Depends(get_db_tvshows_simple)):
     db_tvshow = Tvshow(**tvshow.dict())
     db.add(db_tvshow)
@@ -26,14 +28,14 @@ def create_tvshow(tvshow: TvshowCreate, db: Session = Depends(get_db_tvshows_sim
     db.refresh(db_tvshow)
     return db_tvshow
 
-@router.get("/tvshows/{tvshow_id}")
+@router.get("/tvshows/{tvshow_id}", response_model=TvshowResponse)
 def get_tvshow(tvshow_id: int, db: Session = Depends(get_db_tvshows_simple)):
     tvshow = db.query(Tvshow).filter(Tvshow.id == tvshow_id).first()
     if not tvshow:
         raise HTTPException(status_code=404, detail="Tvshow not found")
     return tvshow
 
-@router.put("/tvshows/{tvshow_id}")
+@router.put("/tvshows/{tvshow_id}", response_model=TvshowResponse)
 def update_tvshow(tvshow_id: int, tvshow: TvshowCreate, db: Session = Depends(get_db_tvshows_simple)):
     db_tvshow = db.query(Tvshow).filter(Tvshow.id == tvshow_id).first()
     if not db_tvshow:
@@ -70,7 +72,7 @@ def delete_tvshow(tvshow_id: int, db: Session = Depends(get_db_tvshows_simple)):
     db.commit()
     return {"message": "Tvshow deleted successfully"}
 
-@router.post("/tvshows/{tvshow_id}/upload")
+@router.post("/tvshows/{tvshow_id}/upload", response_model=TvshowResponse)
 async def upload_tvshow_file(tvshow_id: int, file: UploadFile = File(...), db: Session = Depends(get_db_tvshows_simple)):
     tvshow = db.query(Tvshow).filter(Tvshow.id == tvshow_id).first()
     if not tvshow:
@@ -83,7 +85,7 @@ async def upload_tvshow_file(tvshow_id: int, file: UploadFile = File(...), db: S
 
     file_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/tvshows/{tvshow_id}_{file.filename}"))
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "wb") as buffer:
+    with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
     relative_path = os.path.relpath(file_path, BASE_DIR)
@@ -91,7 +93,7 @@ async def upload_tvshow_file(tvshow_id: int, file: UploadFile = File(...), db: S
     db.commit()
     return tvshow
 
-@router.post("/tvshows/{tvshow_id}/upload_thumbnail")
+@router.post("/tvshows/{tvshow_id}/upload_thumbnail", response_model=TvshowResponse)
 async def upload_tvshow_thumbnail(tvshow_id: int, file: UploadFile = File(...), db: Session = Depends(get_db_tvshows_simple)):
     tvshow = db.query(Tvshow).filter(Tvshow.id == tvshow_id).first()
     if not tvshow:
@@ -102,22 +104,67 @@ async def upload_tvshow_thumbnail(tvshow_id: int, file: UploadFile = File(...),
     if ext not in allowed_ext:
         raise HTTPException(status_code=400, detail="Неподдерживаемый формат изображения")
 
-    thumb_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/tvshows/{tvshow_id}_thumb{ext}"))
+    # Новое имя на каждую загрузку: миниатюры кэшируются клиентом как неизменяемые
+    thumb_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/tvshows/{tvshow_id}_thumb_{uuid.uuid4().hex[:8]}{ext}"))
     os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
     with open(thumb_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
+    old_thumb = tvshow.thumbnail_path
     relative_path = os.path.relpath(thumb_path, BASE_DIR)
     tvshow.thumbnail_path = relative_path.replace(os.sep, '/').replace('\\', '/')
     db.commit()
+    if old_thumb and old_thumb != tvshow.thumbnail_path:
+        try:
+            media_store.release(os.path.join(BASE_DIR, old_thumb))
+        except OSError:
+            pass
     return tvshow
 
-@router.get("/tvshows/search")
+@router.post("/tvshows/{tvshow_id}/import")
+def import_tvshow_episodes(tvshow_id: int, body: TvshowImportRequest, db: Session = Depends(get_db_tvshows_simple)):
+    """Imports a whole season or series from a server-side folder (inside TV_IMPORT_ROOTS)"""
+    from services import tv_import
+    try:
+        source = tv_import.check_source(body.path)
+        return tv_import.import_directory(
+            db, tvshow_id, source, default_season=body.default_season,
+            overwrite=body.overwrite, dry_run=body.dry_run,
+        )
+    except tv_import.TvshowNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except tv_import.TvImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/tvshows/{tvshow_id}/import/archive")
+def import_tvshow_archive(tvshow_id: int, file: UploadFile = File(...), default_season: Optional[int] = None,
+                          overwrite: bool = False, db: Session = Depends(get_db_tvshows_simple)):
+    """Imports the episodes of an uploaded zip / tar archive"""
+    from services import tv_import
+    if not db.query(Tvshow).filter(Tvshow.id == tvshow_id).first():
+        raise HTTPException(status_code=404, detail="Tvshow not found")
+
+    staging = os.path.join(tv_import.STAGING_DIR, uuid.uuid4().hex)
+    os.makedirs(staging, exist_ok=True)
+    try:
+        archive_path = os.path.join(staging, "archive")
+        with open(archive_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        unpacked = os.path.join(staging, "files")
+        tv_import.unpack_archive(archive_path, unpacked)
+        os.remove(archive_path)
+        return tv_import.import_directory(db, tvshow_id, unpacked, default_season=default_season, overwrite=overwrite)
+    except tv_import.TvImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+@router.get("/tvshows/search", response_model=List[TvshowResponse])
 def search_tvshows(query: str, db: Session = Depends(get_db_tvshows_simple)):
     return db.query(Tvshow).filter(Tvshow.title.ilike(f"%{query}%")).all()
 
 # Episodes
-@router.get("/episodes")
+@router.get("/episodes", response_model=List[EpisodeResponse])
 def get_episodes(tvshow_id: Optional[int] = None, season: Optional[int] = None, db: Session = Depends(get_db_tvshows_simple)):
     query = db.query(Episode)
     if tvshow_id:
@@ -126,14 +173,14 @@ def get_episodes(tvshow_id: Optional[int] = None, season: Optional[int] = None,
         query = query.filter(Episode.season_number == season)
     return query.all()
 
-@router.get("/episodes/{episode_id}")
+@router.get("/episodes/{episode_id}", response_model=EpisodeResponse)
 def get_episode(episode_id: int, db: Session = Depends(get_db_tvshows_simple)):
     episode = db.query(Episode).filter(Episode.id == episode_id).first()
     if not episode:
         raise HTTPException(status_code=404, detail="Episode not found")
     return episode
 
-@router.post("/episodes")
+@router.post("/episodes", response_model=EpisodeResponse)
 def create_episode(episode: EpisodeCreate, db: Session = Depends(get_db_tvshows_simple)):
     tvshow = db.query(Tvshow).filter(Tvshow.id == episode.tvshow_id).first()
     if not tvshow:
@@ -144,7 +191,7 @@ def create_episode(episode: EpisodeCreate, db: Session = Depends(get_db_tvshows_
     db.refresh(db_episode)
     return db_episode
 
-@router.put("/episodes/{episode_id}")
+@router.put("/episodes/{episode_id}", response_model=EpisodeResponse)
 def update_episode(episode_id: int, episode: EpisodeCreate, db: Session = Depends(get_db_tvshows_simple)):
     db_episode = db.query(Episode).filter(Episode.id == episode_id).first()
     if not db_episode:
@@ -173,7 +220,7 @@ def delete_episode(episode_id: int, db: Session = Depends(get_db_tvshows_simple)
     db.commit()
     return {"message": "Episode deleted successfully"}
 
-@router.post("/episodes/{episode_id}/upload")
+@router.post("/episodes/{episode_id}/upload", response_model=EpisodeResponse)
 async def upload_episode_file(episode_id: int, file: UploadFile = File(...), db: Session = Depends(get_db_tvshows_simple)):
     episode = db.query(Episode).filter(Episode.id == episode_id).first()
     if not episode:
@@ -186,7 +233,7 @@ async def upload_episode_file(episode_id: int, file: UploadFile = File(...), db:
 
     file_path = os.path.abspath(os.path.join(BASE_DIR, f"uploads/tvshows/{episode.tvshow_id}/S{episode.season_number:02d}E{episode.episode_number:02d}_{file.filename}"))
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "wb") as buffer:
+    with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
     relative_path = os.path.relpath(file_path, BASE_DIR)
@@ -9,6 +9,7 @@ from fastapi.responses import StreamingResponse
 from database_videogallery import SessionLocalVideoGallery, Video, get_db_videogallery
 from sqlalchemy.orm import Session
 from utils import range_requests_response
+from services import media_store
 import threading
 
 router = APIRouter(prefix="/videogallery", tags=["videogallery"])
@@ -68,7 +69,7 @@ def search_directory_for_videos(directory: str, relative_path: str = ""):
             })
         else:
             ext = os.path.splitext(file)[1].lower()
-            if ext in [".mp4", ".mov", ".avi", ".mkv", ".webm"]:
+            if ext in [".mp4", ".mov", ".avi", ".mkv", ".webm"] and not media_store.is_temp(file):
                 # Check for thumbnail
                 thumb_name = f"{hashlib.md5(rel_path.encode()).hexdigest()}.jpg"
                 thumb_path = os.path.join(VIDEOGALLERY_UPLOADS, "thumbnails", thumb_name)
@@ -135,7 +136,7 @@ def upload_video_to_folder(folder: str = Form(""), file: UploadFile = File(...))
 
         file_path = os.path.join(target_dir, file.filename)
         print(f"DEBUG: Saving video to: {file_path}")
-        with open(file_path, "wb") as buffer:
+        with media_store.rewriting(file_path) as tmp, open(tmp, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
         # Generate thumbnail
@@ -389,21 +390,18 @@ def stream_videogallery_video(path: str, request: Request, original: bool = Fals
             media_type="video/mp4"
         )
 
-def optimize_video_task(source_file: str):
-    temp_file = source_file + ".opt.mp4"
+def optimize_video_task(source_file: str, plan=None):
+    from services import media_probe, media_store
+    # Only what the file needs is redone: phone footage in H.264/AAC at a sane
+    # bitrate just gets its index moved to the front (or nothing at all)
+    plan = plan or media_probe.inspect(source_file, profile="gallery") or media_probe.Plan(action="full", profile="gallery")
+    if not plan.needs_ffmpeg:
+        return
+    temp_file = media_store.temp_path(source_file)
     try:
-        cmd = [
-            'ffmpeg', '-i', source_file,
-            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
-            '-maxrate', '2.5M', '-bufsize', '5M',
-            '-c:a', 'aac', '-b:a', '128k',
-            '-movflags', '+faststart',
-            temp_file, '-y'
-        ]
+        cmd = ['ffmpeg', '-i', source_file] + media_probe.ffmpeg_args(plan) + [temp_file, '-y']
         subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-        os.rename(source_file, source_file + ".original_backup")
-        os.rename(temp_file, source_file)
-        os.remove(source_file + ".original_backup")
+        media_store.replace(temp_file, source_file)
     except Exception as e:
         if os.path.exists(temp_file):
             os.remove(temp_file)
@@ -419,11 +417,16 @@ def optimize_video(path: str):
         
     if target_file in active_optimizations:
         return {"status": "optimizing"}
+    
+    from services import media_probe
+    plan = media_probe.inspect(target_file, profile="gallery")
+    if plan and not plan.needs_ffmpeg:
+        return {"status": "optimal"}
         
     active_optimizations.add(target_file)
     
     def run_task():
-        optimize_video_task(target_file)
+        optimize_video_task(target_file, plan)
         active_optimizations.discard(target_file)
         
     threading.Thread(target=run_task, daemon=True).start()
@@ -1,22 +1,21 @@
 import os
-import time
-import json
 import uuid
 import shutil
 from sqlalchemy.orm import Session
 from database_audiobooks import Audiobook, SessionLocalAudiobooks
 from routers.discovery import suggest_audiobook, GENRE_MAPPING
 from utils import unzip_file, find_audio_files, find_thumbnail_in_dir
+from services import media_store, library_index, discovery_events
 from discovery_shared import log, load_settings, get_weighted_genre, download_file
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_FILE = os.path.join(BASE_DIR, "audiobooks_discovery.log")
-SETTINGS_FILE = os.path.join(BASE_DIR, "auto_discovery_settings.json")
 
-def log_audio(msg):
-    log(msg, LOG_FILE)
+def log_audio(msg, event="info"):
+    log(msg, LOG_FILE, event)
 
 def process_auto_audiobook(genre_name):
+    """One audiobook discovery cycle. Returns the added title, or None."""
     max_attempts = 3
     for attempt in range(max_attempts):
         db: Session = SessionLocalAudiobooks()
@@ -48,8 +47,8 @@ def process_auto_audiobook(genre_name):
                 db.close()
                 continue
 
-            # Check for duplicates
-            existing = db.query(Audiobook).filter(Audiobook.title == suggestion.title, Audiobook.author == suggestion.author_director).first()
+            # Check for duplicates (fuzzy, in memory)
+            existing = library_index.find_duplicate("audiobooks", suggestion.title, suggestion.author_director)
             if existing:
                 log_audio(f"Audiobook '{suggestion.title}' by {suggestion.author_director} already exists. Trying another...")
                 db.close()
@@ -68,6 +67,7 @@ def process_auto_audiobook(genre_name):
             db.add(new_audio)
             db.commit()
             db.refresh(new_audio)
+            library_index.register("audiobooks", new_audio.id, new_audio.title, new_audio.author)
             
             audio_id = new_audio.id
             AUDIO_UPLOADS = os.path.join(BASE_DIR, "uploads", "audiobooks")
@@ -88,6 +88,7 @@ def process_auto_audiobook(genre_name):
                 log_audio(f"Skipping '{suggestion.title}': failed to download thumbnail image.")
                 db.delete(new_audio)
                 db.commit()
+                library_index.unregister("audiobooks", new_audio.id)
                 db.close()
                 continue
 
@@ -96,6 +97,7 @@ def process_auto_audiobook(genre_name):
                  log_audio(f"Skipping '{suggestion.title}': thumbnail path is empty.")
                  db.delete(new_audio)
                  db.commit()
+                 library_index.unregister("audiobooks", new_audio.id)
                  db.close()
                  continue
 
@@ -112,9 +114,11 @@ def process_auto_audiobook(genre_name):
                         book_dir_path = os.path.join(AUDIO_UPLOADS, book_dir_name)
                         
                         if unzip_file(temp_zip_path, book_dir_path):
+                            media_store.ingest_tree(book_dir_path)
                             audio_files = find_audio_files(book_dir_path)
                             if audio_files:
                                 new_audio.file_path = os.path.relpath(audio_files[0], BASE_DIR).replace(os.sep, '/')
+                                new_audio.content_sha256 = media_store.digest_for(audio_files[0])
                                 # Try to find thumbnail in zip if not downloaded yet
                                 if not new_audio.thumbnail_path:
                                     inner_thumb = find_thumbnail_in_dir(book_dir_path)
@@ -130,13 +134,14 @@ def process_auto_audiobook(genre_name):
                                     file_success = True
                                     log_audio(f"Successfully added multi-track audiobook: {new_audio.title}")
                             
-                        try: os.remove(temp_zip_path)
+                        try: media_store.release(temp_zip_path)
                         except: pass
                 else:
                     safe_name = f"audiobook_{audio_id}_{new_audio.title[:30].replace(' ', '_')}{ext}"
                     file_path = os.path.join(AUDIO_UPLOADS, safe_name)
                     if download_file(suggestion.download_url, file_path, log_audio, referer=suggestion.source_url):
                         new_audio.file_path = os.path.relpath(file_path, BASE_DIR).replace(os.sep, '/')
+                        new_audio.content_sha256 = media_store.digest_for(file_path)
                         file_success = True
                         log_audio(f"Successfully added single-file audiobook: {new_audio.title}")
 
@@ -144,6 +149,7 @@ def process_auto_audiobook(genre_name):
                 log_audio(f"Failed to download audiobook file for: {suggestion.title}. Rolling back record.")
                 db.delete(new_audio)
                 db.commit()
+                library_index.unregister("audiobooks", new_audio.id)
                 # Clean up thumbnail if it was downloaded
                 if thumb_success and new_audio.thumbnail_path:
                     try: os.remove(os.path.join(BASE_DIR, new_audio.thumbnail_path))
@@ -152,59 +158,33 @@ def process_auto_audiobook(genre_name):
                 continue # Try next attempt
 
             db.commit()
-            return # Success!
+            return suggestion.title # Success!
         except Exception as e:
-            log_audio(f"Error processing audiobook (attempt {attempt+1}): {e}")
+            log_audio(f"Error processing audiobook (attempt {attempt+1}): {e}", "error")
             if new_audio:
                 try:
                     db.delete(new_audio)
                     db.commit()
+                    library_index.unregister("audiobooks", new_audio.id)
                 except: pass
         finally:
             if db: db.close()
 
     log_audio(f"Failed to add any audiobook for genre {genre_name} after {max_attempts} attempts.")
 
-def main_loop():
-    log_audio("Audiobook discovery script started.")
-    last_audiobook_run = 0
-    
-    while True:
-        settings = load_settings()
-        if not settings.get("enabled", True):
-            log_audio("Auto-discovery is disabled in settings. Sleeping for 10 minutes.")
-            time.sleep(600)
-            continue
-        
-        current_time = time.time()
-        
-        # Get interval
-        audiobook_interval = settings.get("audiobook_interval_minutes", settings.get("interval_minutes", 60)) * 60
-        
-        force_audio = settings.get("force_run_audiobooks", False)
-        if force_audio or (current_time - last_audiobook_run >= audiobook_interval):
-            if force_audio:
-                log_audio("⚠️ Force run triggered for Audiobooks!")
-                # Reset flag
-                try:
-                    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    data["force_run_audiobooks"] = False
-                    with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-                        json.dump(data, f, indent=4, ensure_ascii=False)
-                except Exception as e:
-                    log_audio(f"Error resetting force_run_audiobooks flag: {e}")
-
-            try:
-                genre = get_weighted_genre(settings.get("genre_priorities", {}), GENRE_MAPPING)
-                log_audio(f"--- Starting audiobook discovery cycle for genre: {genre} ---")
-                process_auto_audiobook(genre)
-                last_audiobook_run = time.time()
-                log_audio(f"Audiobook cycle completed. Next audiobook in {settings.get('audiobook_interval_minutes', settings.get('interval_minutes', 60))} minutes.")
-            except Exception as e:
-                log_audio(f"Error in audiobook processing: {e}")
-        
-        time.sleep(10) # Check every 10 seconds
+def run_once(genre=None, job_id=None):
+    """
+    One audiobook discovery cycle right now, recorded in the discovery run
+    table. Periodic runs are scheduled by the API server
+    (services/discovery_jobs.py), so this script no longer loops. Returns the
+    added title, or None.
+    """
+    if not genre:
+        genre = get_weighted_genre(load_settings().get("genre_priorities", {}), GENRE_MAPPING)
+    log_audio(f"--- Starting audiobook discovery cycle for genre: {genre} ---")
+    with discovery_events.run("audiobooks", genre, job_id) as cycle:
+        cycle.added = process_auto_audiobook(genre)
+    return cycle.added
 
 if __name__ == "__main__":
-    main_loop()
+    run_once()
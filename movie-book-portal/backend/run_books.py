@@ -1,20 +1,19 @@
 import os
-import time
-import json
 from sqlalchemy.orm import Session
 from database_books import Book, SessionLocalBooks
 from routers.discovery import suggest_book, GENRE_MAPPING
 from discovery_shared import log, load_settings, get_weighted_genre, download_file
 from utils import get_epub_page_count
+from services import media_store, library_index, discovery_events
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_FILE = os.path.join(BASE_DIR, "books_discovery.log")
-SETTINGS_FILE = os.path.join(BASE_DIR, "auto_discovery_settings.json")
 
-def log_book(msg):
-    log(msg, LOG_FILE)
+def log_book(msg, event="info"):
+    log(msg, LOG_FILE, event)
 
 def process_auto_book(genre_name):
+    """One book discovery cycle. Returns the added title, or None."""
     max_attempts = 3
     for attempt in range(max_attempts):
         db: Session = SessionLocalBooks()
@@ -26,8 +25,8 @@ def process_auto_book(genre_name):
                 log_book("No book suggestion found.")
                 break
 
-            # Check for duplicates
-            existing = db.query(Book).filter(Book.title == suggestion.title, Book.author == suggestion.author_director).first()
+            # Check for duplicates (fuzzy, in memory)
+            existing = library_index.find_duplicate("books", suggestion.title, suggestion.author_director)
             if existing:
                 log_book(f"Book '{suggestion.title}' by {suggestion.author_director} already exists. Trying another...")
                 db.close()
@@ -65,6 +64,7 @@ def process_auto_book(genre_name):
             db.add(new_book)
             db.commit()
             db.refresh(new_book)
+            library_index.register("books", new_book.id, new_book.title, new_book.author)
             
             book_id = new_book.id
             
@@ -84,6 +84,7 @@ def process_auto_book(genre_name):
                 log_book(f"Skipping '{suggestion.title}': failed to download cover image.")
                 db.delete(new_book)
                 db.commit()
+                library_index.unregister("books", new_book.id)
                 db.close()
                 continue
 
@@ -102,6 +103,7 @@ def process_auto_book(genre_name):
                 file_path = os.path.join(BASE_DIR, "uploads", "books", file_name)
                 if download_file(suggestion.download_url, file_path, log_book, referer=suggestion.source_url):
                     new_book.file_path = os.path.relpath(file_path, BASE_DIR).replace(os.sep, '/')
+                    new_book.content_sha256 = media_store.digest_for(file_path)
                     file_success = True
                     
                     # Update page count from file
@@ -116,6 +118,7 @@ def process_auto_book(genre_name):
                 log_book(f"Failed to download book file for: {suggestion.title}. Rolling back record.")
                 db.delete(new_book)
                 db.commit()
+                library_index.unregister("books", new_book.id)
                 # Clean up thumbnail if it was downloaded
                 if thumb_success and new_book.thumbnail_path:
                     try: os.remove(os.path.join(BASE_DIR, new_book.thumbnail_path))
@@ -125,59 +128,32 @@ def process_auto_book(genre_name):
                 continue # Try next attempt
 
             db.commit()
-            return # Success!
+            return suggestion.title # Success!
         except Exception as e:
-            log_book(f"Error processing book (attempt {attempt+1}): {e}")
+            log_book(f"Error processing book (attempt {attempt+1}): {e}", "error")
             if new_book:
                 try:
                     db.delete(new_book)
                     db.commit()
+                    library_index.unregister("books", new_book.id)
                 except: pass
         finally:
             if db: db.close()
     
     log_book(f"Failed to add any book for genre {genre_name} after {max_attempts} attempts.")
 
-def main_loop():
-    log_book("Book discovery script started.")
-    last_book_run = 0
-    
-    while True:
-        settings = load_settings()
-        if not settings.get("enabled", True):
-            log_book("Auto-discovery is disabled in settings. Sleeping for 10 minutes.")
-            time.sleep(600)
-            continue
-        
-        current_time = time.time()
-        
-        # Get interval
-        book_interval = settings.get("book_interval_minutes", settings.get("interval_minutes", 60)) * 60
-        
-        force_books = settings.get("force_run_books", False)
-        if force_books or (current_time - last_book_run >= book_interval):
-            if force_books:
-                log_book("⚠️ Force run triggered for Books!")
-                # Reset flag
-                try:
-                    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    data["force_run_books"] = False
-                    with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-                        json.dump(data, f, indent=4, ensure_ascii=False)
-                except Exception as e:
-                    log_book(f"Error resetting force_run_books flag: {e}")
-
-            try:
-                genre = get_weighted_genre(settings.get("genre_priorities", {}), GENRE_MAPPING)
-                log_book(f"--- Starting book discovery cycle for genre: {genre} ---")
-                process_auto_book(genre)
-                last_book_run = time.time()
-                log_book(f"Book cycle completed. Next book in {settings.get('book_interval_minutes', settings.get('interval_minutes', 60))} minutes.")
-            except Exception as e:
-                log_book(f"Error in book processing: {e}")
-        
-        time.sleep(10) # Check every 10 seconds
+def run_once(genre=None, job_id=None):
+    """
+    One book discovery cycle right now, recorded in the discovery run table.
+    Periodic runs are scheduled by the API server (services/discovery_jobs.py),
+    so this script no longer loops. Returns the added title, or None.
+    """
+    if not genre:
+        genre = get_weighted_genre(load_settings().get("genre_priorities", {}), GENRE_MAPPING)
+    log_book(f"--- Starting book discovery cycle for genre: {genre} ---")
+    with discovery_events.run("books", genre, job_id) as cycle:
+        cycle.added = process_auto_book(genre)
+    return cycle.added
 
 if __name__ == "__main__":
-    main_loop()
+    run_once()
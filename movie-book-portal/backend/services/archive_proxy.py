@@ -0,0 +1,198 @@
+"""
+Disk-spilling archive handling for /api/discovery/proxy.
+
+The upstream body is spooled into a SpooledTemporaryFile (RAM up to
+SPOOL_MAX_MEMORY, disk beyond), the book member is streamed out of the zip
+chunk by chunk and the extracted file is kept in a small on-disk cache keyed
+by URL, so repeated requests for the same book never touch the network.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from starlette.responses import StreamingResponse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(BASE_DIR, "cache", "proxy")
+SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+MAX_CACHE_BYTES = int(os.environ.get("PROXY_CACHE_MAX_MB", "500")) * 1024 * 1024
+
+# Priority: fb2, epub, mobi, txt
+BOOK_EXTENSIONS = ['.fb2', '.epub', '.mobi', '.txt']
+
+_evict_lock = threading.Lock()
+
+@dataclass
+class ExtractedFile:
+    """A book extracted from an archive, either cached on disk or about to be streamed"""
+    filename: str
+    media_type: str
+    size: int
+    path: Optional[str] = None  # Set for cache hits
+
+def _key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+def _paths(url: str):
+    key = _key(url)
+    return os.path.join(CACHE_DIR, f"{key}.bin"), os.path.join(CACHE_DIR, f"{key}.json")
+
+def media_type_for(filename: str) -> str:
+    """Semantic content type of an extracted book"""
+    if filename.endswith('.fb2'):
+        return "application/x-fictionbook+xml"
+    if filename.endswith('.epub'):
+        return "application/epub+zip"
+    return "application/octet-stream"
+
+def get_cached(url: str) -> Optional[ExtractedFile]:
+    """Extracted book for this URL if a previous request cached it"""
+    data_path, meta_path = _paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        size = os.path.getsize(data_path)
+    except (OSError, ValueError):
+        return None
+    if size != meta.get("size"):
+        return None
+    os.utime(data_path)  # LRU by mtime
+    return ExtractedFile(filename=meta["filename"], media_type=meta["media_type"], size=size, path=data_path)
+
+def spool(chunks: Iterator[bytes], max_memory: int = SPOOL_MAX_MEMORY):
+    """Copies a byte stream into a SpooledTemporaryFile and rewinds it"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    try:
+        for chunk in chunks:
+            if chunk:
+                spooled.write(chunk)
+        spooled.seek(0)
+    except Exception:
+        spooled.close()
+        raise
+    return spooled
+
+def find_book_member(archive: zipfile.ZipFile) -> Optional[zipfile.ZipInfo]:
+    """First book file in the archive, by BOOK_EXTENSIONS priority"""
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    for ext in BOOK_EXTENSIONS:
+        for info in members:
+            if info.filename.lower().endswith(ext):
+                return info
+    return None
+
+def stream_member(url: str, spooled, archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    """
+    Yields the decompressed member while writing it to the cache.
+    The cache entry only appears once the member was read completely.
+    Closes the archive and the spool when done; serve it with
+    CleanupStreamingResponse so they are also closed when the generator
+    never starts (client gone before the first chunk).
+    """
+    data_path, meta_path = _paths(url)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{data_path}.{uuid.uuid4().hex[:8]}.tmp"
+    complete = False
+    try:
+        with archive.open(info) as member, open(tmp_path, "wb") as cache_file:
+            while True:
+                chunk = member.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                cache_file.write(chunk)
+                yield chunk
+        complete = True
+    finally:
+        archive.close()
+        spooled.close()
+        if complete:
+            try:
+                os.replace(tmp_path, data_path)
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"url": url, "filename": info.filename, "media_type": media_type_for(info.filename),
+                               "size": info.file_size, "cached_at": time.time()}, f, ensure_ascii=False)
+                _evict()
+            except OSError as e:
+                print(f"Proxy cache: could not store {url}: {e}")
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def stream_file(fileobj, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Streams an open file (e.g. the spool when extraction failed) and closes it"""
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+class CleanupStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that always runs cleanup once the response is over.
+
+    A generator's finally block does not run if the generator was never
+    started, and Starlette skips background tasks when the client
+    disconnects, so neither can be relied on to close the spool.
+    """
+
+    def __init__(self, content, cleanup: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cleanup()
+
+def closer(*resources) -> Callable[[], None]:
+    """Cleanup that closes generators and files in order, ignoring the ones already closed"""
+    def close():
+        for resource in resources:
+            try:
+                resource.close()
+            except Exception as e:  # e.g. a generator still running in the threadpool
+                print(f"Proxy: cleanup of {type(resource).__name__} failed: {e}")
+    return close
+
+def spooled_size(spooled) -> int:
+    position = spooled.tell()
+    spooled.seek(0, os.SEEK_END)
+    size = spooled.tell()
+    spooled.seek(position)
+    return size
+
+def _evict():
+    """Keeps the cache under MAX_CACHE_BYTES, dropping least recently used books first"""
+    with _evict_lock:
+        entries = []
+        total = 0
+        for name in os.listdir(CACHE_DIR):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= MAX_CACHE_BYTES:
+            return
+        for _, size, path in sorted(entries):
+            if total <= MAX_CACHE_BYTES * 0.9:
+                break
+            for victim in (path, path[:-4] + ".json"):
+                if os.path.exists(victim):
+                    os.remove(victim)
+            total -= size
@@ -0,0 +1,261 @@
+"""
+Background genre catalog warmer for discovery.
+
+A low-priority daemon thread crawls the first pages of the library genres
+(weighted by genre_priorities from auto_discovery_settings.json) into a local
+catalog table and fills in cover URLs, so /discovery/browse can answer from
+SQLite instead of a 3-10 s live scrape. Pages are re-crawled once they are
+older than refresh_hours; books that have disappeared from the site are pruned.
+"""
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any
+
+from database_catalog import SessionLocalCatalog, CatalogBook, CatalogPage, create_catalog_tables
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "providers": ["flibusta"],
+    "pages": 3,              # First N pages of every genre
+    "refresh_hours": 12,     # Re-crawl a page once it is this old
+    "covers_per_cycle": 10,  # Cover lookups per cycle (one details page each)
+}
+CYCLE_INTERVAL = 120         # Seconds between two cycles
+PAGE_DELAY = 10              # Seconds between two page fetches (on top of the HTTP client host limits)
+UNLISTED_GENRE_WEIGHT = 0.2  # Weight of genres that are not in genre_priorities
+CATALOG_MAX_AGE = timedelta(days=3)   # Older catalog data falls back to a live scrape
+PRUNE_AFTER = timedelta(days=30)
+BROWSE_LIMIT = 10
+
+_tables_ready = False
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_state = {"running": False, "last_cycle": None, "last_genre": None, "last_error": None, "pages_fetched": 0, "covers_found": 0}
+
+def _session():
+    global _tables_ready
+    if not _tables_ready:
+        create_catalog_tables()
+        _tables_ready = True
+    return SessionLocalCatalog()
+
+def load_warmer_settings() -> Dict[str, Any]:
+    """catalog_warmer section of auto_discovery_settings.json merged over the defaults"""
+    from discovery_shared import load_settings
+    settings = load_settings()
+    merged = dict(DEFAULT_SETTINGS)
+    merged.update(settings.get("catalog_warmer") or {})
+    merged["genre_priorities"] = settings.get("genre_priorities") or {}
+    return merged
+
+def _book_dict(book: CatalogBook) -> Dict[str, Any]:
+    return {
+        "id": book.book_id,
+        "title": book.title,
+        "author": book.author,
+        "image": book.image,
+        "source_url": book.source_url
+    }
+
+def browse_from_catalog(provider: str, genre: str, limit: int = BROWSE_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Random books of a genre from the local catalog.
+    Returns [] when the genre was never crawled or its data is too old.
+    """
+    db = _session()
+    try:
+        newest = db.query(CatalogPage.fetched_at).filter(
+            CatalogPage.provider == provider, CatalogPage.genre == genre
+        ).order_by(CatalogPage.fetched_at.desc()).first()
+        if not newest or datetime.utcnow() - newest[0] > CATALOG_MAX_AGE:
+            return []
+        books = db.query(CatalogBook).filter(CatalogBook.provider == provider, CatalogBook.genre == genre).all()
+        if len(books) > limit:
+            books = random.sample(books, limit)
+        return [_book_dict(b) for b in books]
+    finally:
+        db.close()
+
+def record_page(provider: str, genre: str, page: int, books: List[Dict[str, Any]]):
+    """Upserts the books of one scraped genre page into the catalog"""
+    if not books:
+        return
+    now = datetime.utcnow()
+    db = _session()
+    try:
+        existing = {
+            b.book_id: b for b in db.query(CatalogBook).filter(
+                CatalogBook.provider == provider, CatalogBook.genre == genre,
+                CatalogBook.book_id.in_([str(b.get("id")) for b in books])
+            ).all()
+        }
+        for item in books:
+            book_id = str(item.get("id") or "").strip()
+            title = (item.get("title") or "").strip()
+            if not book_id or not title:
+                continue
+            book = existing.get(book_id)
+            if not book:
+                book = CatalogBook(provider=provider, genre=genre, book_id=book_id, first_seen=now)
+                db.add(book)
+                existing[book_id] = book
+            book.title = title
+            book.author = (item.get("author") or "").strip() or None
+            book.image = item.get("image") or book.image
+            book.source_url = item.get("source_url")
+            book.page = page
+            book.last_seen = now
+
+        page_row = db.query(CatalogPage).filter(
+            CatalogPage.provider == provider, CatalogPage.genre == genre, CatalogPage.page == page
+        ).first()
+        if not page_row:
+            page_row = CatalogPage(provider=provider, genre=genre, page=page)
+            db.add(page_row)
+        page_row.book_count = len(books)
+        page_row.fetched_at = now
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Catalog: failed to record {provider}/{genre} page {page}: {e}")
+    finally:
+        db.close()
+
+def pick_genre(genre_priorities: Dict[str, float]) -> str:
+    """Random genre of GENRE_MAPPING, weighted by genre_priorities (names compared case-insensitively)"""
+    from routers.discovery import GENRE_MAPPING
+    priorities = {name.lower(): weight for name, weight in genre_priorities.items()}
+    genres = list(GENRE_MAPPING.keys())
+    weights = [max(float(priorities.get(g.lower(), UNLISTED_GENRE_WEIGHT)), 0.01) for g in genres]
+    return random.choices(genres, weights=weights, k=1)[0]
+
+def _stale_pages(db, provider: str, genre: str, pages: int, refresh_hours: float) -> List[int]:
+    threshold = datetime.utcnow() - timedelta(hours=refresh_hours)
+    fresh = {
+        row.page for row in db.query(CatalogPage).filter(
+            CatalogPage.provider == provider, CatalogPage.genre == genre, CatalogPage.fetched_at >= threshold
+        ).all()
+    }
+    return [p for p in range(1, pages + 1) if p not in fresh]
+
+def _fill_covers(provider: str, limit: int):
+    """Looks up cover URLs for catalog books that have none yet (each is checked only once)"""
+    from routers.discovery import PROVIDERS, get_book_image_url, scrape_book_details
+    db = _session()
+    try:
+        books = db.query(CatalogBook).filter(
+            CatalogBook.provider == provider, CatalogBook.image.is_(None), CatalogBook.cover_checked_at.is_(None)
+        ).order_by(CatalogBook.first_seen.desc()).limit(limit).all()
+        for book in books:
+            if _stop.is_set():
+                break
+            try:
+                if provider == "flibusta":
+                    image = get_book_image_url(book.book_id)
+                else:
+                    details = scrape_book_details(book.book_id, PROVIDERS[provider])
+                    image = details.image if details else None
+            except Exception as e:
+                print(f"Catalog: cover lookup failed for {book.book_id}: {e}")
+                image = None
+            if image:
+                # The same book may be listed under several genres
+                db.query(CatalogBook).filter(
+                    CatalogBook.provider == provider, CatalogBook.book_id == book.book_id
+                ).update({"image": image}, synchronize_session=False)
+                _state["covers_found"] += 1
+            book.cover_checked_at = datetime.utcnow()
+            db.commit()
+            _stop.wait(PAGE_DELAY / 2)
+    finally:
+        db.close()
+
+def _prune():
+    db = _session()
+    try:
+        removed = db.query(CatalogBook).filter(CatalogBook.last_seen < datetime.utcnow() - PRUNE_AFTER).delete()
+        db.commit()
+        if removed:
+            print(f"Catalog: pruned {removed} books no longer listed")
+    finally:
+        db.close()
+
+def warm_cycle(settings: Optional[Dict[str, Any]] = None):
+    """One crawl step: the stale pages of one weighted-random genre, then a few covers"""
+    from routers.discovery import PROVIDERS, scrape_genre_page
+    settings = settings or load_warmer_settings()
+    genre = pick_genre(settings["genre_priorities"])
+    _state["last_genre"] = genre
+
+    for provider in settings["providers"]:
+        if provider not in PROVIDERS or _stop.is_set():
+            continue
+        db = _session()
+        try:
+            pages = _stale_pages(db, provider, genre, int(settings["pages"]), float(settings["refresh_hours"]))
+        finally:
+            db.close()
+
+        for page in pages:
+            if _stop.is_set():
+                return
+            books = scrape_genre_page(genre, PROVIDERS[provider], page=page)
+            record_page(provider, genre, page, books)
+            _state["pages_fetched"] += 1
+            if not books:
+                break  # Past the last page (or the site is down): do not hammer it
+            _stop.wait(PAGE_DELAY)
+
+        _fill_covers(provider, int(settings["covers_per_cycle"]))
+    _prune()
+
+def _lower_priority():
+    """Nice this thread only (Linux allows per-thread priorities)"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+def _run():
+    _lower_priority()
+    _state["running"] = True
+    _stop.wait(30)  # Let the server finish starting up first
+    while not _stop.is_set():
+        try:
+            settings = load_warmer_settings()
+            if settings.get("enabled", True):
+                warm_cycle(settings)
+                _state["last_cycle"] = datetime.utcnow().isoformat()
+                _state["last_error"] = None
+        except Exception as e:
+            _state["last_error"] = str(e)
+            print(f"Catalog warmer error: {e}")
+        _stop.wait(CYCLE_INTERVAL + random.uniform(0, CYCLE_INTERVAL / 2))
+    _state["running"] = False
+
+def start():
+    """Starts the warmer thread once per process (CATALOG_WARMER=0 disables it)"""
+    global _thread
+    if os.environ.get("CATALOG_WARMER", "1") == "0":
+        return
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="catalog-warmer", daemon=True)
+    _thread.start()
+
+def stop():
+    _stop.set()
+
+def status() -> Dict[str, Any]:
+    db = _session()
+    try:
+        books = db.query(CatalogBook).count()
+        with_covers = db.query(CatalogBook).filter(CatalogBook.image.isnot(None)).count()
+        pages = db.query(CatalogPage).count()
+        genres = db.query(CatalogPage.provider, CatalogPage.genre).distinct().count()
+    finally:
+        db.close()
+    return dict(_state, books=books, books_with_covers=with_covers, pages=pages, genres=genres)
@@ -0,0 +1,194 @@
+"""
+Structured record of the discovery cycles.
+
+Every book, audiobook and movie cycle is a row in discovery_runs (start, end,
+duration, added title, error) and writes its steps to discovery_events. The
+admin status page is answered from these tables with indexed queries; the
+*_discovery.log files are still written for humans, but nothing reads them.
+
+Workers open a run with `with discovery_events.run("books", genre) as r:` and
+set r.added to the title they added. Log helpers call note() with every line,
+which lands in the run that is open on the current thread (or nowhere when
+no run is open).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+from database_jobs import SessionLocalJobs, DiscoveryRun, DiscoveryEvent, create_jobs_tables
+
+KINDS = ("books", "audiobooks", "movies")
+KEEP_EVENTS = timedelta(days=30)   # Step events older than this are pruned; run rows are kept
+RECENT_EVENTS = 10
+
+_current = threading.local()
+_tables_ready = False
+
+def _session():
+    global _tables_ready
+    if not _tables_ready:
+        create_jobs_tables()
+        _tables_ready = True
+    return SessionLocalJobs()
+
+def _add_event(db, run_id: Optional[int], kind: str, event: str, message: str):
+    db.add(DiscoveryEvent(run_id=run_id, kind=kind, event=event, message=(message or "")[:2000]))
+
+class Run:
+    """Handle of an open run; the worker sets `added` to the title it added"""
+
+    def __init__(self, run_id: int, kind: str):
+        self.run_id = run_id
+        self.kind = kind
+        self.added: Optional[str] = None
+        self.started = time.monotonic()
+
+def start_run(kind: str, genre: Optional[str] = None, job_id: Optional[int] = None) -> Run:
+    db = _session()
+    try:
+        row = DiscoveryRun(kind=kind, genre=genre, job_id=job_id, status="running", pid=os.getpid())
+        db.add(row)
+        db.flush()
+        _add_event(db, row.id, kind, "start", "Cycle started" + (f" for genre: {genre}" if genre else ""))
+        db.commit()
+        return Run(row.id, kind)
+    finally:
+        db.close()
+
+def finish_run(handle: Run, error: Optional[str] = None):
+    duration = round(time.monotonic() - handle.started, 3)
+    if error:
+        status, message = "failed", f"Cycle failed after {int(duration)} s: {error}"
+    elif handle.added:
+        status, message = "added", f"Cycle finished in {int(duration)} s, added: {handle.added}"
+    else:
+        status, message = "nothing", f"Cycle finished in {int(duration)} s, nothing added"
+    db = _session()
+    try:
+        db.query(DiscoveryRun).filter(DiscoveryRun.id == handle.run_id).update({
+            "status": status, "finished_at": datetime.utcnow(), "duration": duration,
+            "added_title": handle.added, "error": error[:4000] if error else None,
+        })
+        if handle.added:
+            _add_event(db, handle.run_id, handle.kind, "added", f"Added: {handle.added}")
+        _add_event(db, handle.run_id, handle.kind, "error" if error else "end", message)
+        db.query(DiscoveryEvent).filter(DiscoveryEvent.created_at < datetime.utcnow() - KEEP_EVENTS).delete()
+        db.commit()
+    finally:
+        db.close()
+
+@contextmanager
+def run(kind: str, genre: Optional[str] = None, job_id: Optional[int] = None):
+    """Records one discovery cycle; note() calls on this thread are attached to it"""
+    handle = start_run(kind, genre, job_id)
+    previous = getattr(_current, "run", None)
+    _current.run = handle
+    try:
+        yield handle
+    except BaseException as e:
+        finish_run(handle, f"{type(e).__name__}: {e}")
+        raise
+    else:
+        finish_run(handle)
+    finally:
+        _current.run = previous
+
+def note(message: str, event: str = "info"):
+    """Adds a step to the run open on this thread (no-op outside a run)"""
+    handle = getattr(_current, "run", None)
+    if handle is None or not message or not message.strip():
+        return
+    db = _session()
+    try:
+        _add_event(db, handle.run_id, handle.kind, event, message.strip())
+        db.commit()
+    except Exception as e:
+        print(f"Discovery events: could not record event: {e}")
+    finally:
+        db.close()
+
+# ---- Queries ----
+
+def _local(value: Optional[datetime]) -> Optional[str]:
+    """UTC column value as a local "YYYY-MM-DD HH:MM:SS" string (the format the logs used)"""
+    if not value:
+        return None
+    return (value + (datetime.now() - datetime.utcnow())).strftime("%Y-%m-%d %H:%M:%S")
+
+def _mark_interrupted(db):
+    """Runs whose process is gone (server restart, killed script) are not running any more"""
+    stale = [r for r in db.query(DiscoveryRun).filter(DiscoveryRun.status == "running").all()
+             if not r.pid or not psutil.pid_exists(r.pid)]
+    for r in stale:
+        r.status = "interrupted"
+        r.finished_at = datetime.utcnow()
+    if stale:
+        db.commit()
+
+def summary(kind: str, recent: int = RECENT_EVENTS) -> Dict[str, Any]:
+    """
+    Status of one discovery kind from the run/event tables.
+
+    Returns:
+        last_run, last_success, last_duration, last_error, status
+        ("running" / "idle" / "error") and recent_activity (newest last)
+    """
+    db = _session()
+    try:
+        _mark_interrupted(db)
+        last = db.query(DiscoveryRun).filter(DiscoveryRun.kind == kind).order_by(DiscoveryRun.started_at.desc()).first()
+        success = (db.query(DiscoveryRun)
+                   .filter(DiscoveryRun.kind == kind, DiscoveryRun.status == "added")
+                   .order_by(DiscoveryRun.started_at.desc()).first())
+        events = (db.query(DiscoveryEvent).filter(DiscoveryEvent.kind == kind)
+                  .order_by(DiscoveryEvent.id.desc()).limit(recent).all())
+    finally:
+        db.close()
+    if last is None:
+        status = "idle"
+    elif last.status == "running":
+        status = "running"
+    elif last.status in ("failed", "interrupted"):
+        status = "error"
+    else:
+        status = "idle"
+    return {
+        "last_run": _local(last.started_at) if last else None,
+        "last_success": success.added_title if success else None,
+        "last_success_at": _local(success.finished_at) if success else None,
+        "last_duration": last.duration if last else None,
+        "last_error": last.error if last else None,
+        "status": status,
+        "recent_activity": [f"[{_local(e.created_at)}] {e.message}" for e in reversed(events)],
+    }
+
+def list_runs(kind: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    db = _session()
+    try:
+        q = db.query(DiscoveryRun)
+        if kind:
+            q = q.filter(DiscoveryRun.kind == kind)
+        return [
+            {"id": r.id, "kind": r.kind, "job_id": r.job_id, "genre": r.genre, "status": r.status,
+             "started_at": r.started_at.isoformat() if r.started_at else None,
+             "finished_at": r.finished_at.isoformat() if r.finished_at else None,
+             "duration": r.duration, "added_title": r.added_title, "error": r.error}
+            for r in q.order_by(DiscoveryRun.started_at.desc()).limit(limit).all()
+        ]
+    finally:
+        db.close()
+
+def run_events(run_id: int) -> List[Dict[str, Any]]:
+    db = _session()
+    try:
+        return [
+            {"event": e.event, "message": e.message, "created_at": e.created_at.isoformat()}
+            for e in db.query(DiscoveryEvent).filter(DiscoveryEvent.run_id == run_id).order_by(DiscoveryEvent.id).all()
+        ]
+    finally:
+        db.close()
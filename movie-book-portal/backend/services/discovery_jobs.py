@@ -0,0 +1,92 @@
+"""
+Discovery job types and their schedules (plus the OPDS mirror sync).
+
+The book, audiobook and movie discovery cycles used to be separate
+sleep-polling processes (run_books.py, run_audiobooks.py,
+movie_auto_discovery.py); they now run as scheduler jobs inside the API
+process. Schedules follow the settings files: *_interval_minutes, or a cron
+expression in book_cron / audiobook_cron / cron (movies) when present.
+"""
+import json
+import os
+from typing import Any, Dict
+
+from services import scheduler
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOVIE_SETTINGS_FILE = os.path.join(BASE_DIR, "movie_discovery_settings.json")
+
+# Schedule name (also the discovery type used by /api/system) -> job type
+DISCOVERY_JOBS = {
+    "books": "discover_books",
+    "audiobooks": "discover_audiobooks",
+    "movies": "discover_movies",
+}
+
+def _load_movie_settings() -> Dict[str, Any]:
+    try:
+        with open(MOVIE_SETTINGS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def discover_books(ctx: scheduler.JobContext):
+    from run_books import run_once
+    title = run_once(ctx.payload.get("genre"), ctx.job_id)
+    # Nothing suitable this cycle is a normal outcome, not a failure to retry
+    return {"added": title or None}
+
+def discover_audiobooks(ctx: scheduler.JobContext):
+    from run_audiobooks import run_once
+    title = run_once(ctx.payload.get("genre"), ctx.job_id)
+    return {"added": title or None}
+
+def discover_movies(ctx: scheduler.JobContext):
+    from movie_auto_discovery import run_once
+    title = run_once(ctx.job_id)
+    return {"added": title or None}
+
+def sync_opds_mirror(ctx: scheduler.JobContext):
+    from services import opds_sync
+    state = opds_sync.sync_followed_genres()
+    if state.get("status") == "error":
+        raise RuntimeError(state.get("last_error"))
+    return {"new_books": state.get("new_books"), "pages": state.get("pages")}
+
+def sync_schedules():
+    """(Re)creates the discovery schedules from the settings files"""
+    from discovery_shared import load_settings
+    settings = load_settings()
+    default_interval = settings.get("interval_minutes", 60)
+    enabled = settings.get("enabled", True)
+    scheduler.set_schedule(
+        "books", DISCOVERY_JOBS["books"],
+        interval_seconds=int(settings.get("book_interval_minutes", default_interval)) * 60,
+        cron=settings.get("book_cron"), enabled=enabled,
+    )
+    scheduler.set_schedule(
+        "audiobooks", DISCOVERY_JOBS["audiobooks"],
+        interval_seconds=int(settings.get("audiobook_interval_minutes", default_interval)) * 60,
+        cron=settings.get("audiobook_cron"), enabled=enabled,
+    )
+    movie_settings = _load_movie_settings()
+    scheduler.set_schedule(
+        "movies", DISCOVERY_JOBS["movies"],
+        interval_seconds=int(movie_settings.get("interval_minutes", 720)) * 60,
+        cron=movie_settings.get("cron"), enabled=movie_settings.get("enabled", True),
+    )
+    from services import opds_sync
+    scheduler.set_schedule("opds_sync", "opds_sync", interval_seconds=opds_sync.SYNC_INTERVAL,
+                           enabled=os.environ.get("OPDS_SYNC", "1") != "0")
+
+def register():
+    """Registers the discovery job types and their schedules"""
+    scheduler.register_job_type("discover_books", discover_books, concurrency=1, max_attempts=2, backoff=300)
+    scheduler.register_job_type("discover_audiobooks", discover_audiobooks, concurrency=1, max_attempts=2, backoff=300)
+    # A movie cycle downloads and converts for hours: never run two, never retry automatically
+    scheduler.register_job_type("discover_movies", discover_movies, concurrency=1, max_attempts=1)
+    scheduler.register_job_type("opds_sync", sync_opds_mirror, concurrency=1, max_attempts=3, backoff=600)
+    try:
+        sync_schedules()
+    except Exception as e:
+        print(f"Discovery schedules could not be set up: {e}")
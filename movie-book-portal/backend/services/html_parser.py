@@ -0,0 +1,185 @@
+"""
+Pluggable HTML parsing backend for the scrapers.
+
+The hot extraction loops (book lists of flibusta / coollib / royallib) use
+the small backend interface below: with lxml + cssselect the document is a C
+tree and CSS selectors are compiled once to XPath, with BeautifulSoup as the
+fallback. bench_html_parser.py checks on the pages in bench_html/ that every
+backend extracts the same values there.
+
+parse_html() returns a BeautifulSoup document for the code that walks the
+tree freely (details pages, audioboo, kinorush...). It stays on html.parser:
+lxml repairs broken markup differently and those paths were not verified.
+
+HTML_PARSER=html.parser|bs4-lxml|lxml forces a backend.
+"""
+import os
+from typing import Dict, Iterable, List, Optional
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+try:
+    from lxml import html as lxml_html
+    from lxml import etree
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+try:
+    from lxml.cssselect import CSSSelector
+    HAS_CSSSELECT = HAS_LXML
+except ImportError:
+    HAS_CSSSELECT = False
+
+# Link selectors shared by the extraction loops
+BOOK_LINK_SELECTOR = 'a[href*="/b/"]'                      # Flibusta / Coollib: /b/123
+ROYALLIB_BOOK_SELECTOR = 'a[href*="/book/"][href$=".html"]'
+AUTHOR_LINK_SELECTOR = 'a[href*="/a/"], a[href*="/author/"]'
+ROYALLIB_AUTHOR_SELECTOR = 'a[href*="/author/"]'
+
+class SoupBackend:
+    """BeautifulSoup tree + soupsieve selectors (pure Python apart from the tree builder)"""
+
+    def __init__(self, builder: str):
+        self.name = "bs4-lxml" if builder == "lxml" else builder
+        self.builder = builder
+
+    def document(self, content):
+        return BeautifulSoup(content, self.builder)
+
+    def select(self, root, selector: str) -> List:
+        return root.select(selector)
+
+    def select_one(self, root, selector: str):
+        return root.select_one(selector)
+
+    def first(self, root, selectors: Iterable[str]):
+        """First element matching any selector, trying selectors in order"""
+        for selector in selectors:
+            found = root.select_one(selector)
+            if found is not None:
+                return found
+        return None
+
+    def text(self, el) -> str:
+        return el.get_text(strip=True)
+
+    def attr(self, el, name: str, default=None):
+        value = el.get(name, default)
+        return " ".join(value) if isinstance(value, list) else value
+
+    def closest(self, el, tags: Iterable[str], class_: Optional[str] = None):
+        return el.find_parent(list(tags), class_=class_) if class_ else el.find_parent(list(tags))
+
+    def next_link(self, el):
+        """Next <a href> in document order (same as Tag.find_next('a', href=True))"""
+        return el.find_next('a', href=True)
+
+class LxmlBackend:
+    """lxml.html tree with CSS selectors compiled to XPath and evaluated in libxml2"""
+
+    name = "lxml"
+
+    def __init__(self):
+        self._selectors: Dict[str, "CSSSelector"] = {}
+        self._next_link = etree.XPath("(descendant::a[@href] | following::a[@href])[1]")
+        self._texts = etree.XPath(".//text()")
+
+    def _compiled(self, selector: str):
+        compiled = self._selectors.get(selector)
+        if compiled is None:
+            compiled = CSSSelector(selector, translator="html")
+            self._selectors[selector] = compiled
+        return compiled
+
+    def document(self, content):
+        if isinstance(content, bytes):
+            try:
+                content = content.decode("utf-8")
+            except UnicodeDecodeError:
+                # Same encoding detection as BeautifulSoup (meta charset, then guessing)
+                content = UnicodeDammit(content, is_html=True).unicode_markup or ""
+        if content.lstrip().startswith("<?xml"):
+            content = content.split("?>", 1)[-1]  # lxml refuses str input with an encoding declaration
+        try:
+            return lxml_html.document_fromstring(content)
+        except (etree.ParserError, ValueError):
+            return lxml_html.document_fromstring("<html><body></body></html>")
+
+    def select(self, root, selector: str) -> List:
+        return self._compiled(selector)(root)
+
+    def select_one(self, root, selector: str):
+        found = self._compiled(selector)(root)
+        return found[0] if found else None
+
+    def first(self, root, selectors: Iterable[str]):
+        for selector in selectors:
+            found = self.select_one(root, selector)
+            if found is not None:
+                return found
+        return None
+
+    def text(self, el) -> str:
+        return "".join(t.strip() for t in self._texts(el))
+
+    def attr(self, el, name: str, default=None):
+        return el.get(name, default)
+
+    def closest(self, el, tags: Iterable[str], class_: Optional[str] = None):
+        tags = set(tags)
+        for ancestor in el.iterancestors():
+            if ancestor.tag in tags and (class_ is None or class_ in (ancestor.get("class") or "").split()):
+                return ancestor
+        return None
+
+    def next_link(self, el):
+        found = self._next_link(el)
+        return found[0] if found else None
+
+def available_backends() -> List[str]:
+    names = ["html.parser"]
+    if HAS_LXML:
+        names.append("bs4-lxml")
+    if HAS_CSSSELECT:
+        names.append("lxml")
+    return names
+
+def _make_backend(name: str):
+    if name == "lxml" and HAS_CSSSELECT:
+        return LxmlBackend()
+    if name in ("lxml", "bs4-lxml") and HAS_LXML:
+        return SoupBackend("lxml")
+    return SoupBackend("html.parser")
+
+DEFAULT_BACKEND = available_backends()[-1]
+_backend = _make_backend(os.environ.get("HTML_PARSER", DEFAULT_BACKEND))
+
+def get_backend():
+    """Backend used by the hot extraction loops"""
+    return _backend
+
+def use(name: str):
+    """Switches the backend at runtime (used by bench_html_parser.py)"""
+    global _backend
+    _backend = _make_backend(name)
+    return _backend
+
+def has_match(content, selectors: Iterable[str]) -> bool:
+    """True if the page has an element matching one of the selectors"""
+    backend = get_backend()
+    return backend.first(backend.document(content), selectors) is not None
+
+def parse_html(markup, parser: str = "html.parser") -> BeautifulSoup:
+    """
+    Builds a BeautifulSoup tree.
+
+    Args:
+        markup: bytes (response.content) or str
+        parser: BeautifulSoup tree builder; pass "lxml" only for pages whose
+            extraction bench_html_parser.py showed to be identical
+
+    Returns:
+        BeautifulSoup document
+    """
+    return BeautifulSoup(markup, parser)
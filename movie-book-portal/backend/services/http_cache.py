@@ -0,0 +1,125 @@
+"""
+Conditional requests (ETag / If-None-Match) for the catalog endpoints.
+
+Every committed write bumps an in-memory change counter of the tables it
+touched: ORM objects added, changed or deleted in a flush, and bulk
+query().update() / delete() statements. A catalog response is tagged with a
+weak ETag built from the counters of the tables it reads (plus the query
+string and the mtime of the database files, so writes made by another
+process such as restore_movies.py are noticed too). When the client sends
+that ETag back and nothing changed, conditional_json() answers 304 without
+running the query or serializing anything.
+
+The counters start over with every process; a random boot token in the
+ETag keeps tags of a previous run from matching.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy import Table, event
+from sqlalchemy.orm import Session
+
+from responses import FastJSONResponse
+
+BOOT_TOKEN = uuid.uuid4().hex[:8]
+CACHE_CONTROL = "no-cache"   # May be stored, but revalidated on every use
+
+_versions: Dict[Table, int] = {}
+_lock = threading.Lock()
+
+def _pending(session) -> set:
+    return session.info.setdefault("http_cache_tables", set())
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    pending = _pending(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(type(obj), "__table__", None)
+        if table is not None:
+            pending.add(table)
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if isinstance(table, Table):
+            _pending(orm_execute_state.session).add(table)
+
+@event.listens_for(Session, "after_commit")
+def _bump(session):
+    pending = session.info.pop("http_cache_tables", None)
+    if pending:
+        with _lock:
+            for table in pending:
+                _versions[table] = _versions.get(table, 0) + 1
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("http_cache_tables", None)
+
+def table_version(model) -> int:
+    """Change counter of a model's table (0 until the first write in this process)"""
+    return _versions.get(model.__table__, 0)
+
+def _db_mtime(session) -> int:
+    database = session.get_bind().url.database
+    try:
+        return os.stat(database).st_mtime_ns if database else 0
+    except OSError:
+        return 0
+
+def make_etag(models: Iterable, sessions: Sequence = (), extra: str = "") -> str:
+    """
+    Weak ETag of a response that depends on the given models' tables.
+
+    Args:
+        models: ORM classes whose tables the response reads
+        sessions: Sessions of those tables (their database file mtimes are part of the tag)
+        extra: Anything else the response depends on (query string, user...)
+    """
+    parts = [f"{m.__table__.name}:{table_version(m)}" for m in models]
+    parts += [str(_db_mtime(s)) for s in sessions]
+    parts.append(extra)
+    digest = hashlib.md5("|".join(parts).encode(), usedforsecurity=False).hexdigest()[:16]
+    return f'W/"{BOOT_TOKEN}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison (RFC 9110) of an If-None-Match header with an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+@lru_cache(maxsize=None)
+def _adapter(response_model) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+def conditional_json(request: Request, build: Callable[[], Any], models: Iterable,
+                     sessions: Sequence = (), extra: str = "", response_model=None) -> Response:
+    """
+    304 when the client's copy is current, else the JSON of build() with an ETag.
+
+    build is only called for a full response, so a 304 costs no query and no
+    serialization. The query string is always part of the tag. With a
+    response_model (e.g. List[MovieResponse]) the result is dumped by
+    pydantic-core, like FastAPI does for endpoints that declare one.
+    """
+    etag = make_etag(models, sessions, f"{request.url.query}|{extra}")
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if response_model is not None:
+        adapter = _adapter(response_model)
+        content = adapter.dump_json(adapter.validate_python(build(), from_attributes=True))
+        return Response(content, media_type="application/json", headers=headers)
+    return FastJSONResponse(jsonable_encoder(build()), headers=headers)
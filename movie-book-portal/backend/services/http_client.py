@@ -0,0 +1,258 @@
+"""
+Process-wide HTTP client shared by all scrapers and downloaders.
+
+One keep-alive connection pool per host, a per-host concurrency limit with a
+politeness delay, one retry/backoff policy and a cookie jar that survives
+between calls. Async code uses the a* variants, which run in a worker thread
+so the event loop is never blocked.
+"""
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services import provider_health
+from services.provider_health import CircuitOpenError
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Connection': 'keep-alive',
+}
+DEFAULT_TIMEOUT = 15
+
+@dataclass
+class HostPolicy:
+    """Per-host limits"""
+    max_concurrency: int = 4
+    min_interval: float = 0.0  # Politeness delay between two request starts (seconds)
+    jitter: float = 0.0        # Extra random delay added to min_interval
+
+DEFAULT_POLICY = HostPolicy()
+
+HOST_POLICIES: Dict[str, HostPolicy] = {
+    # audioboo drops connections (10054 / SSL errors) when hit in parallel
+    "audioboo.org": HostPolicy(max_concurrency=2, min_interval=1.0, jitter=2.0),
+    "flibusta.is": HostPolicy(max_concurrency=3, min_interval=0.3),
+    "pda.coollib.net": HostPolicy(max_concurrency=3, min_interval=0.3),
+    "royallib.com": HostPolicy(max_concurrency=3, min_interval=0.3),
+    "kinorush.name": HostPolicy(max_concurrency=2, min_interval=0.5),
+}
+
+def build_retry_policy() -> Retry:
+    """The single retry/backoff policy for every outgoing request"""
+    return Retry(
+        total=3,
+        connect=3,
+        read=2,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "POST", "HEAD", "OPTIONS"],
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 30.0) -> float:
+    """
+    Delay before retry number `attempt` (1-based) for retries done above the
+    transport layer, e.g. a download that broke mid-stream. Exponential with jitter.
+    """
+    return min(cap, base * (2 ** (attempt - 1))) * random.uniform(0.5, 1.0)
+
+def host_of(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+class _HostGate:
+    """Concurrency limit plus minimum spacing between request starts for one host"""
+
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.semaphore = threading.BoundedSemaphore(policy.max_concurrency)
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def acquire(self):
+        self.semaphore.acquire()
+        if not self.policy.min_interval and not self.policy.jitter:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.policy.min_interval + random.uniform(0, self.policy.jitter)
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self):
+        self.semaphore.release()
+
+class StreamedResponse:
+    """
+    Returned by HttpClient.request for stream=True. Wraps the requests.Response
+    (attributes are forwarded to it) and holds the host slot until the body
+    has been iterated to the end or the response is closed, so max_concurrency
+    also bounds downloads in progress. Use it as a context manager:
+
+        with http_client.get(url, stream=True) as response:
+            for chunk in response.iter_content(8192): ...
+    """
+
+    def __init__(self, response: requests.Response, gate: _HostGate):
+        self.response = response
+        self._gate = gate
+        self._lock = threading.Lock()
+        self._held = True
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def _release(self):
+        with self._lock:
+            if not self._held:
+                return
+            self._held = False
+        self._gate.release()
+
+    def iter_content(self, *args, **kwargs):
+        try:
+            yield from self.response.iter_content(*args, **kwargs)
+        finally:
+            self.close()
+
+    def iter_lines(self, *args, **kwargs):
+        try:
+            yield from self.response.iter_lines(*args, **kwargs)
+        finally:
+            self.close()
+
+    def __iter__(self):
+        return self.iter_content(128)
+
+    def close(self):
+        try:
+            self.response.close()
+        finally:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        # Last resort for a caller that drops the response without closing it
+        self._release()
+
+def _is_failure(response: requests.Response) -> bool:
+    """Server-side trouble counts against a host's health; 4xx answers do not"""
+    return response.status_code >= 500
+
+class HttpClient:
+    """Thread-safe wrapper around one pooled requests.Session"""
+
+    def __init__(self, pool_maxsize: int = 16):
+        self.session = requests.Session()
+        self.session.trust_env = False  # Disable system proxies
+        self.session.verify = False     # Mirrors often have broken certificates
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_maxsize, max_retries=build_retry_policy())
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._gates: Dict[str, _HostGate] = {}
+        self._gates_lock = threading.Lock()
+        self._warmed = set()
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    def _gate(self, url: str) -> _HostGate:
+        host = host_of(url)
+        with self._gates_lock:
+            gate = self._gates.get(host)
+            if gate is None:
+                gate = _HostGate(HOST_POLICIES.get(host, DEFAULT_POLICY))
+                self._gates[host] = gate
+            return gate
+
+    def request(self, method: str, url: str, referer: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Same arguments as requests.Session.request, plus an optional referer.
+        With stream=True a StreamedResponse is returned; it holds the host slot
+        until its body is consumed or it is closed.
+        Raises CircuitOpenError without any network traffic while the host's
+        circuit is open (see services/provider_health.py).
+        """
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        if referer:
+            headers = dict(kwargs.get("headers") or {})
+            headers.setdefault("Referer", referer)
+            kwargs["headers"] = headers
+        host = host_of(url)
+        if not provider_health.allow(host):
+            raise CircuitOpenError(f"Circuit open for {host}, not contacting it")
+        gate = self._gate(url)
+        gate.acquire()
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception as e:
+            gate.release()
+            provider_health.record(host, False, time.monotonic() - started, error=f"{type(e).__name__}: {e}"[:300])
+            raise
+        if kwargs.get("stream"):
+            response = StreamedResponse(response, gate)
+        else:
+            gate.release()
+        failed = _is_failure(response)
+        provider_health.record(host, not failed, time.monotonic() - started,
+                               error=f"HTTP {response.status_code}" if failed else None)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def warm_up(self, base_url: str, timeout: int = 10):
+        """Visits a site's homepage once per process to obtain its cookies"""
+        if base_url in self._warmed:
+            return
+        try:
+            response = self.get(base_url, timeout=timeout)
+        except Exception as e:
+            print(f"Warning: could not initialize session cookies for {base_url}: {e}")
+            return
+        # Failed visits are retried by the next caller
+        if not _is_failure(response):
+            self._warmed.add(base_url)
+
+    async def arequest(self, method: str, url: str, **kwargs) -> requests.Response:
+        return await asyncio.to_thread(self.request, method, url, **kwargs)
+
+    async def aget(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+http_client = HttpClient()
+
+def get_client() -> HttpClient:
+    return http_client
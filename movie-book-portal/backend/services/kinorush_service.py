@@ -1,14 +1,12 @@
 """
 Kinorush.name scraper service for movie discovery and metadata extraction
 """
-import requests
-from bs4 import BeautifulSoup
+from services.html_parser import parse_html
 from typing import List, Optional, Dict
 from dataclasses import dataclass
 import re
-import urllib3
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from services.http_client import http_client
 
 @dataclass
 class TorrentInfo:
@@ -43,20 +41,9 @@ class MovieDetails:
 BASE_URL = "https://kinorush.name"
 
 def get_session():
-    """Create a session with proper headers"""
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-        'Connection': 'keep-alive',
-    })
-    # Initial visit to trigger cookies/session
-    try:
-        session.get(BASE_URL, timeout=10, verify=False)
-    except Exception as e:
-        print(f"Warning: could not initialize session cookies: {e}")
-    return session
+    """Shared pooled client; the homepage is visited once per process to obtain cookies"""
+    http_client.warm_up(BASE_URL)
+    return http_client
 
 def is_series(url: str, title: str) -> bool:
     """
@@ -275,7 +262,7 @@ def search_movies_by_genre(genre: str, min_year: int = None, min_rating: float =
         response = session.get(genre_url, timeout=15, verify=False)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content)
         all_movies = _extract_movies_from_soup(soup, limit=100) # Get more to filter
         
         # Apply filters
@@ -307,7 +294,7 @@ def get_movie_details(movie_url: str) -> Optional[MovieDetails]:
         response = session.get(movie_url, timeout=15, verify=False)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content)
         
         # Extract title
         title = ""
@@ -477,7 +464,7 @@ def search_movies_by_name(query: str, limit: int = 20) -> List[MovieInfo]:
         response = session.post(search_url, data=data, headers=headers, timeout=15, verify=False)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content)
         return _extract_movies_from_soup(soup, limit=limit)
                 
     except Exception as e:
@@ -498,7 +485,7 @@ def search_films_page(page: int = 1) -> List[MovieInfo]:
         response = session.get(url, timeout=15, verify=False)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content)
         return _extract_movies_from_soup(soup)
         
     except Exception as e:
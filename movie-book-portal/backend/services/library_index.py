@@ -0,0 +1,290 @@
+"""
+In-memory duplicate check for the local library.
+
+Books, audiobooks and movies are reduced to fingerprints: title and author
+(or director) are case- and punctuation-folded and transliterated to one
+Latin spelling, so "Пикник на обочине" / "Piknik na obochine" and
+"Стругацкий" / "Strugatsky" compare equal. Each index is loaded from its
+database on first use, updated by register() after an insert and by
+unregister() after a delete, and reloaded when another process has changed
+the table (row count or max id differ).
+
+Discovery workers screen candidates with find_duplicate() before spending
+any bandwidth on them.
+"""
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+STALE_CHECK_INTERVAL = 30.0   # Seconds between two "did the table change?" queries
+FUZZY_TITLE_RATIO = 0.9       # Title similarity that still counts as the same work
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "iu",
+    "я": "ia", "і": "i", "ї": "i", "є": "e",
+}
+# Latin spellings that the transliteration above folds together
+_LATIN_FOLDS = [("kh", "h"), ("shch", "sh"), ("sch", "sh"), ("j", "i"), ("y", "i"),
+                ("w", "v"), ("ck", "k"), ("x", "ks")]
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase, without bracketed remarks and punctuation, transliterated to Latin"""
+    text = (text or "").lower()
+    text = re.sub(r"[\(\[].*?[\)\]]", " ", text)   # "(сборник)", "[litres]"
+    text = "".join(_TRANSLIT.get(ch, ch) for ch in text)
+    for src, dst in _LATIN_FOLDS:
+        text = text.replace(src, dst)
+    text = re.sub(r"([^\W\d_])\1+", r"\1", text)  # Strugatskii / Strugatski (letters only, not "2033")
+    return " ".join(re.findall(r"\w+", text))
+
+UNKNOWN_AUTHORS = {normalize_text(name) for name in ("Неизвестен", "Неизвестный автор", "Неизвестно", "Unknown")}
+
+# Transliterated endings of patronymics: -вич / -вна / -ична / Ильич, Кузьмич
+_PATRONYMIC = re.compile(r"(vich|vna|ichna|ich)$")
+
+def author_key(author: Optional[str]) -> str:
+    """
+    The words of the name, sorted, so the name order does not matter.
+    Initials and the patronymic are dropped: "Булгаков Михаил Афанасьевич",
+    "Михаил Булгаков" and "М. А. Булгаков" keep bulgakov (and mihail).
+    """
+    name = normalize_text(author)
+    if not name or name in UNKNOWN_AUTHORS:
+        return ""
+    words = [w for w in name.split() if len(w) > 2 and not w.isdigit()]
+    # Only a three-part name has a patronymic: "Имя Отчество Фамилия" or "Фамилия Имя Отчество"
+    # (a two-part "Роман Абрамович" keeps its -вич surname)
+    if len(words) >= 3:
+        if _PATRONYMIC.search(words[1]):
+            del words[1]
+        elif _PATRONYMIC.search(words[-1]):
+            del words[-1]
+    return " ".join(sorted(set(words)))
+
+def _same_word(a: str, b: str) -> bool:
+    """Name words that differ only in the ending ("Стругацкий" / "Стругацкие")"""
+    if a == b:
+        return True
+    prefix = len(os.path.commonprefix([a, b]))
+    return prefix >= 5 and prefix >= min(len(a), len(b)) - 2
+
+def same_author(a: str, b: str) -> bool:
+    """
+    Author keys of the same person: every word of the shorter name matches a
+    word of the other one. "Пушкин" matches "Александр Пушкин", but
+    "Александр Пушкин" does not match "Александр Дюма".
+    """
+    words_a, words_b = a.split(), b.split()
+    if len(words_a) > len(words_b):
+        words_a, words_b = words_b, words_a
+    return bool(words_a) and all(any(_same_word(w, other) for other in words_b) for w in words_a)
+
+def fingerprint(title: Optional[str], author: Optional[str] = None) -> Tuple[str, str]:
+    return normalize_text(title), author_key(author)
+
+@dataclass
+class Entry:
+    item_id: int
+    title: str
+    who: str
+    year: Optional[int] = None
+
+class FingerprintIndex:
+    """Fingerprints of one library table, with exact and fuzzy title lookup"""
+
+    def __init__(self, kind: str, loader: Callable[[], List[Tuple[int, str, Optional[str], Optional[int]]]],
+                 signature: Callable[[], Tuple[int, int]]):
+        self.kind = kind
+        self._loader = loader
+        self._signature = signature
+        self._lock = threading.RLock()
+        self._loaded_signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._by_title: Dict[str, List[Entry]] = {}
+        self._titles_by_who: Dict[str, Set[str]] = {}
+        self._titles_by_word: Dict[str, Set[str]] = {}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._by_title.values())
+
+    def _add(self, entry: Entry):
+        self._by_title.setdefault(entry.title, []).append(entry)
+        for who_word in entry.who.split():
+            self._titles_by_who.setdefault(who_word, set()).add(entry.title)
+        self._titles_by_word.setdefault(entry.title.split()[0], set()).add(entry.title)
+
+    def load(self):
+        with self._lock:
+            started = time.monotonic()
+            rows = self._loader()
+            self._by_title.clear()
+            self._titles_by_who.clear()
+            self._titles_by_word.clear()
+            for item_id, title, who, year in rows:
+                title_fp, who_fp = fingerprint(title, who)
+                if title_fp:
+                    self._add(Entry(item_id, title_fp, who_fp, year or None))
+            self._loaded_signature = self._signature()
+            self._checked_at = time.monotonic()
+            print(f"Library index: {len(self)} {self.kind} loaded in {int((time.monotonic() - started) * 1000)} ms")
+
+    def _ensure_fresh(self):
+        if self._loaded_signature is None:
+            self.load()
+            return
+        if time.monotonic() - self._checked_at < STALE_CHECK_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        if self._signature() != self._loaded_signature:
+            self.load()
+
+    def register(self, item_id: int, title: str, who: Optional[str] = None, year: Optional[int] = None):
+        """Adds a freshly inserted row without reloading the table"""
+        with self._lock:
+            if self._loaded_signature is None:
+                return  # Not loaded yet: the first lookup reads the row from the database
+            title_fp, who_fp = fingerprint(title, who)
+            if title_fp:
+                self._add(Entry(item_id, title_fp, who_fp, year or None))
+            # Our own insert must not trigger a full reload
+            count, max_id = self._loaded_signature
+            self._loaded_signature = (count + 1, max(max_id, item_id or 0))
+
+    def unregister(self, item_id: int):
+        """Drops a row that was just deleted (e.g. rolled back after a failed download)"""
+        with self._lock:
+            if self._loaded_signature is None:
+                return
+            for title_fp in list(self._by_title):
+                entries = self._by_title[title_fp]
+                kept = [entry for entry in entries if entry.item_id != item_id]
+                if len(kept) == len(entries):
+                    continue
+                if kept:
+                    self._by_title[title_fp] = kept
+                    continue
+                del self._by_title[title_fp]
+                for entry in entries:
+                    for who_word in entry.who.split():
+                        self._titles_by_who.get(who_word, set()).discard(title_fp)
+                self._titles_by_word.get(title_fp.split()[0], set()).discard(title_fp)
+            # Our own delete must not trigger a full reload either
+            count, max_id = self._loaded_signature
+            if item_id == max_id:
+                max_id = max((e.item_id for entries in self._by_title.values() for e in entries), default=0)
+            self._loaded_signature = (max(count - 1, 0), max_id)
+
+    def _candidates(self, title_fp: str, who_fp: str) -> List[Entry]:
+        entries = list(self._by_title.get(title_fp, []))
+        if entries:
+            return entries
+        # Fuzzy: only titles sharing a name word with the author (or starting with the same word) are compared
+        if who_fp:
+            pool = set().union(*(self._titles_by_who.get(who_word, set()) for who_word in who_fp.split()))
+        else:
+            pool = self._titles_by_word.get(title_fp.split()[0], set())
+        for other in pool:
+            if SequenceMatcher(None, title_fp, other).ratio() >= FUZZY_TITLE_RATIO:
+                entries.extend(self._by_title[other])
+        return entries
+
+    def find(self, title: str, who: Optional[str] = None, year: Optional[int] = None) -> Optional[Entry]:
+        """
+        Library entry that is the same work, or None.
+        Authors only have to agree when both sides know them; years (movies)
+        may differ by one, since sources disagree about release dates.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            title_fp, who_fp = fingerprint(title, who)
+            if not title_fp:
+                return None
+            for entry in self._candidates(title_fp, who_fp):
+                if who_fp and entry.who and not same_author(who_fp, entry.who):
+                    continue
+                if year and entry.year and abs(year - entry.year) > 1:
+                    continue
+                return entry
+            return None
+
+def _table_signature(session_factory, model) -> Tuple[int, int]:
+    from sqlalchemy import func
+    db = session_factory()
+    try:
+        count, max_id = db.query(func.count(model.id), func.max(model.id)).one()
+        return count or 0, max_id or 0
+    finally:
+        db.close()
+
+def _table_rows(session_factory, model, who_column, year_column=None):
+    db = session_factory()
+    try:
+        columns = [model.id, model.title, who_column] + ([year_column] if year_column is not None else [])
+        return [(row[0], row[1], row[2], row[3] if year_column is not None else None) for row in db.query(*columns).all()]
+    finally:
+        db.close()
+
+def _books_index() -> FingerprintIndex:
+    from database_books import Book, SessionLocalBooks
+    return FingerprintIndex(
+        "books",
+        lambda: _table_rows(SessionLocalBooks, Book, Book.author),
+        lambda: _table_signature(SessionLocalBooks, Book),
+    )
+
+def _audiobooks_index() -> FingerprintIndex:
+    from database_audiobooks import Audiobook, SessionLocalAudiobooks
+    return FingerprintIndex(
+        "audiobooks",
+        lambda: _table_rows(SessionLocalAudiobooks, Audiobook, Audiobook.author),
+        lambda: _table_signature(SessionLocalAudiobooks, Audiobook),
+    )
+
+def _movies_index() -> FingerprintIndex:
+    # Movies are told apart by year rather than by director (sources rarely agree on his spelling)
+    from database import Movie, SessionLocal
+    return FingerprintIndex(
+        "movies",
+        lambda: [(item_id, title, None, year) for item_id, title, _, year in _table_rows(SessionLocal, Movie, Movie.director, Movie.year)],
+        lambda: _table_signature(SessionLocal, Movie),
+    )
+
+_FACTORIES = {"books": _books_index, "audiobooks": _audiobooks_index, "movies": _movies_index}
+_indexes: Dict[str, FingerprintIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(kind: str) -> FingerprintIndex:
+    with _indexes_lock:
+        index = _indexes.get(kind)
+        if index is None:
+            index = _FACTORIES[kind]()
+            _indexes[kind] = index
+        return index
+
+def find_duplicate(kind: str, title: str, author: Optional[str] = None, year: Optional[int] = None) -> Optional[Entry]:
+    """
+    Library entry that duplicates the candidate, or None.
+
+    Args:
+        kind: books / audiobooks / movies
+        title: Candidate title
+        author: Author (books, audiobooks); ignored for movies
+        year: Release year (movies)
+    """
+    return get_index(kind).find(title, None if kind == "movies" else author, year)
+
+def register(kind: str, item_id: int, title: str, author: Optional[str] = None, year: Optional[int] = None):
+    """Records a row that was just inserted into the library"""
+    get_index(kind).register(item_id, title, None if kind == "movies" else author, year)
+
+def unregister(kind: str, item_id: Optional[int]):
+    """Forgets a row that was deleted from the library"""
+    if item_id is not None:
+        get_index(kind).unregister(item_id)
@@ -0,0 +1,422 @@
+"""
+Incremental scanner for the movie library.
+
+A pass walks the movie folders and compares every video file with its row in
+library_scan.db (path, size, mtime): only new and changed files are
+processed, unchanged ones are skipped, rows of deleted files are dropped.
+Files left pending by an interrupted pass are picked up by the next one, so
+a pass never starts over. Files the ingest pipeline (media_ingest) is still
+working on are left pending as well.
+
+For each pending file:
+    probe      - ffprobe, several at a time (PROBE_WORKERS), through the
+                 media_probe cache
+    link       - the Movie record is looked up by file path or id prefix;
+                 a complete record ends the work for this file
+    restore    - otherwise the title is looked up on kinorush (cached in
+                 metadata_lookups, at most one request per LOOKUP_INTERVAL)
+                 and the Movie record is created or completed, like
+                 restore_movies.py always did
+
+Passes run as "library_scan" scheduler jobs (daily by default, see
+register()); progress is stored after every file and exposed by status().
+"""
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from database_library_scan import (
+    LibraryFile, LibraryScan, MetadataLookup, SessionLocalLibraryScan, create_library_scan_tables,
+)
+from services import library_index, media_ingest, media_probe, media_store
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOTS = [
+    os.path.join(BASE_DIR, "uploads", "movies"),
+    os.path.join(os.path.dirname(BASE_DIR), "uploads", "movies"),
+]
+SKIP_SUFFIXES = ("_backup.mp4", "_fixed_temp.mp4", ".opt.mp4")
+
+PROBE_WORKERS = int(os.environ.get("LIBRARY_SCAN_PROBE_WORKERS", str(min(8, os.cpu_count() or 2))))
+LOOKUP_INTERVAL = 1.0                  # Seconds between two kinorush lookups
+LOOKUP_TTL = timedelta(days=30)        # A found title is looked up again after this
+LOOKUP_MISS_TTL = timedelta(days=1)    # Not found (or the site was down)
+SCAN_INTERVAL = int(os.environ.get("LIBRARY_SCAN_INTERVAL", str(24 * 3600)))
+
+_tables_ready = False
+_lookup_lock = threading.Lock()
+_last_lookup = [0.0]
+
+def _session():
+    global _tables_ready
+    if not _tables_ready:
+        create_library_scan_tables()
+        _tables_ready = True
+    return SessionLocalLibraryScan()
+
+def clean_title(filename: str) -> str:
+    """Extract clean title from filename"""
+    # Remove extension
+    name = os.path.splitext(filename)[0]
+
+    # Remove ID prefix if it exists (e.g., "10_")
+    name = re.sub(r'^\d+_', '', name)
+
+    # Replace underscores and dots with spaces
+    name = name.replace('_', ' ').replace('.', ' ')
+
+    # Remove common tags
+    tags = [
+        '1080p', '720p', 'BDRip', 'WEBRip', 'WEB-DL', 'HDRip', 'x264', 'x265',
+        'HEVC', 'AAC', 'AC3', 'DTS', 'RUS', 'ENG', 'seleZen', 'ExKinoRay', 'OPUS'
+    ]
+    for tag in tags:
+        name = re.sub(r'\b' + tag + r'\b', '', name, flags=re.IGNORECASE)
+
+    # Remove year if present
+    name = re.sub(r'\b(19|20)\d{2}\b', '', name)
+
+    # Trim whitespace
+    return name.strip()
+
+def _rel(path: str) -> str:
+    return os.path.relpath(path, BASE_DIR).replace(os.sep, "/")
+
+# ---- Metadata lookups ----
+
+def _throttle():
+    """Spaces lookups LOOKUP_INTERVAL apart across all threads"""
+    with _lookup_lock:
+        wait = _last_lookup[0] + LOOKUP_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_lookup[0] = time.monotonic()
+
+def lookup_movie(title: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Movie details for a cleaned-up title: the first kinorush search hit.
+
+    Returns:
+        (details dict or None, whether the answer came from the cache)
+    """
+    from services.kinorush_service import get_movie_details, search_movies_by_name
+    query = title.lower().strip()
+    db = _session()
+    try:
+        cached = db.query(MetadataLookup).filter(MetadataLookup.query == query).first()
+        if cached and datetime.utcnow() - cached.fetched_at < (LOOKUP_TTL if cached.found else LOOKUP_MISS_TTL):
+            return (json.loads(cached.data) if cached.found else None), True
+
+        _throttle()
+        details = None
+        results = search_movies_by_name(title)
+        if results:
+            _throttle()
+            found = get_movie_details(results[0].url)
+            if found:
+                details = asdict(found)
+                details.pop("torrents", None)
+        db.merge(MetadataLookup(query=query, found=details is not None,
+                                data=json.dumps(details, ensure_ascii=False) if details else None,
+                                fetched_at=datetime.utcnow()))
+        db.commit()
+        return details, False
+    finally:
+        db.close()
+
+# ---- Movie records ----
+
+def _find_thumbnail(upload_dir: str, filename: str, movie_id: Optional[int], poster_url: Optional[str]) -> Optional[str]:
+    """Local thumbnail next to the file, else the poster downloaded there"""
+    stem = str(movie_id) if movie_id else os.path.splitext(filename)[0]
+    for ext in (".webp", ".jpg", ".jpeg", ".png"):
+        candidate = os.path.join(upload_dir, f"{stem}_thumb{ext}")
+        if os.path.exists(candidate):
+            return _rel(candidate)
+    if not poster_url:
+        return None
+    try:
+        from services.http_client import http_client
+        resp = http_client.get(poster_url, timeout=10)
+        if resp.status_code == 200:
+            ext = os.path.splitext(poster_url.split("?")[0])[1] or ".webp"
+            target = os.path.join(upload_dir, f"{stem}_thumb{ext}")
+            with media_store.rewriting(target) as tmp, open(tmp, "wb") as f:
+                f.write(resp.content)
+            return _rel(target)
+    except Exception as e:
+        print(f"Library scan: poster download failed for {filename}: {e}")
+    return None
+
+def _is_complete(movie) -> bool:
+    return bool(
+        movie.rating and movie.rating > 0
+        and movie.description and len(movie.description) > 10
+        and movie.thumbnail_path and os.path.exists(os.path.join(BASE_DIR, movie.thumbnail_path))
+    )
+
+def _link_movie(full_path: str, scan: LibraryScan) -> Tuple[str, Optional[int]]:
+    """Finds, creates or completes the Movie record of a file. Returns (match, movie_id)."""
+    from database import Movie, SessionLocal
+    upload_dir, filename = os.path.split(full_path)
+    rel_path = _rel(full_path)
+    id_match = re.match(r"^(\d+)_", filename)
+    movie_id = int(id_match.group(1)) if id_match else None
+
+    db = SessionLocal()
+    try:
+        movie = db.query(Movie).filter(Movie.file_path == rel_path).first()
+        if not movie and movie_id:
+            movie = db.query(Movie).filter(Movie.id == movie_id).first()
+        if movie and _is_complete(movie):
+            return "linked", movie.id
+        if movie and not movie_id:
+            movie_id = movie.id
+
+        details, cached = lookup_movie(clean_title(filename))
+        scan.lookups += 1
+        scan.lookups_cached += int(cached)
+        if not details:
+            return "no_metadata", movie.id if movie else None
+        rating = details.get("rating_kp") or details.get("rating_imdb") or 0.0
+        description = details.get("description") or ""
+        thumbnail = _find_thumbnail(upload_dir, filename, movie_id, details.get("poster_url"))
+        # Only complete records: the library pages need a rating, a description and a cover
+        if not rating or len(description) < 10 or not thumbnail:
+            return "no_metadata", movie.id if movie else None
+
+        created = movie is None
+        if created:
+            movie = Movie()
+            if movie_id:
+                movie.id = movie_id
+            db.add(movie)
+        movie.title = details.get("title") or clean_title(filename)
+        movie.year = details.get("year") or 0
+        movie.director = details.get("director") or "Unknown"
+        movie.genre = details.get("genre") or "Неизвестно"
+        movie.rating = rating
+        movie.description = description
+        movie.file_path = rel_path
+        movie.thumbnail_path = thumbnail
+        db.commit()
+        if not created:
+            library_index.unregister("movies", movie.id)
+        library_index.register("movies", movie.id, movie.title, year=movie.year)
+        return "restored", movie.id
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# ---- Scanning ----
+
+def _walk(roots: List[str]) -> Dict[str, Tuple[str, str, int, int]]:
+    """rel path -> (root, full path, size, mtime) of every video file in the roots"""
+    found = {}
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for entry in os.scandir(root):
+            name = entry.name
+            if (not entry.is_file() or name.endswith(SKIP_SUFFIXES) or media_store.is_temp(name)
+                    or os.path.splitext(name)[1].lower() not in media_probe.VIDEO_EXTENSIONS):
+                continue
+            st = entry.stat()
+            found[_rel(entry.path)] = (root, entry.path, st.st_size, int(st.st_mtime))
+    return found
+
+def _reconcile(db, roots: List[str], full: bool) -> Tuple[int, int]:
+    """
+    Marks new and changed files pending and drops deleted ones. Returns (total, removed).
+    Failed files are retried, and files whose title was not found are looked
+    up again once their cached miss has expired (LOOKUP_MISS_TTL).
+    """
+    on_disk = _walk(roots)
+    retry_misses_before = datetime.utcnow() - LOOKUP_MISS_TTL
+    rows = {row.path: row for row in db.query(LibraryFile).filter(LibraryFile.root.in_(roots)).all()}
+    removed = 0
+    for path, row in rows.items():
+        if path not in on_disk:
+            db.delete(row)
+            removed += 1
+    for path, (root, _, size, mtime) in on_disk.items():
+        row = rows.get(path)
+        if row is None:
+            db.add(LibraryFile(path=path, root=root, size=size, mtime=mtime, state="pending"))
+        elif (full or row.size != size or row.mtime != mtime or row.state == "failed"
+              or (row.match == "no_metadata" and (row.updated_at is None or row.updated_at <= retry_misses_before))):
+            row.size, row.mtime, row.state, row.error = size, mtime, "pending", None
+    db.commit()
+    return len(on_disk), removed
+
+def _scan_dict(scan: Optional[LibraryScan]) -> Optional[Dict[str, Any]]:
+    if scan is None:
+        return None
+    return {
+        "id": scan.id,
+        "job_id": scan.job_id,
+        "status": scan.status,
+        "full": bool(scan.full),
+        "started_at": scan.started_at.isoformat() if scan.started_at else None,
+        "finished_at": scan.finished_at.isoformat() if scan.finished_at else None,
+        "files_total": scan.files_total,
+        "files_pending": scan.files_pending,
+        "files_removed": scan.files_removed,
+        "processed": scan.processed,
+        "restored": scan.restored,
+        "failed": scan.failed,
+        "lookups": scan.lookups,
+        "lookups_cached": scan.lookups_cached,
+        "current": scan.current,
+        "error": scan.error,
+    }
+
+def run_scan(full: bool = False, roots: Optional[List[str]] = None, job_id: Optional[int] = None,
+             ctx=None) -> Dict[str, Any]:
+    """
+    One scanner pass.
+
+    Args:
+        full: Process every file, not only new and changed ones
+        roots: Folders to scan (ROOTS by default)
+        job_id: Scheduler job running the pass
+        ctx: scheduler.JobContext, checked for cancellation between files
+
+    Returns:
+        The finished pass as a dict (see status())
+    """
+    roots = [os.path.abspath(r) for r in (roots or ROOTS)]
+    db = _session()
+    scan = LibraryScan(job_id=job_id, full=full, status="running")
+    try:
+        # A pass still marked running was cut short by a restart; its pending files carry over
+        for stale in db.query(LibraryScan).filter(LibraryScan.status == "running").all():
+            stale.status = "interrupted"
+        db.add(scan)
+        db.commit()
+
+        scan.files_total, scan.files_removed = _reconcile(db, roots, full)
+        pending = db.query(LibraryFile).filter(LibraryFile.root.in_(roots), LibraryFile.state == "pending").all()
+        # Files the ingest pipeline is still converting or registering stay pending for the next pass
+        busy = media_ingest.active_paths()
+        pending = [row for row in pending if os.path.abspath(os.path.join(BASE_DIR, row.path)) not in busy]
+        scan.files_pending = len(pending)
+        db.commit()
+        print(f"Library scan #{scan.id}: {scan.files_total} files, {scan.files_pending} to process, {scan.files_removed} removed")
+
+        with ThreadPoolExecutor(max(1, PROBE_WORKERS), thread_name_prefix="library-probe") as pool:
+            futures = {pool.submit(media_probe.probe, os.path.join(BASE_DIR, row.path)): row for row in pending}
+            try:
+                for future in as_completed(futures):
+                    if ctx is not None:
+                        ctx.check_cancelled()
+                    _process(db, scan, futures[future], future.result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        scan.status = "finished"
+    except Exception as e:
+        from services.scheduler import JobCancelled
+        scan.status = "cancelled" if isinstance(e, JobCancelled) else "failed"
+        scan.error = None if isinstance(e, JobCancelled) else f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        scan.current = None
+        scan.finished_at = datetime.utcnow()
+        db.commit()
+        result = _scan_dict(scan)
+        db.close()
+        print(f"Library scan #{result['id']} {result['status']}: {result['processed']} processed, "
+              f"{result['restored']} restored, {result['lookups']} lookups ({result['lookups_cached']} cached)")
+    return result
+
+def _process(db, scan: LibraryScan, row: LibraryFile, info: Optional[Dict[str, Any]]):
+    """Stores what the probe found and links the file to its Movie record"""
+    scan.current = row.path
+    full_path = os.path.join(BASE_DIR, row.path)
+    try:
+        if info is None:
+            raise RuntimeError("ffprobe could not read the file")
+        plan = media_probe.plan(info)
+        row.duration = media_probe.duration(info)
+        row.video_codec, row.audio_codec, row.action = plan.video_codec, plan.audio_codec, plan.action
+        row.match, row.movie_id = _link_movie(full_path, scan)
+        row.state, row.error = "done", None
+        scan.restored += int(row.match == "restored")
+    except Exception as e:
+        row.state, row.error = "failed", f"{type(e).__name__}: {e}"
+        scan.failed += 1
+    row.scan_id = scan.id
+    row.updated_at = datetime.utcnow()
+    scan.processed += 1
+    db.commit()
+
+# ---- Queries ----
+
+def status() -> Dict[str, Any]:
+    """Latest pass plus the state of the library as a whole"""
+    from sqlalchemy import func
+    db = _session()
+    try:
+        latest = db.query(LibraryScan).order_by(LibraryScan.id.desc()).first()
+        states = dict(db.query(LibraryFile.state, func.count()).group_by(LibraryFile.state).all())
+        matches = dict(db.query(LibraryFile.match, func.count()).filter(LibraryFile.state == "done")
+                       .group_by(LibraryFile.match).all())
+        actions = dict(db.query(LibraryFile.action, func.count()).filter(LibraryFile.state == "done")
+                       .group_by(LibraryFile.action).all())
+        lookups = db.query(func.count(MetadataLookup.query)).scalar()
+        return {"scan": _scan_dict(latest), "files": states, "matches": matches, "actions": actions,
+                "cached_lookups": lookups}
+    finally:
+        db.close()
+
+def list_scans(limit: int = 20) -> List[Dict[str, Any]]:
+    db = _session()
+    try:
+        return [_scan_dict(s) for s in db.query(LibraryScan).order_by(LibraryScan.id.desc()).limit(limit).all()]
+    finally:
+        db.close()
+
+def list_files(state: Optional[str] = None, match: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    db = _session()
+    try:
+        query = db.query(LibraryFile)
+        if state:
+            query = query.filter(LibraryFile.state == state)
+        if match:
+            query = query.filter(LibraryFile.match == match)
+        rows = query.order_by(LibraryFile.updated_at.desc()).limit(limit).all()
+        return [{
+            "path": r.path, "state": r.state, "size": r.size, "duration": r.duration,
+            "video_codec": r.video_codec, "audio_codec": r.audio_codec, "action": r.action,
+            "match": r.match, "movie_id": r.movie_id, "error": r.error, "scan_id": r.scan_id,
+            "updated_at": r.updated_at.isoformat() if r.updated_at else None,
+        } for r in rows]
+    finally:
+        db.close()
+
+# ---- Scheduler ----
+
+def scan_job(ctx) -> Dict[str, Any]:
+    result = run_scan(full=bool(ctx.payload.get("full")), job_id=ctx.job_id, ctx=ctx)
+    return {"scan_id": result["id"], "processed": result["processed"], "restored": result["restored"]}
+
+def register():
+    """Registers the "library_scan" job type and its schedule (LIBRARY_SCAN=0 disables the schedule)"""
+    from services import scheduler
+    scheduler.register_job_type("library_scan", scan_job, concurrency=1, max_attempts=1)
+    try:
+        scheduler.set_schedule("library_scan", "library_scan", interval_seconds=SCAN_INTERVAL,
+                               enabled=os.environ.get("LIBRARY_SCAN", "1") != "0")
+    except Exception as e:
+        print(f"Library scan schedule could not be set up: {e}")
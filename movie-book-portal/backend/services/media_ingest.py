@@ -0,0 +1,152 @@
+"""
+Staged post-download processing for movies.
+
+A finished download is handed to submit() and the download thread is free
+for the next torrent at once. Each item then goes through
+
+    downloaded -> probing -> planned -> converting -> registering -> done / failed
+
+Probing runs on a small pool of its own, so the next movie is already probed
+and planned while the previous one converts; conversions run on a bounded
+pool (INGEST_CONVERT_WORKERS, default 1: one FFmpeg at a time keeps the disk
+from thrashing). The caller's register() callback stores the result in the
+database; cleanup() always runs last (temp directory, torrent). Every stage
+change is reported through on_stage(stage, progress) and visible in status().
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from services import media_probe
+
+CONVERT_WORKERS = int(os.environ.get("INGEST_CONVERT_WORKERS", "1"))
+PROBE_WORKERS = 2
+KEEP_FINISHED = 50            # Finished items kept for status()
+
+STAGES = ("downloaded", "probing", "planned", "converting", "registering", "done", "failed")
+
+@dataclass
+class IngestItem:
+    title: str
+    source_path: str
+    output_path: str
+    register: Callable[[str], None]                      # Called with the output path after a successful conversion
+    cleanup: Optional[Callable[[bool], None]] = None     # Called with the outcome, always
+    on_stage: Optional[Callable[[str, float], None]] = None
+    log_file: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    stage: str = "downloaded"
+    progress: float = 0.0
+    plan: Optional[str] = None
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)   # Seconds spent per stage
+    queued_at: float = 0.0
+    future: Future = field(default_factory=Future)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "title": self.title, "stage": self.stage, "progress": round(self.progress, 1),
+                "plan": self.plan, "error": self.error, "timings": {k: round(v, 1) for k, v in self.timings.items()}}
+
+_probe_pool = ThreadPoolExecutor(PROBE_WORKERS, thread_name_prefix="ingest-probe")
+_convert_pool = ThreadPoolExecutor(max(1, CONVERT_WORKERS), thread_name_prefix="ingest-convert")
+_items: List[IngestItem] = []
+_lock = threading.Lock()
+
+def _set_stage(item: IngestItem, stage: str, progress: float = 0.0):
+    item.stage, item.progress = stage, progress
+    if item.on_stage:
+        try:
+            item.on_stage(stage, progress)
+        except Exception as e:
+            print(f"Ingest: stage callback failed for {item.title}: {e}")
+
+def _finish(item: IngestItem, ok: bool, error: Optional[str] = None):
+    item.error = error
+    _set_stage(item, "done" if ok else "failed", 100.0 if ok else item.progress)
+    if not ok:
+        print(f"Ingest: {item.title} failed: {error}")
+    if item.cleanup:
+        try:
+            item.cleanup(ok)
+        except Exception as e:
+            print(f"Ingest: cleanup failed for {item.title}: {e}")
+    item.future.set_result(ok)
+    with _lock:
+        finished = [i for i in _items if i.stage in ("done", "failed")]
+        for old in finished[:-KEEP_FINISHED]:
+            _items.remove(old)
+
+def _timed(item: IngestItem, stage: str, started: float):
+    item.timings[stage] = item.timings.get(stage, 0.0) + time.monotonic() - started
+
+def _probe_stage(item: IngestItem):
+    started = time.monotonic()
+    try:
+        _set_stage(item, "probing")
+        info = media_probe.probe(item.source_path)
+        if not info:
+            return _finish(item, False, "ffprobe could not read the file")
+        plan = media_probe.plan(info)
+        item.plan = plan.action
+        _timed(item, "probing", started)
+        _set_stage(item, "planned")
+        item.queued_at = time.monotonic()
+        _convert_pool.submit(_convert_stage, item, plan)
+    except Exception as e:
+        _finish(item, False, f"{type(e).__name__}: {e}")
+
+def _convert_stage(item: IngestItem, plan: media_probe.Plan):
+    from services.video_converter import convert_to_mp4
+    item.timings["waiting"] = time.monotonic() - item.queued_at
+    try:
+        started = time.monotonic()
+        _set_stage(item, "converting")
+        ok = convert_to_mp4(item.source_path, item.output_path, delete_source=False, log_file=item.log_file,
+                            conversion_plan=plan, on_progress=lambda pct: _progress(item, pct))
+        _timed(item, "converting", started)
+        if not ok:
+            return _finish(item, False, "Conversion failed")
+        started = time.monotonic()
+        _set_stage(item, "registering")
+        item.register(item.output_path)
+        _timed(item, "registering", started)
+        _finish(item, True)
+    except Exception as e:
+        _finish(item, False, f"{type(e).__name__}: {e}")
+
+def _progress(item: IngestItem, percent: float):
+    # Callbacks only on whole-percent changes: FFmpeg reports several times a second
+    if int(percent) != int(item.progress):
+        _set_stage(item, "converting", percent)
+    else:
+        item.progress = percent
+
+def submit(item: IngestItem) -> IngestItem:
+    """
+    Queues a downloaded file for probe -> convert -> register and returns at once.
+    item.future resolves to True / False when the item is done.
+    """
+    with _lock:
+        _items.append(item)
+    _set_stage(item, "downloaded")
+    _probe_pool.submit(_probe_stage, item)
+    return item
+
+def active_paths() -> Set[str]:
+    """Absolute paths of the source and output files of items still in progress"""
+    with _lock:
+        active = [i for i in _items if i.stage not in ("done", "failed")]
+    return {os.path.abspath(p) for i in active for p in (i.source_path, i.output_path)}
+
+def status() -> Dict[str, Any]:
+    with _lock:
+        items = [i.to_dict() for i in _items]
+    return {
+        "convert_workers": max(1, CONVERT_WORKERS),
+        "active": [i for i in items if i["stage"] not in ("done", "failed")],
+        "finished": [i for i in items if i["stage"] in ("done", "failed")][-20:],
+    }
@@ -0,0 +1,348 @@
+"""
+Media compatibility engine: probe a file once, decide the cheapest fix.
+
+probe() runs ffprobe (JSON, all streams and the format) once per file
+version (path, size and mtime) and stores the result in media_store.db, with
+an in-process LRU in front, so the ingest pipeline, convert_to_mp4,
+fix_movies.py, the video gallery optimizer and the library report share one
+probe per file, across restarts. For MP4 files the top-level boxes are read
+too, to know whether the index (moov) already precedes the data.
+
+plan() picks the cheapest way to a browser-playable MP4 (H.264 video,
+stereo AAC audio, index first):
+
+    none       - already fine, nothing to do
+    faststart  - fine, but the index is at the end: rewrite with moov first
+    remux      - both streams can be copied, only the container changes
+    audio      - video is copied, the audio track is transcoded to stereo AAC
+    full       - the video cannot be copied: full transcode
+
+The "gallery" profile (video gallery uploads, mostly phone footage) also
+transcodes video whose bitrate is above GALLERY_MAX_VIDEO_BITRATE.
+
+Every video that is not H.264 is fully re-encoded with libx264, HEVC
+included: Chrome, Firefox and most Android WebViews cannot decode it. Set
+COPY_HEVC=1 when every client can (Safari, hardware-decoding TVs) to copy it
+with the hvc1 tag instead. (Before this planner, convert_to_mp4 always copied
+the video stream whatever its codec; see VIDEO_SUPPORT.md.)
+"""
+import json
+import os
+import struct
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+PROBE_CACHE_SIZE = 512
+FFMPEG_RECHECK = 60.0            # Seconds before a missing ffmpeg is looked for again
+
+# Playable from MP4 without re-encoding in every browser; HEVC only on request
+COPY_VIDEO_CODECS = {"h264"} | ({"hevc"} if os.environ.get("COPY_HEVC", "0") == "1" else set())
+COPY_AUDIO_CODECS = {"aac"}
+MAX_COPY_CHANNELS = 2
+MP4_FORMATS = {"mov", "mp4", "m4a", "3gp", "3g2", "mj2"}   # ffprobe format_name of the ISO BMFF demuxer
+GALLERY_MAX_VIDEO_BITRATE = 3_000_000
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm", ".m4v", ".mpg", ".mpeg", ".ts"}
+
+ACTIONS = ("none", "faststart", "remux", "audio", "full")
+
+_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_ffmpeg_state = {"available": None, "checked": 0.0}
+_tables_ready = False
+
+def ffmpeg_available() -> bool:
+    """Whether ffmpeg runs; a success is remembered, a failure is re-checked after a minute"""
+    state = _ffmpeg_state
+    if state["available"] or (state["available"] is False and time.monotonic() - state["checked"] < FFMPEG_RECHECK):
+        return state["available"]
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, timeout=5)
+        state["available"] = result.returncode == 0
+    except Exception:
+        state["available"] = False
+    state["checked"] = time.monotonic()
+    return state["available"]
+
+def moov_first(path: str) -> Optional[bool]:
+    """
+    For an ISO BMFF (MP4/MOV) file: True if the moov box comes before mdat
+    (playback can start before the whole file is read), False if after,
+    None if the file is not MP4. Only box headers are read.
+    """
+    try:
+        with open(path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset + 8 <= file_size:
+                f.seek(offset)
+                size, box = struct.unpack(">I4s", f.read(8))
+                if offset == 0 and box != b"ftyp":
+                    return None
+                if box == b"moov":
+                    return True
+                if box == b"mdat":
+                    return False
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                elif size == 0:
+                    return None
+                if size < 8:
+                    return None
+                offset += size
+    except (OSError, struct.error):
+        return None
+    return None
+
+def _key(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.realpath(path), st.st_size, int(st.st_mtime)
+
+def _session():
+    global _tables_ready
+    from database_media_store import SessionLocalMediaStore, create_media_store_tables
+    if not _tables_ready:
+        create_media_store_tables()
+        _tables_ready = True
+    return SessionLocalMediaStore()
+
+def _load_stored(key: tuple) -> Optional[Dict[str, Any]]:
+    from database_media_store import MediaProbe
+    db = _session()
+    try:
+        row = db.query(MediaProbe).filter(MediaProbe.path == key[0]).first()
+        if row and row.size == key[1] and row.mtime == key[2]:
+            info = json.loads(row.probe)
+            info["moov_first"] = row.moov_first
+            return info
+    except Exception as e:
+        print(f"Media probe: cache read failed: {e}")
+    finally:
+        db.close()
+    return None
+
+def _store(key: tuple, info: Dict[str, Any]):
+    from database_media_store import MediaProbe
+    db = _session()
+    try:
+        db.merge(MediaProbe(path=key[0], size=key[1], mtime=key[2],
+                            probe=json.dumps({k: v for k, v in info.items() if k != "moov_first"}),
+                            moov_first=info.get("moov_first")))
+        db.commit()
+    except Exception as e:
+        print(f"Media probe: cache write failed: {e}")
+    finally:
+        db.close()
+
+def _remember(key: tuple, info: Dict[str, Any]):
+    with _cache_lock:
+        _cache[key] = info
+        while len(_cache) > PROBE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def probe(path: str) -> Optional[Dict[str, Any]]:
+    """
+    ffprobe JSON (format and streams) of a file plus "moov_first" (see
+    moov_first()), or None if it cannot be probed. Probed once per file version.
+    """
+    key = _key(path)
+    if key is None:
+        return None
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    info = _load_stored(key)
+    if info is not None:
+        _remember(key, info)
+        return info
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", path],
+            capture_output=True, text=True, timeout=60,
+        )
+        if result.returncode != 0:
+            return None
+        info = json.loads(result.stdout)
+    except Exception:
+        return None
+    info["moov_first"] = moov_first(path)
+    _store(key, info)
+    _remember(key, info)
+    return info
+
+def duration(info: Optional[Dict[str, Any]]) -> Optional[float]:
+    try:
+        return float(info["format"]["duration"])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+def _streams(info: Dict[str, Any], codec_type: str) -> List[Dict[str, Any]]:
+    return [s for s in info.get("streams", []) if s.get("codec_type") == codec_type
+            and not (s.get("disposition") or {}).get("attached_pic")]
+
+def _main_stream(streams: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The stream marked default, else the first one"""
+    for s in streams:
+        if (s.get("disposition") or {}).get("default"):
+            return s
+    return streams[0] if streams else None
+
+def _is_mp4(info: Dict[str, Any]) -> bool:
+    names = set((info.get("format") or {}).get("format_name", "").split(","))
+    return bool(names & MP4_FORMATS)
+
+def _video_bitrate(info: Dict[str, Any], video: Dict[str, Any]) -> Optional[int]:
+    for value in (video.get("bit_rate"), (info.get("format") or {}).get("bit_rate")):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+@dataclass
+class Plan:
+    action: str                          # none / faststart / remux / audio / full
+    video_index: Optional[int] = None    # Absolute stream indexes in the source
+    audio_index: Optional[int] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    audio_channels: Optional[int] = None
+    profile: str = "library"
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def needs_ffmpeg(self) -> bool:
+        return self.action != "none"
+
+def plan(info: Dict[str, Any], profile: str = "library") -> Plan:
+    """
+    Cheapest conversion to a browser-playable MP4 for probed media.
+
+    Args:
+        info: probe() result
+        profile: "library" (movies, series: copy whatever can be copied) or
+            "gallery" (also re-encode video above GALLERY_MAX_VIDEO_BITRATE)
+    """
+    video = _main_stream(_streams(info, "video"))
+    audio = _main_stream(_streams(info, "audio"))
+    p = Plan(
+        action="none",
+        video_index=video.get("index") if video else None,
+        audio_index=audio.get("index") if audio else None,
+        video_codec=video.get("codec_name") if video else None,
+        audio_codec=audio.get("codec_name") if audio else None,
+        audio_channels=audio.get("channels") if audio else None,
+        profile=profile,
+    )
+    full = audio_fix = False
+    if video and p.video_codec not in COPY_VIDEO_CODECS:
+        full = True
+        p.reasons.append(f"video codec {p.video_codec}")
+    elif video and profile == "gallery":
+        bitrate = _video_bitrate(info, video)
+        if bitrate and bitrate > GALLERY_MAX_VIDEO_BITRATE:
+            full = True
+            p.reasons.append(f"video bitrate {bitrate // 1000} kb/s")
+    if audio and (p.audio_codec not in COPY_AUDIO_CODECS or (p.audio_channels or 0) > MAX_COPY_CHANNELS):
+        audio_fix = True
+        p.reasons.append(f"audio {p.audio_codec} {p.audio_channels}ch")
+    if full:
+        p.action = "full"
+    elif audio_fix:
+        p.action = "audio"
+    elif not _is_mp4(info):
+        p.action = "remux"
+        p.reasons.append(f"container {(info.get('format') or {}).get('format_name')}")
+    elif len(_streams(info, "video")) > 1 or len(_streams(info, "audio")) > 1:
+        # Extra tracks: the browser would pick the first, not necessarily the default one
+        p.action = "remux"
+        p.reasons.append("extra tracks")
+    elif info.get("moov_first") is False:
+        p.action = "faststart"
+        p.reasons.append("index at the end of the file")
+    return p
+
+def ffmpeg_args(p: Plan) -> List[str]:
+    """Output options (between input and output path) that carry out a plan"""
+    args = []
+    if p.video_index is not None:
+        args += ["-map", f"0:{p.video_index}"]
+    if p.audio_index is not None:
+        args += ["-map", f"0:{p.audio_index}"]
+    if p.action == "full":
+        if p.profile == "gallery":
+            args += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-maxrate", "2.5M", "-bufsize", "5M"]
+        else:
+            args += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20"]
+        args += ["-pix_fmt", "yuv420p"]
+    else:
+        args += ["-c:v", "copy"]
+        if p.video_codec == "hevc":
+            args += ["-tag:v", "hvc1"]   # Safari only plays HEVC in MP4 with this tag
+    if p.action in ("full", "audio"):
+        args += ["-c:a", "aac", "-ac", "2", "-b:a", "128k" if p.profile == "gallery" else "192k"]
+    else:
+        args += ["-c:a", "copy"]
+    return args + ["-sn", "-movflags", "+faststart"]
+
+def inspect(path: str, profile: str = "library") -> Optional[Plan]:
+    """Plan for a file, or None if it cannot be probed"""
+    info = probe(path)
+    return plan(info, profile) if info else None
+
+# ---- Library report ----
+
+def _library_roots() -> List[tuple]:
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    uploads = os.path.join(base, "uploads")
+    return [
+        (os.path.join(uploads, "movies"), "library"),
+        (os.path.join(uploads, "tvshows"), "library"),
+        (os.path.join(uploads, "videogallery"), "gallery"),
+    ]
+
+def _video_files(root: str) -> Iterable[str]:
+    from services.media_store import is_temp
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != "thumbnails"]
+        for name in filenames:
+            if (os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS and not name.endswith(("_backup.mp4", ".opt.mp4"))
+                    and not is_temp(name)):
+                yield os.path.join(dirpath, name)
+
+def library_report(roots: Optional[List[tuple]] = None) -> Dict[str, Any]:
+    """
+    Dry run over the library: what every video file would need, without
+    converting anything. Files probed before are answered from the cache.
+
+    Returns:
+        {"summary": {action: count}, "bytes": {action: total size},
+         "files": [{path, profile, action, reasons, video_codec, audio_codec,
+         audio_channels, size}], "unreadable": [paths]}
+    """
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    summary = {action: 0 for action in ACTIONS}
+    total_bytes = {action: 0 for action in ACTIONS}
+    files, unreadable = [], []
+    for root, profile in roots or _library_roots():
+        for path in _video_files(root):
+            rel = os.path.relpath(path, base).replace(os.sep, "/")
+            p = inspect(path, profile)
+            if p is None:
+                unreadable.append(rel)
+                continue
+            size = os.path.getsize(path)
+            summary[p.action] += 1
+            total_bytes[p.action] += size
+            files.append({"path": rel, "profile": profile, "action": p.action, "reasons": p.reasons,
+                          "video_codec": p.video_codec, "audio_codec": p.audio_codec,
+                          "audio_channels": p.audio_channels, "size": size})
+    files.sort(key=lambda f: (ACTIONS.index(f["action"]), f["path"]), reverse=True)
+    return {"summary": summary, "bytes": total_bytes, "files": files, "unreadable": unreadable}
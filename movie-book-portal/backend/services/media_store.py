@@ -0,0 +1,418 @@
+"""
+Content-addressed media store with hardlink materialization into uploads/
+"""
+import os
+import re
+import shutil
+import hashlib
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Optional, Dict, Any
+
+from database_media_store import SessionLocalMediaStore, MediaBlob, MediaLink, create_media_store_tables
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Blobs live inside uploads/ so that hardlinks never cross a filesystem boundary
+BLOBS_DIR = os.path.join(BASE_DIR, "uploads", ".blobs")
+TMP_DIR = os.path.join(BLOBS_DIR, "tmp")
+CHUNK_SIZE = 1024 * 1024
+
+_TEMP_NAME = re.compile(r"\.[0-9a-f]{8}\.tmp(\.[^./\\]*)?$")
+
+_lock = threading.Lock()
+_tables_ready = False
+
+@dataclass
+class StoredMedia:
+    """Result of putting a file into the store"""
+    sha256: str
+    size: int
+    deduplicated: bool  # True if identical content was already stored
+    linked: bool = True  # False if the filesystem has no hardlinks and a plain copy was kept
+
+def _session():
+    global _tables_ready
+    if not _tables_ready:
+        create_media_store_tables()
+        _tables_ready = True
+    return SessionLocalMediaStore()
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(BLOBS_DIR, digest[:2], digest)
+
+def _rel(path: str) -> str:
+    return os.path.relpath(os.path.abspath(path), BASE_DIR).replace(os.sep, '/').replace('\\', '/')
+
+def _inside(path: str, directory: str) -> bool:
+    path, directory = os.path.abspath(path), os.path.abspath(directory)
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:  # Different drives
+        return False
+
+def _materialize(blob_path: str, target_path: str):
+    """Atomically points target_path at the blob (replacing any existing file)"""
+    os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+    tmp = f"{target_path}.{uuid.uuid4().hex[:8]}.tmp"
+    os.link(blob_path, tmp)
+    try:
+        os.replace(tmp, target_path)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+def _record(digest: str, size: int, target_path: str):
+    """Registers the blob and the uploads/ path that references it"""
+    rel_path = _rel(target_path)
+    previous = None
+    db = _session()
+    try:
+        if not db.query(MediaBlob).filter(MediaBlob.sha256 == digest).first():
+            db.add(MediaBlob(sha256=digest, size=size))
+        link = db.query(MediaLink).filter(MediaLink.path == rel_path).first()
+        if link:
+            if link.sha256 != digest:
+                previous = link.sha256
+                link.sha256 = digest
+        else:
+            db.add(MediaLink(path=rel_path, sha256=digest))
+        db.commit()
+    finally:
+        db.close()
+    # The path used to point at other content: that blob may be unreferenced now
+    if previous:
+        with _lock:
+            _collect_blob(previous)
+
+def _collect_blob(digest: str) -> int:
+    """Deletes a blob nobody links to any more. Returns freed bytes."""
+    blob_path = _blob_path(digest)
+    freed = 0
+    if os.path.exists(blob_path):
+        st = os.stat(blob_path)
+        if st.st_nlink > 1:
+            return 0
+        os.remove(blob_path)
+        freed = st.st_size
+    db = _session()
+    try:
+        db.query(MediaBlob).filter(MediaBlob.sha256 == digest).delete()
+        db.query(MediaLink).filter(MediaLink.sha256 == digest).delete()
+        db.commit()
+    finally:
+        db.close()
+    return freed
+
+def _commit(tmp_path: str, digest: str, size: int, target_path: str) -> StoredMedia:
+    blob_path = _blob_path(digest)
+    with _lock:
+        deduplicated = os.path.exists(blob_path)
+        if deduplicated:
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+        try:
+            _materialize(blob_path, target_path)
+        except OSError as e:
+            # No hardlink support here: fall back to a plain file as before
+            print(f"Media store: hardlink failed for {target_path} ({e}), keeping a plain copy")
+            if deduplicated:
+                shutil.copyfile(blob_path, target_path)
+            else:
+                shutil.move(blob_path, target_path)
+            return StoredMedia(sha256=digest, size=size, deduplicated=False, linked=False)
+    _record(digest, size, target_path)
+    return StoredMedia(sha256=digest, size=size, deduplicated=deduplicated)
+
+class StoreWriter:
+    """
+    Push-style store_stream for producers that hand over data in callbacks
+    (e.g. a multipart parser): write() the chunks, then commit() or abort().
+    """
+
+    def __init__(self):
+        os.makedirs(TMP_DIR, exist_ok=True)
+        self.tmp_path = os.path.join(TMP_DIR, uuid.uuid4().hex)
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.tmp_path, "wb")
+
+    def write(self, chunk: bytes):
+        if chunk:
+            self._digest.update(chunk)
+            self._file.write(chunk)
+            self.size += len(chunk)
+
+    def commit(self, target_path: str) -> StoredMedia:
+        """Moves the written content into the store and materializes it at target_path"""
+        self._file.close()
+        return _commit(self.tmp_path, self._digest.hexdigest(), self.size, target_path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def store_stream(chunks: Iterable[bytes], target_path: str) -> StoredMedia:
+    """
+    Writes a stream of chunks into the store, hashing it on the fly,
+    and materializes it at target_path as a hardlink to the blob.
+
+    Args:
+        chunks: Iterable of byte chunks (e.g. response.iter_content())
+        target_path: Absolute path inside uploads/ where the file must appear
+
+    Returns:
+        StoredMedia with the SHA-256 and whether the content was already stored
+    """
+    writer = StoreWriter()
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.commit(target_path)
+
+def store_fileobj(fileobj, target_path: str, chunk_size: int = CHUNK_SIZE) -> StoredMedia:
+    """Same as store_stream for a file-like object (e.g. UploadFile.file)"""
+    return store_stream(iter(lambda: fileobj.read(chunk_size), b""), target_path)
+
+def ingest_file(path: str) -> Optional[StoredMedia]:
+    """
+    Adopts a file that is already on disk. If identical content is stored,
+    the file is replaced with a hardlink to it and its space is reclaimed.
+
+    Returns:
+        StoredMedia or None if the file does not exist
+    """
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+    size = os.path.getsize(path)
+    blob_path = _blob_path(digest)
+
+    with _lock:
+        deduplicated = False
+        try:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.link(path, blob_path)
+            elif not os.path.samefile(path, blob_path):
+                _materialize(blob_path, path)
+                deduplicated = True
+        except OSError as e:
+            print(f"Media store: could not link {path}: {e}")
+            return StoredMedia(sha256=digest, size=size, deduplicated=False, linked=False)
+    _record(digest, size, path)
+    return StoredMedia(sha256=digest, size=size, deduplicated=deduplicated)
+
+def ingest_tree(directory: str) -> Dict[str, int]:
+    """Adopts every file under a directory. Returns counts and reclaimed bytes."""
+    stats = {"files": 0, "deduplicated": 0, "reclaimed_bytes": 0}
+    for root, dirs, files in os.walk(directory):
+        if _inside(root, BLOBS_DIR):
+            dirs[:] = []
+            continue
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            try:
+                result = ingest_file(os.path.join(root, name))
+            except Exception as e:
+                print(f"Media store: error ingesting {name}: {e}")
+                continue
+            if result:
+                stats["files"] += 1
+                if result.deduplicated:
+                    stats["deduplicated"] += 1
+                    stats["reclaimed_bytes"] += result.size
+    return stats
+
+def _forget(path: str):
+    """Drops the link of path and its blob once nothing else links to it"""
+    db = _session()
+    try:
+        link = db.query(MediaLink).filter(MediaLink.path == _rel(path)).first()
+        digest = link.sha256 if link else None
+        if link:
+            db.delete(link)
+            db.commit()
+    finally:
+        db.close()
+    if digest:
+        with _lock:
+            _collect_blob(digest)
+
+def release(path: str):
+    """
+    Removes a materialized file and drops its blob once nothing links to it.
+    Safe to call for files that were never stored.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    _forget(path)
+
+def temp_path(path: str) -> str:
+    """Unique name next to path with the same extension (FFmpeg and PIL pick the format from it)"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{uuid.uuid4().hex[:8]}.tmp{ext}"
+
+def is_temp(name: str) -> bool:
+    """Whether a file name is one of temp_path()'s (a write still in progress)"""
+    return bool(_TEMP_NAME.search(name))
+
+def replace(src: str, dst: str):
+    """
+    os.replace(src, dst) for a dst that may be a stored file.
+
+    A stored file is a hardlink: writing into it in place would change every
+    other copy and the blob, while a rename only swaps the directory entry.
+    The store is only consulted when dst really was linked (st_nlink > 1).
+    """
+    try:
+        linked = os.stat(dst).st_nlink > 1
+    except FileNotFoundError:
+        linked = False
+    os.replace(src, dst)
+    if linked:
+        _forget(dst)
+
+@contextmanager
+def rewriting(path: str):
+    """
+    Temp path to write the new content of path to; moved over path with
+    replace() when the block succeeds, removed when it raises.
+
+        with media_store.rewriting(thumb_path) as tmp:
+            img.save(tmp, "WEBP")
+    """
+    tmp = temp_path(path)
+    try:
+        yield tmp
+        replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def digest_for(path: str) -> Optional[str]:
+    """SHA-256 of the blob a stored file points at (None if the store does not know it)"""
+    db = _session()
+    try:
+        link = db.query(MediaLink).filter(MediaLink.path == _rel(path)).first()
+        return link.sha256 if link else None
+    finally:
+        db.close()
+
+def link_catalog() -> Dict[str, int]:
+    """
+    Fills content_sha256 of movies, books and audiobooks from the links of
+    their file_path, so catalog rows reference blobs rather than only paths.
+    """
+    from database import Movie, SessionLocal
+    from database_books import Book, SessionLocalBooks
+    from database_audiobooks import Audiobook, SessionLocalAudiobooks
+
+    db = _session()
+    try:
+        digests = {l.path: l.sha256 for l in db.query(MediaLink.path, MediaLink.sha256).all()}
+    finally:
+        db.close()
+
+    stats = {}
+    for model, session_factory in ((Movie, SessionLocal), (Book, SessionLocalBooks),
+                                   (Audiobook, SessionLocalAudiobooks)):
+        updated = 0
+        db = session_factory()
+        try:
+            for item in db.query(model).filter(model.file_path.isnot(None)).all():
+                digest = digests.get(item.file_path.replace('\\', '/'))
+                if item.content_sha256 != digest:
+                    item.content_sha256 = digest
+                    updated += 1
+            db.commit()
+        finally:
+            db.close()
+        stats[model.__tablename__] = updated
+    return stats
+
+def collect_garbage() -> Dict[str, int]:
+    """Deletes unreferenced blobs and forgets links to files that were removed or moved"""
+    removed_blobs = 0
+    freed = 0
+    db = _session()
+    try:
+        digests = [b.sha256 for b in db.query(MediaBlob.sha256).all()]
+        stale = 0
+        for link in db.query(MediaLink).all():
+            full_path = os.path.join(BASE_DIR, link.path)
+            blob_path = _blob_path(link.sha256)
+            if not os.path.exists(full_path) or not os.path.exists(blob_path) or not os.path.samefile(full_path, blob_path):
+                db.delete(link)
+                stale += 1
+        db.commit()
+    finally:
+        db.close()
+
+    with _lock:
+        for digest in digests:
+            bytes_freed = _collect_blob(digest)
+            if bytes_freed or not os.path.exists(_blob_path(digest)):
+                removed_blobs += 1
+                freed += bytes_freed
+    return {"removed_blobs": removed_blobs, "stale_links": stale, "freed_bytes": freed}
+
+def dedup_report(top: int = 20) -> Dict[str, Any]:
+    """
+    Summarizes how much space the store saves. Link counts come from the
+    filesystem, so files moved around in the gallery are still counted.
+    """
+    db = _session()
+    try:
+        blobs = db.query(MediaBlob).all()
+        physical = 0
+        logical = 0
+        files = 0
+        duplicates = []
+        for blob in blobs:
+            blob_path = _blob_path(blob.sha256)
+            if not os.path.exists(blob_path):
+                continue
+            copies = os.stat(blob_path).st_nlink - 1  # minus the blob itself
+            if copies < 1:
+                continue
+            physical += blob.size
+            logical += blob.size * copies
+            files += copies
+            if copies > 1:
+                duplicates.append((blob, copies))
+
+        duplicates.sort(key=lambda d: d[0].size * (d[1] - 1), reverse=True)
+        top_duplicates = []
+        for blob, copies in duplicates[:top]:
+            paths = [l.path for l in db.query(MediaLink).filter(MediaLink.sha256 == blob.sha256).all()]
+            top_duplicates.append({
+                "sha256": blob.sha256,
+                "size": blob.size,
+                "copies": copies,
+                "reclaimed_bytes": blob.size * (copies - 1),
+                "paths": paths
+            })
+    finally:
+        db.close()
+
+    return {
+        "blobs": len(blobs),
+        "files": files,
+        "logical_bytes": logical,
+        "physical_bytes": physical,
+        "reclaimed_bytes": logical - physical,
+        "top_duplicates": top_duplicates
+    }
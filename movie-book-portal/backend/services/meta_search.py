@@ -0,0 +1,145 @@
+"""
+Meta-search over all book providers.
+
+Every provider is searched in its own worker thread. The merged answer is
+returned as soon as all providers are done, or GRACE_PERIOD seconds after
+the first provider answered, but never later than DEADLINE; late providers
+are dropped from this answer. Hits of several providers for the same book
+(transliterated title + author surname) are merged into one entry that lists
+every provider, and the list is ranked by known EPUB availability, the
+success rate of the provider's host (services/provider_health.py) and the
+providers' own relevance order.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services import provider_health
+
+DEADLINE = 12.0       # Hard limit for the whole meta-search, seconds
+GRACE_PERIOD = 3.0    # How long slower providers may lag behind the first answer
+MAX_WORKERS = 12      # Provider searches running at once, stragglers of earlier searches included
+
+# Shared by all meta-searches: stragglers finish in it after we answered
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="meta-search")
+
+def book_key(book: Dict[str, Any]) -> Tuple[str, str]:
+    """Normalized, transliterated title plus author surname (same fingerprint as the library index)"""
+    from services.library_index import fingerprint
+    return fingerprint(book.get("title"), book.get("author"))
+
+def _format_rank(formats: List[str]) -> int:
+    if "epub" in formats:
+        return 0
+    return 1 if not formats else 2  # Unknown formats rank above known non-EPUB ones
+
+def merge_results(outcomes: Dict[str, List[Dict[str, Any]]], provider_order: List[str],
+                  hosts: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Deduplicates and ranks the hits of several providers.
+
+    Args:
+        outcomes: Provider name -> its search results (in its own relevance order)
+        provider_order: Providers by preference, used as a tie-breaker
+        hosts: Provider name -> host, whose success rate ranks the provider
+
+    Returns:
+        Merged results; each has the fields of the best provider's hit plus
+        "provider", "providers" (all providers that have the book),
+        "alternatives" ({provider, id, source_url} of the others) and "formats".
+    """
+    merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    order: Dict[Tuple[str, str], Tuple] = {}
+    for provider in provider_order:
+        host = (hosts or {}).get(provider)
+        health = provider_health.success_rate(host) if host else 1.0
+        for position, book in enumerate(outcomes.get(provider) or []):
+            key = book_key(book)
+            if not key[0]:
+                continue
+            formats = list(book.get("formats") or [])
+            rank = (_format_rank(formats), -health, provider_order.index(provider), position)
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = dict(book, provider=provider, providers=[provider], alternatives=[], formats=formats)
+                order[key] = rank
+                continue
+
+            entry["formats"] += [f for f in formats if f not in entry["formats"]]
+            if provider not in entry["providers"]:
+                entry["providers"].append(provider)
+            if rank < order[key]:
+                # This provider's hit becomes the primary one
+                previous = {"provider": entry["provider"], "id": entry["id"], "source_url": entry.get("source_url")}
+                keep = {k: entry[k] for k in ("providers", "alternatives", "formats")}
+                entry.clear()
+                entry.update(book, provider=provider, **keep)
+                entry["alternatives"].append(previous)
+                order[key] = rank
+            else:
+                entry["alternatives"].append({"provider": provider, "id": book.get("id"), "source_url": book.get("source_url")})
+            if not entry.get("image"):
+                entry["image"] = book.get("image")
+
+    for key, entry in merged.items():
+        # EPUB learned from another provider's hit counts for the merged book too
+        order[key] = (_format_rank(entry["formats"]),) + order[key][1:]
+    return [merged[key] for key in sorted(merged, key=lambda k: order[k])]
+
+def meta_search(query: str, searchers: Dict[str, Callable[[str], List[Dict[str, Any]]]],
+                limit: int = 25, deadline: float = DEADLINE, grace: float = GRACE_PERIOD,
+                hosts: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Runs all searchers concurrently and merges whatever arrived in time.
+
+    Args:
+        query: Search query
+        searchers: Provider name -> blocking search function taking the query
+        limit: Maximum number of merged results
+        deadline: Hard limit for the whole search in seconds
+        grace: Extra seconds granted to the others once the first provider answered
+        hosts: Provider name -> host, for ranking by host health
+
+    Returns:
+        {"results": [...], "providers": {name: {"status", "count", "elapsed_ms"}}, "elapsed_ms"}
+    """
+    started = time.monotonic()
+    # Stragglers keep running in the shared pool after we answered; they are not waited for
+    futures = {_pool.submit(search, query): name for name, search in searchers.items()}
+    finished_at: Dict[str, float] = {}
+    pending = set(futures)
+    try:
+        first_answer: Optional[float] = None
+        while pending:
+            now = time.monotonic()
+            remaining = started + deadline - now
+            if first_answer is not None:
+                remaining = min(remaining, first_answer + grace - now)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished_at[futures[future]] = time.monotonic()
+            if first_answer is None and any(f.exception() is None for f in done):
+                # Only a real answer starts the grace period, not a provider that failed fast
+                first_answer = time.monotonic()
+    finally:
+        for future in pending:
+            future.cancel()  # Still queued behind other searches: never started
+
+    outcomes: Dict[str, List[Dict[str, Any]]] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    for future, name in futures.items():
+        if name not in finished_at:
+            report[name] = {"status": "timeout", "count": 0, "elapsed_ms": int((time.monotonic() - started) * 1000)}
+            continue
+        elapsed_ms = int((finished_at[name] - started) * 1000)
+        try:
+            outcomes[name] = future.result() or []
+            report[name] = {"status": "ok", "count": len(outcomes[name]), "elapsed_ms": elapsed_ms}
+        except Exception as e:
+            print(f"Meta-search: {name} failed: {e}")
+            report[name] = {"status": "error", "count": 0, "elapsed_ms": elapsed_ms}
+
+    results = merge_results(outcomes, list(searchers.keys()), hosts)[:limit]
+    return {"results": results, "providers": report, "elapsed_ms": int((time.monotonic() - started) * 1000)}
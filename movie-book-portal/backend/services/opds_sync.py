@@ -0,0 +1,328 @@
+"""
+Local mirror of the Flibusta OPDS genre feeds.
+
+The genres we follow (genre_priorities in auto_discovery_settings.json) are
+resolved to their OPDS feeds once, then every sync walks each feed from the
+newest entry along rel="next" until it reaches entries it has already seen
+(by <updated>). A page budget per run keeps the first crawl polite; the
+remaining history is back-filled on later runs from a saved rel="next" link.
+When more new books arrived than the budget covers, the high-water mark is
+not moved: the unread part is walked on from a second saved link (the gap)
+on the next runs, and the mark advances once that walk reaches it.
+"""
+import os
+import re
+import random
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin
+
+import feedparser
+
+from database_catalog import SessionLocalCatalog, OpdsBook, OpdsBookGenre, OpdsGenreFeed, create_catalog_tables
+from services.http_client import http_client
+
+FLIBUSTA_BASE_URL = os.environ.get("FLIBUSTA_URL", "http://flibusta.is")
+OPDS_URL = f"{FLIBUSTA_BASE_URL}/opds"
+
+SYNC_INTERVAL = 6 * 3600        # Seconds between two scheduled syncs (services/discovery_jobs.py)
+PAGES_PER_FEED = 5              # Newest pages fetched per feed and run
+BACKFILL_PAGES_PER_FEED = 3     # Older pages back-filled per feed and run
+LOCAL_MIN_RESULTS = 5           # Fewer local hits than this counts as a miss for search
+
+BOOK_FORMATS = ("fb2", "epub", "mobi")  # Matched against acquisition link types
+
+_tables_ready = False
+_sync_lock = threading.Lock()
+_stop = threading.Event()
+_state = {"status": "idle", "last_sync": None, "last_error": None, "new_books": 0, "pages": 0}
+
+def _session():
+    global _tables_ready
+    if not _tables_ready:
+        create_catalog_tables()
+        _tables_ready = True
+    return SessionLocalCatalog()
+
+def fetch_feed(url: str):
+    response = http_client.get(url, timeout=20)
+    response.raise_for_status()
+    return feedparser.parse(response.content)
+
+def _link(links, rel: str) -> Optional[str]:
+    for link in links or []:
+        if link.get("rel") == rel:
+            return link.get("href")
+    return None
+
+def _is_book_entry(entry) -> bool:
+    return any("acquisition" in (l.get("rel") or "") for l in entry.get("links", []))
+
+def _updated(entry) -> Optional[datetime]:
+    parsed = entry.get("updated_parsed") or entry.get("published_parsed")
+    return datetime(*parsed[:6]) if parsed else None
+
+def parse_entry(entry, feed_url: str) -> Optional[Dict[str, Any]]:
+    """Normalizes one OPDS acquisition entry"""
+    book_id = None
+    formats = []
+    cover = None
+    for link in entry.get("links", []):
+        href = link.get("href") or ""
+        rel = link.get("rel") or ""
+        type_ = (link.get("type") or "").lower()
+        match = re.search(r"/b/(\d+)", href)
+        if match and not book_id:
+            book_id = match.group(1)
+        if "acquisition" in rel:
+            for name in BOOK_FORMATS:
+                if name in type_ and name not in formats:
+                    formats.append(name)
+        if ("image" in rel or "thumbnail" in rel or type_.startswith("image/")) and (cover is None or "thumbnail" not in rel):
+            cover = urljoin(feed_url, href)
+    if not book_id:
+        book_id = (entry.get("id") or "").rsplit(":", 1)[-1].rsplit("/", 1)[-1] or None
+    title = (entry.get("title") or "").strip()
+    if not book_id or not title:
+        return None
+
+    authors = ", ".join(a.get("name", "").strip() for a in entry.get("authors", []) if a.get("name"))
+    summary = entry.get("summary") or ""
+    series_match = re.search(r"Серия:\s*([^<\n]+)", summary)
+    return {
+        "book_id": book_id,
+        "title": title,
+        "authors": authors or None,
+        "series": series_match.group(1).strip() if series_match else None,
+        "formats": ",".join(formats) or None,
+        "cover_url": cover,
+        "summary": re.sub(r"<[^>]+>", " ", summary).strip() or None,
+        "updated": _updated(entry),
+    }
+
+def _upsert(db, book: Dict[str, Any], genre: str) -> bool:
+    """Returns True if the book is new to the mirror"""
+    row = db.query(OpdsBook).filter(OpdsBook.book_id == book["book_id"]).first()
+    created = row is None
+    if created:
+        row = OpdsBook(book_id=book["book_id"])
+        db.add(row)
+    for key, value in book.items():
+        if key != "book_id" and (value is not None or created):
+            setattr(row, key, value)
+    row.search_text = f"{book['title']} {book['authors'] or ''}".lower()
+    row.synced_at = datetime.utcnow()
+    if not db.query(OpdsBookGenre).filter(OpdsBookGenre.book_id == book["book_id"], OpdsBookGenre.genre == genre).first():
+        db.add(OpdsBookGenre(book_id=book["book_id"], genre=genre))
+    return created
+
+def followed_genres() -> List[str]:
+    from discovery_shared import load_settings
+    return list((load_settings().get("genre_priorities") or {}).keys())
+
+def resolve_genre_feeds(genres: List[str]) -> Dict[str, List[str]]:
+    """
+    Finds the OPDS feeds of the given genres by walking /opds/genres.
+    A genre group (e.g. "Фантастика") expands to the feeds of all its sub-genres.
+    """
+    wanted = {g.lower(): g for g in genres}
+    found: Dict[str, List[str]] = {}
+    root = fetch_feed(f"{OPDS_URL}/genres")
+    for group in root.entries:
+        group_url = urljoin(f"{OPDS_URL}/genres", (group.get("links") or [{}])[0].get("href", ""))
+        group_name = (group.get("title") or "").strip()
+        try:
+            sub = fetch_feed(group_url)
+        except Exception as e:
+            print(f"OPDS: could not read genre group {group_name}: {e}")
+            continue
+        for entry in sub.entries:
+            name = (entry.get("title") or "").strip()
+            href = (entry.get("links") or [{}])[0].get("href")
+            if not href:
+                continue
+            url = urljoin(group_url, href)
+            for key in (group_name.lower(), name.lower()):
+                if key in wanted:
+                    found.setdefault(wanted[key], [])
+                    if url not in found[wanted[key]]:
+                        found[wanted[key]].append(url)
+    return found
+
+def _walk(db, feed: OpdsGenreFeed, start_url: str, max_pages: int, stop_at: Optional[datetime]):
+    """Follows rel=next from start_url. Returns (new books, newest updated, next url or None, pages)."""
+    url, pages, new_books, newest = start_url, 0, 0, None
+    while url and pages < max_pages and not _stop.is_set():
+        parsed = fetch_feed(url)
+        pages += 1
+        reached_known = False
+        for entry in parsed.entries:
+            if not _is_book_entry(entry):
+                continue
+            book = parse_entry(entry, url)
+            if not book:
+                continue
+            if stop_at and book["updated"] and book["updated"] <= stop_at:
+                reached_known = True
+                break
+            if _upsert(db, book, feed.genre):
+                new_books += 1
+            if book["updated"] and (newest is None or book["updated"] > newest):
+                newest = book["updated"]
+        db.commit()
+        next_href = _link(parsed.feed.get("links"), "next")
+        url = urljoin(url, next_href) if next_href else None
+        if reached_known:
+            url = None
+    return new_books, newest, url, pages
+
+def sync_feed(db, feed: OpdsGenreFeed) -> Dict[str, int]:
+    """Incremental sync of one feed: the open gap, new entries, then a bit of back-fill"""
+    new_books = pages = 0
+    if feed.gap_url and not _stop.is_set():
+        # New entries a previous run had no page budget left for, down to high_water
+        gap_books, _, feed.gap_url, gap_pages = _walk(db, feed, feed.gap_url, PAGES_PER_FEED, feed.high_water)
+        new_books += gap_books
+        pages += gap_pages
+        if not feed.gap_url:
+            if feed.gap_newest and feed.gap_newest > feed.high_water:
+                feed.high_water = feed.gap_newest
+            feed.gap_newest = None
+
+    # While a gap is open, everything above it was read already
+    stop_at = feed.gap_newest or feed.high_water
+    top_books, newest, next_url, top_pages = _walk(db, feed, feed.feed_url, PAGES_PER_FEED, stop_at)
+    new_books += top_books
+    pages += top_pages
+    if feed.high_water is None:
+        # First crawl: whatever did not fit into the page budget is back-filled later
+        feed.backfill_url = next_url
+        feed.high_water = newest
+    elif next_url is None:
+        # Reached stop_at (or the end of the feed): nothing between it and newest is missing
+        if newest and newest > stop_at:
+            if feed.gap_url:
+                feed.gap_newest = newest
+            else:
+                feed.high_water = newest
+    elif not feed.gap_url:
+        # Burst of new books larger than the budget: keep high_water, resume below next time
+        feed.gap_url = next_url
+        feed.gap_newest = newest
+    # else: a gap is already open; this part is read again next run (stop_at did not move)
+
+    if feed.backfill_url and not _stop.is_set():
+        old_books, _, feed.backfill_url, old_pages = _walk(db, feed, feed.backfill_url, BACKFILL_PAGES_PER_FEED, None)
+        new_books += old_books
+        pages += old_pages
+
+    feed.last_sync = datetime.utcnow()
+    feed.book_count = db.query(OpdsBookGenre).filter(OpdsBookGenre.genre == feed.genre).count()
+    db.commit()
+    return {"new_books": new_books, "pages": pages}
+
+def sync_followed_genres(genres: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Resolves missing genre feeds and syncs all of them. Only one sync runs at a time."""
+    if not _sync_lock.acquire(blocking=False):
+        return dict(_state)
+    _state.update(status="running", last_error=None, new_books=0, pages=0)
+    db = _session()
+    try:
+        genres = genres or followed_genres()
+        known = {f.genre for f in db.query(OpdsGenreFeed).all()}
+        missing = [g for g in genres if g not in known]
+        if missing:
+            for genre, urls in resolve_genre_feeds(missing).items():
+                for url in urls:
+                    if not db.query(OpdsGenreFeed).filter(OpdsGenreFeed.feed_url == url).first():
+                        db.add(OpdsGenreFeed(genre=genre, feed_url=url))
+            db.commit()
+
+        for feed in db.query(OpdsGenreFeed).filter(OpdsGenreFeed.genre.in_(genres)).all():
+            if _stop.is_set():
+                break
+            try:
+                result = sync_feed(db, feed)
+                _state["new_books"] += result["new_books"]
+                _state["pages"] += result["pages"]
+            except Exception as e:
+                db.rollback()
+                print(f"OPDS: sync of {feed.feed_url} failed: {e}")
+                _state["last_error"] = str(e)
+        _state.update(status="done", last_sync=datetime.utcnow().isoformat())
+    except Exception as e:
+        db.rollback()
+        _state.update(status="error", last_error=str(e))
+        print(f"OPDS sync failed: {e}")
+    finally:
+        db.close()
+        _sync_lock.release()
+    return dict(_state)
+
+def _book_dict(book: OpdsBook) -> Dict[str, Any]:
+    """Same shape as discovery.search_flibusta results"""
+    return {
+        "id": book.book_id,
+        "title": book.title,
+        "author": book.authors or "Неизвестен",
+        "description": book.summary or "Описание подгрузится при выборе",
+        "image": book.cover_url,
+        "source_url": f"{FLIBUSTA_BASE_URL}/b/{book.book_id}",
+        "formats": (book.formats or "").split(",") if book.formats else [],
+        "series": book.series,
+    }
+
+def search_local(query: str, limit: int = 25) -> List[Dict[str, Any]]:
+    """Title/author search in the mirror (every word must match), newest first"""
+    terms = [t for t in query.lower().split() if t]
+    if not terms:
+        return []
+    db = _session()
+    try:
+        q = db.query(OpdsBook)
+        for term in terms:
+            # % and _ in the query are literal characters, not wildcards
+            term = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            q = q.filter(OpdsBook.search_text.like(f"%{term}%", escape="\\"))
+        return [_book_dict(b) for b in q.order_by(OpdsBook.updated.desc()).limit(limit).all()]
+    finally:
+        db.close()
+
+def random_books(genre: str, count: int = 5, require_format: str = "epub", require_cover: bool = True) -> List[Dict[str, Any]]:
+    """Random mirrored books of a followed genre (genre compared case-insensitively)"""
+    db = _session()
+    try:
+        genre_names = [g for (g,) in db.query(OpdsBookGenre.genre).distinct().all() if g.lower() == genre.lower()]
+        if not genre_names:
+            return []
+        q = db.query(OpdsBook).join(OpdsBookGenre, OpdsBookGenre.book_id == OpdsBook.book_id).filter(OpdsBookGenre.genre.in_(genre_names))
+        if require_format:
+            q = q.filter(OpdsBook.formats.like(f"%{require_format}%"))
+        if require_cover:
+            q = q.filter(OpdsBook.cover_url.isnot(None))
+        ids = [b.book_id for b in q.with_entities(OpdsBook.book_id).all()]
+        picked = random.sample(ids, min(count, len(ids)))
+        return [_book_dict(b) for b in db.query(OpdsBook).filter(OpdsBook.book_id.in_(picked)).all()]
+    finally:
+        db.close()
+
+def status() -> Dict[str, Any]:
+    db = _session()
+    try:
+        feeds = [
+            {"genre": f.genre, "feed_url": f.feed_url, "genre_books": f.book_count,
+             "high_water": f.high_water.isoformat() if f.high_water else None,
+             "backfill_pending": bool(f.backfill_url),
+             "gap_pending": bool(f.gap_url),
+             "last_sync": f.last_sync.isoformat() if f.last_sync else None}
+            for f in db.query(OpdsGenreFeed).order_by(OpdsGenreFeed.genre).all()
+        ]
+        books = db.query(OpdsBook).count()
+    finally:
+        db.close()
+    return dict(_state, books=books, feeds=feeds)
+
+def stop():
+    """Makes a running sync stop after the current page"""
+    _stop.set()
@@ -0,0 +1,188 @@
+"""
+Health registry and circuit breaker for the external hosts we scrape.
+
+Every request made through the shared HTTP client is recorded per host:
+success, latency to the response headers and a rolling success rate over
+the last WINDOW requests. After FAILURE_THRESHOLD consecutive failures the
+host's circuit opens and requests to it fail immediately with
+CircuitOpenError instead of waiting for timeouts. Once the cooldown has
+passed the circuit is half-open: a single trial request goes through, and
+its outcome closes the circuit again or re-opens it with a doubled cooldown.
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import requests
+
+WINDOW = 50                 # Requests remembered per host
+FAILURE_THRESHOLD = 5       # Consecutive failures that open the circuit
+BASE_COOLDOWN = 60.0        # Seconds an opened circuit stays open
+MAX_COOLDOWN = 30 * 60.0    # Cap for the doubled cooldown of a host that keeps failing
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of contacting a host whose circuit is open"""
+
+@dataclass
+class HostHealth:
+    host: str
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=WINDOW))  # (ok, latency)
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    cooldown: float = BASE_COOLDOWN
+    trial_in_flight: bool = False
+    last_error: Optional[str] = None
+    last_success: Optional[float] = None
+    last_failure: Optional[float] = None
+
+    @property
+    def success_rate(self) -> float:
+        if not self.outcomes:
+            return 1.0
+        return sum(1 for ok, _ in self.outcomes if ok) / len(self.outcomes)
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Median latency of the successful requests in the window, seconds"""
+        latencies = sorted(latency for ok, latency in self.outcomes if ok)
+        if not latencies:
+            return None
+        return latencies[len(latencies) // 2]
+
+    def retry_in(self, now: float) -> float:
+        return max(0.0, self.opened_at + self.cooldown - now)
+
+_hosts: Dict[str, HostHealth] = {}
+_lock = threading.Lock()
+
+def _get(host: str) -> HostHealth:
+    health = _hosts.get(host)
+    if health is None:
+        health = HostHealth(host=host)
+        _hosts[host] = health
+    return health
+
+def allow(host: str) -> bool:
+    """
+    True if a request to the host may be made now. An open circuit whose
+    cooldown has passed lets exactly one trial request through (half-open).
+    """
+    with _lock:
+        health = _get(host)
+        if health.state == CLOSED:
+            return True
+        if health.state == OPEN and health.retry_in(time.monotonic()) == 0:
+            health.state = HALF_OPEN
+            health.trial_in_flight = False
+        if health.state == HALF_OPEN and not health.trial_in_flight:
+            health.trial_in_flight = True
+            return True
+        return False
+
+def is_available(host: str) -> bool:
+    """Like allow(), but only looks: never claims the half-open trial request"""
+    with _lock:
+        health = _hosts.get(host)
+        if health is None or health.state == CLOSED:
+            return True
+        if health.state == OPEN:
+            return health.retry_in(time.monotonic()) == 0
+        return not health.trial_in_flight
+
+def success_rate(host: str) -> float:
+    """Rolling success rate of a host (1.0 until it was contacted)"""
+    with _lock:
+        health = _hosts.get(host)
+        return health.success_rate if health else 1.0
+
+def record(host: str, ok: bool, latency: float, error: Optional[str] = None):
+    """Records the outcome of one request and moves the circuit accordingly"""
+    now = time.monotonic()
+    with _lock:
+        health = _get(host)
+        health.outcomes.append((ok, latency))
+        if ok:
+            health.consecutive_failures = 0
+            health.last_success = time.time()
+            if health.state != CLOSED:
+                print(f"Provider health: {host} recovered, circuit closed")
+            health.state = CLOSED
+            health.cooldown = BASE_COOLDOWN
+            health.trial_in_flight = False
+            return
+
+        health.consecutive_failures += 1
+        health.last_failure = time.time()
+        health.last_error = error
+        if health.state == HALF_OPEN:
+            # The trial failed: back off harder
+            health.cooldown = min(health.cooldown * 2, MAX_COOLDOWN)
+            health.state = OPEN
+            health.opened_at = now
+            health.trial_in_flight = False
+            print(f"Provider health: {host} still failing, circuit open for {int(health.cooldown)} s")
+        elif health.state == CLOSED and health.consecutive_failures >= FAILURE_THRESHOLD:
+            health.state = OPEN
+            health.opened_at = now
+            print(f"Provider health: {host} failed {health.consecutive_failures} times in a row, circuit open for {int(health.cooldown)} s")
+
+def order_mirrors(urls: List[str]) -> List[str]:
+    """
+    Mirrors sorted for trying: open circuits last, the rest by observed median
+    latency. Mirrors without measurements yet go first so they get measured;
+    ties keep the configured order.
+    """
+    from services.http_client import host_of
+    now = time.monotonic()
+
+    def sort_key(item):
+        index, url = item
+        with _lock:
+            health = _hosts.get(host_of(url))
+            if health is None:
+                return (0, 0.0, index)
+            blocked = health.state == OPEN and health.retry_in(now) > 0
+            latency = health.latency
+        return (1 if blocked else 0, latency if latency is not None else 0.0, index)
+
+    return [url for _, url in sorted(enumerate(urls), key=sort_key)]
+
+def reset(host: Optional[str] = None) -> int:
+    """Forgets the health of one host (or of all hosts); returns how many were reset"""
+    with _lock:
+        if host is None:
+            count = len(_hosts)
+            _hosts.clear()
+            return count
+        return 1 if _hosts.pop(host, None) else 0
+
+def snapshot() -> List[Dict[str, Any]]:
+    """Live health of every host seen so far, worst first"""
+    now = time.monotonic()
+    with _lock:
+        hosts = list(_hosts.values())
+        rows = []
+        for h in hosts:
+            latency = h.latency
+            rows.append({
+                "host": h.host,
+                "state": h.state,
+                "success_rate": round(h.success_rate, 3),
+                "requests": len(h.outcomes),
+                "latency_ms": int(latency * 1000) if latency is not None else None,
+                "consecutive_failures": h.consecutive_failures,
+                "retry_in_s": int(h.retry_in(now)) if h.state == OPEN else 0,
+                "cooldown_s": int(h.cooldown),
+                "last_error": h.last_error,
+                "last_success": h.last_success,
+                "last_failure": h.last_failure,
+            })
+    order = {OPEN: 0, HALF_OPEN: 1, CLOSED: 2}
+    return sorted(rows, key=lambda r: (order[r["state"]], r["success_rate"], r["host"]))
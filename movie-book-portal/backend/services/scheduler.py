@@ -0,0 +1,476 @@
+"""
+Persistent job scheduler for background work (discovery cycles, syncs).
+
+Jobs live in jobs.db (queued -> running -> succeeded / failed / cancelled,
+with timings, result and error). Schedules put jobs into the queue on an
+interval or a cron expression; their next run time is stored, so a restart
+neither skips nor repeats a run. One dispatcher thread sleeps until the
+earliest due schedule or delayed job, or until it is woken by enqueue,
+cancel or a finished job, so an idle server does not poll. Jobs run on a
+worker pool with a concurrency limit per job type; a failed job is retried
+as a new job row with exponential backoff until max_attempts is reached.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from database_jobs import SessionLocalJobs, Job, JobSchedule, create_jobs_tables
+
+MAX_SLEEP = 3600.0          # Upper bound for one dispatcher sleep (clock changes, lost wakeups)
+KEEP_FINISHED = timedelta(days=30)
+ACTIVE = ("queued", "running")
+
+@dataclass
+class JobType:
+    name: str
+    handler: Callable[["JobContext"], Any]
+    concurrency: int = 1
+    max_attempts: int = 1
+    backoff: float = 60.0       # Delay before the first retry, doubled for every further one
+    backoff_cap: float = 3600.0
+
+class JobCancelled(Exception):
+    """Raised by JobContext.check_cancelled() inside a job whose cancellation was requested"""
+
+class JobContext:
+    """What a job handler gets: its payload and a way to notice cancellation"""
+
+    def __init__(self, job_id: int, job_type: str, payload: Dict[str, Any], attempt: int):
+        self.job_id = job_id
+        self.job_type = job_type
+        self.payload = payload
+        self.attempt = attempt
+
+    def cancelled(self) -> bool:
+        return self.job_id in _cancel_requested
+
+    def check_cancelled(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+_types: Dict[str, JobType] = {}
+_running: Dict[str, int] = {}
+_cancel_requested = set()
+_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_pool: Optional[ThreadPoolExecutor] = None
+_tables_ready = False
+
+def _session():
+    global _tables_ready
+    if not _tables_ready:
+        create_jobs_tables()
+        _tables_ready = True
+    return SessionLocalJobs()
+
+def _wakeup():
+    _wake.set()
+
+# ---- Cron ----
+
+def _cron_field(spec: str, low: int, high: int) -> set:
+    values = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            step = int(step_str)
+        if part in ("*", ""):
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+        else:
+            start = end = int(part)
+            if step != 1:
+                end = high
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Cron field out of range: {spec}")
+        values.update(range(start, end + 1, step))
+    return values
+
+def parse_cron(expr: str):
+    """'minute hour day month weekday' (weekday 0-7, 0 and 7 are Sunday)"""
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron expression needs 5 fields: {expr!r}")
+    minutes = _cron_field(fields[0], 0, 59)
+    hours = _cron_field(fields[1], 0, 23)
+    days = _cron_field(fields[2], 1, 31)
+    months = _cron_field(fields[3], 1, 12)
+    weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}
+    return minutes, hours, days, months, weekdays, fields[2] != "*", fields[4] != "*"
+
+def cron_next(expr: str, after: datetime) -> datetime:
+    """First local time strictly after `after` (naive local) that matches the expression"""
+    minutes, hours, days, months, weekdays, days_set, weekdays_set = parse_cron(expr)
+    start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    day = start.replace(hour=0, minute=0)
+    for _ in range(366 * 5):
+        cron_weekday = (day.weekday() + 1) % 7  # cron counts from Sunday
+        if days_set and weekdays_set:
+            day_ok = day.day in days or cron_weekday in weekdays  # Classic cron: either may match
+        else:
+            day_ok = day.day in days and cron_weekday in weekdays
+        if day.month in months and day_ok:
+            for hour in sorted(hours):
+                for minute in sorted(minutes):
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate >= start:
+                        return candidate
+        day += timedelta(days=1)
+    raise ValueError(f"Cron expression never matches: {expr!r}")
+
+def _utc(local: datetime) -> datetime:
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _next_run(schedule: JobSchedule, after_utc: datetime) -> datetime:
+    if schedule.cron:
+        after_local = after_utc.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        return _utc(cron_next(schedule.cron, after_local))
+    return after_utc + timedelta(seconds=max(int(schedule.interval_seconds or 0), 60))
+
+# ---- Public API ----
+
+def register_job_type(name: str, handler: Callable[[JobContext], Any], concurrency: int = 1,
+                      max_attempts: int = 1, backoff: float = 60.0, backoff_cap: float = 3600.0):
+    """Makes a job type known to the workers. The handler's return value is stored as the result."""
+    _types[name] = JobType(name, handler, concurrency, max_attempts, backoff, backoff_cap)
+    _running.setdefault(name, 0)
+    _wakeup()
+
+def _job_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "trigger": job.trigger,
+        "schedule": job.schedule_name,
+        "attempt": job.attempt,
+        "max_attempts": job.max_attempts,
+        "payload": json.loads(job.payload) if job.payload else None,
+        "run_after": job.run_after.isoformat() if job.run_after else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "duration": job.duration,
+        "result": job.result,
+        "error": job.error,
+        "cancel_requested": bool(job.cancel_requested),
+    }
+
+def _insert_job(db, job_type: str, payload: Optional[Dict[str, Any]], trigger: str, run_after: Optional[datetime] = None,
+                schedule_name: Optional[str] = None, attempt: int = 1) -> Job:
+    job = Job(
+        job_type=job_type,
+        status="queued",
+        payload=json.dumps(payload, ensure_ascii=False) if payload else None,
+        trigger=trigger,
+        schedule_name=schedule_name,
+        attempt=attempt,
+        max_attempts=_types[job_type].max_attempts if job_type in _types else 1,
+        run_after=run_after or datetime.utcnow(),
+    )
+    db.add(job)
+    return job
+
+def enqueue(job_type: str, payload: Optional[Dict[str, Any]] = None, trigger: str = "manual",
+            delay: float = 0, schedule_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Queues a job.
+
+    Args:
+        job_type: A registered job type
+        payload: JSON-serializable arguments for the handler
+        trigger: Why the job exists (manual / force / schedule)
+        delay: Seconds to wait before the job may start
+        schedule_name: Schedule the job belongs to, if any
+
+    Returns:
+        The queued job as a dict
+    """
+    if job_type not in _types:
+        raise ValueError(f"Unknown job type: {job_type}")
+    db = _session()
+    try:
+        job = _insert_job(db, job_type, payload, trigger, datetime.utcnow() + timedelta(seconds=delay), schedule_name)
+        db.commit()
+        db.refresh(job)
+        result = _job_dict(job)
+    finally:
+        db.close()
+    _wakeup()
+    return result
+
+def force_run(schedule_name: str) -> Dict[str, Any]:
+    """
+    Runs a schedule's job now. If one is already queued or running, that job
+    is returned instead of queueing a second one. The next scheduled run is
+    counted from now.
+    """
+    db = _session()
+    try:
+        schedule = db.query(JobSchedule).filter(JobSchedule.name == schedule_name).first()
+        if not schedule:
+            raise KeyError(schedule_name)
+        active = db.query(Job).filter(Job.schedule_name == schedule_name, Job.status.in_(ACTIVE)).first()
+        if active:
+            if active.status == "queued" and active.run_after > datetime.utcnow():
+                active.run_after = datetime.utcnow()  # A delayed retry: start it now
+                db.commit()
+                _wakeup()
+            return _job_dict(active)
+        job = _insert_job(db, schedule.job_type, None, "force", schedule_name=schedule_name)
+        now = datetime.utcnow()
+        schedule.last_run_at = now
+        schedule.next_run_at = _next_run(schedule, now)
+        db.commit()
+        db.refresh(job)
+        result = _job_dict(job)
+    finally:
+        db.close()
+    _wakeup()
+    return result
+
+def cancel(job_id: int) -> Optional[Dict[str, Any]]:
+    """Cancels a queued job at once; a running job is asked to stop (handlers check it cooperatively)"""
+    db = _session()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if not job:
+            return None
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+        elif job.status == "running":
+            job.cancel_requested = True
+            _cancel_requested.add(job.id)
+        db.commit()
+        result = _job_dict(job)
+    finally:
+        db.close()
+    _wakeup()
+    return result
+
+def set_schedule(name: str, job_type: str, interval_seconds: Optional[int] = None, cron: Optional[str] = None,
+                 enabled: bool = True):
+    """
+    Creates or updates a schedule. The stored next run is kept unless the
+    trigger changed; a new schedule first fires a minute after startup.
+    """
+    if cron:
+        parse_cron(cron)  # Reject invalid expressions before storing them
+    elif not interval_seconds:
+        raise ValueError("A schedule needs interval_seconds or cron")
+    db = _session()
+    try:
+        schedule = db.query(JobSchedule).filter(JobSchedule.name == name).first()
+        now = datetime.utcnow()
+        if not schedule:
+            schedule = JobSchedule(name=name, job_type=job_type, next_run_at=now + timedelta(minutes=1))
+            db.add(schedule)
+        changed = schedule.cron != (cron or None) or (not cron and schedule.interval_seconds != interval_seconds)
+        schedule.job_type = job_type
+        schedule.interval_seconds = None if cron else int(interval_seconds)
+        schedule.cron = cron or None
+        schedule.enabled = enabled
+        if changed and schedule.last_run_at:
+            schedule.next_run_at = _next_run(schedule, max(schedule.last_run_at, now - timedelta(days=365)))
+            if schedule.next_run_at < now:
+                schedule.next_run_at = now
+        db.commit()
+    finally:
+        db.close()
+    _wakeup()
+
+def list_jobs(status: Optional[str] = None, job_type: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    db = _session()
+    try:
+        q = db.query(Job)
+        if status:
+            q = q.filter(Job.status == status)
+        if job_type:
+            q = q.filter(Job.job_type == job_type)
+        return [_job_dict(j) for j in q.order_by(Job.id.desc()).limit(limit).all()]
+    finally:
+        db.close()
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    db = _session()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        return _job_dict(job) if job else None
+    finally:
+        db.close()
+
+def list_schedules() -> List[Dict[str, Any]]:
+    db = _session()
+    try:
+        return [{
+            "name": s.name,
+            "job_type": s.job_type,
+            "interval_seconds": s.interval_seconds,
+            "cron": s.cron,
+            "enabled": bool(s.enabled),
+            "next_run_at": s.next_run_at.isoformat() if s.next_run_at else None,
+            "last_run_at": s.last_run_at.isoformat() if s.last_run_at else None,
+        } for s in db.query(JobSchedule).order_by(JobSchedule.name).all()]
+    finally:
+        db.close()
+
+def status() -> Dict[str, Any]:
+    with _lock:
+        running = dict(_running)
+    return {
+        "running": bool(_thread and _thread.is_alive()),
+        "job_types": {name: {"concurrency": t.concurrency, "running": running.get(name, 0), "max_attempts": t.max_attempts}
+                      for name, t in _types.items()},
+    }
+
+# ---- Dispatcher ----
+
+def _fire_schedules(db, now: datetime):
+    # Schedules of job types this process does not register are left alone (and not waited for)
+    for schedule in db.query(JobSchedule).filter(JobSchedule.enabled == True, JobSchedule.next_run_at <= now,
+                                                 JobSchedule.job_type.in_(list(_types))).all():
+        busy = db.query(Job.id).filter(Job.schedule_name == schedule.name, Job.status.in_(ACTIVE)).first()
+        if busy:
+            print(f"Scheduler: {schedule.name} is still busy, skipping this run")
+        else:
+            _insert_job(db, schedule.job_type, None, "schedule", schedule_name=schedule.name)
+        schedule.last_run_at = now
+        schedule.next_run_at = _next_run(schedule, now)
+    db.commit()
+
+def _dispatch(db, now: datetime):
+    for name, job_type in _types.items():
+        with _lock:
+            free = job_type.concurrency - _running.get(name, 0)
+        if free <= 0:
+            continue
+        jobs = db.query(Job).filter(Job.job_type == name, Job.status == "queued", Job.run_after <= now) \
+            .order_by(Job.run_after, Job.id).limit(free).all()
+        for job in jobs:
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.commit()
+            with _lock:
+                _running[name] = _running.get(name, 0) + 1
+            payload = json.loads(job.payload) if job.payload else {}
+            _pool.submit(_execute, job.id, name, payload, job.attempt)
+
+def _next_wakeup(db, now: datetime) -> float:
+    candidates = []
+    schedule = db.query(JobSchedule.next_run_at).filter(JobSchedule.enabled == True, JobSchedule.next_run_at.isnot(None),
+                                                        JobSchedule.job_type.in_(list(_types))) \
+        .order_by(JobSchedule.next_run_at).first()
+    if schedule:
+        candidates.append(schedule[0])
+    with _lock:
+        free_types = [name for name, t in _types.items() if _running.get(name, 0) < t.concurrency]
+    if free_types:
+        delayed = db.query(Job.run_after).filter(Job.status == "queued", Job.job_type.in_(free_types)) \
+            .order_by(Job.run_after).first()
+        if delayed:
+            candidates.append(delayed[0])
+    if not candidates:
+        return MAX_SLEEP
+    return min(MAX_SLEEP, max(0.0, (min(candidates) - now).total_seconds()))
+
+def _execute(job_id: int, job_type_name: str, payload: Dict[str, Any], attempt: int):
+    job_type = _types[job_type_name]
+    started = time.monotonic()
+    result, error, state = None, None, "succeeded"
+    try:
+        value = job_type.handler(JobContext(job_id, job_type_name, payload, attempt))
+        if value is not None:
+            result = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    except JobCancelled:
+        state = "cancelled"
+    except Exception as e:
+        state, error = "failed", f"{type(e).__name__}: {e}"
+        print(f"Scheduler: job {job_id} ({job_type_name}) failed: {error}")
+    finally:
+        with _lock:
+            _running[job_type_name] -= 1
+
+    db = _session()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job.cancel_requested and state == "succeeded":
+            state = "cancelled"  # Finished anyway, but the user asked for it to stop: no retry either
+        job.status = state
+        job.finished_at = datetime.utcnow()
+        job.duration = round(time.monotonic() - started, 3)
+        job.result = result[:4000] if result else None
+        job.error = error[:4000] if error else None
+        if state == "failed" and attempt < job_type.max_attempts and not job.cancel_requested:
+            delay = min(job_type.backoff_cap, job_type.backoff * (2 ** (attempt - 1)))
+            _insert_job(db, job_type_name, payload, "retry", datetime.utcnow() + timedelta(seconds=delay),
+                        job.schedule_name, attempt + 1)
+            print(f"Scheduler: retrying {job_type_name} in {int(delay)} s (attempt {attempt + 1}/{job_type.max_attempts})")
+        db.commit()
+    except Exception as e:
+        print(f"Scheduler: could not store the outcome of job {job_id}: {e}")
+    finally:
+        db.close()
+        _cancel_requested.discard(job_id)
+    _wakeup()
+
+def _recover(db):
+    """Jobs that were running when the process died are failed (and retried if they may be)"""
+    now = datetime.utcnow()
+    for job in db.query(Job).filter(Job.status == "running").all():
+        job.status = "failed"
+        job.finished_at = now
+        job.error = "Interrupted: server restarted"
+        if job.attempt < job.max_attempts and not job.cancel_requested:
+            _insert_job(db, job.job_type, json.loads(job.payload) if job.payload else None, "retry", now,
+                        job.schedule_name, job.attempt + 1)
+    db.query(Job).filter(Job.status.notin_(ACTIVE), Job.created_at < now - KEEP_FINISHED).delete(synchronize_session=False)
+    db.commit()
+
+def _run():
+    db = _session()
+    try:
+        _recover(db)
+    finally:
+        db.close()
+    while not _stop.is_set():
+        _wake.clear()
+        timeout = MAX_SLEEP
+        db = _session()
+        try:
+            now = datetime.utcnow()
+            _fire_schedules(db, now)
+            _dispatch(db, now)
+            timeout = _next_wakeup(db, datetime.utcnow())
+        except Exception as e:
+            print(f"Scheduler error: {e}")
+            timeout = 60.0
+        finally:
+            db.close()
+        _wake.wait(timeout)
+
+def start(workers: int = 4):
+    """Starts the dispatcher and its worker pool once per process (SCHEDULER=0 disables them)"""
+    global _thread, _pool
+    if os.environ.get("SCHEDULER", "1") == "0":
+        return
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _pool = ThreadPoolExecutor(max_workers=max(workers, sum(t.concurrency for t in _types.values())),
+                               thread_name_prefix="job")
+    _thread = threading.Thread(target=_run, name="job-scheduler", daemon=True)
+    _thread.start()
+
+def stop():
+    _stop.set()
+    _wakeup()
@@ -0,0 +1,331 @@
+"""
+Persistent HTTP response cache for discovery scraping (flibusta / coollib / royallib).
+
+Pages are keyed by normalized URL and kept in SQLite with a per-endpoint TTL.
+Expired pages are still served for a grace period while a background thread
+revalidates them with If-None-Match / If-Modified-Since; total size is bounded
+by evicting the least recently used pages. Only pages that contain what the
+scrapers look for are stored, so a captcha or "site busy" page answered with
+200 is never served from the cache.
+"""
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Any, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from sqlalchemy import func
+
+from database_scrape_cache import SessionLocalScrapeCache, ScrapeCacheEntry, create_scrape_cache_tables
+from services import html_parser
+from services.html_parser import BOOK_LINK_SELECTOR, ROYALLIB_BOOK_SELECTOR, AUTHOR_LINK_SELECTOR
+from services.http_client import http_client
+
+@dataclass
+class CachePolicy:
+    ttl: int    # Seconds a page is fresh
+    stale: int  # Extra seconds it may be served while being revalidated
+    expect: Tuple[str, ...] = ()  # A page is stored only if it matches one of these selectors (empty: any page)
+
+BOOK_LINKS = (BOOK_LINK_SELECTOR, ROYALLIB_BOOK_SELECTOR)
+
+CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "browse": CachePolicy(ttl=6 * 3600, stale=24 * 3600, expect=BOOK_LINKS),        # Genre listings
+    "search": CachePolicy(ttl=30 * 60, stale=6 * 3600, expect=BOOK_LINKS),          # Search results
+    "details": CachePolicy(ttl=7 * 86400, stale=30 * 86400, expect=(AUTHOR_LINK_SELECTOR,)),  # Book pages (also used for covers)
+}
+DEFAULT_POLICY = CachePolicy(ttl=3600, stale=6 * 3600)
+
+MAX_CACHE_BYTES = int(os.environ.get("SCRAPE_CACHE_MAX_MB", "200")) * 1024 * 1024
+MAX_ENTRY_BYTES = 5 * 1024 * 1024
+ACCESS_FLUSH_INTERVAL = 60  # Seconds between batched writes of hit counters
+
+_db_lock = threading.Lock()
+_tables_ready = False
+# Guarded by _db_lock: hits / last access not yet written, and the summed size of all pages
+_pending_access: Dict[str, Tuple[int, float]] = {}
+_last_access_flush = 0.0
+_total_bytes: Optional[int] = None
+_inflight = set()
+_inflight_lock = threading.Lock()
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "revalidated": 0, "bypassed": 0, "errors_served_stale": 0}
+_stats_lock = threading.Lock()
+
+def _session():
+    global _tables_ready
+    if not _tables_ready:
+        create_scrape_cache_tables()
+        _tables_ready = True
+    return SessionLocalScrapeCache()
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+def normalize_url(url: str) -> str:
+    """Cache key: lower-case scheme/host, no default port, sorted query, no fragment"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+def _snapshot(entry: ScrapeCacheEntry) -> Dict[str, Any]:
+    return {
+        "status_code": entry.status_code,
+        "content_type": entry.content_type,
+        "encoding": entry.encoding,
+        "etag": entry.etag,
+        "last_modified": entry.last_modified,
+        "content": entry.content,
+        "expires_at": entry.expires_at,
+        "stale_until": entry.stale_until,
+    }
+
+def _to_response(url: str, cached: Dict[str, Any]) -> requests.Response:
+    """Rebuilds a requests.Response so callers cannot tell a cached page from a live one"""
+    response = requests.Response()
+    response.status_code = cached["status_code"]
+    response._content = cached["content"]
+    response.url = url
+    response.encoding = cached["encoding"]
+    response.headers = CaseInsensitiveDict()
+    if cached["content_type"]:
+        response.headers["Content-Type"] = cached["content_type"]
+    response.from_cache = True
+    return response
+
+def _flush_access(db):
+    """Writes the buffered hit counters in one transaction (caller holds _db_lock)"""
+    global _last_access_flush
+    _last_access_flush = time.monotonic()
+    if not _pending_access:
+        return
+    for key, (hits, last_access) in _pending_access.items():
+        db.query(ScrapeCacheEntry).filter(ScrapeCacheEntry.url == key).update(
+            {ScrapeCacheEntry.hits: func.coalesce(ScrapeCacheEntry.hits, 0) + hits,
+             ScrapeCacheEntry.last_access: last_access},
+            synchronize_session=False)
+    _pending_access.clear()
+    db.commit()
+
+def _cache_bytes(db) -> int:
+    """Total size of the stored pages, summed once and then kept up to date (caller holds _db_lock)"""
+    global _total_bytes
+    if _total_bytes is None:
+        _total_bytes = db.query(func.coalesce(func.sum(ScrapeCacheEntry.size), 0)).scalar()
+    return _total_bytes
+
+def _load(key: str) -> Optional[Dict[str, Any]]:
+    with _db_lock:
+        db = _session()
+        try:
+            entry = db.query(ScrapeCacheEntry).filter(ScrapeCacheEntry.url == key).first()
+            if not entry:
+                return None
+            # A hit only bumps an in-memory counter; the LRU order is written in batches
+            hits, _ = _pending_access.get(key, (0, 0.0))
+            _pending_access[key] = (hits + 1, time.time())
+            if time.monotonic() - _last_access_flush >= ACCESS_FLUSH_INTERVAL:
+                _flush_access(db)
+            return _snapshot(entry)
+        finally:
+            db.close()
+
+def _worth_storing(policy: CachePolicy, content: bytes) -> bool:
+    """Pages without the expected links are captcha / error pages served with 200"""
+    if len(content) > MAX_ENTRY_BYTES:
+        return False
+    return not policy.expect or html_parser.has_match(content, policy.expect)
+
+def _store(key: str, policy_name: str, response: requests.Response):
+    global _total_bytes
+    policy = CACHE_POLICIES.get(policy_name, DEFAULT_POLICY)
+    content = response.content
+    if not _worth_storing(policy, content):
+        return
+    now = time.time()
+    with _db_lock:
+        db = _session()
+        try:
+            total = _cache_bytes(db)
+            entry = db.query(ScrapeCacheEntry).filter(ScrapeCacheEntry.url == key).first()
+            previous_size = (entry.size or 0) if entry else 0
+            if not entry:
+                entry = ScrapeCacheEntry(url=key, hits=0)
+                db.add(entry)
+            entry.policy = policy_name
+            entry.status_code = response.status_code
+            entry.content_type = response.headers.get("Content-Type")
+            entry.encoding = response.encoding
+            entry.etag = response.headers.get("ETag")
+            entry.last_modified = response.headers.get("Last-Modified")
+            entry.content = content
+            entry.size = len(content)
+            entry.fetched_at = now
+            entry.expires_at = now + policy.ttl
+            entry.stale_until = now + policy.ttl + policy.stale
+            entry.last_access = now
+            db.commit()
+            _total_bytes = total + len(content) - previous_size
+            if _total_bytes > MAX_CACHE_BYTES:
+                _flush_access(db)
+                _evict(db)
+        finally:
+            db.close()
+
+def _mark_fresh(key: str, policy_name: str):
+    """304 Not Modified: the stored page is valid for another TTL"""
+    policy = CACHE_POLICIES.get(policy_name, DEFAULT_POLICY)
+    now = time.time()
+    with _db_lock:
+        db = _session()
+        try:
+            entry = db.query(ScrapeCacheEntry).filter(ScrapeCacheEntry.url == key).first()
+            if entry:
+                entry.fetched_at = now
+                entry.expires_at = now + policy.ttl
+                entry.stale_until = now + policy.ttl + policy.stale
+                db.commit()
+        finally:
+            db.close()
+
+def _evict(db):
+    """Drops least recently used pages until the cache is back under 90% of its limit"""
+    global _total_bytes
+    target = MAX_CACHE_BYTES * 0.9
+    for url, size in db.query(ScrapeCacheEntry.url, ScrapeCacheEntry.size).order_by(ScrapeCacheEntry.last_access.asc()).all():
+        if _total_bytes <= target:
+            break
+        db.query(ScrapeCacheEntry).filter(ScrapeCacheEntry.url == url).delete()
+        _pending_access.pop(url, None)
+        _total_bytes -= size or 0
+    db.commit()
+
+def _fetch(url: str, key: str, policy_name: str, headers: Optional[dict], timeout: int,
+           cached: Optional[Dict[str, Any]] = None) -> requests.Response:
+    """
+    Live GET (conditional if a cached copy exists). Only 200 responses that
+    contain what the policy expects are stored.
+    """
+    request_headers = dict(headers or {})
+    if cached:
+        if cached["etag"]:
+            request_headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            request_headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = http_client.get(url, headers=request_headers, timeout=timeout)
+    if response.status_code == 304 and cached:
+        _count("revalidated")
+        _mark_fresh(key, policy_name)
+        return _to_response(url, cached)
+    if response.status_code == 200:
+        _store(key, policy_name, response)
+    response.from_cache = False
+    return response
+
+def _revalidate_in_background(url: str, key: str, policy_name: str, headers: Optional[dict],
+                              timeout: int, cached: Dict[str, Any]):
+    with _inflight_lock:
+        if key in _inflight:
+            return
+        _inflight.add(key)
+
+    def run():
+        try:
+            _fetch(url, key, policy_name, headers, timeout, cached)
+        except Exception as e:
+            print(f"Scrape cache: background revalidation of {url} failed: {e}")
+        finally:
+            with _inflight_lock:
+                _inflight.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def cached_get(url: str, policy: str = "details", headers: Optional[dict] = None,
+               timeout: int = 15, refresh: bool = False) -> requests.Response:
+    """
+    GET through the scrape cache.
+
+    Args:
+        url: Page URL
+        policy: Key of CACHE_POLICIES (browse / search / details)
+        headers: Request headers for a live fetch
+        timeout: Timeout for a live fetch
+        refresh: Bypass the cache (the fresh page is still stored)
+
+    Returns:
+        requests.Response; `response.from_cache` tells whether the network was skipped
+    """
+    key = normalize_url(url)
+    if refresh:
+        _count("bypassed")
+        return _fetch(url, key, policy, headers, timeout)
+
+    cached = _load(key)
+    now = time.time()
+    if cached:
+        if now < cached["expires_at"]:
+            _count("hits")
+            return _to_response(url, cached)
+        if now < cached["stale_until"]:
+            _count("stale_hits")
+            _revalidate_in_background(url, key, policy, headers, timeout, cached)
+            return _to_response(url, cached)
+
+    _count("misses")
+    try:
+        return _fetch(url, key, policy, headers, timeout, cached)
+    except requests.RequestException:
+        # Site is down: a very old page is still better than nothing
+        if cached:
+            _count("errors_served_stale")
+            return _to_response(url, cached)
+        raise
+
+def stats() -> Dict[str, Any]:
+    """Counters since startup plus current cache size"""
+    with _stats_lock:
+        counters = dict(_stats)
+    lookups = counters["hits"] + counters["stale_hits"] + counters["misses"]
+    with _db_lock:
+        db = _session()
+        try:
+            _flush_access(db)
+            entries = db.query(func.count(ScrapeCacheEntry.url)).scalar()
+            total = _cache_bytes(db)
+            by_policy = dict(db.query(ScrapeCacheEntry.policy, func.count(ScrapeCacheEntry.url)).group_by(ScrapeCacheEntry.policy).all())
+        finally:
+            db.close()
+    counters.update({
+        "lookups": lookups,
+        "hit_rate": round((counters["hits"] + counters["stale_hits"]) / lookups, 3) if lookups else 0.0,
+        "entries": entries,
+        "bytes": total,
+        "max_bytes": MAX_CACHE_BYTES,
+        "entries_by_policy": by_policy,
+    })
+    return counters
+
+def clear(policy: Optional[str] = None) -> int:
+    """Deletes all cached pages (or those of one policy). Returns the number removed."""
+    global _total_bytes
+    with _db_lock:
+        db = _session()
+        try:
+            _flush_access(db)
+            query = db.query(ScrapeCacheEntry)
+            if policy:
+                query = query.filter(ScrapeCacheEntry.policy == policy)
+            removed = query.delete()
+            db.commit()
+            _total_bytes = None  # Summed again on the next store
+            return removed
+        finally:
+            db.close()
@@ -4,6 +4,7 @@ import platform
 
 def get_directory_size(start_path = '.'):
     total_size = 0
+    seen_inodes = set()
     try:
         for dirpath, dirnames, filenames in os.walk(start_path):
             for f in filenames:
@@ -11,7 +12,13 @@ def get_directory_size(start_path = '.'):
                 # skip if it is symbolic link
                 if not os.path.islink(fp):
                     try:
-                        total_size += os.path.getsize(fp)
+                        st = os.stat(fp)
+                        # Hardlinked copies (media store) take disk space only once
+                        if st.st_nlink > 1:
+                            if (st.st_dev, st.st_ino) in seen_inodes:
+                                continue
+                            seen_inodes.add((st.st_dev, st.st_ino))
+                        total_size += st.st_size
                     except OSError:
                         pass
     except Exception:
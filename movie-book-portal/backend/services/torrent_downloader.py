@@ -3,10 +3,10 @@ Torrent downloader using qBittorrent client via API
 Requires qBittorrent installed and running with Web UI enabled
 """
 from qbittorrentapi import Client
-import time
 import os
 from typing import Optional
 from datetime import datetime
+from services import torrent_monitor
 
 def log_progress(message: str, log_file: str = None):
     """Log progress message"""
@@ -30,7 +30,8 @@ def download_torrent(
     qbt_host: str = "localhost",
     qbt_port: int = 8080,
     qbt_username: str = "admin",
-    qbt_password: str = "adminadmin"
+    qbt_password: str = "adminadmin",
+    stall_timeout: float = torrent_monitor.STALL_TIMEOUT
 ) -> Optional[str]:
     """
     Download torrent file using qBittorrent and return path to the largest video file
@@ -45,9 +46,12 @@ def download_torrent(
         qbt_port: qBittorrent Web UI port (default: 8080)
         qbt_username: qBittorrent username (default: admin)
         qbt_password: qBittorrent password (default: adminadmin)
+        stall_timeout: Give up after this many seconds without download activity
         
     Returns:
-        Tuple of (video_file_path, torrent_hash), or (None, None) if download fails
+        Tuple of (video_file_path, torrent_hash), or (None, None) if download fails.
+        torrent_hash is None when the torrent was already in the client before:
+        it is not ours to remove.
     """
     try:
         os.makedirs(save_path, exist_ok=True)
@@ -56,14 +60,7 @@ def download_torrent(
         
         # Connect to qBittorrent
         try:
-            qbt_client = Client(
-                host=qbt_host,
-                port=qbt_port,
-                username=qbt_username,
-                password=qbt_password
-            )
-            # Test connection
-            qbt_client.auth_log_in()
+            qbt_client = torrent_monitor.connect(qbt_host, qbt_port, qbt_username, qbt_password)
             log_progress("Successfully connected to qBittorrent", log_file)
         except Exception as e:
             log_progress(f"Failed to connect to qBittorrent: {e}", log_file)
@@ -73,18 +70,10 @@ def download_torrent(
         log_progress(f"Adding torrent from: {torrent_url}", log_file)
         
         # Download torrent file with proper headers
-        import requests
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        from services.http_client import http_client
         
-        # Create session to maintain cookies
-        session = requests.Session()
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Connection': 'keep-alive',
-        }
+        # The shared client keeps cookies between calls
+        headers = {'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'}
         
         # Add referer if provided (CRITICAL for kinorush.name)
         if referer:
@@ -94,10 +83,10 @@ def download_torrent(
         try:
             # First visit the main page to get cookies
             if referer:
-                session.get(referer, headers=headers, timeout=10, verify=False)
+                http_client.get(referer, headers=headers, timeout=10)
             
             # Now download the torrent file
-            response = session.get(torrent_url, headers=headers, timeout=30, verify=False, allow_redirects=True)
+            response = http_client.get(torrent_url, headers=headers, timeout=30, allow_redirects=True)
             response.raise_for_status()
             
             # Check if we got HTML instead of torrent
@@ -106,133 +95,71 @@ def download_torrent(
                 log_progress(f"ERROR: Received HTML instead of torrent file. Site may be blocking downloads.", log_file)
                 log_progress(f"Content-Type: {content_type}", log_file)
                 log_progress(f"First 200 bytes: {response.content[:200]}", log_file)
-                return None
-            
-            # Save torrent file temporarily
-            temp_torrent_path = os.path.join(save_path, "temp_download.torrent")
-            with open(temp_torrent_path, 'wb') as f:
-                f.write(response.content)
+                return None, None
             
-            log_progress(f"Torrent file downloaded", log_file)
+            torrent_data = response.content
+            # The info-hash identifies our torrent in qBittorrent without guessing
+            torrent_hash = torrent_monitor.info_hash(torrent_data)
+            log_progress(f"Torrent file downloaded (info-hash {torrent_hash})", log_file)
         except Exception as e:
             log_progress(f"Failed to download torrent file: {e}", log_file)
             return None, None
         
         # Add torrent to qBittorrent
         try:
-            torrent = qbt_client.torrents_add(
-                torrent_files=temp_torrent_path,
+            added = qbt_client.torrents_add(
+                torrent_files={"download.torrent": torrent_data},
                 save_path=save_path,
                 is_paused=False
             )
-            
-            # Give it a moment to be added
-            time.sleep(2)
-            
-            # Get torrent info
-            torrents = qbt_client.torrents_info()
-            if not torrents:
-                log_progress("Failed to add torrent to qBittorrent", log_file)
-                return None, None
-            
-            # Find our torrent (should be the last one added)
-            torrent_hash = None
-            for t in torrents:
-                if t.save_path == save_path or save_path in t.save_path:
-                    torrent_hash = t.hash
-                    torrent_name = t.name
-                    log_progress(f"Torrent added: {torrent_name}", log_file)
-                    break
-            
-            if not torrent_hash:
-                # Just use the first torrent as fallback
-                torrent_hash = torrents[-1].hash
-                torrent_name = torrents[-1].name
-                log_progress(f"Using torrent: {torrent_name}", log_file)
-            
+            # "Fails." also means "already in the client": watching the hash covers both,
+            # but only a torrent we added ourselves may be deleted afterwards
+            owned = added == "Ok."
+            if not owned:
+                log_progress(f"qBittorrent answered '{added}' (torrent may already be in the client)", log_file)
         except Exception as e:
             log_progress(f"Failed to add torrent: {e}", log_file)
             return None, None
-        finally:
-            # Clean up temp torrent file
-            try:
-                os.remove(temp_torrent_path)
-            except:
-                pass
         
-        # Wait for download to complete
+        # Wait for download to complete: the shared monitor follows every torrent with one poller
         log_progress("Starting download...", log_file)
-        start_time = time.time()
-        last_progress = -1
-        last_download_time = time.time()  # Track when we last saw download activity
-        stall_timeout = 180  # 3 minutes in seconds
+        last_logged = [-1]
+        
+        def report(info):
+            progress = int(float(info.get("progress", 0)) * 100)
+            # Log progress every 10%
+            if progress // 10 != last_logged[0] // 10 or last_logged[0] < 0:
+                last_logged[0] = progress
+                log_progress(
+                    f"Download progress: {progress}% "
+                    f"(Down: {info.get('dlspeed', 0) / 1000:.1f} KB/s, "
+                    f"Up: {info.get('upspeed', 0) / 1000:.1f} KB/s, "
+                    f"Peers: {info.get('num_seeds', 0)})",
+                    log_file
+                )
         
-        while True:
-            # Check timeout
-            if time.time() - start_time > timeout:
+        monitor = torrent_monitor.get_monitor(qbt_host, qbt_port, qbt_username, qbt_password)
+        outcome, info = monitor.wait(torrent_hash, timeout=timeout, stall_timeout=stall_timeout, on_progress=report)
+        
+        if outcome != "completed":
+            if outcome == "stalled":
+                log_progress(f"Torrent stalled (no download for {int(stall_timeout)}s). Aborting...", log_file)
+            elif outcome == "timeout":
                 log_progress(f"Download timeout after {timeout} seconds", log_file)
+            elif outcome == "removed":
+                log_progress("Torrent not found in client", log_file)
+            else:
+                log_progress(f"Download error: {info.get('state')}", log_file)
+            if owned and outcome != "removed":
                 try:
                     qbt_client.torrents_delete(delete_files=True, torrent_hashes=torrent_hash)
                 except:
                     pass
-                return None, None
-            
-            # Get torrent status
-            try:
-                torrent_info = qbt_client.torrents_info(torrent_hashes=torrent_hash)
-                if not torrent_info:
-                    log_progress("Torrent not found in client", log_file)
-                    return None, None
-                
-                info = torrent_info[0]
-                progress = int(info.progress * 100)
-                state = info.state
-                dlspeed = info.dlspeed
-                
-                # Check for stalled download (no activity for 3 minutes)
-                if dlspeed > 0:
-                    # Reset stall timer if we're downloading
-                    last_download_time = time.time()
-                elif time.time() - last_download_time > stall_timeout and progress < 100:
-                    # No download activity for 3 minutes and not complete
-                    log_progress(f"Torrent stalled (no download for {stall_timeout}s). Aborting...", log_file)
-                    try:
-                        qbt_client.torrents_delete(delete_files=True, torrent_hashes=torrent_hash)
-                    except:
-                        pass
-                    return None, None
-                
-                # Log progress every 10%
-                if progress != last_progress and progress % 10 == 0:
-                    log_progress(
-                        f"Download progress: {progress}% "
-                        f"(Down: {dlspeed / 1000:.1f} KB/s, "
-                        f"Up: {info.upspeed / 1000:.1f} KB/s, "
-                        f"Peers: {info.num_seeds})",
-                        log_file
-                    )
-                    last_progress = progress
-                
-                # Check if completed
-                if state in ['uploading', 'stalledUP', 'pausedUP'] or progress >= 100:
-                    log_progress("Download complete!", log_file)
-                    break
-                
-                # Check for errors
-                if state == 'error':
-                    log_progress(f"Download error: {info.state}", log_file)
-                    try:
-                        qbt_client.torrents_delete(delete_files=True, torrent_hashes=torrent_hash)
-                    except:
-                        pass
-                    return None, None
-                
-            except Exception as e:
-                log_progress(f"Error checking torrent status: {e}", log_file)
-                time.sleep(5)
-                continue
-            
-            time.sleep(2)
+            return None, None
+        log_progress("Download complete!", log_file)
+        if not owned:
+            # Someone else's torrent: its files are where they were saved, and it stays in the client
+            save_path = info.get("save_path") or save_path
         
         # Find largest video file
         log_progress("Finding video file...", log_file)
@@ -269,7 +196,7 @@ def download_torrent(
         
         if largest_video and os.path.exists(largest_video):
             log_progress(f"Found video file: {largest_video} ({largest_size / (1024**3):.2f} GB)", log_file)
-            return largest_video, torrent_hash  # Return both video path and hash
+            return largest_video, torrent_hash if owned else None  # Return both video path and hash
         else:
             log_progress("No video file found in torrent", log_file)
             return None, None
@@ -0,0 +1,220 @@
+"""
+One poller for all torrents a qBittorrent instance is downloading for us.
+
+Instead of a thread per torrent polling torrents_info() every 2 seconds, a
+single monitor thread per qBittorrent instance follows the Web API's
+incremental sync/maindata endpoint: every response carries a rid cursor and
+only the fields that changed since the previous rid, so one request covers
+any number of torrents and an idle swarm costs almost nothing. Waiters
+register the info-hash of their torrent (computed from the .torrent file,
+see info_hash()) and are woken with an outcome:
+
+    completed / stalled / error / removed / timeout
+
+The poller thread exits when nobody is waiting and is started again by the
+next watch().
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+POLL_INTERVAL = 2.0          # Seconds between two sync/maindata requests while torrents are watched
+STALL_TIMEOUT = 180.0        # No download activity for this long -> "stalled"
+RECONNECT_DELAY = 5.0        # Pause after a failed sync request
+
+COMPLETE_STATES = {"uploading", "stalledUP", "pausedUP", "stoppedUP", "queuedUP", "forcedUP", "checkingUP"}
+ERROR_STATES = {"error", "missingFiles"}
+
+# ---- .torrent parsing ----
+
+def _bdecode_end(data: bytes, i: int) -> int:
+    """Index just past the bencoded value that starts at data[i]"""
+    c = data[i:i + 1]
+    if c == b"i":
+        return data.index(b"e", i) + 1
+    if c in (b"l", b"d"):
+        i += 1
+        while data[i:i + 1] != b"e":
+            i = _bdecode_end(data, i)
+        return i + 1
+    if c.isdigit():
+        colon = data.index(b":", i)
+        return colon + 1 + int(data[i:colon])
+    raise ValueError(f"Invalid bencoding at offset {i}")
+
+def info_hash(torrent: bytes) -> str:
+    """
+    BitTorrent v1 info-hash (lowercase hex) of a .torrent file: SHA-1 of the
+    raw bencoded "info" dictionary. This is the hash qBittorrent reports, so
+    the added torrent is known before qBittorrent has even seen it.
+    """
+    if torrent[:1] != b"d":
+        raise ValueError("Not a torrent file")
+    i = 1
+    while torrent[i:i + 1] != b"e":
+        key_end = _bdecode_end(torrent, i)
+        key = torrent[torrent.index(b":", i) + 1:key_end]
+        value_end = _bdecode_end(torrent, key_end)
+        if key == b"info":
+            return hashlib.sha1(torrent[key_end:value_end]).hexdigest()
+        i = value_end
+    raise ValueError("Torrent file has no info dictionary")
+
+# ---- Watches ----
+
+@dataclass
+class TorrentWatch:
+    """A waiter for one torrent; outcome is set once, when event fires"""
+    torrent_hash: str
+    deadline: float
+    stall_timeout: float
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    event: threading.Event = field(default_factory=threading.Event)
+    outcome: Optional[str] = None
+    info: Dict[str, Any] = field(default_factory=dict)
+    last_activity: float = field(default_factory=time.monotonic)
+    last_progress: float = -1.0
+
+    def wait(self) -> Tuple[str, Dict[str, Any]]:
+        self.event.wait()
+        return self.outcome, self.info
+
+class TorrentMonitor:
+    """Tracks the torrents of one qBittorrent instance through sync/maindata"""
+
+    def __init__(self, client_factory: Callable[[], Any], poll_interval: float = POLL_INTERVAL):
+        self._client_factory = client_factory
+        self._client = None
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._watches: Dict[str, list] = {}
+        self._torrents: Dict[str, Dict[str, Any]] = {}
+        self._rid = 0
+        self._thread: Optional[threading.Thread] = None
+        self.requests = 0
+
+    def watch(self, torrent_hash: str, timeout: float = 7200, stall_timeout: float = STALL_TIMEOUT,
+              on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> TorrentWatch:
+        """Starts watching a torrent (by info-hash); the returned watch fires once"""
+        w = TorrentWatch(torrent_hash.lower(), time.monotonic() + timeout, stall_timeout, on_progress)
+        with self._lock:
+            self._watches.setdefault(w.torrent_hash, []).append(w)
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="torrent-monitor", daemon=True)
+                self._thread.start()
+        return w
+
+    def wait(self, torrent_hash: str, timeout: float = 7200, stall_timeout: float = STALL_TIMEOUT,
+             on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[str, Dict[str, Any]]:
+        """Blocks until the torrent completes, stalls, fails, disappears or times out"""
+        return self.watch(torrent_hash, timeout, stall_timeout, on_progress).wait()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rid": self._rid,
+                "known_torrents": len(self._torrents),
+                "watched": {h: len(ws) for h, ws in self._watches.items()},
+                "sync_requests": self.requests,
+            }
+
+    def _sync(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        data = self._client.sync_maindata(rid=self._rid)
+        self.requests += 1
+        if data.get("full_update"):
+            self._torrents = {}
+        for h, changes in (data.get("torrents") or {}).items():
+            self._torrents.setdefault(h.lower(), {}).update(changes)
+        for h in data.get("torrents_removed") or []:
+            self._torrents.pop(h.lower(), None)
+        self._rid = data.get("rid", 0)
+
+    def _fire(self, w: TorrentWatch, outcome: str, info: Dict[str, Any]):
+        w.outcome = outcome
+        w.info = dict(info)
+        w.event.set()
+
+    def _check(self, w: TorrentWatch, info: Optional[Dict[str, Any]], now: float) -> bool:
+        """Dispatches the watch's outcome if it has one; True when the watch is done"""
+        if info is None:
+            # Not in the client: either not picked up yet (the add is asynchronous) or deleted
+            if w.last_progress >= 0:
+                self._fire(w, "removed", {})
+                return True
+        else:
+            progress = float(info.get("progress", 0))
+            if info.get("dlspeed", 0) > 0 or progress > w.last_progress:
+                w.last_activity = now
+            if progress != w.last_progress:
+                w.last_progress = progress
+                if w.on_progress:
+                    try:
+                        w.on_progress(info)
+                    except Exception as e:
+                        print(f"Torrent monitor: progress callback failed: {e}")
+            state = info.get("state", "")
+            if state in COMPLETE_STATES or progress >= 1:
+                self._fire(w, "completed", info)
+                return True
+            if state in ERROR_STATES:
+                self._fire(w, "error", info)
+                return True
+        if now - w.last_activity > w.stall_timeout:
+            self._fire(w, "stalled", info or {})
+            return True
+        if now > w.deadline:
+            self._fire(w, "timeout", info or {})
+            return True
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                self._sync()
+                delay = self.poll_interval
+            except Exception as e:
+                print(f"Torrent monitor: sync failed: {e}")
+                self._client, self._rid = None, 0   # Log in again and start over with a full update
+                delay = RECONNECT_DELAY
+            now = time.monotonic()
+            with self._lock:
+                for h in list(self._watches):
+                    info = self._torrents.get(h)
+                    self._watches[h] = [w for w in self._watches[h] if not self._check(w, info, now)]
+                    if not self._watches[h]:
+                        del self._watches[h]
+                if not self._watches:
+                    self._thread = None
+                    return
+            time.sleep(delay)
+
+# ---- One monitor per qBittorrent instance ----
+
+_monitors: Dict[Tuple[str, int, str], TorrentMonitor] = {}
+_monitors_lock = threading.Lock()
+
+def connect(qbt_host: str = "localhost", qbt_port: int = 8080, qbt_username: str = "admin",
+            qbt_password: str = "adminadmin"):
+    """Logged-in qBittorrent Web API client"""
+    from qbittorrentapi import Client
+    client = Client(host=qbt_host, port=qbt_port, username=qbt_username, password=qbt_password)
+    client.auth_log_in()
+    return client
+
+def get_monitor(qbt_host: str = "localhost", qbt_port: int = 8080, qbt_username: str = "admin",
+                qbt_password: str = "adminadmin") -> TorrentMonitor:
+    key = (qbt_host, int(qbt_port), qbt_username)
+    with _monitors_lock:
+        monitor = _monitors.get(key)
+        if monitor is None:
+            monitor = TorrentMonitor(lambda: connect(qbt_host, qbt_port, qbt_username, qbt_password))
+            _monitors[key] = monitor
+        return monitor
+
+def status() -> Dict[str, Any]:
+    with _monitors_lock:
+        return {f"{host}:{port}": m.snapshot() for (host, port, _), m in _monitors.items()}
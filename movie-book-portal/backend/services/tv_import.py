@@ -0,0 +1,267 @@
+"""
+Bulk import of TV episodes from a directory or an archive.
+
+The source is walked once, every video file is matched to a season and an
+episode number (S01E02, 1x02, "Season 1 Episode 2", "1 сезон 2 серия", or
+an episode number with the season taken from a folder name such as
+"Season 1" / "S01" / "Сезон 1"), the files are moved into
+uploads/tvshows/<id>/ with renames, their durations are probed in parallel
+and all episodes are inserted in a single transaction together with the
+show's episodes_count and season_count. If the transaction fails, the files
+are moved back.
+"""
+import os
+import re
+import shutil
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from database_tvshows import Episode, Tvshow
+from services import media_probe, media_store
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TVSHOWS_DIR = os.path.join(BASE_DIR, "uploads", "tvshows")
+STAGING_DIR = os.path.join(TVSHOWS_DIR, ".import")   # Archives are unpacked here: same filesystem, so moves are renames
+
+# Server-side folders an import may read from (os.pathsep-separated)
+IMPORT_ROOTS = [os.path.abspath(p) for p in os.environ.get(
+    "TV_IMPORT_ROOTS", os.path.join(BASE_DIR, "uploads", "import")).split(os.pathsep) if p]
+PROBE_WORKERS = 4
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv", ".webm", ".m4v", ".3gp", ".3g2", ".ogv", ".qt"}
+
+# Season and episode in the file name, most specific first
+SEASON_EPISODE_PATTERNS = [
+    re.compile(r"[Ss](\d{1,2})[ ._-]?[Ee](\d{1,3})"),                                  # S01E02, s1.e2
+    re.compile(r"(?<!\d)(\d{1,2})[xXх](\d{2,3})(?!\d)"),                                # 1x02
+    re.compile(r"season[ ._-]*(\d{1,2})[ ._-]*ep(?:isode)?[ ._-]*(\d{1,3})", re.I),     # Season 1 Episode 2
+    re.compile(r"сезон[ ._-]*(\d{1,2}).*?сери[яи][ ._-]*(\d{1,3})", re.I),              # Сезон 1 серия 2
+    re.compile(r"(\d{1,2})[ ._-]*сезон.*?(\d{1,3})[ ._-]*сери\w*", re.I),               # 1 сезон 2 серия
+]
+# Episode only: the season comes from a folder name or the request
+EPISODE_PATTERNS = [
+    re.compile(r"(?:^|[ ._-])(?:ep?|episode)[ ._-]?(\d{1,3})(?!\d)", re.I),            # E02, Ep 2, Episode 2
+    re.compile(r"сери[яи][ ._-]*(\d{1,3})", re.I),                                       # Серия 2
+    re.compile(r"(\d{1,3})[ ._-]*сери\w*", re.I),                                        # 2 серия
+    re.compile(r"^(\d{1,3})(?!\d)"),                                                     # 02. Title.mkv
+]
+SEASON_DIR_PATTERNS = [
+    re.compile(r"^(?:season|s|сезон)[ ._-]*(\d{1,2})$", re.I),                          # Season 1, S01, Сезон 1
+    re.compile(r"^(\d{1,2})[ ._-]*(?:season|сезон)$", re.I),                             # 1 сезон
+    re.compile(r"[Ss](\d{1,2})(?![\dEe])"),                                              # Show.S01.1080p
+]
+RELEASE_TAG = re.compile(r"\b(2160p|1080p|720p|480p|web-?dl|web-?rip|bdrip|hdtv|hdrip|x264|x265|h\.?264|hevc)\b", re.I)
+
+@dataclass
+class ImportCandidate:
+    source: str                       # Absolute path of the file to import
+    season: Optional[int]
+    episode: Optional[int]
+    title: Optional[str]
+    size: int
+    target: Optional[str] = None      # Path relative to BASE_DIR after the move
+    status: str = "new"               # new / exists / duplicate / unmatched
+
+class TvImportError(ValueError):
+    """The import cannot start (bad source, unknown show); the message is meant for the user"""
+
+class TvshowNotFound(TvImportError):
+    """The show to import into does not exist"""
+
+def _episode_title(rest: str) -> Optional[str]:
+    """Whatever follows the episode marker, minus release tags: 'Pilot' from '.Pilot.1080p.WEB-DL'"""
+    rest = re.sub(r"[._]", " ", rest)
+    tag = RELEASE_TAG.search(rest)
+    if tag:
+        rest = rest[:tag.start()]
+    rest = rest.strip(" -[]()")
+    return rest or None
+
+def season_from_dirs(rel_dir: str) -> Optional[int]:
+    """Season number from the nearest folder that names one"""
+    for part in reversed([p for p in re.split(r"[\\/]", rel_dir) if p]):
+        for pattern in SEASON_DIR_PATTERNS:
+            match = pattern.search(part)
+            if match:
+                return int(match.group(1))
+    return None
+
+def parse_episode(filename: str, folder_season: Optional[int] = None) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    """
+    (season, episode, title) from a file name; season falls back to folder_season.
+    Unrecognized names give (folder_season, None, None).
+    """
+    stem = os.path.splitext(filename)[0]
+    for pattern in SEASON_EPISODE_PATTERNS:
+        match = pattern.search(stem)
+        if match:
+            return int(match.group(1)), int(match.group(2)), _episode_title(stem[match.end():])
+    for pattern in EPISODE_PATTERNS:
+        match = pattern.search(stem)
+        if match:
+            return folder_season, int(match.group(1)), _episode_title(stem[match.end():])
+    return folder_season, None, None
+
+def check_source(path: str) -> str:
+    """Absolute source folder, if it lies inside one of IMPORT_ROOTS"""
+    source = os.path.realpath(path)
+    if not any(source == root or source.startswith(root + os.sep) for root in map(os.path.realpath, IMPORT_ROOTS)):
+        raise TvImportError(f"Import folder must be inside: {', '.join(IMPORT_ROOTS)}")
+    if not os.path.isdir(source):
+        raise TvImportError(f"Folder not found: {path}")
+    return source
+
+def scan(source_dir: str, default_season: Optional[int] = None) -> List[ImportCandidate]:
+    """Every video file under source_dir with its parsed season and episode"""
+    candidates = []
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        folder_season = season_from_dirs(os.path.relpath(dirpath, source_dir))
+        if folder_season is None:
+            folder_season = default_season
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() not in VIDEO_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            season, episode, title = parse_episode(name, folder_season)
+            candidates.append(ImportCandidate(
+                source=path, season=season, episode=episode, title=title, size=os.path.getsize(path),
+                status="new" if season is not None and episode is not None else "unmatched",
+            ))
+    return candidates
+
+def _move(source: str, target: str):
+    try:
+        os.replace(source, target)
+    except OSError:
+        # Another filesystem: rename is impossible, fall back to copy + delete
+        shutil.move(source, target)
+
+def import_directory(db, tvshow_id: int, source_dir: str, default_season: Optional[int] = None,
+                     overwrite: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Imports every recognizable episode under source_dir into a show.
+
+    Args:
+        db: tvshows session
+        tvshow_id: Show to import into
+        source_dir: Folder to read (already checked, see check_source)
+        default_season: Season for files whose name and folders do not tell
+        overwrite: Replace episodes that already exist (otherwise they are skipped)
+        dry_run: Only report what would be imported
+
+    Returns:
+        {"imported": [...], "skipped": [...], "unmatched": [...], "episodes_count", "season_count"}
+    """
+    tvshow = db.query(Tvshow).filter(Tvshow.id == tvshow_id).first()
+    if not tvshow:
+        raise TvshowNotFound("Tvshow not found")
+
+    candidates = scan(source_dir, default_season)
+    existing = {(e.season_number, e.episode_number): e
+                for e in db.query(Episode).filter(Episode.tvshow_id == tvshow_id).all()}
+    seen = set()
+    # Two files for one episode: the largest (best quality) wins
+    for c in sorted(candidates, key=lambda c: (-c.size, len(c.source))):
+        if c.status != "new":
+            continue
+        key = (c.season, c.episode)
+        if key in seen:
+            c.status = "duplicate"
+            continue
+        seen.add(key)
+        if key in existing and not overwrite:
+            c.status = "exists"
+            continue
+        c.target = (f"uploads/tvshows/{tvshow_id}/S{c.season:02d}E{c.episode:02d}_"
+                    f"{os.path.basename(c.source)}")
+    todo = [c for c in candidates if c.status == "new"]
+
+    if not dry_run and todo:
+        os.makedirs(os.path.join(TVSHOWS_DIR, str(tvshow_id)), exist_ok=True)
+        moved = []
+        try:
+            for c in todo:
+                _move(c.source, os.path.join(BASE_DIR, c.target))
+                moved.append(c)
+            with ThreadPoolExecutor(PROBE_WORKERS, thread_name_prefix="tv-import-probe") as pool:
+                durations = list(pool.map(
+                    lambda c: media_probe.duration(media_probe.probe(os.path.join(BASE_DIR, c.target))), todo))
+
+            replaced = []
+            for c, duration in zip(todo, durations):
+                episode = existing.get((c.season, c.episode))
+                if episode is None:
+                    episode = Episode(tvshow_id=tvshow_id, season_number=c.season, episode_number=c.episode)
+                    db.add(episode)
+                elif episode.file_path and episode.file_path != c.target:
+                    replaced.append(episode.file_path)
+                episode.title = c.title or episode.title
+                episode.file_path = c.target
+                episode.duration = duration
+            db.flush()
+            tvshow.episodes_count = db.query(func.count(Episode.id)).filter(Episode.tvshow_id == tvshow_id).scalar()
+            tvshow.season_count = (db.query(func.count(func.distinct(Episode.season_number)))
+                                   .filter(Episode.tvshow_id == tvshow_id).scalar())
+            db.commit()
+        except Exception:
+            db.rollback()
+            for c in reversed(moved):
+                try:
+                    _move(os.path.join(BASE_DIR, c.target), c.source)
+                except OSError as e:
+                    print(f"TV import: could not move {c.target} back: {e}")
+            raise
+        for old in replaced:
+            try:
+                media_store.release(os.path.join(BASE_DIR, old))
+            except OSError:
+                pass
+        print(f"TV import: {len(todo)} episodes added to tvshow {tvshow_id}")
+
+    def report(c: ImportCandidate) -> Dict[str, Any]:
+        item = asdict(c)
+        item["source"] = os.path.relpath(c.source, source_dir).replace(os.sep, "/")
+        return item
+
+    return {
+        "dry_run": dry_run,
+        "imported": [report(c) for c in todo],
+        "skipped": [report(c) for c in candidates if c.status in ("exists", "duplicate")],
+        "unmatched": [report(c) for c in candidates if c.status == "unmatched"],
+        "episodes_count": tvshow.episodes_count,
+        "season_count": tvshow.season_count,
+    }
+
+def unpack_archive(archive_path: str, dest: str):
+    """Extracts the video files of a zip / tar archive, refusing paths that leave dest"""
+    dest = os.path.realpath(dest)
+
+    def safe(name: str) -> Optional[str]:
+        target = os.path.realpath(os.path.join(dest, name))
+        if not target.startswith(dest + os.sep) or os.path.splitext(name)[1].lower() not in VIDEO_EXTENSIONS:
+            return None
+        return target
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                target = None if member.is_dir() else safe(member.filename)
+                if target:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with archive.open(member) as src, open(target, "wb") as out:
+                        shutil.copyfileobj(src, out, 1024 * 1024)
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path) as archive:
+            for member in archive.getmembers():
+                target = safe(member.name) if member.isfile() else None
+                if target:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with archive.extractfile(member) as src, open(target, "wb") as out:
+                        shutil.copyfileobj(src, out, 1024 * 1024)
+    else:
+        raise TvImportError("Unsupported archive (zip or tar expected)")
@@ -5,8 +5,9 @@ import subprocess
 import os
 import shutil
 import re
-from typing import Optional
+from typing import Callable, Optional
 from datetime import datetime
+from services import media_probe, media_store
 
 try:
     from tqdm import tqdm
@@ -29,25 +30,16 @@ def log_message(message: str, log_file: str = None):
 
 def check_ffmpeg_available() -> bool:
     """
-    Check if FFmpeg is installed and available in PATH
+    Check if FFmpeg is installed and available in PATH (cached, see media_probe)
     
     Returns:
         True if FFmpeg is available, False otherwise
     """
-    try:
-        result = subprocess.run(
-            ['ffmpeg', '-version'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        return result.returncode == 0
-    except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-        return False
+    return media_probe.ffmpeg_available()
 
 def get_video_info(video_path: str) -> Optional[dict]:
     """
-    Get video file information using FFprobe
+    Get video file information using FFprobe (probed once per file version)
     
     Args:
         video_path: Path to video file
@@ -55,76 +47,67 @@ def get_video_info(video_path: str) -> Optional[dict]:
     Returns:
         Dictionary with video info or None
     """
-    try:
-        cmd = [
-            'ffprobe',
-            '-v', 'quiet',
-            '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
-            video_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode == 0:
-            import json
-            return json.loads(result.stdout)
-        return None
-    except Exception:
-        return None
+    return media_probe.probe(video_path)
 
-def convert_to_mp4(input_path: str, output_path: str, delete_source: bool = False, log_file: str = None) -> bool:
+def convert_to_mp4(input_path: str, output_path: str, delete_source: bool = False, log_file: str = None,
+                   conversion_plan: Optional[media_probe.Plan] = None,
+                   on_progress: Optional[Callable[[float], None]] = None) -> bool:
     """
-    Convert video file to MP4 format using FFmpeg with high quality settings
+    Convert video file to a browser-playable MP4 the cheapest way the source allows
+    (nothing, moving the index to the front, container remux, audio-only transcode
+    or full transcode, see media_probe.plan)
     
     Args:
         input_path: Path to input video file
         output_path: Path for output MP4 file
         delete_source: Whether to delete source file after successful conversion
         log_file: Optional path to log file
+        conversion_plan: Plan computed by the caller (probed and planned here otherwise)
+        on_progress: Called with the percentage done while FFmpeg runs
         
     Returns:
         True if conversion successful, False otherwise
     """
+    temp_output = None
     try:
         if not os.path.exists(input_path):
             log_message(f"Input file not found: {input_path}", log_file)
             return False
         
-        if not check_ffmpeg_available():
-            log_message("FFmpeg is not available. Please install FFmpeg.", log_file)
-            return False
-        
         log_message(f"Processing video file: {input_path}", log_file)
         
-        # Always re-encode to ensure proper audio channels (stereo)
-        # Even if file is already MP4, it may have incompatible multi-channel audio
+        info = media_probe.probe(input_path)
+        if conversion_plan is None:
+            if not info:
+                log_message(f"Could not probe {input_path}, converting audio to be safe", log_file)
+            conversion_plan = media_probe.plan(info) if info else media_probe.Plan(action="audio")
+        log_message(
+            f"Conversion plan: {conversion_plan.action}"
+            + (f" ({', '.join(conversion_plan.reasons)})" if conversion_plan.reasons else ""),
+            log_file
+        )
         
         # Create output directory if needed
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
-        # FFmpeg command optimized for MAXIMUM SPEED
-        # Strategy: Copy video stream (no re-encoding), only convert audio to stereo
-        # This is 10-20x faster than re-encoding everything!
-        # -c:v copy = copy video stream without re-encoding (instant!)
-        # -c:a aac -ac 2 = only convert audio to stereo AAC (fast!)
-        cmd = [
-            'ffmpeg',
-            '-i', input_path,
-            '-c:v', 'copy',           # Copy video stream without re-encoding (FAST!)
-            '-c:a', 'aac',            # AAC audio codec
-            '-ac', '2',               # Force stereo audio (2 channels) for browser compatibility
-            '-b:a', '192k',           # Audio bitrate
-            '-movflags', '+faststart', # Enable streaming
-            '-y',                      # Overwrite output file
-            output_path
-        ]
+        if not conversion_plan.needs_ffmpeg:
+            return _place_unchanged(input_path, output_path, delete_source, log_file)
+        
+        if not check_ffmpeg_available():
+            log_message("FFmpeg is not available. Please install FFmpeg.", log_file)
+            return False
+        
+        # Only what the plan needs is re-encoded: copying a stream is 10-20x faster
+        # than transcoding it, and most sources only need their audio made stereo AAC
+        # FFmpeg writes next to the target, which is replaced only once the output is complete
+        temp_output = media_store.temp_path(output_path)
+        cmd = ['ffmpeg', '-i', input_path] + media_probe.ffmpeg_args(conversion_plan) + ['-y', temp_output]
         
         # Run conversion
         log_message(f"Running FFmpeg conversion...", log_file)
         
         # Get video duration for progress bar
-        duration_seconds = get_video_duration(input_path)
+        duration_seconds = media_probe.duration(info)
         
         process = subprocess.Popen(
             cmd,
@@ -140,7 +123,7 @@ def convert_to_mp4(input_path: str, output_path: str, delete_source: bool = Fals
         # Pattern to extract time from FFmpeg output (e.g., "time=00:01:23.45")
         time_pattern = re.compile(r'time=(\d+):(\d+):(\d+\.\d+)')
         
-        if TQDM_AVAILABLE and duration_seconds:
+        if TQDM_AVAILABLE and duration_seconds and not on_progress:
             pbar = tqdm(
                 total=duration_seconds,
                 desc="⏳ Конвертация",
@@ -154,7 +137,10 @@ def convert_to_mp4(input_path: str, output_path: str, delete_source: bool = Fals
             # Parse progress from FFmpeg output
             if 'time=' in line:
                 match = time_pattern.search(line)
-                if match and pbar:
+                if match and on_progress and duration_seconds:
+                    current_time = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+                    on_progress(min(100.0, current_time / duration_seconds * 100))
+                elif match and pbar:
                     hours = int(match.group(1))
                     minutes = int(match.group(2))
                     seconds = float(match.group(3))
@@ -163,7 +149,7 @@ def convert_to_mp4(input_path: str, output_path: str, delete_source: bool = Fals
                     # Update progress bar
                     pbar.n = min(current_time, duration_seconds)
                     pbar.refresh()
-                elif not TQDM_AVAILABLE and duration_seconds:
+                elif not TQDM_AVAILABLE and duration_seconds and not on_progress:
                     # Fallback: print progress without tqdm
                     match = time_pattern.search(line)
                     if match:
@@ -176,13 +162,14 @@ def convert_to_mp4(input_path: str, output_path: str, delete_source: bool = Fals
         
         if pbar:
             pbar.close()
-        elif not TQDM_AVAILABLE and duration_seconds:
+        elif not TQDM_AVAILABLE and duration_seconds and not on_progress:
             print()  # New line after progress
         
         # Wait for completion
         process.wait()
         
-        if process.returncode == 0 and os.path.exists(output_path):
+        if process.returncode == 0 and os.path.exists(temp_output):
+            media_store.replace(temp_output, output_path)
             output_size = os.path.getsize(output_path) / (1024**3)
             log_message(f"Conversion successful! Output size: {output_size:.2f} GB", log_file)
             
@@ -196,12 +183,37 @@ def convert_to_mp4(input_path: str, output_path: str, delete_source: bool = Fals
             
             return True
         else:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
             error_msg = '\n'.join(stderr_output[-10:])  # Last 10 lines
             log_message(f"Conversion failed. FFmpeg error:\n{error_msg}", log_file)
             return False
             
     except Exception as e:
         log_message(f"Error during conversion: {e}", log_file)
+        if temp_output and os.path.exists(temp_output):
+            os.remove(temp_output)
+        return False
+
+def _place_unchanged(input_path: str, output_path: str, delete_source: bool, log_file: str = None) -> bool:
+    """Puts an already compatible file at output_path without running FFmpeg"""
+    if os.path.realpath(input_path) == os.path.realpath(output_path):
+        log_message("File is already compatible, nothing to do", log_file)
+        return True
+    try:
+        with media_store.rewriting(output_path) as tmp:
+            if delete_source:
+                shutil.move(input_path, tmp)
+            else:
+                try:
+                    os.link(input_path, tmp)
+                except OSError:
+                    # Different filesystem (or no hardlinks): a plain copy
+                    shutil.copy2(input_path, tmp)
+        log_message(f"File is already compatible, placed as is: {output_path}", log_file)
+        return True
+    except Exception as e:
+        log_message(f"Could not place {input_path} at {output_path}: {e}", log_file)
         return False
 
 def is_video_file(filename: str) -> bool:
@@ -233,18 +245,4 @@ def get_video_duration(file_path: str) -> Optional[int]:
     Returns:
         Duration in seconds or None
     """
-    try:
-        cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            file_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            return int(float(result.stdout.strip()))
-        return None
-    except Exception:
-        return None
+    return int(media_probe.duration(media_probe.probe(file_path)) or 0) or None
@@ -0,0 +1,200 @@
+"""
+Per-user watch state of TV shows, kept next to playback progress.
+
+Episodes live in tvshows.db and progress in progress.db, so "what to play
+next" used to need every episode plus one progress request per episode.
+save_progress() now also calls record(), which keeps one EpisodeWatchState
+row per user and episode (with the season and episode numbers copied over)
+and a ShowWatchState summary per user and show. up_next() answers from one
+query on each database: the episode to play, where to resume it, per-season
+completion and prefetch hints for the episodes that follow.
+"""
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from database_progress import EpisodeWatchState, PlaybackProgress, ShowWatchState
+from database_tvshows import Episode
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WATCHED_RATIO = 0.9            # An episode counts as watched from 90%...
+CREDITS_SECONDS = 120          # ...or when less than this is left (end credits)
+PREFETCH_BYTES = 4 * 1024 * 1024   # Suggested first range to buffer (faststart MP4: index + first seconds)
+
+# File versions (path, size, mtime) ffprobe could not read: not probed again on every progress save
+_unprobeable: Set[Tuple[str, int, int]] = set()
+_unprobeable_lock = threading.Lock()
+
+def is_watched(position: float, duration: Optional[float]) -> bool:
+    if not duration or duration <= 0:
+        return False
+    return position >= duration * WATCHED_RATIO or (position >= duration / 2 and duration - position <= CREDITS_SECONDS)
+
+def _episode_duration(db_tvshows, episode: Episode) -> Optional[float]:
+    """
+    Stored duration, else probed once and stored. A file that cannot be
+    probed is remembered until it changes, so the save request does not wait
+    for ffprobe again.
+    """
+    if episode.duration:
+        return episode.duration
+    if not episode.file_path:
+        return None
+    path = os.path.join(BASE_DIR, episode.file_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    version = (path, st.st_size, int(st.st_mtime))
+    with _unprobeable_lock:
+        if version in _unprobeable:
+            return None
+    from services import media_probe
+    duration = media_probe.duration(media_probe.probe(path))
+    if duration:
+        episode.duration = duration
+        db_tvshows.commit()
+    else:
+        with _unprobeable_lock:
+            _unprobeable.add(version)
+    return duration
+
+def _summarize(db_progress, user_id: str, tvshow_id: int, last: Optional[EpisodeWatchState]):
+    show = db_progress.query(ShowWatchState).filter(
+        ShowWatchState.user_id == user_id, ShowWatchState.tvshow_id == tvshow_id).first()
+    if not show:
+        show = ShowWatchState(user_id=user_id, tvshow_id=tvshow_id)
+        db_progress.add(show)
+    if last is not None:
+        show.last_episode_id, show.last_season, show.last_episode = last.episode_id, last.season_number, last.episode_number
+    db_progress.flush()
+    show.watched_count = db_progress.query(EpisodeWatchState).filter(
+        EpisodeWatchState.user_id == user_id, EpisodeWatchState.tvshow_id == tvshow_id,
+        EpisodeWatchState.watched == True).count()  # noqa: E712
+    return show
+
+def record(db_progress, db_tvshows, user_id: str, episode_id: int, position: float,
+           duration: Optional[float] = None) -> Optional[EpisodeWatchState]:
+    """
+    Updates the watch state after a progress save. Commits db_progress.
+
+    Args:
+        duration: Length reported by the player (the stored or probed one otherwise)
+    """
+    episode = db_tvshows.query(Episode).filter(Episode.id == episode_id).first()
+    if not episode:
+        return None
+    duration = duration or _episode_duration(db_tvshows, episode)
+    if not db_progress.query(ShowWatchState).filter(
+            ShowWatchState.user_id == user_id, ShowWatchState.tvshow_id == episode.tvshow_id).first():
+        _backfill(db_progress, user_id, episode.tvshow_id,
+                  db_tvshows.query(Episode).filter(Episode.tvshow_id == episode.tvshow_id).all())
+    state = db_progress.query(EpisodeWatchState).filter(
+        EpisodeWatchState.user_id == user_id, EpisodeWatchState.episode_id == episode_id).first()
+    if not state:
+        state = EpisodeWatchState(user_id=user_id, episode_id=episode_id, watched=False)
+        db_progress.add(state)
+    state.tvshow_id = episode.tvshow_id
+    state.season_number, state.episode_number = episode.season_number, episode.episode_number
+    state.position, state.duration = position, duration
+    state.watched = bool(state.watched) or is_watched(position, duration)
+    _summarize(db_progress, user_id, episode.tvshow_id, state)
+    db_progress.commit()
+    return state
+
+def _backfill(db_progress, user_id: str, tvshow_id: int, episodes: List[Episode]):
+    """Builds the watch state of a show from progress saved before the state existed"""
+    by_id = {e.id: e for e in episodes}
+    rows = db_progress.query(PlaybackProgress).filter(
+        PlaybackProgress.user_id == user_id, PlaybackProgress.item_type == "episode",
+        PlaybackProgress.item_id.in_(list(by_id))).order_by(PlaybackProgress.last_updated).all()
+    last = None
+    for p in rows:
+        e = by_id[p.item_id]
+        last = EpisodeWatchState(user_id=user_id, tvshow_id=tvshow_id, episode_id=e.id,
+                                 season_number=e.season_number, episode_number=e.episode_number,
+                                 position=p.progress_seconds or 0.0, duration=e.duration,
+                                 watched=is_watched(p.progress_seconds or 0.0, e.duration))
+        db_progress.add(last)
+    _summarize(db_progress, user_id, tvshow_id, last)
+    db_progress.commit()
+
+def media_url(file_path: Optional[str]) -> Optional[str]:
+    """Percent-encoded URL of an uploaded file: Cyrillic names and spaces stay valid in a Link header"""
+    return "/" + quote(file_path.replace("\\", "/").lstrip("/")) if file_path else None
+
+def _episode_dict(e: Episode, state: Optional[EpisodeWatchState]) -> Dict[str, Any]:
+    return {
+        "episode_id": e.id,
+        "season_number": e.season_number,
+        "episode_number": e.episode_number,
+        "title": e.title,
+        "duration": e.duration,
+        "url": media_url(e.file_path),
+        "resume_from": state.position if state and not state.watched else 0.0,
+        "watched": bool(state and state.watched),
+    }
+
+def up_next(db_progress, db_tvshows, user_id: str, tvshow_id: int) -> Dict[str, Any]:
+    """
+    Next episode to play for a user and per-season completion.
+
+    The last episode played is resumed while unfinished; otherwise the first
+    unwatched episode after it is next (wrapping to the first unwatched one).
+    "next" is None when every episode is watched.
+    """
+    episodes = (db_tvshows.query(Episode).filter(Episode.tvshow_id == tvshow_id)
+                .order_by(Episode.season_number, Episode.episode_number).all())
+    show = db_progress.query(ShowWatchState).filter(
+        ShowWatchState.user_id == user_id, ShowWatchState.tvshow_id == tvshow_id).first()
+    if show is None and episodes:
+        _backfill(db_progress, user_id, tvshow_id, episodes)
+        show = db_progress.query(ShowWatchState).filter(
+            ShowWatchState.user_id == user_id, ShowWatchState.tvshow_id == tvshow_id).first()
+    states = {s.episode_id: s for s in db_progress.query(EpisodeWatchState).filter(
+        EpisodeWatchState.user_id == user_id, EpisodeWatchState.tvshow_id == tvshow_id).all()}
+
+    playable = [e for e in episodes if e.file_path]
+    index = {e.id: i for i, e in enumerate(playable)}
+    last_i = index.get(show.last_episode_id) if show else None
+    next_i = None
+    if last_i is not None and not (states.get(playable[last_i].id) and states[playable[last_i].id].watched):
+        next_i = last_i
+    else:
+        start = last_i + 1 if last_i is not None else 0
+        order = list(range(start, len(playable))) + list(range(0, start))
+        next_i = next((i for i in order if not (states.get(playable[i].id) and states[playable[i].id].watched)), None)
+
+    seasons: Dict[int, Dict[str, Any]] = {}
+    for e in episodes:
+        season = seasons.setdefault(e.season_number, {"season_number": e.season_number, "episodes": 0,
+                                                      "watched": 0, "in_progress": 0})
+        state = states.get(e.id)
+        season["episodes"] += 1
+        if state and state.watched:
+            season["watched"] += 1
+        elif state and state.position:
+            season["in_progress"] += 1
+    for season in seasons.values():
+        season["completion"] = round(season["watched"] / season["episodes"], 3)
+        season["completed"] = season["watched"] == season["episodes"]
+
+    next_episode = _episode_dict(playable[next_i], states.get(playable[next_i].id)) if next_i is not None else None
+    # While "next" plays, the one after it is what the client should start buffering
+    prefetch = []
+    if next_i is not None:
+        following = playable[next_i + 1: next_i + 3]
+        prefetch = [{"episode_id": e.id, "url": media_url(e.file_path), "range": f"bytes=0-{PREFETCH_BYTES - 1}"}
+                    for e in following]
+    return {
+        "tvshow_id": tvshow_id,
+        "next": next_episode,
+        "finished": bool(playable) and next_i is None,
+        "watched_episodes": sum(s["watched"] for s in seasons.values()),
+        "total_episodes": len(episodes),
+        "last_episode_id": show.last_episode_id if show else None,
+        "seasons": [seasons[k] for k in sorted(seasons)],
+        "prefetch": prefetch,
+    }
@@ -1,19 +1,21 @@
 import os
 import io
+import struct
+import zlib
 import fitz  # PyMuPDF
 import zipfile
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
 from PIL import Image
-from PIL import Image
 import shutil
 from fastapi import Request, HTTPException, Response
-from fastapi.responses import StreamingResponse
+from services import media_store
 
 AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.m4b', '.aac', '.flac', '.wav', '.ogg'}
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+COVER_NAMES = ['cover', 'folder', 'album', 'front', 'art']
+ZIP_STREAM_CHUNK_SIZE = 1024 * 1024
 
 def range_requests_response(
     request: Request, file_path: str, content_type: str
@@ -100,6 +102,333 @@ def unzip_file(zip_path, dest_dir):
         print(f"Error unzipping file {zip_path}: {e}")
         return None
 
+_ZIP_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_ZIP_LOCAL_SIG = b'PK\x03\x04'
+_ZIP_CENTRAL_SIG = b'PK\x01\x02'
+_ZIP_END_SIG = b'PK\x05\x06'
+_ZIP_DESCRIPTOR_SIG = b'PK\x07\x08'
+
+def _cover_rank(filename):
+    """
+    Ranks an image as a cover candidate (lower is better), None if not an image.
+    Same preference order as find_thumbnail_in_dir.
+    """
+    name, ext = os.path.splitext(os.path.basename(filename).lower())
+    if ext not in IMAGE_EXTENSIONS:
+        return None
+    if name in COVER_NAMES:
+        return 0
+    if 'cover' in name or 'folder' in name:
+        return 1
+    return 2
+
+class _ZipStreamEntry:
+    __slots__ = ("name", "path", "tmp", "out", "is_dir", "has_descriptor", "zip64",
+                 "crc", "usize", "remaining", "decompressor", "crc_out", "size_out")
+
+class StreamingZipExtractor:
+    """
+    Extracts a ZIP archive while it is still being received.
+
+    Chunks are passed in order to feed(); each entry is written straight into
+    dest_dir (next to its final name, renamed once its CRC checks out), so
+    neither the archive nor a temporary copy of it is ever kept.
+    Audio tracks and the best cover candidate are collected in the same pass.
+    Supports stored and deflated entries, data descriptors and ZIP64 sizes.
+    """
+
+    def __init__(self, dest_dir):
+        self.dest_dir = os.path.abspath(dest_dir)
+        self.audio_files = []
+        self.cover_path = None
+        self._cover_rank = None
+        self._written = []
+        self._buffer = bytearray()
+        self._state = "header"
+        self._started = False
+        self._entry = None
+        os.makedirs(self.dest_dir, exist_ok=True)
+
+    def feed(self, data):
+        if not data or self._state == "done":
+            return
+        self._buffer += data
+        while self._step():
+            pass
+
+    def close(self):
+        """
+        Finishes extraction. Raises zipfile.BadZipFile if the stream ended early.
+        Returns the sorted list of extracted audio files.
+        """
+        if self._state != "done":
+            if not self._started:
+                raise zipfile.BadZipFile("Not a ZIP archive")
+            raise zipfile.BadZipFile("Unexpected end of ZIP stream")
+        self.audio_files.sort()
+        return self.audio_files
+
+    def abort(self):
+        """Removes everything written so far (used when the stream fails)."""
+        if self._entry is not None:
+            if self._entry.out:
+                self._entry.out.close()
+            if self._entry.tmp and os.path.exists(self._entry.tmp):
+                os.remove(self._entry.tmp)
+        for path in self._written:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        for root, dirs, files in os.walk(self.dest_dir, topdown=False):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+        self.audio_files = []
+        self.cover_path = None
+        self._state = "done"
+
+    def _step(self):
+        if self._state == "header":
+            return self._read_header()
+        if self._state == "data":
+            return self._read_data()
+        if self._state == "descriptor":
+            return self._read_descriptor()
+        return False
+
+    def _read_header(self):
+        buf = self._buffer
+        if len(buf) < 4:
+            return False
+        sig = bytes(buf[:4])
+        if sig in (_ZIP_CENTRAL_SIG, _ZIP_END_SIG):
+            # Central directory reached: every entry has already been extracted
+            self._started = True
+            self._state = "done"
+            self._buffer = bytearray()
+            return False
+        if sig != _ZIP_LOCAL_SIG:
+            raise zipfile.BadZipFile("Corrupted ZIP stream" if self._started else "Not a ZIP archive")
+        if len(buf) < _ZIP_LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, csize, usize,
+         name_len, extra_len) = _ZIP_LOCAL_HEADER.unpack_from(buf)
+        header_len = _ZIP_LOCAL_HEADER.size + name_len + extra_len
+        if len(buf) < header_len:
+            return False
+        raw_name = bytes(buf[_ZIP_LOCAL_HEADER.size:_ZIP_LOCAL_HEADER.size + name_len])
+        extra = bytes(buf[_ZIP_LOCAL_HEADER.size + name_len:header_len])
+        del buf[:header_len]
+        self._started = True
+
+        if flags & 0x1:
+            raise zipfile.BadZipFile("Encrypted ZIP entries are not supported")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise zipfile.BadZipFile(f"Unsupported ZIP compression method: {method}")
+
+        e = _ZipStreamEntry()
+        e.name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437', errors='replace')
+        e.has_descriptor = bool(flags & 0x8)
+        e.zip64 = False
+        e.crc = crc
+        e.usize = usize
+
+        # ZIP64 extra field carries the real sizes when the header has 0xFFFFFFFF
+        pos = 0
+        while pos + 4 <= len(extra):
+            field_id, field_len = struct.unpack_from('<HH', extra, pos)
+            if field_id == 0x0001:
+                e.zip64 = True
+                field = extra[pos + 4:pos + 4 + field_len]
+                offset = 0
+                if usize == 0xFFFFFFFF and offset + 8 <= len(field):
+                    e.usize = struct.unpack_from('<Q', field, offset)[0]
+                    offset += 8
+                if csize == 0xFFFFFFFF and offset + 8 <= len(field):
+                    csize = struct.unpack_from('<Q', field, offset)[0]
+            pos += 4 + field_len
+
+        if e.has_descriptor and (csize == 0 or method == zipfile.ZIP_DEFLATED):
+            e.remaining = None  # size is only known from the trailing data descriptor
+        else:
+            e.remaining = csize
+        e.decompressor = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+        e.crc_out = 0
+        e.size_out = 0
+
+        e.path = self._target_path(e.name)
+        e.is_dir = e.name.replace('\\', '/').endswith('/')
+        e.out = None
+        e.tmp = None
+        if e.path:
+            if e.is_dir:
+                os.makedirs(e.path, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(e.path), exist_ok=True)
+                e.tmp = media_store.temp_path(e.path)
+                e.out = open(e.tmp, 'wb')
+
+        self._entry = e
+        self._state = "data"
+        return True
+
+    def _target_path(self, name):
+        # Same sanitizing rules as ZipFile.extract: no absolute paths, no "..", no drive letters
+        name = os.path.splitdrive(name.replace('\\', '/'))[1]
+        parts = [p for p in name.split('/') if p not in ('', '.', '..')]
+        if not parts:
+            return None
+        return os.path.join(self.dest_dir, *parts)
+
+    def _write(self, data):
+        e = self._entry
+        if not data:
+            return
+        if e.out:
+            e.out.write(data)
+        e.crc_out = zlib.crc32(data, e.crc_out)
+        e.size_out += len(data)
+
+    def _consume(self, chunk):
+        d = self._entry.decompressor
+        if d is None:
+            self._write(chunk)
+            return
+        # Bounded output per call so a highly compressible entry cannot blow up memory
+        self._write(d.decompress(chunk, ZIP_STREAM_CHUNK_SIZE))
+        while d.unconsumed_tail:
+            self._write(d.decompress(d.unconsumed_tail, ZIP_STREAM_CHUNK_SIZE))
+
+    def _read_data(self):
+        e = self._entry
+        buf = self._buffer
+        if e.remaining is not None:
+            if e.remaining and not buf:
+                return False
+            take = min(len(buf), e.remaining)
+            chunk = bytes(buf[:take])
+            del buf[:take]
+            e.remaining -= take
+            self._consume(chunk)
+            if e.remaining == 0:
+                if e.decompressor is not None:
+                    self._write(e.decompressor.flush())
+                return self._end_data()
+            return True
+
+        if not buf:
+            return False
+
+        if e.decompressor is not None:
+            # Deflate streams are self-terminating, so the entry end is found without sizes
+            chunk = bytes(buf)
+            buf.clear()
+            self._consume(chunk)
+            if e.decompressor.eof:
+                self._buffer[:0] = e.decompressor.unused_data
+                return self._end_data()
+            return True
+
+        return self._scan_stored()
+
+    def _scan_stored(self):
+        # Stored entry of unknown size: the data ends at a descriptor whose CRC and size match
+        e = self._entry
+        buf = self._buffer
+        size_len = 8 if e.zip64 else 4
+        desc_len = 8 + 2 * size_len
+        start = 0
+        while True:
+            idx = buf.find(_ZIP_DESCRIPTOR_SIG, start)
+            if idx < 0:
+                break
+            if len(buf) < idx + desc_len:
+                if idx:
+                    self._write(bytes(buf[:idx]))
+                    del buf[:idx]
+                    return True
+                return False
+            crc = struct.unpack_from('<I', buf, idx + 4)[0]
+            csize = struct.unpack_from('<Q' if e.zip64 else '<I', buf, idx + 8)[0]
+            candidate = bytes(buf[:idx])
+            if csize == e.size_out + idx and crc == zlib.crc32(candidate, e.crc_out):
+                self._write(candidate)
+                del buf[:idx + desc_len]
+                self._finish_entry(crc, e.size_out)
+                return True
+            start = idx + 1
+
+        # Keep a few trailing bytes in case they start a descriptor signature
+        flush = len(buf) - 3
+        if flush > 0:
+            self._write(bytes(buf[:flush]))
+            del buf[:flush]
+            return True
+        return False
+
+    def _end_data(self):
+        e = self._entry
+        if e.has_descriptor:
+            self._state = "descriptor"
+        else:
+            self._finish_entry(e.crc, e.usize)
+        return True
+
+    def _read_descriptor(self):
+        e = self._entry
+        buf = self._buffer
+        size_len = 8 if e.zip64 else 4
+        if len(buf) < 4:
+            return False
+        offset = 4 if bytes(buf[:4]) == _ZIP_DESCRIPTOR_SIG else 0
+        if len(buf) < offset + 4 + 2 * size_len:
+            return False
+        crc = struct.unpack_from('<I', buf, offset)[0]
+        usize = struct.unpack_from('<Q' if e.zip64 else '<I', buf, offset + 4 + size_len)[0]
+        del buf[:offset + 4 + 2 * size_len]
+        self._finish_entry(crc, usize)
+        return True
+
+    def _finish_entry(self, crc, usize):
+        e = self._entry
+        if e.out:
+            e.out.close()
+            e.out = None
+        if e.crc_out != crc or e.size_out != usize:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {e.name!r}")
+        if e.tmp:
+            media_store.replace(e.tmp, e.path)
+            e.tmp = None
+            self._written.append(e.path)
+        if e.path and not e.is_dir:
+            ext = os.path.splitext(e.path.lower())[1]
+            if ext in AUDIO_EXTENSIONS:
+                self.audio_files.append(e.path)
+            rank = _cover_rank(e.path)
+            if rank is not None and (self._cover_rank is None or rank < self._cover_rank):
+                self._cover_rank = rank
+                self.cover_path = e.path
+        self._entry = None
+        self._state = "header"
+
+def extract_zip_stream(chunks, dest_dir):
+    """
+    Extracts a ZIP archive from an iterable of byte chunks (e.g. response.iter_content).
+    Returns the StreamingZipExtractor with audio_files and cover_path filled in.
+    On failure the partially extracted files are removed and the error is re-raised.
+    """
+    extractor = StreamingZipExtractor(dest_dir)
+    try:
+        for chunk in chunks:
+            extractor.feed(chunk)
+        extractor.close()
+    except Exception:
+        extractor.abort()
+        raise
+    return extractor
+
 def get_epub_page_count(file_path):
     """
     Extracts the page count (number of spine items) from an EPUB file.
@@ -175,14 +504,12 @@ def find_thumbnail_in_dir(directory):
     """
     Looks for a common cover image file in the directory.
     """
-    common_names = ['cover', 'folder', 'album', 'front', 'art']
-    
     # First search for exact matches of common names
     for root, dirs, files in os.walk(directory):
         for file in files:
             name, ext = os.path.splitext(file.lower())
             if ext in IMAGE_EXTENSIONS:
-                if name in common_names:
+                if name in COVER_NAMES:
                     return os.path.join(root, file)
                 
     # If not found, look for any image that might be a cover (e.g. contains 'cover')
@@ -0,0 +1,40 @@
+// Writes .br and .gz next to the text files of dist/assets after `vite build`.
+// The backend (PrecompressedStaticFiles) serves them to clients that accept
+// the encoding, so the bundles are compressed once at maximum level instead
+// of on every request. Node's zlib has brotli built in: no extra dependency.
+import { readdirSync, readFileSync, statSync, writeFileSync } from 'node:fs'
+import { extname, join } from 'node:path'
+import { brotliCompressSync, constants, gzipSync } from 'node:zlib'
+
+const ASSETS_DIR = new URL('../dist/assets/', import.meta.url).pathname
+const EXTENSIONS = new Set(['.js', '.mjs', '.css', '.html', '.json', '.svg', '.txt', '.xml', '.webmanifest', '.map'])
+const MIN_SIZE = 1024
+
+const files = (dir) => readdirSync(dir, { withFileTypes: true }).flatMap((entry) =>
+  entry.isDirectory() ? files(join(dir, entry.name)) : [join(dir, entry.name)])
+
+let written = 0
+let before = 0
+let after = 0
+for (const file of files(ASSETS_DIR)) {
+  if (!EXTENSIONS.has(extname(file)) || statSync(file).size < MIN_SIZE) continue
+  const data = readFileSync(file)
+  const variants = {
+    '.br': brotliCompressSync(data, {
+      params: {
+        [constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY,
+        [constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+      },
+    }),
+    '.gz': gzipSync(data, { level: constants.Z_BEST_COMPRESSION }),
+  }
+  for (const [suffix, compressed] of Object.entries(variants)) {
+    // A sidecar that does not save anything would only cost a lookup
+    if (compressed.length >= data.length) continue
+    writeFileSync(file + suffix, compressed)
+    written++
+  }
+  before += data.length
+  after += variants['.br'].length
+}
+console.log(`precompress: ${written} sidecars, ${(before / 1024).toFixed(0)} KB -> ${(after / 1024).toFixed(0)} KB (br)`)
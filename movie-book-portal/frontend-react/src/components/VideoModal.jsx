@@ -125,7 +125,10 @@ export default function VideoModal({ item, onClose, onNext, onPrev, onDelete })
         try {
             const res = await fetch(`/api/videogallery/optimize?path=${encodeURIComponent(item.path)}`, { method: 'POST' });
             if (res.ok) {
-                alert("Оптимизация запущена! Видео станет загружаться быстрее через пару минут.");
+                const data = await res.json();
+                alert(data.status === "optimal"
+                    ? "Видео уже оптимально для просмотра, сжимать нечего."
+                    : "Оптимизация запущена! Видео станет загружаться быстрее через пару минут.");
             }
         } catch (e) {
             alert("Ошибка при запуске оптимизации");
@@ -15,7 +15,10 @@ const STATUS_LABELS = {
     fetching_details: 'Получение данных...',
     downloading: 'Скачивание...',
     downloading_torrent: 'Скачивание торрента...',
+    probing: 'Анализ видео...',
+    queued_conversion: 'В очереди на конвертацию...',
     converting: 'Конвертация видео...',
+    registering: 'Добавление в библиотеку...',
     completed: 'Готово!',
     error: 'Ошибка',
 };
@@ -1,115 +1,60 @@
 #!/bin/bash
 
-# Restart script for Auto-Discovery services
-# Usage: ./restart_discovery.sh [books|movies|all]
+# Force a discovery cycle now
+# Usage: ./restart_discovery.sh [books|audiobooks|movies|all]
+#
+# Discovery no longer runs as separate daemons: the cycles are scheduler jobs
+# inside the API server (backend/services/discovery_jobs.py). This script
+# stops daemons left over from older versions and asks the running backend
+# to queue the cycle right away.
 
-echo "=== Restarting Auto-Discovery Services ==="
+echo "=== Restarting Auto-Discovery ==="
 
-DIR="$(dirname "$(realpath "$0")")"
-BACKEND_DIR="$DIR/backend"
-LOG_DIR="$DIR/logs"
-VENV_DIR="$DIR/.venv"
+BACKEND_URL="${BACKEND_URL:-http://127.0.0.1:5055}"
 
-# Create logs directory if it doesn't exist
-mkdir -p "$LOG_DIR"
+# Stop daemons of older versions (they would download alongside the scheduler)
+pkill -f "python.*auto_discovery.py" && echo "  ✓ Stopped legacy discovery daemon(s)"
 
-# Activate virtual environment
-echo "→ Activating virtual environment..."
-if [ -f "$VENV_DIR/bin/activate" ]; then
-    source "$VENV_DIR/bin/activate"
-    echo "  ✓ Virtual environment activated"
-elif [ -f "$VENV_DIR/Scripts/activate" ]; then
-    # Windows Git Bash
-    source "$VENV_DIR/Scripts/activate"
-    echo "  ✓ Virtual environment activated (Windows)"
-else
-    echo "  ⚠ Warning: Virtual environment not found at $VENV_DIR"
-    echo "  Continuing without venv..."
-fi
-
-# Check and install dependencies if needed
-echo "→ Checking dependencies..."
-cd "$BACKEND_DIR" || { echo "❌ Cannot cd to backend directory"; exit 1; }
-
-if [ -f "requirements.txt" ]; then
-    # Quick check if main packages are installed
-    if ! python -c "import qbittorrentapi" 2>/dev/null; then
-        echo "  Installing missing dependencies..."
-        pip install -q -r requirements.txt
-        echo "  ✓ Dependencies installed"
+trigger() {
+    local discovery_type=$1
+    echo ""
+    echo "→ Triggering $discovery_type discovery..."
+    if curl -fsS -X POST "$BACKEND_URL/api/system/discovery-restart/$discovery_type"; then
+        echo ""
+        echo "  ✓ Queued"
     else
-        echo "  ✓ Dependencies OK"
+        echo "  ❌ Backend not reachable at $BACKEND_URL (start it with ./start.sh)"
+        return 1
     fi
-else
-    echo "  ℹ No requirements.txt found"
-fi
-
-# Function to restart a service
-restart_service() {
-    local script_name=$1
-    local service_name=$2
-    local log_file=$3
-    
-    echo ""
-    echo "→ Restarting $service_name..."
-    
-    # Stop existing process
-    pkill -f "python.*$script_name" && echo "  ✓ Stopped old process" || echo "  ℹ No running process found"
-    
-    sleep 1
-    
-    # Start new process
-    cd "$BACKEND_DIR" || { echo "❌ Cannot cd to backend directory"; exit 1; }
-    
-    nohup python "$script_name" > "$log_file" 2>&1 &
-    NEW_PID=$!
-    
-    echo "  ✓ Started with PID: $NEW_PID"
-    echo "  📄 Log file: $log_file"
 }
 
 # Parse command line argument
 MODE="${1:-all}"
 
 case "$MODE" in
-    books)
-        restart_service "auto_discovery.py" "Book Auto-Discovery" "$LOG_DIR/auto_discovery.log"
-        ;;
-    movies)
-        restart_service "movie_auto_discovery.py" "Movie Auto-Discovery" "$LOG_DIR/movie_discovery.log"
+    books|audiobooks|movies)
+        trigger "$MODE" || exit 1
         ;;
     all)
-        restart_service "auto_discovery.py" "Book Auto-Discovery" "$LOG_DIR/auto_discovery.log"
-        restart_service "movie_auto_discovery.py" "Movie Auto-Discovery" "$LOG_DIR/movie_discovery.log"
+        trigger books && trigger audiobooks && trigger movies || exit 1
         ;;
     *)
         echo "❌ Invalid argument: $MODE"
         echo ""
-        echo "Usage: $0 [books|movies|all]"
-        echo "  books  - restart only book auto-discovery"
-        echo "  movies - restart only movie auto-discovery"
-        echo "  all    - restart both services (default)"
+        echo "Usage: $0 [books|audiobooks|movies|all]"
+        echo "  books      - run a book discovery cycle now"
+        echo "  audiobooks - run an audiobook discovery cycle now"
+        echo "  movies     - run a movie discovery cycle now"
+        echo "  all        - all of them (default)"
         exit 1
         ;;
 esac
 
 echo ""
 echo "========================================"
-echo "Auto-Discovery services restarted!"
-echo ""
-echo "To view logs:"
-if [ "$MODE" = "books" ] || [ "$MODE" = "all" ]; then
-    echo "  tail -f $LOG_DIR/auto_discovery.log"
-fi
-if [ "$MODE" = "movies" ] || [ "$MODE" = "all" ]; then
-    echo "  tail -f $LOG_DIR/movie_discovery.log"
-fi
+echo "Discovery cycles queued!"
 echo ""
-echo "To stop:"
-if [ "$MODE" = "books" ] || [ "$MODE" = "all" ]; then
-    echo "  pkill -f 'python.*auto_discovery.py'"
-fi
-if [ "$MODE" = "movies" ] || [ "$MODE" = "all" ]; then
-    echo "  pkill -f 'python.*movie_auto_discovery.py'"
-fi
+echo "To follow them:"
+echo "  curl $BACKEND_URL/api/system/jobs"
+echo "  curl $BACKEND_URL/api/system/discovery-runs"
 echo "========================================"